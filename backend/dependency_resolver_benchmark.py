@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Benchmark del resolvedor de dependencias con planes sintéticos grandes
+
+Uso:
+    python dependency_resolver_benchmark.py [--sizes 1000 2000 5000 10000] [--repeat 3] [--seed 7]
+
+Los planes imitan la descomposición jerárquica de tareas: objetivos divididos
+en subtareas, cada una con una cadena de pasos (investigar, analizar, generar,
+informar) y dependencias explícitas entre subtareas consecutivas, ficheros
+compartidos y algún ciclo explícito para forzar la rotura de ciclos.
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from src.orchestration.dependency_resolver import DependencyResolver
+from src.orchestration.planning_algorithms import TaskStep
+
+SUBTASK_PATTERNS = [
+    [("web_search", "Search sources for {topic}"),
+     ("deep_research", "Analyze findings about {topic}"),
+     ("file_manager", "Generate summary file for {topic}"),
+     ("comprehensive_research", "Write report on {topic}")],
+    [("file_manager", "Prepare workspace for {topic}"),
+     ("shell", "Execute build for {topic}"),
+     ("shell", "Analyze build output of {topic}"),
+     ("file_manager", "Generate report for {topic}")],
+    [("playwright", "Navigate to pages about {topic}"),
+     ("web_search", "Search references for {topic}"),
+     ("deep_research", "Analyze references for {topic}")],
+]
+
+
+def build_hierarchical_plan(step_count: int, seed: int = 7):
+    """Plan sintético de step_count pasos a partir de objetivos descompuestos"""
+    rng = random.Random(seed)
+    steps = []
+    goal = 0
+    while len(steps) < step_count:
+        goal += 1
+        previous_subtask_tail = None
+        for subtask in range(rng.randint(3, 8)):
+            topic = f"goal{goal}.sub{subtask}"
+            previous = previous_subtask_tail
+            for tool, description in rng.choice(SUBTASK_PATTERNS):
+                if len(steps) >= step_count:
+                    break
+                step_id = f"step_{len(steps)}"
+                parameters = {"query": topic} if tool in ("web_search", "deep_research") else {}
+                if tool in ("file_manager", "shell"):
+                    parameters["file_path"] = f"/tmp/goal{goal}/{rng.randint(0, 3)}.txt"
+                steps.append(TaskStep(
+                    id=step_id,
+                    title=description.format(topic=topic),
+                    description=description.format(topic=topic),
+                    tool=tool,
+                    parameters=parameters,
+                    dependencies=[previous] if previous else [],
+                    estimated_duration=rng.randint(5, 60),
+                    complexity=rng.random(),
+                    priority=rng.randint(1, 5),
+                    can_parallelize=rng.random() < 0.7
+                ))
+                previous = step_id
+            previous_subtask_tail = previous
+        # Un ciclo explícito ocasional (el último paso del objetivo vuelve al primero)
+        if goal % 10 == 0 and len(steps) > 2:
+            first_of_goal = next(step for step in steps if step.title.startswith(("Search", "Prepare", "Navigate"))
+                                 and f"goal{goal}." in step.title)
+            first_of_goal.dependencies.append(steps[-1].id)
+    return steps
+
+
+def timed(function, *args, repeat: int = 1):
+    best = None
+    value = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        value = function(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return value, best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del resolvedor de dependencias")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 2000, 5000, 10000])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    print(f"{'pasos':>7} {'análisis':>10} {'validación':>11} {'orden':>10} {'µs/paso':>9} "
+          f"{'relaciones':>11} {'niveles':>8} {'aristas rotas':>14}")
+    for size in args.sizes:
+        steps = build_hierarchical_plan(size, args.seed)
+        resolver = DependencyResolver()
+        dependencies, analyze_time = timed(resolver.analyze_dependencies, steps, repeat=args.repeat)
+        _, validate_time = timed(resolver.validate_dependencies, steps, repeat=args.repeat)
+        levels, order_time = timed(resolver.resolve_execution_order, steps, repeat=args.repeat)
+        relations = sum(len(deps) for deps in dependencies.values())
+        print(f"{size:>7} {analyze_time * 1000:>8.1f}ms {validate_time * 1000:>9.1f}ms {order_time * 1000:>8.1f}ms "
+              f"{order_time / size * 1e6:>9.1f} {relations:>11} {len(levels):>8} {len(resolver.removed_edges):>14}")
+
+
+if __name__ == '__main__':
+    main()
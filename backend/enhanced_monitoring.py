@@ -8,7 +8,7 @@ import json
 import time
 import threading
 import asyncio
-from typing import List, Dict, Optional, Any, Callable, Union
+from typing import List, Dict, Optional, Any, Callable, Union, Tuple
 from dataclasses import dataclass, asdict, field
 from enum import Enum
 from datetime import datetime, timedelta
@@ -19,6 +19,8 @@ import traceback
 import psutil
 import os
 
+from src.utils.system_sampler import get_system_sampler
+
 class AlertLevel(Enum):
     """Niveles de alerta"""
     INFO = "info"
@@ -112,6 +114,7 @@ class EnhancedMonitoringSystem:
         self.event_queue = queue.Queue()
         self.processing_thread = None
         self.running = False
+        self.sampler_subscription = None
         
         # Métricas del sistema
         self.system_metrics = {
@@ -224,6 +227,9 @@ class EnhancedMonitoringSystem:
         self.running = False
         if self.processing_thread:
             self.processing_thread.join(timeout=5.0)
+        if self.sampler_subscription is not None:
+            get_system_sampler().unsubscribe(self.sampler_subscription)
+            self.sampler_subscription = None
         
         self.logger.info("Sistema de monitoreo detenido")
     
@@ -249,35 +255,34 @@ class EnhancedMonitoringSystem:
                 time.sleep(1.0)
     
     def _start_system_metrics_collection(self):
-        """Inicia la recolección de métricas del sistema"""
-        def collect_system_metrics():
-            while self.running:
-                try:
-                    # CPU
-                    cpu_percent = psutil.cpu_percent(interval=1)
-                    self.record_metric("cpu_usage", cpu_percent, MetricType.GAUGE, unit="%")
-                    
-                    # Memoria
-                    memory = psutil.virtual_memory()
-                    self.record_metric("memory_usage", memory.percent, MetricType.GAUGE, unit="%")
-                    
-                    # Disco
-                    disk = psutil.disk_usage('/')
-                    disk_percent = (disk.used / disk.total) * 100
-                    self.record_metric("disk_usage", disk_percent, MetricType.GAUGE, unit="%")
-                    
-                    # Red (simplificado)
-                    net_io = psutil.net_io_counters()
-                    self.record_metric("network_bytes_sent", net_io.bytes_sent, MetricType.COUNTER, unit="bytes")
-                    self.record_metric("network_bytes_recv", net_io.bytes_recv, MetricType.COUNTER, unit="bytes")
-                    
-                except Exception as e:
-                    self.logger.error(f"Error recolectando métricas del sistema: {e}")
+        """Inicia la recolección de métricas del sistema (suscripción al muestreador compartido)"""
+        def collect_system_metrics(sample: Dict[str, Any]):
+            if not self.running:
+                return
+            try:
+                # CPU
+                self.record_metric("cpu_usage", sample["cpu_percent"], MetricType.GAUGE, unit="%")
+                
+                # Memoria
+                self.record_metric("memory_usage", sample["memory_percent"], MetricType.GAUGE, unit="%")
+                
+                # Disco
+                self.record_metric("disk_usage", sample["disk_percent"], MetricType.GAUGE, unit="%")
                 
-                time.sleep(5.0)  # Recolectar cada 5 segundos
+                # Red (simplificado)
+                self.record_metric("network_bytes_sent", sample["net_bytes_sent"], MetricType.COUNTER, unit="bytes")
+                self.record_metric("network_bytes_recv", sample["net_bytes_recv"], MetricType.COUNTER, unit="bytes")
+                
+                # Procesos lanzados por herramientas (shell, navegadores...)
+                self.record_metric("tool_processes", sample["children_count"], MetricType.GAUGE)
+                self.record_metric("tool_processes_rss", sample["children_rss"] / 1024 / 1024, MetricType.GAUGE, unit="MB")
+                
+            except Exception as e:
+                self.logger.error(f"Error recolectando métricas del sistema: {e}")
         
-        metrics_thread = threading.Thread(target=collect_system_metrics, daemon=True)
-        metrics_thread.start()
+        if self.sampler_subscription is None:
+            # Recolectar cada 5 segundos como mucho
+            self.sampler_subscription = get_system_sampler().subscribe(collect_system_metrics, interval=5.0)
     
     def record_metric(self, name: str, value: Union[int, float], 
                      metric_type: MetricType, tags: Optional[Dict[str, str]] = None,
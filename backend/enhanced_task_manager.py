@@ -11,12 +11,12 @@ import asyncio
 from typing import List, Dict, Optional, Any, Callable, Union
 from dataclasses import dataclass, asdict, field
 from enum import Enum
-import threading
 from datetime import datetime
 import networkx as nx
 
 from task_manager import TaskStatus, PhaseStatus, TaskPhase, Task, TaskManager
 from memory_manager import MemoryManager
+from src.services.task_executor import get_task_executor
 
 class ToolType(Enum):
     """Tipos de herramientas disponibles"""
@@ -496,19 +496,23 @@ class EnhancedTaskManager(TaskManager):
             return False
         
         try:
-            # Ejecutar fases en paralelo usando threading
-            threads = []
-            for phase in parallel_phases:
-                thread = threading.Thread(
-                    target=self.execute_phase_with_tools,
-                    args=(task_id, phase.id)
+            # Ejecutar fases en paralelo en el pool compartido de workers; la
+            # tarea ya está admitida, así que sus fases no pasan por los límites
+            # de cola (el usuario del reparto justo es la propia tarea)
+            executor = get_task_executor()
+            jobs = [
+                executor.submit(
+                    f"{task_id}:phase:{phase.id}",
+                    lambda phase_id=phase.id: self.execute_phase_with_tools(task_id, phase_id),
+                    user_id=task_id,
+                    kind='task_phase',
+                    enforce_limits=False
                 )
-                threads.append(thread)
-                thread.start()
+                for phase in parallel_phases
+            ]
             
             # Esperar a que todas las fases terminen
-            for thread in threads:
-                thread.join()
+            executor.wait_all(jobs)
             
             self.logger.info(f"Ejecutadas {len(parallel_phases)} fases en paralelo para tarea {task_id}")
             return True
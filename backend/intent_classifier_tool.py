@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Herramienta de entrenamiento, evaluación y benchmark del clasificador de intención
+
+Uso:
+    python intent_classifier_tool.py train [--data ejemplos.jsonl]
+    python intent_classifier_tool.py eval [--data ejemplos.jsonl] [--folds 5]
+    python intent_classifier_tool.py benchmark [--data ejemplos.jsonl] [--llm] [--limit 50]
+
+Los ejemplos son líneas JSON con 'message' e 'intent' (el formato de
+INTENT_LOG_PATH); sin --data se usan los ejemplos semilla más los registrados.
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from src.analysis.intent_classifier import (
+    SEED_EXAMPLES, HashedNgramIntentClassifier, IntentExampleLog, IntentClassificationService,
+    classify_intent_with_llm, cross_validate, evaluate_classifier
+)
+
+
+def load_examples(path: str = None):
+    if path:
+        return IntentExampleLog(path).load()
+    service_log = IntentExampleLog(os.getenv('INTENT_LOG_PATH', '/tmp/mitosis_intent/intent_examples.jsonl'))
+    return SEED_EXAMPLES + service_log.load()
+
+
+def cmd_train(args):
+    service = IntentClassificationService()
+    if args.data:
+        examples = load_examples(args.data)
+        service.model = HashedNgramIntentClassifier().fit(examples, epochs=args.epochs)
+        service.model.save(service.model_path)
+    else:
+        examples = SEED_EXAMPLES + service.example_log.load()
+        service.retrain(epochs=args.epochs)
+    print(f"✅ Modelo entrenado con {len(examples)} ejemplos -> {service.model_path}")
+    print(json.dumps(cross_validate(examples, folds=args.folds), indent=2))
+
+
+def cmd_eval(args):
+    examples = load_examples(args.data)
+    print(f"📊 Validación cruzada ({args.folds} folds) sobre {len(examples)} ejemplos")
+    print(json.dumps(cross_validate(examples, folds=args.folds), indent=2))
+
+
+def cmd_benchmark(args):
+    examples = load_examples(args.data)
+    rng = random.Random(13)
+    rng.shuffle(examples)
+    split = max(1, int(len(examples) * 0.8))
+    train, test = examples[:split], examples[split:][:args.limit]
+    if not test:
+        print("⚠️ No hay suficientes ejemplos para el benchmark")
+        return
+
+    model = HashedNgramIntentClassifier().fit(train)
+    local = evaluate_classifier(model, test)
+    print(f"🧠 Local: exactitud={local['accuracy']:.3f} casual/tarea={local['casual_vs_task_accuracy']:.3f} "
+          f"latencia media={local['latency_ms_avg']:.3f}ms p95={local['latency_ms_p95']:.3f}ms")
+
+    if not args.llm:
+        return
+
+    from src.services.ollama_service import OllamaService
+    ollama_service = OllamaService()
+    if not ollama_service.is_healthy():
+        print("⚠️ Ollama no disponible, se omite la comparación con el LLM")
+        return
+
+    llm_correct = llm_binary = hybrid_correct = hybrid_binary = escalations = 0
+    llm_latencies = []
+    for text, expected in test:
+        start = time.perf_counter()
+        intent, error = classify_intent_with_llm(ollama_service, text)
+        llm_latencies.append((time.perf_counter() - start) * 1000)
+        intent = intent or 'otro'
+        llm_correct += intent == expected
+        llm_binary += (intent == 'casual') == (expected == 'casual')
+
+        probabilities = model.predict_proba(text)
+        local_intent = max(probabilities, key=probabilities.get)
+        if probabilities[local_intent] >= args.threshold:
+            chosen = local_intent
+        else:
+            chosen = intent
+            escalations += 1
+        hybrid_correct += chosen == expected
+        hybrid_binary += (chosen == 'casual') == (expected == 'casual')
+
+    total = len(test)
+    llm_latencies.sort()
+    print(f"🤖 LLM: exactitud={llm_correct / total:.3f} casual/tarea={llm_binary / total:.3f} "
+          f"latencia media={sum(llm_latencies) / total:.1f}ms p95={llm_latencies[int(0.95 * (total - 1))]:.1f}ms")
+    print(f"⚡ Híbrido (umbral {args.threshold}): exactitud={hybrid_correct / total:.3f} "
+          f"casual/tarea={hybrid_binary / total:.3f} escalados al LLM={escalations}/{total}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Clasificador de intención local")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    train_parser = subparsers.add_parser('train', help='Entrenar y guardar el modelo')
+    train_parser.add_argument('--data')
+    train_parser.add_argument('--epochs', type=int, default=15)
+    train_parser.add_argument('--folds', type=int, default=5)
+    train_parser.set_defaults(func=cmd_train)
+
+    eval_parser = subparsers.add_parser('eval', help='Validación cruzada')
+    eval_parser.add_argument('--data')
+    eval_parser.add_argument('--folds', type=int, default=5)
+    eval_parser.set_defaults(func=cmd_eval)
+
+    bench_parser = subparsers.add_parser('benchmark', help='Comparar exactitud y latencia con el LLM')
+    bench_parser.add_argument('--data')
+    bench_parser.add_argument('--llm', action='store_true', help='Incluir la clasificación con Ollama')
+    bench_parser.add_argument('--limit', type=int, default=50)
+    bench_parser.add_argument('--threshold', type=float, default=float(os.getenv('INTENT_CONFIDENCE_THRESHOLD', '0.85')))
+    bench_parser.set_defaults(func=cmd_benchmark)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -52,6 +52,7 @@ CORS(app, resources={
 # 🚀 Inicializar WebSocket para updates en tiempo real
 print("🔌 Initializing WebSocket for real-time updates...")
 websocket_manager = initialize_websocket(app)
+app.websocket_manager = websocket_manager
 print("✅ WebSocket initialized successfully")
 
 # Inicializar servicios con configuración correcta
@@ -61,6 +62,12 @@ ollama_service = OllamaService(base_url=ollama_base_url)
 tool_manager = ToolManager()
 database_service = DatabaseService()
 
+# Almacenamiento opcional de eventos antiguos de tareas (replay en reconexión)
+from src.websocket.task_event_log import create_event_spill
+websocket_manager.event_log.spill = create_event_spill(
+    os.getenv('TASK_EVENT_LOG_SPILL', 'none'), database_service
+)
+
 # Inicializar Enhanced Components
 print("🚀 Inicializando Enhanced Components...")
 try:
@@ -107,6 +114,21 @@ app.register_blueprint(agent_bp, url_prefix='/api/agent')
 from src.routes.memory_routes import memory_bp
 app.register_blueprint(memory_bp, url_prefix='/api/memory')
 
+# Importar y registrar rutas de administración (profiler)
+from src.routes.admin_routes import admin_bp
+app.register_blueprint(admin_bp, url_prefix='/api/admin')
+
+# Etiquetar el hilo de cada petición con su ruta para el profiler de muestreo
+from src.monitoring.sampling_profiler import set_thread_tags, clear_thread_tags
+
+@app.before_request
+def tag_request_thread():
+    set_thread_tags(route=request.path)
+
+@app.teardown_request
+def untag_request_thread(exception=None):
+    clear_thread_tags()
+
 # Memory manager will be initialized if available
 try:
     from src.routes.agent_routes import memory_manager
@@ -167,12 +189,37 @@ def not_found(error):
 def internal_error(error):
     return jsonify({'error': 'Internal server error'}), 500
 
+# Event loop persistente para las corrutinas de los handlers (memoria, etc.)
+import atexit
+from src.utils.async_bridge import get_async_bridge
+
+app.async_bridge = get_async_bridge()
+app.async_bridge.start()
+atexit.register(app.async_bridge.stop)
+
+# Reanudar los planes interrumpidos por el último reinicio (diario de ejecución)
+if os.getenv('RESUME_INTERRUPTED_TASKS', 'true').lower() == 'true':
+    try:
+        from src.routes.agent_routes import resume_interrupted_executions
+        with app.app_context():
+            resumed_tasks = resume_interrupted_executions()
+        if resumed_tasks:
+            print(f"♻️ Resumed {len(resumed_tasks)} interrupted tasks")
+    except Exception as e:
+        print(f"⚠️ Could not resume interrupted tasks: {e}")
+
 # Convertir Flask WSGI app a ASGI para uvicorn
 try:
     from asgiref.wsgi import WsgiToAsgi
     
     # Crear aplicación ASGI
     asgi_app = WsgiToAsgi(app)
+
+    # Modo ASGI nativo opcional para las rutas asíncronas de memoria
+    if os.getenv('MEMORY_ASGI_NATIVE', 'false').lower() == 'true':
+        from src.routes.memory_asgi import MemoryASGIApp
+        asgi_app = MemoryASGIApp(asgi_app, app, app.async_bridge)
+        print("✅ Native ASGI memory routes enabled")
     
 except ImportError:
     # Si asgiref no está disponible, mantener la aplicación Flask
@@ -26,6 +26,7 @@ from src.tools.task_planner import ExecutionPlan, TaskStep, ExecutionStrategy
 from src.memory.advanced_memory_manager import AdvancedMemoryManager
 from src.services.ollama_service import OllamaService
 from src.analysis.error_analyzer import ErrorAnalyzer
+from src.agents.replanning_strategy_cache import ReplanningStrategyCache, parameter_shape
 
 # Forward references to avoid circular imports
 from typing import TYPE_CHECKING
@@ -67,6 +68,7 @@ class ReplanningContext:
     available_tools: List[str]
     previous_attempts: List[Dict[str, Any]] = field(default_factory=list)
     constraints: Dict[str, Any] = field(default_factory=dict)
+    metadata: Dict[str, Any] = field(default_factory=dict)
     
 @dataclass
 class ReplanningResult:
@@ -79,6 +81,8 @@ class ReplanningResult:
     reasoning: str = ""
     estimated_success_probability: float = 0.0
     fallback_options: List[Dict[str, Any]] = field(default_factory=list)
+    cache_key: Optional[str] = None
+    from_cache: bool = False
 
 class ReplanningEngine:
     """Motor de replanificación dinámica"""
@@ -104,12 +108,20 @@ class ReplanningEngine:
         self.confidence_threshold = self.config.get('confidence_threshold', 0.6)
         self.enable_aggressive_replanning = self.config.get('enable_aggressive_replanning', True)
         self.enable_llm_analysis = self.config.get('enable_llm_analysis', True)
+        self.enable_strategy_cache = self.config.get('enable_strategy_cache', True)
         
         # Estadísticas
         self.replannings_performed = 0
         self.successful_replannings = 0
         self.strategies_used = {}
         
+        # Tabla memoizada (herramienta, categoría, forma de parámetros) -> estrategia
+        self.strategy_cache = ReplanningStrategyCache(
+            max_entries=self.config.get('strategy_cache_size', 5000),
+            min_observations=self.config.get('strategy_cache_min_observations', 2),
+            confidence_threshold=self.config.get('strategy_cache_confidence', self.confidence_threshold)
+        )
+        
         # Mapeo de herramientas alternativas
         self.tool_alternatives = {
             'web_search': ['enhanced_web_search', 'duckduckgo_search', 'comprehensive_research'],
@@ -152,25 +164,49 @@ class ReplanningEngine:
             # Incrementar contador
             self.replannings_performed += 1
             
-            # 1. Categorizar error
-            error_category = await self._categorize_error(context)
+            # 1. Categorizar error (memorizado por firma normalizada del mensaje)
+            error_category = await self._categorize_error_cached(context)
+            context.metadata['error_category'] = error_category.value
             logger.info(f"📊 Error categorizado como: {error_category.value}")
             
-            # 2. Analizar con LLM si está habilitado
-            llm_analysis = {}
-            if self.enable_llm_analysis:
-                llm_analysis = await self._analyze_with_llm(context, error_category)
+            # 2. Consultar la tabla de estrategias antes de recurrir al LLM
+            cache_key = self.strategy_cache.make_key(
+                context.failed_step.tool, error_category.value, context.failed_step.parameters
+            )
+            cached_decision = self.strategy_cache.lookup(cache_key) if self.enable_strategy_cache else None
             
-            # 3. Determinar estrategia de replanificación
-            strategy = await self._determine_strategy(context, error_category, llm_analysis)
+            if cached_decision is not None:
+                strategy_name, cached_probability, llm_analysis = cached_decision
+                strategy = ReplanningStrategy(strategy_name)
+                logger.info(f"⚡ Estrategia memorizada: {strategy.value} (p={cached_probability:.2f})")
+            else:
+                # 3. Analizar con LLM si está habilitado
+                llm_analysis = {}
+                if self.enable_llm_analysis:
+                    llm_analysis = await self._analyze_with_llm(context, error_category)
+                
+                # 4. Determinar estrategia de replanificación
+                strategy = await self._determine_strategy(context, error_category, llm_analysis)
+                self.strategy_cache.register_decision(
+                    cache_key,
+                    tool=context.failed_step.tool,
+                    error_category=error_category.value,
+                    param_shape=parameter_shape(context.failed_step.parameters),
+                    strategy=strategy.value,
+                    prior=await self._estimate_strategy_success_probability(context, strategy),
+                    analysis=llm_analysis
+                )
             logger.info(f"🎯 Estrategia seleccionada: {strategy.value}")
             
-            # 4. Generar nuevo plan según estrategia
+            # 5. Generar nuevo plan según estrategia
             new_plan = await self._generate_new_plan(context, strategy, llm_analysis)
             
-            # 5. Evaluar confianza y probabilidad de éxito
+            # 6. Evaluar confianza y probabilidad de éxito
             confidence_score = await self._evaluate_confidence(context, new_plan, strategy)
-            success_probability = await self._estimate_success_probability(context, new_plan)
+            if cached_decision is not None:
+                success_probability = cached_probability if new_plan else 0.0
+            else:
+                success_probability = await self._estimate_success_probability(context, new_plan)
             
             # 6. Crear resultado
             result = ReplanningResult(
@@ -180,7 +216,9 @@ class ReplanningEngine:
                 confidence_score=confidence_score,
                 reasoning=llm_analysis.get('reasoning', f"Applied {strategy.value} strategy"),
                 estimated_success_probability=success_probability,
-                fallback_options=await self._generate_fallback_options(context, strategy)
+                fallback_options=await self._generate_fallback_options(context, strategy),
+                cache_key=cache_key,
+                from_cache=cached_decision is not None
             )
             
             # 7. Registrar en memoria para aprendizaje
@@ -201,6 +239,48 @@ class ReplanningEngine:
                 reasoning=f"Error en replanificación: {str(e)}"
             )
     
+    async def _categorize_error_cached(self, context: ReplanningContext) -> ErrorCategory:
+        """Categorizar el error reutilizando la categoría memorizada para su firma"""
+        
+        error_signature, _ = self.error_analyzer.fingerprint_index.fingerprint(
+            str(context.error_info.get('error', '')),
+            context.error_info.get('type', 'unknown')
+        )
+        
+        cached_category = self.strategy_cache.get_category(error_signature) if self.enable_strategy_cache else None
+        if cached_category is not None:
+            return ErrorCategory(cached_category)
+        
+        error_category = await self._categorize_error(context)
+        self.strategy_cache.remember_category(error_signature, error_category.value)
+        return error_category
+    
+    def record_replanning_outcome(self, 
+                                  cache_key: str, 
+                                  strategy: str, 
+                                  success: bool,
+                                  error_info: Dict[str, Any] = None):
+        """
+        Registrar si el plan generado por una replanificación tuvo éxito
+        
+        Args:
+            cache_key: Clave de la tabla devuelta en ReplanningResult.cache_key
+            strategy: Estrategia aplicada
+            success: Si el paso replanificado se completó
+            error_info: Error original ({'error', 'type'}) para el ErrorAnalyzer
+        """
+        self.strategy_cache.record_outcome(cache_key, strategy, success)
+        
+        if error_info:
+            self.error_analyzer.record_recovery_outcome(
+                str(error_info.get('error', '')),
+                error_info.get('type', 'unknown'),
+                strategy,
+                success
+            )
+        
+        logger.info(f"📈 Resultado de replanificación registrado: {strategy} -> {'éxito' if success else 'fallo'}")
+    
     async def _categorize_error(self, context: ReplanningContext) -> ErrorCategory:
         """Categorizar el error para determinar estrategia usando ErrorAnalyzer"""
         
@@ -236,7 +316,6 @@ class ReplanningEngine:
             )
             
             # Registrar análisis adicional en contexto
-            context.metadata = context.metadata or {}
             context.metadata['error_analysis'] = {
                 'severity': error_analysis.severity,
                 'pattern': error_analysis.pattern,
@@ -932,7 +1011,7 @@ Responde en formato JSON con las siguientes claves:
                 'timestamp': datetime.now().isoformat(),
                 'original_step_id': context.failed_step.id,
                 'original_tool': context.failed_step.tool,
-                'error_category': self._categorize_error(context).value,
+                'error_category': context.metadata.get('error_category'),
                 'strategy_used': result.strategy_used.value if result.strategy_used else None,
                 'success': result.success,
                 'confidence_score': result.confidence_score,
@@ -995,11 +1074,14 @@ Responde en formato JSON con las siguientes claves:
             'success_rate': success_rate,
             'strategies_used': self.strategies_used,
             'most_used_strategy': max(self.strategies_used.keys(), key=self.strategies_used.get) if self.strategies_used else None,
+            'strategy_cache': self.strategy_cache.get_statistics(),
+            'top_cached_strategies': self.strategy_cache.top_entries(5),
             'configuration': {
                 'max_replanning_attempts': self.max_replanning_attempts,
                 'confidence_threshold': self.confidence_threshold,
                 'enable_aggressive_replanning': self.enable_aggressive_replanning,
-                'enable_llm_analysis': self.enable_llm_analysis
+                'enable_llm_analysis': self.enable_llm_analysis,
+                'enable_strategy_cache': self.enable_strategy_cache
             }
         }
     
@@ -0,0 +1,256 @@
+"""
+ReplanningStrategyCache - Tabla Memoizada de Estrategias de Replanificación
+==========================================================================
+
+Memoriza qué estrategia de replanificación funcionó para cada firma de fallo
+(herramienta, categoría de error, forma de los parámetros) y la probabilidad de
+éxito observada, actualizada en línea con los resultados reales.
+
+Características clave:
+- Decisión en O(1) para fallos recurrentes, sin llamadas al LLM
+- Probabilidad de éxito por estrategia con prior Beta (base por estrategia);
+  las estrategias se ordenan por la cota inferior de esa probabilidad, así una
+  sin resultados no desplaza a otra con historial
+- Caché de categoría de error por firma normalizada del mensaje
+- Desalojo LRU de entradas poco usadas
+"""
+
+import math
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional, Tuple
+
+# Peso (en observaciones equivalentes) de la probabilidad base de cada estrategia
+_PRIOR_WEIGHT = 2.0
+# z de la cota inferior de Wilson (unilateral al 95%)
+_CONFIDENCE_Z = 1.645
+
+
+def parameter_shape(parameters: Dict[str, Any]) -> str:
+    """Describir la forma de los parámetros (claves y tipos) sin sus valores"""
+    if not isinstance(parameters, dict):
+        return type(parameters).__name__
+    return ','.join(
+        f"{key}:{type(value).__name__}"
+        for key, value in sorted(parameters.items(), key=lambda item: str(item[0]))
+    )
+
+
+@dataclass
+class StrategyStats:
+    """Resultados observados de una estrategia para una firma de fallo"""
+    prior: float
+    attempts: int = 0
+    successes: int = 0
+
+    @property
+    def success_probability(self) -> float:
+        return (self.successes + self.prior * _PRIOR_WEIGHT) / (self.attempts + _PRIOR_WEIGHT)
+
+    @property
+    def lower_bound(self) -> float:
+        """Cota inferior de Wilson de success_probability (más estrecha con más resultados)"""
+        n = self.attempts + _PRIOR_WEIGHT
+        p = self.success_probability
+        z2 = _CONFIDENCE_Z ** 2
+        margin = _CONFIDENCE_Z * math.sqrt(p * (1 - p) / n + z2 / (4 * n * n))
+        return (p + z2 / (2 * n) - margin) / (1 + z2 / n)
+
+
+@dataclass
+class StrategyCacheEntry:
+    """Entrada de la tabla: estrategias probadas para una firma de fallo"""
+    key: str
+    tool: str
+    error_category: str
+    param_shape: str
+    strategies: Dict[str, StrategyStats] = field(default_factory=dict)
+    analysis: Dict[str, Any] = field(default_factory=dict)
+    hits: int = 0
+    created_at: float = field(default_factory=time.time)
+    last_used: float = field(default_factory=time.time)
+
+    def best_strategy(self, min_attempts: int = 0) -> Optional[Tuple[str, StrategyStats]]:
+        """Estrategia con mayor cota inferior entre las que tienen min_attempts resultados"""
+        candidates = [item for item in self.strategies.items() if item[1].attempts >= min_attempts]
+        if not candidates:
+            return None
+        return max(candidates, key=lambda item: item[1].lower_bound)
+
+    def to_dict(self) -> Dict[str, Any]:
+        best = self.best_strategy()
+        return {
+            'key': self.key,
+            'tool': self.tool,
+            'error_category': self.error_category,
+            'param_shape': self.param_shape,
+            'hits': self.hits,
+            'best_strategy': best[0] if best else None,
+            'success_probability': best[1].success_probability if best else 0.0,
+            'strategies': {
+                name: {
+                    'attempts': stats.attempts,
+                    'successes': stats.successes,
+                    'success_probability': stats.success_probability
+                }
+                for name, stats in self.strategies.items()
+            }
+        }
+
+
+class ReplanningStrategyCache:
+    """Tabla de decisiones de replanificación indexada por firma de fallo"""
+
+    def __init__(self, max_entries: int = 5000, min_observations: int = 2,
+                 confidence_threshold: float = 0.6, max_categories: int = 10000):
+        """
+        Inicializar caché
+
+        Args:
+            max_entries: Firmas de fallo retenidas (desalojo LRU)
+            min_observations: Resultados observados antes de confiar en la tabla
+            confidence_threshold: Probabilidad de éxito mínima para usar la tabla
+            max_categories: Categorías de error memorizadas por firma de mensaje
+        """
+        self.max_entries = max_entries
+        self.min_observations = min_observations
+        self.confidence_threshold = confidence_threshold
+        self.max_categories = max_categories
+
+        self._entries: "OrderedDict[str, StrategyCacheEntry]" = OrderedDict()
+        self._categories: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.RLock()
+
+        self.stats = {
+            'lookups': 0,
+            'hits': 0,
+            'misses': 0,
+            'low_confidence': 0,
+            'category_hits': 0,
+            'outcomes_recorded': 0,
+            'evictions': 0
+        }
+
+    @staticmethod
+    def make_key(tool: str, error_category: str, parameters: Dict[str, Any]) -> str:
+        return f"{tool}|{error_category}|{parameter_shape(parameters)}"
+
+    # ------------------------------------------------------------ categorías
+
+    def get_category(self, error_signature: str) -> Optional[str]:
+        """Categoría de error memorizada para una firma de mensaje"""
+        with self._lock:
+            category = self._categories.get(error_signature)
+            if category is not None:
+                self._categories.move_to_end(error_signature)
+                self.stats['category_hits'] += 1
+            return category
+
+    def remember_category(self, error_signature: str, error_category: str):
+        with self._lock:
+            self._categories[error_signature] = error_category
+            self._categories.move_to_end(error_signature)
+            while len(self._categories) > self.max_categories:
+                self._categories.popitem(last=False)
+
+    # ------------------------------------------------------------ decisiones
+
+    def lookup(self, key: str) -> Optional[Tuple[str, float, Dict[str, Any]]]:
+        """
+        Consultar la tabla
+
+        Returns:
+            (estrategia, probabilidad de éxito, análisis memorizado) si la
+            decisión es fiable; None si no hay entrada o la confianza es baja
+        """
+        with self._lock:
+            self.stats['lookups'] += 1
+            entry = self._entries.get(key)
+            if entry is None or not entry.strategies:
+                self.stats['misses'] += 1
+                return None
+
+            # Solo compiten estrategias con resultados suficientes
+            best = entry.best_strategy(self.min_observations)
+            if best is None or best[1].success_probability < self.confidence_threshold:
+                self.stats['low_confidence'] += 1
+                return None
+
+            strategy, stats = best
+
+            self._entries.move_to_end(key)
+            entry.hits += 1
+            entry.last_used = time.time()
+            self.stats['hits'] += 1
+            return strategy, stats.success_probability, dict(entry.analysis)
+
+    def register_decision(self, key: str, tool: str, error_category: str, param_shape: str,
+                          strategy: str, prior: float, analysis: Dict[str, Any] = None):
+        """Registrar una estrategia elegida (por el LLM o por reglas) para una firma"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = StrategyCacheEntry(
+                    key=key,
+                    tool=tool,
+                    error_category=error_category,
+                    param_shape=param_shape
+                )
+                self._entries[key] = entry
+                self._evict_if_needed()
+            else:
+                self._entries.move_to_end(key)
+
+            entry.strategies.setdefault(strategy, StrategyStats(prior=prior))
+            if analysis:
+                entry.analysis = analysis
+            entry.last_used = time.time()
+
+    def record_outcome(self, key: str, strategy: str, success: bool, prior: float = 0.5):
+        """Actualizar en línea la probabilidad de éxito de una estrategia"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+            stats = entry.strategies.setdefault(strategy, StrategyStats(prior=prior))
+            stats.attempts += 1
+            if success:
+                stats.successes += 1
+            self.stats['outcomes_recorded'] += 1
+
+    def success_probability(self, key: str, strategy: str) -> Optional[float]:
+        entry = self._entries.get(key)
+        stats = entry.strategies.get(strategy) if entry else None
+        return stats.success_probability if stats and stats.attempts else None
+
+    def _evict_if_needed(self):
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats['evictions'] += 1
+
+    def top_entries(self, limit: int = 10):
+        with self._lock:
+            entries = sorted(self._entries.values(), key=lambda e: e.hits, reverse=True)
+            return [entry.to_dict() for entry in entries[:limit]]
+
+    def get_statistics(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.stats['lookups']
+            return {
+                **self.stats,
+                'entries': len(self._entries),
+                'categories': len(self._categories),
+                'hit_rate': self.stats['hits'] / lookups if lookups else 0.0
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._categories.clear()
+            for key in self.stats:
+                self.stats[key] = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
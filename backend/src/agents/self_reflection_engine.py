@@ -20,9 +20,10 @@ from typing import Dict, List, Any, Optional, Tuple
 from dataclasses import dataclass, field
 from enum import Enum
 import json
+import time
 import uuid
 import statistics
-from collections import defaultdict
+from collections import defaultdict, deque
 
 from src.tools.task_planner import ExecutionPlan, TaskStep, ExecutionStrategy
 from src.tools.execution_engine import ExecutionStrategy
@@ -59,6 +60,12 @@ class InsightType(Enum):
     STRATEGIC_INSIGHT = "strategic_insight"
     LEARNING_POINT = "learning_point"
 
+class ReflectionTier(Enum):
+    """Niveles de coste de reflexión"""
+    ARITHMETIC = "arithmetic"  # Tier 0: puntuación aritmética, sin LLM
+    BATCHED = "batched"        # Tier 1: resumen de varias tareas en una sola llamada LLM
+    FULL = "full"              # Tier 2: análisis completo por tarea
+
 @dataclass
 class ReflectionMetrics:
     """Métricas para reflexión"""
@@ -101,6 +108,7 @@ class ReflectionResult:
     strategic_recommendations: List[str]
     confidence_score: float
     timestamp: datetime
+    tier: str = "full"
 
 class SelfReflectionEngine:
     """Motor de auto-reflexión y metacognición"""
@@ -127,6 +135,15 @@ class SelfReflectionEngine:
         self.enable_metacognition = self.config.get('enable_metacognition', True)
         self.reflection_depth = self.config.get('reflection_depth', 'comprehensive')
         
+        # Configuración de reflexión por niveles
+        self.enable_tiered_reflection = self.config.get('enable_tiered_reflection', True)
+        self.tier1_complexity_threshold = self.config.get('tier1_complexity_threshold', 0.3)
+        self.tier2_complexity_threshold = self.config.get('tier2_complexity_threshold', 0.7)
+        self.tier2_min_success_rate = self.config.get('tier2_min_success_rate', 0.8)
+        self.tier2_min_errors = self.config.get('tier2_min_errors', 1)
+        self.batch_size = self.config.get('reflection_batch_size', 5)
+        self.batch_max_wait = self.config.get('reflection_batch_max_wait', 120)  # segundos
+        
         # Estadísticas
         self.reflections_performed = 0
         self.insights_generated = 0
@@ -141,74 +158,55 @@ class SelfReflectionEngine:
         # Cache de reflexiones recientes
         self.recent_reflections = {}
         
+        # Cola de reflexión por lotes (Tier 1)
+        self._pending_batch: List[Dict[str, Any]] = []
+        self._batch_flush_task: Optional[asyncio.Task] = None
+        self._batch_flush_sleeping = False
+        self.recent_batch_insights = deque(maxlen=20)
+        
+        # Coste por nivel de reflexión
+        self.tier_metrics = self._empty_tier_metrics()
+        
         logger.info("🧠 SelfReflectionEngine inicializado")
     
     async def reflect_on_task_execution(self, 
                                       execution_context: ExecutionContext,
-                                      additional_metrics: Dict[str, Any] = None) -> ReflectionResult:
+                                      additional_metrics: Dict[str, Any] = None,
+                                      tier: Optional[ReflectionTier] = None) -> ReflectionResult:
         """
         Reflexionar sobre la ejecución de una tarea
         
         Args:
             execution_context: Contexto de ejecución de la tarea
             additional_metrics: Métricas adicionales
+            tier: Forzar un nivel de reflexión (por defecto se selecciona automáticamente)
             
         Returns:
             Resultado de reflexión
         """
+        start_time = time.time()
         try:
             logger.info(f"🧠 Iniciando reflexión sobre tarea: {execution_context.task_id}")
             
             # Incrementar contador
             self.reflections_performed += 1
             
-            # 1. Recopilar métricas de ejecución
+            # 1. Recopilar métricas de ejecución (puramente aritmético)
             metrics = await self._collect_execution_metrics(execution_context, additional_metrics)
             
-            # 2. Analizar rendimiento por dimensiones
-            dimensional_scores = await self._analyze_performance_dimensions(execution_context, metrics)
-            
-            # 3. Generar insights usando LLM
-            insights = await self._generate_insights(execution_context, metrics, dimensional_scores)
-            
-            # 4. Realizar análisis de metacognición
-            metacognition_results = await self._perform_metacognition_analysis(execution_context, insights)
-            
-            # 5. Identificar patrones y aprendizajes
-            patterns = await self._identify_patterns(execution_context, insights)
-            
-            # 6. Calcular puntuación general
-            overall_score = await self._calculate_overall_performance(dimensional_scores, insights)
-            
-            # 7. Generar recomendaciones
-            recommendations = await self._generate_recommendations(insights, patterns)
-            
-            # 8. Crear resultado de reflexión
-            reflection_result = ReflectionResult(
-                task_id=execution_context.task_id,
-                reflection_id=str(uuid.uuid4()),
-                overall_performance_score=overall_score,
-                dimensional_scores=dimensional_scores,
-                insights=insights,
-                learning_points=metacognition_results.get('learning_points', []),
-                improvement_actions=recommendations.get('improvement_actions', []),
-                strengths_identified=recommendations.get('strengths', []),
-                weaknesses_identified=recommendations.get('weaknesses', []),
-                strategic_recommendations=recommendations.get('strategic', []),
-                confidence_score=self._calculate_confidence(insights),
-                timestamp=datetime.now()
-            )
-            
-            # 9. Registrar en memoria para aprendizaje
-            await self._record_reflection_in_memory(reflection_result)
+            # 2. Seleccionar nivel de reflexión según fallos y complejidad
+            tier = tier or self._select_reflection_tier(metrics)
             
-            # 10. Actualizar estadísticas
-            await self._update_statistics(reflection_result)
+            if tier == ReflectionTier.FULL:
+                reflection_result = await self._perform_full_reflection(execution_context, metrics)
+            else:
+                reflection_result = await self._perform_arithmetic_reflection(execution_context, metrics, tier)
+                if tier == ReflectionTier.BATCHED:
+                    self._enqueue_batched_reflection(execution_context, metrics, reflection_result)
             
-            # 11. Aplicar mejoras automáticas si es posible
-            await self._apply_automatic_improvements(reflection_result)
+            self._record_tier_cost(tier, time.time() - start_time)
             
-            logger.info(f"✅ Reflexión completada con score: {overall_score:.2f}")
+            logger.info(f"✅ Reflexión ({tier.value}) completada con score: {reflection_result.overall_performance_score:.2f}")
             return reflection_result
             
         except Exception as e:
@@ -229,6 +227,279 @@ class SelfReflectionEngine:
                 timestamp=datetime.now()
             )
     
+    def _select_reflection_tier(self, metrics: ReflectionMetrics) -> ReflectionTier:
+        """Seleccionar el nivel de reflexión más barato adecuado para la tarea"""
+        
+        if not self.enable_tiered_reflection:
+            return ReflectionTier.FULL
+        
+        is_failure = (metrics.error_count >= self.tier2_min_errors or
+                      metrics.success_rate < self.tier2_min_success_rate)
+        is_complex = metrics.complexity_score >= self.tier2_complexity_threshold
+        
+        if (is_failure or is_complex) and self.enable_deep_reflection:
+            return ReflectionTier.FULL
+        
+        if (is_failure or is_complex or metrics.retries_used > 0 or
+                metrics.complexity_score >= self.tier1_complexity_threshold):
+            return ReflectionTier.BATCHED
+        
+        return ReflectionTier.ARITHMETIC
+    
+    async def _perform_full_reflection(self, 
+                                     execution_context: ExecutionContext,
+                                     metrics: ReflectionMetrics) -> ReflectionResult:
+        """Reflexión completa (Tier 2): análisis LLM, metacognición y registro en memoria"""
+        
+        # Analizar rendimiento por dimensiones
+        dimensional_scores = await self._analyze_performance_dimensions(execution_context, metrics)
+        
+        # Generar insights usando LLM
+        insights = await self._generate_insights(execution_context, metrics, dimensional_scores)
+        
+        # Realizar análisis de metacognición
+        metacognition_results = await self._perform_metacognition_analysis(execution_context, insights)
+        
+        # Identificar patrones y aprendizajes
+        patterns = await self._identify_patterns(execution_context, insights)
+        
+        # Calcular puntuación general
+        overall_score = await self._calculate_overall_performance(dimensional_scores, insights)
+        
+        # Generar recomendaciones
+        recommendations = await self._generate_recommendations(insights, patterns)
+        
+        # Crear resultado de reflexión
+        reflection_result = ReflectionResult(
+            task_id=execution_context.task_id,
+            reflection_id=str(uuid.uuid4()),
+            overall_performance_score=overall_score,
+            dimensional_scores=dimensional_scores,
+            insights=insights,
+            learning_points=metacognition_results.get('learning_points', []),
+            improvement_actions=recommendations.get('improvement_actions', []),
+            strengths_identified=recommendations.get('strengths', []),
+            weaknesses_identified=recommendations.get('weaknesses', []),
+            strategic_recommendations=recommendations.get('strategic', []),
+            confidence_score=self._calculate_confidence(insights),
+            timestamp=datetime.now(),
+            tier=ReflectionTier.FULL.value
+        )
+        
+        # Registrar en memoria para aprendizaje
+        await self._record_reflection_in_memory(reflection_result)
+        
+        # Actualizar estadísticas
+        await self._update_statistics(reflection_result)
+        
+        # Aplicar mejoras automáticas si es posible
+        await self._apply_automatic_improvements(reflection_result)
+        
+        return reflection_result
+    
+    async def _perform_arithmetic_reflection(self, 
+                                           execution_context: ExecutionContext,
+                                           metrics: ReflectionMetrics,
+                                           tier: ReflectionTier) -> ReflectionResult:
+        """Reflexión barata (Tier 0/1): puntuación aritmética e insights por reglas, sin LLM"""
+        
+        dimensional_scores = await self._analyze_performance_dimensions(execution_context, metrics)
+        insights = self._generate_fallback_insights(dimensional_scores)
+        patterns = await self._identify_patterns(execution_context, insights)
+        overall_score = await self._calculate_overall_performance(dimensional_scores, insights)
+        recommendations = await self._generate_recommendations(insights, patterns)
+        
+        reflection_result = ReflectionResult(
+            task_id=execution_context.task_id,
+            reflection_id=str(uuid.uuid4()),
+            overall_performance_score=overall_score,
+            dimensional_scores=dimensional_scores,
+            insights=insights,
+            learning_points=[],
+            improvement_actions=recommendations.get('improvement_actions', []),
+            strengths_identified=recommendations.get('strengths', []),
+            weaknesses_identified=recommendations.get('weaknesses', []),
+            strategic_recommendations=recommendations.get('strategic', []),
+            confidence_score=self._calculate_confidence(insights),
+            timestamp=datetime.now(),
+            tier=tier.value
+        )
+        
+        await self._update_statistics(reflection_result)
+        return reflection_result
+    
+    def _enqueue_batched_reflection(self, 
+                                  execution_context: ExecutionContext,
+                                  metrics: ReflectionMetrics,
+                                  reflection_result: ReflectionResult):
+        """Encolar el resumen de una tarea para la reflexión por lotes (Tier 1)"""
+        
+        weak_dimensions = [
+            dim.value for dim, score in reflection_result.dimensional_scores.items() if score < 0.6
+        ]
+        self._pending_batch.append({
+            'task_id': execution_context.task_id,
+            'title': execution_context.execution_plan.title,
+            'strategy': execution_context.execution_plan.strategy.value,
+            'total_steps': len(execution_context.step_executions),
+            'success_rate': metrics.success_rate,
+            'execution_time': metrics.execution_time,
+            'retries_used': metrics.retries_used,
+            'complexity_score': metrics.complexity_score,
+            'overall_score': reflection_result.overall_performance_score,
+            'weak_dimensions': weak_dimensions
+        })
+        
+        if len(self._pending_batch) >= self.batch_size:
+            self._schedule_batch_flush(delay=0.0)
+        elif self._batch_flush_task is None or self._batch_flush_task.done():
+            self._schedule_batch_flush(delay=self.batch_max_wait)
+    
+    def _schedule_batch_flush(self, delay: float):
+        """Programar el vaciado del lote en segundo plano"""
+        
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        
+        if self._batch_flush_task is not None and not self._batch_flush_task.done():
+            # Solo se cancela una tarea que aún espera: si ya está vaciando el
+            # lote, recogerá las reflexiones nuevas al terminar
+            if delay > 0 or not self._batch_flush_sleeping:
+                return
+            self._batch_flush_task.cancel()
+        
+        self._batch_flush_sleeping = delay > 0
+        self._batch_flush_task = loop.create_task(self._flush_after_delay(delay))
+    
+    async def _flush_after_delay(self, delay: float):
+        while True:
+            if delay > 0:
+                try:
+                    await asyncio.sleep(delay)
+                finally:
+                    self._batch_flush_sleeping = False
+            await self.flush_batched_reflections()
+            
+            if not self._pending_batch:
+                return
+            delay = 0.0 if len(self._pending_batch) >= self.batch_size else self.batch_max_wait
+            self._batch_flush_sleeping = delay > 0
+    
+    async def flush_batched_reflections(self) -> List[ReflectionInsight]:
+        """
+        Resumir en una sola llamada LLM todas las tareas pendientes del lote
+        
+        Returns:
+            Insights de nivel sesión generados para el lote
+        """
+        if not self._pending_batch:
+            return []
+        
+        batch, self._pending_batch = self._pending_batch, []
+        start_time = time.time()
+        insights = []
+        
+        try:
+            response = await self._call_llm(self._build_batch_prompt(batch), {
+                'max_tokens': 1000,
+                'temperature': 0.4,
+                'task_type': 'reflection_batch_analysis'
+            }, ReflectionTier.BATCHED)
+            
+            if response.get('error'):
+                logger.warning(f"Error en análisis LLM por lotes: {response['error']}")
+                return []
+            
+            task_ids = [entry['task_id'] for entry in batch]
+            for insight_data in self._parse_llm_insights(response.get('response', '')):
+                insights.append(ReflectionInsight(
+                    id=str(uuid.uuid4()),
+                    type=InsightType(insight_data.get('type', 'learning_point')),
+                    dimension=ReflectionDimension(insight_data.get('dimension', 'task_quality')),
+                    level=ReflectionLevel.SESSION_LEVEL,
+                    title=insight_data.get('title', 'Insight'),
+                    description=insight_data.get('description', ''),
+                    confidence=insight_data.get('confidence', 0.5),
+                    actionable_recommendations=insight_data.get('recommendations', []),
+                    supporting_evidence=insight_data.get('evidence', []) + [f"Tareas: {', '.join(task_ids)}"],
+                    priority=insight_data.get('priority', 0.5),
+                    timestamp=datetime.now()
+                ))
+            
+            self.insights_generated += len(insights)
+            await self._store_insights_in_memory(insights)
+            self.recent_batch_insights.append({
+                'timestamp': datetime.now(),
+                'task_ids': task_ids,
+                'insights': insights
+            })
+            logger.info(f"🧠 Reflexión por lotes completada: {len(batch)} tareas, {len(insights)} insights")
+            
+        except Exception as e:
+            logger.warning(f"Error en reflexión por lotes: {str(e)}")
+        
+        finally:
+            tier_stats = self.tier_metrics[ReflectionTier.BATCHED.value]
+            tier_stats['batches_flushed'] += 1
+            tier_stats['tasks_batched'] += len(batch)
+            tier_stats['total_time'] += time.time() - start_time
+        
+        return insights
+    
+    def _build_batch_prompt(self, batch: List[Dict[str, Any]]) -> str:
+        """Construir prompt compacto que resume varias tareas completadas"""
+        
+        tasks_text = '\n'.join([
+            f"- [{entry['task_id']}] {entry['title']} | estrategia={entry['strategy']} | "
+            f"pasos={entry['total_steps']} | éxito={entry['success_rate']:.2f} | "
+            f"tiempo={entry['execution_time']:.1f}s | reintentos={entry['retries_used']} | "
+            f"complejidad={entry['complexity_score']:.2f} | score={entry['overall_score']:.2f} | "
+            f"débiles={','.join(entry['weak_dimensions']) or 'ninguna'}"
+            for entry in batch
+        ])
+        
+        return f"""
+Analiza en conjunto estas {len(batch)} tareas completadas recientemente y extrae
+patrones comunes, no comentarios individuales:
+
+**TAREAS:**
+{tasks_text}
+
+Responde en formato JSON con un array de insights:
+{{
+  "insights": [
+    {{
+      "type": "improvement_opportunity|success_pattern|failure_pattern|efficiency_gain|strategic_insight|learning_point",
+      "dimension": "task_quality|execution_efficiency|resource_utilization|error_handling|learning_outcomes|user_satisfaction|strategic_thinking|adaptability",
+      "title": "Título del insight",
+      "description": "Descripción detallada",
+      "confidence": 0.8,
+      "recommendations": ["Recomendación 1"],
+      "evidence": ["Evidencia 1"],
+      "priority": 0.7
+    }}
+  ]
+}}
+"""
+    
+    async def _call_llm(self, prompt: str, options: Dict[str, Any], tier: ReflectionTier) -> Dict[str, Any]:
+        """Llamar al LLM sin bloquear el event loop y contabilizar el coste por nivel"""
+        
+        self.tier_metrics[tier.value]['llm_calls'] += 1
+        
+        if asyncio.iscoroutinefunction(self.ollama_service.generate_response):
+            return await self.ollama_service.generate_response(prompt, options)
+        
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.ollama_service.generate_response, prompt, options)
+    
+    def _record_tier_cost(self, tier: ReflectionTier, elapsed: float):
+        tier_stats = self.tier_metrics[tier.value]
+        tier_stats['reflections'] += 1
+        tier_stats['total_time'] += elapsed
+    
     async def _collect_execution_metrics(self, 
                                        context: ExecutionContext,
                                        additional_metrics: Dict[str, Any] = None) -> ReflectionMetrics:
@@ -320,11 +591,11 @@ class SelfReflectionEngine:
             prompt = self._build_insight_prompt(context, metrics, dimensional_scores)
             
             # Generar análisis con LLM
-            response = await self.ollama_service.generate_response(prompt, {
+            response = await self._call_llm(prompt, {
                 'max_tokens': 1000,
                 'temperature': 0.4,
                 'task_type': 'reflection_analysis'
-            })
+            }, ReflectionTier.FULL)
             
             if response.get('error'):
                 logger.warning(f"Error en análisis LLM: {response['error']}")
@@ -787,26 +1058,31 @@ Responde en formato JSON con un array de insights:
                 logger.info("🧠 Reflexión almacenada en memoria episódica")
             
             # También almacenar insights como conocimiento semántico
-            for insight in reflection_result.insights:
-                fact_id = f"insight_{insight.dimension.value}_{insight.type.value}"
-                await self.memory_manager.semantic_memory.store_fact(
-                    fact_id,
-                    {
-                        'insight_type': insight.type.value,
-                        'dimension': insight.dimension.value,
-                        'title': insight.title,
-                        'description': insight.description,
-                        'recommendations': insight.actionable_recommendations,
-                        'confidence': insight.confidence,
-                        'priority': insight.priority
-                    },
-                    source="self_reflection_engine",
-                    confidence=insight.confidence
-                )
+            await self._store_insights_in_memory(reflection_result.insights)
             
         except Exception as e:
             logger.warning(f"Error almacenando reflexión en memoria: {str(e)}")
     
+    async def _store_insights_in_memory(self, insights: List[ReflectionInsight]):
+        """Almacenar insights como conocimiento semántico"""
+        
+        for insight in insights:
+            fact_id = f"insight_{insight.dimension.value}_{insight.type.value}"
+            await self.memory_manager.semantic_memory.store_fact(
+                fact_id,
+                {
+                    'insight_type': insight.type.value,
+                    'dimension': insight.dimension.value,
+                    'title': insight.title,
+                    'description': insight.description,
+                    'recommendations': insight.actionable_recommendations,
+                    'confidence': insight.confidence,
+                    'priority': insight.priority
+                },
+                source="self_reflection_engine",
+                confidence=insight.confidence
+            )
+    
     async def _update_statistics(self, reflection_result: ReflectionResult):
         """Actualizar estadísticas del motor"""
         
@@ -998,9 +1274,39 @@ Responde en formato JSON con un array de insights:
                 'min_reflection_interval': self.min_reflection_interval,
                 'enable_deep_reflection': self.enable_deep_reflection,
                 'enable_metacognition': self.enable_metacognition,
-                'reflection_depth': self.reflection_depth
+                'reflection_depth': self.reflection_depth,
+                'enable_tiered_reflection': self.enable_tiered_reflection,
+                'tier1_complexity_threshold': self.tier1_complexity_threshold,
+                'tier2_complexity_threshold': self.tier2_complexity_threshold,
+                'tier2_min_success_rate': self.tier2_min_success_rate,
+                'reflection_batch_size': self.batch_size,
+                'reflection_batch_max_wait': self.batch_max_wait
+            },
+            'tier_metrics': self.get_tier_metrics()
+        }
+    
+    def get_tier_metrics(self) -> Dict[str, Any]:
+        """Obtener métricas de coste por nivel de reflexión"""
+        
+        tiers = {}
+        for tier, tier_stats in self.tier_metrics.items():
+            reflections = tier_stats['reflections']
+            tiers[tier] = {
+                **tier_stats,
+                'average_time': tier_stats['total_time'] / reflections if reflections else 0.0,
+                'llm_calls_per_reflection': tier_stats['llm_calls'] / reflections if reflections else 0.0
             }
+        tiers['pending_batch_size'] = len(self._pending_batch)
+        return tiers
+    
+    @staticmethod
+    def _empty_tier_metrics() -> Dict[str, Dict[str, Any]]:
+        metrics = {
+            tier.value: {'reflections': 0, 'llm_calls': 0, 'total_time': 0.0}
+            for tier in ReflectionTier
         }
+        metrics[ReflectionTier.BATCHED.value].update({'batches_flushed': 0, 'tasks_batched': 0})
+        return metrics
     
     def _calculate_performance_trend(self) -> str:
         """Calcular tendencia de rendimiento"""
@@ -1031,4 +1337,5 @@ Responde en formato JSON con un array de insights:
         self.success_patterns.clear()
         self.failure_patterns.clear()
         self.improvement_history.clear()
+        self.tier_metrics = self._empty_tier_metrics()
         logger.info("🧠 Estadísticas de reflexión reseteadas")
\ No newline at end of file
@@ -12,6 +12,7 @@ Características clave:
 - Recomendaciones para prevención
 - Integración con sistema de memoria
 - Métricas de calidad de análisis
+- Índice de firmas para errores repetidos (sin nueva llamada al LLM)
 """
 
 import asyncio
@@ -33,6 +34,7 @@ if TYPE_CHECKING:
 
 from src.memory.advanced_memory_manager import AdvancedMemoryManager
 from src.services.ollama_service import OllamaService
+from src.analysis.error_fingerprint_index import ErrorFingerprintIndex
 
 logger = logging.getLogger(__name__)
 
@@ -112,6 +114,7 @@ class ErrorAnalysisResult:
     similar_errors: List[Dict[str, Any]]
     confidence_score: float
     analysis_depth: AnalysisDepth
+    signature_id: Optional[str] = None
     
 class ErrorAnalyzer:
     """Analizador sofisticado de errores"""
@@ -138,17 +141,23 @@ class ErrorAnalyzer:
         self.enable_llm_analysis = self.config.get('enable_llm_analysis', True)
         self.max_similar_errors = self.config.get('max_similar_errors', 5)
         self.confidence_threshold = self.config.get('confidence_threshold', 0.7)
+        self.reuse_cached_analysis = self.config.get('reuse_cached_analysis', True)
         
         # Estadísticas
         self.analyses_performed = 0
         self.patterns_detected = 0
         self.root_causes_found = 0
         self.prevention_success_rate = 0.0
+        self.llm_analyses_skipped = 0
         
         # Bases de conocimiento
         self.error_patterns = defaultdict(int)
         self.error_signatures = {}
         self.recovery_success_rates = {}
+        self.fingerprint_index = ErrorFingerprintIndex(
+            max_signatures=self.config.get('max_error_signatures', 10000),
+            similarity_threshold=self.config.get('similarity_threshold', 0.5)
+        )
         
         # Reglas de análisis
         self.analysis_rules = self._initialize_analysis_rules()
@@ -181,8 +190,16 @@ class ErrorAnalyzer:
             # 3. Buscar errores similares
             similar_errors = await self._find_similar_errors(error_context)
             
-            # 4. Analizar causas raíz
-            root_causes = await self._analyze_root_causes(error_context, similar_errors)
+            # Registrar la ocurrencia tras las búsquedas: el error actual no
+            # cuenta como similar a sí mismo ni en su propio patrón
+            signature, _ = self.fingerprint_index.record(
+                error_context.error_message, error_context.error_type
+            )
+            
+            # 4. Analizar causas raíz (reutilizando el análisis de la firma si existe)
+            root_causes = await self._analyze_root_causes(
+                error_context, similar_errors, signature.signature_id
+            )
             
             # 5. Identificar causas inmediatas
             immediate_causes = await self._identify_immediate_causes(error_context)
@@ -223,7 +240,8 @@ class ErrorAnalyzer:
                 recovery_strategies=recovery_strategies,
                 similar_errors=similar_errors,
                 confidence_score=confidence_score,
-                analysis_depth=self.analysis_depth
+                analysis_depth=self.analysis_depth,
+                signature_id=signature.signature_id
             )
             
             # 12. Registrar en memoria
@@ -315,12 +333,12 @@ class ErrorAnalyzer:
         if not self.enable_pattern_detection:
             return ErrorPattern.SYSTEMATIC
         
-        # Analizar historial de errores similares
-        error_signature = self._create_error_signature(error_context)
+        # Analizar historial de errores con la misma firma normalizada
+        signature = self.fingerprint_index.lookup(error_context.error_message, error_context.error_type)
         
         # Contar ocurrencias
-        if error_signature in self.error_signatures:
-            occurrence_count = self.error_signatures[error_signature]
+        if signature is not None:
+            occurrence_count = signature.count
             
             # Determinar patrón basado en frecuencia
             if occurrence_count > 5:
@@ -342,6 +360,24 @@ class ErrorAnalyzer:
         
         return ErrorPattern.SYSTEMATIC
     
+    def record_recovery_outcome(self, error_message: str, error_type: str,
+                                strategy: str, success: bool):
+        """
+        Registrar el resultado de una estrategia de recuperación
+        
+        Args:
+            error_message: Mensaje del error recuperado
+            error_type: Tipo de error original
+            strategy: Estrategia aplicada
+            success: Si la recuperación tuvo éxito
+        """
+        signature = self.fingerprint_index.lookup(error_message, error_type)
+        if signature is None:
+            signature, _ = self.fingerprint_index.record(error_message, error_type)
+        
+        self.fingerprint_index.record_recovery(signature.signature_id, strategy, success)
+        self.recovery_success_rates[signature.signature_id] = signature.recovery_success_rate
+    
     def _create_error_signature(self, error_context: ErrorContext) -> str:
         """Crear firma única del error"""
         
@@ -355,10 +391,31 @@ class ErrorAnalyzer:
         return '_'.join(elements)
     
     async def _find_similar_errors(self, error_context: ErrorContext) -> List[Dict[str, Any]]:
-        """Buscar errores similares en memoria"""
+        """Buscar errores similares en el índice de firmas y, si no hay, en memoria"""
         
         similar_errors = []
         
+        # Buscar en el índice de firmas (historial completo, sin E/S)
+        for signature, similarity in self.fingerprint_index.find_similar(
+            error_context.error_message,
+            error_context.error_type,
+            limit=self.max_similar_errors
+        ):
+            best_strategy = signature.best_recovery_strategy()
+            similar_errors.append({
+                'signature_id': signature.signature_id,
+                'error_type': signature.error_type,
+                'template': signature.template,
+                'occurrences': signature.count,
+                'solution': best_strategy[0] if best_strategy else 'No solution recorded',
+                'success_rate': signature.recovery_success_rate,
+                'timestamp': datetime.fromtimestamp(signature.last_seen).isoformat(),
+                'similarity_score': similarity
+            })
+        
+        if similar_errors:
+            return similar_errors
+        
         try:
             # Buscar en memoria semántica
             if self.memory_manager.is_initialized:
@@ -386,15 +443,28 @@ class ErrorAnalyzer:
     
     async def _analyze_root_causes(self, 
                                  error_context: ErrorContext,
-                                 similar_errors: List[Dict[str, Any]]) -> List[RootCause]:
+                                 similar_errors: List[Dict[str, Any]],
+                                 signature_id: str = None) -> List[RootCause]:
         """Analizar causas raíz del error"""
         
         root_causes = []
         
-        # Análisis usando LLM si está habilitado
+        # Análisis usando LLM si está habilitado, salvo que la firma ya tenga uno
         if self.enable_llm_analysis:
-            llm_causes = await self._analyze_root_causes_with_llm(error_context, similar_errors)
-            root_causes.extend(llm_causes)
+            cached = self.fingerprint_index.get_cached_analysis(signature_id) if signature_id else None
+            
+            if cached is not None and self.reuse_cached_analysis:
+                self.llm_analyses_skipped += 1
+                logger.info(f"♻️ Reutilizando análisis LLM de la firma {signature_id}")
+                root_causes.extend(cached.get('llm_root_causes', []))
+            else:
+                llm_causes = await self._analyze_root_causes_with_llm(error_context, similar_errors)
+                root_causes.extend(llm_causes)
+                if signature_id:
+                    self.fingerprint_index.store_analysis(signature_id, {
+                        'llm_root_causes': llm_causes,
+                        'analyzed_at': datetime.now().isoformat()
+                    })
         
         # Análisis basado en reglas
         rule_causes = await self._analyze_root_causes_with_rules(error_context)
@@ -911,6 +981,7 @@ Responde en formato JSON:
                 'type': 'error_analysis',
                 'timestamp': analysis_result.analysis_timestamp.isoformat(),
                 'error_id': analysis_result.error_id,
+                'signature_id': analysis_result.signature_id,
                 'error_type': analysis_result.error_type.value,
                 'error_severity': analysis_result.error_severity.value,
                 'error_pattern': analysis_result.error_pattern.value,
@@ -1011,6 +1082,8 @@ Responde en formato JSON:
             'error_patterns': dict(self.error_patterns),
             'most_common_error_type': max(self.error_patterns.keys(), key=self.error_patterns.get) if self.error_patterns else None,
             'error_signatures_count': len(self.error_signatures),
+            'llm_analyses_skipped': self.llm_analyses_skipped,
+            'fingerprint_index': self.fingerprint_index.get_statistics(),
             'analysis_rules_count': len(self.analysis_rules),
             'configuration': {
                 'analysis_depth': self.analysis_depth.value,
@@ -1026,6 +1099,7 @@ Responde en formato JSON:
         self.patterns_detected = 0
         self.root_causes_found = 0
         self.prevention_success_rate = 0.0
+        self.llm_analyses_skipped = 0
         self.error_patterns.clear()
         self.error_signatures.clear()
         self.recovery_success_rates.clear()
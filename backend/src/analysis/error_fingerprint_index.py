@@ -0,0 +1,341 @@
+"""
+ErrorFingerprintIndex - Índice de Firmas de Errores para Mitosis V5
+===================================================================
+
+Indexa el historial completo de errores por firma normalizada para que el
+análisis de errores repetidos no dependa de búsquedas lineales ni de nuevas
+llamadas al LLM.
+
+Características clave:
+- Normalización de mensajes a plantillas (números, rutas, URLs, ids enmascarados)
+- Búsqueda exacta O(1) por huella de la plantilla
+- Búsqueda de casi-duplicados con MinHash + LSH por bandas
+- Tasas de éxito de recuperación agregadas por firma y estrategia
+- Caché del análisis de causa raíz por firma
+"""
+
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+# Patrones de enmascarado, aplicados en orden (de más a menos específico)
+_MASK_PATTERNS = [
+    (re.compile(r'https?://\S+'), '<url>'),
+    (re.compile(r'[\w.+-]+@[\w-]+\.[\w.-]+'), '<email>'),
+    (re.compile(r'\b[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}\b', re.I), '<uuid>'),
+    (re.compile(r'(?:[A-Za-z]:)?(?:[\\/][\w.\-]+){2,}[\\/]?'), '<path>'),
+    (re.compile(r'\b0x[0-9a-f]+\b', re.I), '<hex>'),
+    (re.compile(r'\b[0-9a-f]{12,}\b', re.I), '<id>'),
+    (re.compile(r'\b\d+(?:\.\d+)?\b'), '<num>'),
+    (re.compile(r"'[^']{1,200}'"), "'<str>'"),
+    (re.compile(r'"[^"]{1,200}"'), '"<str>"'),
+    (re.compile(r'\s+'), ' '),
+]
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+
+def normalize_error_message(error_message: str) -> str:
+    """Convertir un mensaje de error en una plantilla estable"""
+    template = (error_message or '').strip()
+    for pattern, replacement in _MASK_PATTERNS:
+        template = pattern.sub(replacement, template)
+    return template.lower()[:500]
+
+
+@dataclass
+class ErrorSignatureRecord:
+    """Historial agregado de una firma de error"""
+    signature_id: str
+    error_type: str
+    template: str
+    minhash: Tuple[int, ...]
+    count: int = 0
+    first_seen: float = field(default_factory=time.time)
+    last_seen: float = field(default_factory=time.time)
+    examples: deque = field(default_factory=lambda: deque(maxlen=3))
+    recovery_attempts: Dict[str, int] = field(default_factory=dict)
+    recovery_successes: Dict[str, int] = field(default_factory=dict)
+    cached_analysis: Optional[Dict[str, Any]] = None
+
+    @property
+    def recovery_success_rate(self) -> float:
+        attempts = sum(self.recovery_attempts.values())
+        if not attempts:
+            return 0.0
+        return sum(self.recovery_successes.values()) / attempts
+
+    def best_recovery_strategy(self) -> Optional[Tuple[str, float]]:
+        """Estrategia con mejor tasa de éxito observada (suavizado de Laplace)"""
+        best = None
+        for strategy, attempts in self.recovery_attempts.items():
+            rate = (self.recovery_successes.get(strategy, 0) + 1) / (attempts + 2)
+            if best is None or rate > best[1]:
+                best = (strategy, rate)
+        return best
+
+    def to_dict(self) -> Dict[str, Any]:
+        best = self.best_recovery_strategy()
+        return {
+            'signature_id': self.signature_id,
+            'error_type': self.error_type,
+            'template': self.template,
+            'count': self.count,
+            'first_seen': self.first_seen,
+            'last_seen': self.last_seen,
+            'examples': list(self.examples),
+            'recovery_success_rate': self.recovery_success_rate,
+            'recovery_attempts': dict(self.recovery_attempts),
+            'recovery_successes': dict(self.recovery_successes),
+            'best_recovery_strategy': best[0] if best else None,
+            'has_cached_analysis': self.cached_analysis is not None
+        }
+
+
+class ErrorFingerprintIndex:
+    """Índice de firmas de errores con búsqueda exacta y aproximada"""
+
+    def __init__(self, num_perm: int = 64, bands: int = None, shingle_size: int = 3,
+                 max_signatures: int = 10000, similarity_threshold: float = 0.5):
+        """
+        Inicializar índice
+
+        Args:
+            num_perm: Número de permutaciones MinHash (debe ser múltiplo de bands)
+            bands: Número de bandas LSH; umbral efectivo ~ (1/bands)^(bands/num_perm).
+                   Por defecto se deriva de similarity_threshold
+            shingle_size: Tamaño de los n-gramas de palabras
+            max_signatures: Firmas retenidas (desalojo LRU)
+            similarity_threshold: Similitud Jaccard estimada mínima
+        """
+        if bands is None:
+            bands = self.bands_for_threshold(num_perm, similarity_threshold)
+        if num_perm % bands != 0:
+            raise ValueError("num_perm must be a multiple of bands")
+
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        self.max_signatures = max_signatures
+        self.similarity_threshold = similarity_threshold
+
+        # Coeficientes deterministas de las permutaciones (a*x + b) mod p
+        seed = hashlib.sha256(b'mitosis-error-minhash').digest()
+        self._perms = []
+        for i in range(num_perm):
+            digest = hashlib.blake2b(seed + i.to_bytes(4, 'big'), digest_size=16).digest()
+            a = int.from_bytes(digest[:8], 'big') % (_MERSENNE_PRIME - 1) + 1
+            b = int.from_bytes(digest[8:], 'big') % _MERSENNE_PRIME
+            self._perms.append((a, b))
+
+        self._records: "OrderedDict[str, ErrorSignatureRecord]" = OrderedDict()
+        self._buckets: Dict[Tuple[int, Tuple[int, ...]], set] = {}
+        self._lock = threading.RLock()
+
+        self.stats = {
+            'lookups': 0,
+            'exact_hits': 0,
+            'near_hits': 0,
+            'misses': 0,
+            'evictions': 0
+        }
+
+    @staticmethod
+    def bands_for_threshold(num_perm: int, threshold: float) -> int:
+        """
+        Bandas cuyo umbral LSH (1/bands)^(bands/num_perm) es el mayor que no
+        supera threshold: con menos bandas (filas más largas) los pares con
+        similitud cercana a threshold casi nunca coinciden en un cubo
+        """
+        options = [bands for bands in range(1, num_perm + 1) if num_perm % bands == 0]
+        reachable = [bands for bands in options if (1 / bands) ** (bands / num_perm) <= threshold]
+        return min(reachable) if reachable else num_perm
+
+    @property
+    def lsh_threshold(self) -> float:
+        """Similitud a partir de la cual dos firmas suelen compartir un cubo"""
+        return (1 / self.bands) ** (1 / self.rows)
+
+    # ------------------------------------------------------------ hashing
+
+    def fingerprint(self, error_message: str, error_type: str = '') -> Tuple[str, str]:
+        """Devolver (signature_id, plantilla) de un error"""
+        template = normalize_error_message(error_message)
+        signature_id = hashlib.sha1(f"{error_type}|{template}".encode('utf-8')).hexdigest()[:16]
+        return signature_id, template
+
+    def _shingles(self, template: str) -> set:
+        tokens = re.findall(r'<\w+>|\w+', template)
+        if len(tokens) < self.shingle_size:
+            return {' '.join(tokens)} if tokens else {''}
+        return {
+            ' '.join(tokens[i:i + self.shingle_size])
+            for i in range(len(tokens) - self.shingle_size + 1)
+        }
+
+    def _minhash(self, template: str) -> Tuple[int, ...]:
+        hashes = [
+            int.from_bytes(hashlib.blake2b(s.encode('utf-8'), digest_size=4).digest(), 'big')
+            for s in self._shingles(template)
+        ]
+        return tuple(
+            min(((a * h + b) % _MERSENNE_PRIME) & _MAX_HASH for h in hashes)
+            for a, b in self._perms
+        )
+
+    def _band_keys(self, minhash: Tuple[int, ...]):
+        for band in range(self.bands):
+            yield band, minhash[band * self.rows:(band + 1) * self.rows]
+
+    @staticmethod
+    def _estimate_similarity(a: Tuple[int, ...], b: Tuple[int, ...]) -> float:
+        return sum(1 for x, y in zip(a, b) if x == y) / len(a)
+
+    # ------------------------------------------------------------ records
+
+    def record(self, error_message: str, error_type: str = '') -> Tuple[ErrorSignatureRecord, bool]:
+        """
+        Registrar una ocurrencia de error
+
+        Returns:
+            (registro de la firma, True si la firma es nueva)
+        """
+        signature_id, template = self.fingerprint(error_message, error_type)
+        now = time.time()
+
+        with self._lock:
+            record = self._records.get(signature_id)
+            is_new = record is None
+
+            if is_new:
+                record = ErrorSignatureRecord(
+                    signature_id=signature_id,
+                    error_type=error_type,
+                    template=template,
+                    minhash=self._minhash(template),
+                    first_seen=now
+                )
+                self._records[signature_id] = record
+                for key in self._band_keys(record.minhash):
+                    self._buckets.setdefault(key, set()).add(signature_id)
+                self._evict_if_needed()
+            else:
+                self._records.move_to_end(signature_id)
+
+            record.count += 1
+            record.last_seen = now
+            record.examples.append((error_message or '')[:200])
+
+        return record, is_new
+
+    def get(self, signature_id: str) -> Optional[ErrorSignatureRecord]:
+        return self._records.get(signature_id)
+
+    def lookup(self, error_message: str, error_type: str = '') -> Optional[ErrorSignatureRecord]:
+        """Búsqueda exacta por firma sin registrar ocurrencia"""
+        signature_id, _ = self.fingerprint(error_message, error_type)
+        return self._records.get(signature_id)
+
+    def find_similar(self, error_message: str, error_type: str = None, limit: int = 5,
+                     threshold: float = None) -> List[Tuple[ErrorSignatureRecord, float]]:
+        """
+        Buscar firmas casi-duplicadas mediante LSH
+
+        Args:
+            error_message: Mensaje de error
+            error_type: Si se indica, restringe a firmas del mismo tipo
+            limit: Máximo de resultados
+            threshold: Similitud mínima (por defecto la del índice)
+
+        Returns:
+            Lista de (registro, similitud estimada) ordenada por similitud
+        """
+        threshold = self.similarity_threshold if threshold is None else threshold
+        signature_id, template = self.fingerprint(error_message, error_type or '')
+
+        with self._lock:
+            self.stats['lookups'] += 1
+
+            exact = self._records.get(signature_id)
+            minhash = exact.minhash if exact else self._minhash(template)
+
+            candidates = set()
+            for key in self._band_keys(minhash):
+                candidates.update(self._buckets.get(key, ()))
+
+            results = []
+            for candidate_id in candidates:
+                record = self._records.get(candidate_id)
+                if record is None or (error_type and record.error_type != error_type):
+                    continue
+                similarity = 1.0 if candidate_id == signature_id else self._estimate_similarity(minhash, record.minhash)
+                if similarity >= threshold:
+                    results.append((record, similarity))
+
+            if exact:
+                self.stats['exact_hits'] += 1
+            elif results:
+                self.stats['near_hits'] += 1
+            else:
+                self.stats['misses'] += 1
+
+        results.sort(key=lambda item: (item[1], item[0].count), reverse=True)
+        return results[:limit]
+
+    def record_recovery(self, signature_id: str, strategy: str, success: bool):
+        """Registrar el resultado de una estrategia de recuperación para una firma"""
+        with self._lock:
+            record = self._records.get(signature_id)
+            if record is None:
+                return
+            record.recovery_attempts[strategy] = record.recovery_attempts.get(strategy, 0) + 1
+            if success:
+                record.recovery_successes[strategy] = record.recovery_successes.get(strategy, 0) + 1
+
+    def store_analysis(self, signature_id: str, analysis: Dict[str, Any]):
+        """Guardar el análisis de causa raíz asociado a una firma"""
+        with self._lock:
+            record = self._records.get(signature_id)
+            if record is not None:
+                record.cached_analysis = analysis
+
+    def get_cached_analysis(self, signature_id: str) -> Optional[Dict[str, Any]]:
+        record = self._records.get(signature_id)
+        return record.cached_analysis if record else None
+
+    def _evict_if_needed(self):
+        while len(self._records) > self.max_signatures:
+            signature_id, record = self._records.popitem(last=False)
+            for key in self._band_keys(record.minhash):
+                bucket = self._buckets.get(key)
+                if bucket is not None:
+                    bucket.discard(signature_id)
+                    if not bucket:
+                        del self._buckets[key]
+            self.stats['evictions'] += 1
+
+    def top_signatures(self, limit: int = 10) -> List[Dict[str, Any]]:
+        with self._lock:
+            records = sorted(self._records.values(), key=lambda r: r.count, reverse=True)
+            return [record.to_dict() for record in records[:limit]]
+
+    def get_statistics(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self.stats,
+                'signatures': len(self._records),
+                'bands': self.bands,
+                'rows': self.rows,
+                'lsh_threshold': round(self.lsh_threshold, 3),
+                'occurrences': sum(r.count for r in self._records.values()),
+                'buckets': len(self._buckets)
+            }
+
+    def __len__(self) -> int:
+        return len(self._records)
@@ -0,0 +1,566 @@
+"""
+IntentClassifier - Clasificador Local de Intención para Mitosis V5
+==================================================================
+
+Sustituye la llamada al LLM por mensaje en is_casual_conversation por un
+modelo lineal ligero; solo los mensajes ambiguos se escalan al LLM.
+
+Características clave:
+- Regresión logística multiclase sobre n-gramas con hashing (palabras,
+  bigramas y trigramas de caracteres), sin dependencias externas
+- Entrenamiento inicial con ejemplos semilla y clasificaciones registradas
+- Actualización en línea con cada etiqueta que devuelve el LLM
+- Umbral de confianza para decidir localmente o escalar
+- Utilidades de evaluación (exactitud, matriz de confusión, latencia)
+"""
+
+import json
+import logging
+import math
+import os
+import random
+import re
+import threading
+import time
+import unicodedata
+import zlib
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+INTENT_LABELS = ['casual', 'tarea_investigacion', 'tarea_creacion', 'tarea_analisis', 'otro']
+
+# Ejemplos semilla para que el modelo sea útil desde la primera ejecución
+SEED_EXAMPLES: List[Tuple[str, str]] = [
+    ("hola", "casual"), ("hola, ¿qué tal?", "casual"), ("buenos días", "casual"),
+    ("buenas tardes", "casual"), ("buenas noches", "casual"), ("¿cómo estás?", "casual"),
+    ("gracias", "casual"), ("muchas gracias por tu ayuda", "casual"), ("de nada", "casual"),
+    ("adiós", "casual"), ("hasta luego", "casual"), ("¿quién eres?", "casual"),
+    ("¿cómo te llamas?", "casual"), ("ok", "casual"), ("vale, perfecto", "casual"),
+    ("entiendo", "casual"), ("genial, me alegro", "casual"), ("jaja qué bueno", "casual"),
+    ("hello", "casual"), ("hi there", "casual"), ("thanks a lot", "casual"),
+    ("how are you?", "casual"), ("good morning", "casual"), ("nos vemos", "casual"),
+
+    ("buscar información sobre inteligencia artificial", "tarea_investigacion"),
+    ("investiga las tendencias del mercado de criptomonedas", "tarea_investigacion"),
+    ("busca noticias recientes sobre energía solar", "tarea_investigacion"),
+    ("¿cuáles son los mejores frameworks de python en 2024?", "tarea_investigacion"),
+    ("encuentra estudios sobre el sueño y la productividad", "tarea_investigacion"),
+    ("investigar sobre la historia de roma", "tarea_investigacion"),
+    ("dame información sobre el cambio climático", "tarea_investigacion"),
+    ("search for the latest research on large language models", "tarea_investigacion"),
+    ("necesito datos sobre la población de españa", "tarea_investigacion"),
+    ("recopila fuentes sobre computación cuántica", "tarea_investigacion"),
+
+    ("crear un informe sobre ventas del trimestre", "tarea_creacion"),
+    ("escribe un artículo sobre marketing digital", "tarea_creacion"),
+    ("genera un script en python para renombrar archivos", "tarea_creacion"),
+    ("desarrolla una aplicación web de tareas", "tarea_creacion"),
+    ("redacta un correo para mi jefe", "tarea_creacion"),
+    ("crea una presentación sobre nuestro producto", "tarea_creacion"),
+    ("haz un plan de marketing para una startup", "tarea_creacion"),
+    ("write a blog post about remote work", "tarea_creacion"),
+    ("genera contenido para redes sociales", "tarea_creacion"),
+    ("crea un documento con la estrategia del proyecto", "tarea_creacion"),
+
+    ("analiza estos datos de ventas", "tarea_analisis"),
+    ("analizar las tendencias del mercado inmobiliario", "tarea_analisis"),
+    ("compara el rendimiento de estas dos estrategias", "tarea_analisis"),
+    ("haz un análisis de la competencia", "tarea_analisis"),
+    ("evalúa los riesgos de este proyecto", "tarea_analisis"),
+    ("realiza un estudio estadístico de la encuesta", "tarea_analisis"),
+    ("analyze the performance metrics of our website", "tarea_analisis"),
+    ("revisa este código y encuentra errores", "tarea_analisis"),
+    ("calcula la rentabilidad de la inversión", "tarea_analisis"),
+    ("interpreta los resultados del experimento", "tarea_analisis"),
+
+    ("asdf", "otro"), ("...", "otro"), ("123", "otro"), ("?", "otro"),
+]
+
+
+def _strip_accents(text: str) -> str:
+    return ''.join(
+        ch for ch in unicodedata.normalize('NFKD', text)
+        if not unicodedata.combining(ch)
+    )
+
+
+def _length_bucket(num_words: int) -> str:
+    if num_words <= 3:
+        return str(num_words)
+    if num_words <= 5:
+        return '4-5'
+    if num_words <= 10:
+        return '6-10'
+    return '10+'
+
+
+@dataclass
+class IntentPrediction:
+    """Resultado de clasificar un mensaje"""
+    intent: str
+    confidence: float
+    is_confident: bool
+    probabilities: Dict[str, float] = field(default_factory=dict)
+    latency_ms: float = 0.0
+
+    @property
+    def is_casual(self) -> bool:
+        return self.intent == 'casual'
+
+
+class HashedNgramIntentClassifier:
+    """Regresión logística multiclase sobre n-gramas con hashing"""
+
+    def __init__(self, labels: List[str] = None, num_features: int = 2 ** 18,
+                 learning_rate: float = 0.5, l2: float = 1e-5):
+        """
+        Inicializar modelo
+
+        Args:
+            labels: Etiquetas de intención
+            num_features: Tamaño del espacio de hashing
+            learning_rate: Paso del descenso por gradiente estocástico
+            l2: Regularización L2 aplicada a los pesos tocados en cada paso
+        """
+        self.labels = list(labels or INTENT_LABELS)
+        self.num_features = num_features
+        self.learning_rate = learning_rate
+        self.l2 = l2
+
+        # Pesos dispersos: etiqueta -> {índice: peso}
+        self.weights: Dict[str, Dict[int, float]] = {label: {} for label in self.labels}
+        self.bias: Dict[str, float] = {label: 0.0 for label in self.labels}
+        self.examples_seen = 0
+
+    # ------------------------------------------------------------ features
+
+    def extract_features(self, text: str) -> Dict[int, float]:
+        """Vector disperso normalizado (L2) de n-gramas con hashing"""
+        normalized = _strip_accents((text or '').lower().strip())
+        tokens = re.findall(r'\w+', normalized)
+
+        grams = [f"w:{token}" for token in tokens]
+        grams.extend(f"b:{a}_{b}" for a, b in zip(tokens, tokens[1:]))
+        for token in tokens:
+            padded = f"#{token}#"
+            grams.extend(f"c:{padded[i:i + 3]}" for i in range(len(padded) - 2))
+        grams.append(f"len:{_length_bucket(len(tokens))}")
+        if '?' in normalized:
+            grams.append("punct:?")
+        if not tokens:
+            grams.append("empty")
+
+        features: Dict[int, float] = {}
+        for gram in grams:
+            h = zlib.crc32(gram.encode('utf-8'))
+            index = h % self.num_features
+            sign = 1.0 if h & 0x80000000 else -1.0
+            features[index] = features.get(index, 0.0) + sign
+
+        norm = math.sqrt(sum(v * v for v in features.values())) or 1.0
+        return {index: value / norm for index, value in features.items()}
+
+    # ------------------------------------------------------------ inferencia
+
+    def _scores(self, features: Dict[int, float]) -> Dict[str, float]:
+        scores = {}
+        for label in self.labels:
+            label_weights = self.weights[label]
+            scores[label] = self.bias[label] + sum(
+                label_weights.get(index, 0.0) * value for index, value in features.items()
+            )
+        return scores
+
+    @staticmethod
+    def _softmax(scores: Dict[str, float]) -> Dict[str, float]:
+        top = max(scores.values())
+        exps = {label: math.exp(score - top) for label, score in scores.items()}
+        total = sum(exps.values())
+        return {label: value / total for label, value in exps.items()}
+
+    def predict_proba(self, text: str) -> Dict[str, float]:
+        return self._softmax(self._scores(self.extract_features(text)))
+
+    def predict(self, text: str) -> Tuple[str, float]:
+        probabilities = self.predict_proba(text)
+        label = max(probabilities, key=probabilities.get)
+        return label, probabilities[label]
+
+    # ------------------------------------------------------------ entrenamiento
+
+    def partial_fit(self, text: str, label: str, weight: float = 1.0):
+        """Un paso de SGD sobre la entropía cruzada (actualización en línea)"""
+        self._sgd_step(text, label, weight)
+        self.examples_seen += 1
+
+    def _sgd_step(self, text: str, label: str, weight: float = 1.0):
+        if label not in self.weights:
+            self.labels.append(label)
+            self.weights[label] = {}
+            self.bias[label] = 0.0
+
+        features = self.extract_features(text)
+        probabilities = self._softmax(self._scores(features))
+        step = self.learning_rate * weight
+
+        for candidate in self.labels:
+            gradient = probabilities[candidate] - (1.0 if candidate == label else 0.0)
+            if abs(gradient) < 1e-6:
+                continue
+            label_weights = self.weights[candidate]
+            for index, value in features.items():
+                current = label_weights.get(index, 0.0)
+                label_weights[index] = current - step * (gradient * value + self.l2 * current)
+            self.bias[candidate] -= step * gradient
+
+    def fit(self, examples: Iterable[Tuple[str, str]], epochs: int = 15, seed: int = 13):
+        """Entrenar desde cero con varias pasadas barajadas"""
+        examples = list(examples)
+        self.weights = {label: {} for label in self.labels}
+        self.bias = {label: 0.0 for label in self.labels}
+
+        rng = random.Random(seed)
+        for epoch in range(epochs):
+            rng.shuffle(examples)
+            for text, label in examples:
+                self._sgd_step(text, label)
+
+        # Ejemplos de entrenamiento, no pasos de SGD (epochs × ejemplos)
+        self.examples_seen = len(examples)
+        return self
+
+    # ------------------------------------------------------------ persistencia
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'version': 2,
+            'labels': self.labels,
+            'num_features': self.num_features,
+            'learning_rate': self.learning_rate,
+            'l2': self.l2,
+            'examples_seen': self.examples_seen,
+            'bias': self.bias,
+            'weights': {
+                label: {str(index): round(value, 6) for index, value in weights.items() if abs(value) > 1e-6}
+                for label, weights in self.weights.items()
+            }
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'HashedNgramIntentClassifier':
+        model = cls(
+            labels=data['labels'],
+            num_features=data['num_features'],
+            learning_rate=data.get('learning_rate', 0.5),
+            l2=data.get('l2', 1e-5)
+        )
+        # En la versión 1 examples_seen contaba pasos de SGD: 0 fuerza reentrenar
+        model.examples_seen = data.get('examples_seen', 0) if data.get('version', 1) >= 2 else 0
+        model.bias = {label: float(value) for label, value in data['bias'].items()}
+        model.weights = {
+            label: {int(index): float(value) for index, value in weights.items()}
+            for label, weights in data['weights'].items()
+        }
+        return model
+
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> 'HashedNgramIntentClassifier':
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls.from_dict(json.load(f))
+
+
+class IntentExampleLog:
+    """Registro JSONL de clasificaciones etiquetadas (por el LLM o manualmente)"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def append(self, message: str, intent: str, source: str = 'llm'):
+        record = {'message': message, 'intent': intent, 'source': source, 'timestamp': time.time()}
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+    def load(self) -> List[Tuple[str, str]]:
+        if not os.path.exists(self.path):
+            return []
+        examples = []
+        with self._lock:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                        examples.append((record['message'], record['intent']))
+                    except (ValueError, KeyError):
+                        continue
+        return examples
+
+
+def evaluate_classifier(model: HashedNgramIntentClassifier,
+                        examples: List[Tuple[str, str]]) -> Dict[str, Any]:
+    """Exactitud global, exactitud casual/tarea, matriz de confusión y latencia"""
+    confusion: Dict[str, Dict[str, int]] = {}
+    correct = binary_correct = 0
+    latencies = []
+
+    for text, expected in examples:
+        start = time.perf_counter()
+        predicted, _ = model.predict(text)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+        confusion.setdefault(expected, {}).setdefault(predicted, 0)
+        confusion[expected][predicted] += 1
+        correct += predicted == expected
+        binary_correct += (predicted == 'casual') == (expected == 'casual')
+
+    latencies.sort()
+    total = len(examples)
+    return {
+        'examples': total,
+        'accuracy': correct / total if total else 0.0,
+        'casual_vs_task_accuracy': binary_correct / total if total else 0.0,
+        'confusion': confusion,
+        'latency_ms_avg': sum(latencies) / total if total else 0.0,
+        'latency_ms_p95': latencies[int(0.95 * (total - 1))] if total else 0.0
+    }
+
+
+def cross_validate(examples: List[Tuple[str, str]], folds: int = 5, seed: int = 13,
+                   **model_kwargs) -> Dict[str, Any]:
+    """Validación cruzada k-fold del clasificador local"""
+    examples = list(examples)
+    random.Random(seed).shuffle(examples)
+    folds = max(2, min(folds, len(examples)))
+
+    results = []
+    for fold in range(folds):
+        test = examples[fold::folds]
+        train = [example for i, example in enumerate(examples) if i % folds != fold]
+        model = HashedNgramIntentClassifier(**model_kwargs).fit(train)
+        results.append(evaluate_classifier(model, test))
+
+    return {
+        'folds': folds,
+        'accuracy': sum(r['accuracy'] for r in results) / folds,
+        'casual_vs_task_accuracy': sum(r['casual_vs_task_accuracy'] for r in results) / folds,
+        'latency_ms_avg': sum(r['latency_ms_avg'] for r in results) / folds
+    }
+
+
+# ------------------------------------------------------------ clasificación con LLM
+
+def build_intent_prompt(message: str, context_info: str = '') -> str:
+    """Prompt few-shot de clasificación de intención para el LLM"""
+    return f"""Clasifica la siguiente frase del usuario en una de estas categorías exactas: 'casual', 'tarea_investigacion', 'tarea_creacion', 'tarea_analisis', 'otro'.
+
+{context_info}
+
+Responde ÚNICAMENTE con un objeto JSON con la clave 'intent'. No agregues explicaciones adicionales.
+
+EJEMPLOS:
+- "hola" -> {{"intent": "casual"}}
+- "¿cómo estás?" -> {{"intent": "casual"}}
+- "gracias" -> {{"intent": "casual"}}
+- "buscar información sobre IA" -> {{"intent": "tarea_investigacion"}}
+- "crear un informe" -> {{"intent": "tarea_creacion"}}
+- "analizar datos" -> {{"intent": "tarea_analisis"}}
+
+Frase a clasificar: "{message}"
+
+Respuesta JSON:"""
+
+
+def parse_intent_response(response_text: str) -> Optional[str]:
+    """Extraer la intención de la respuesta del LLM con varias estrategias"""
+    response_text = (response_text or '').strip()
+    intent_data = None
+
+    # Estrategia 1: JSON directo
+    try:
+        cleaned_response = response_text.replace('```json', '').replace('```', '').strip()
+        if cleaned_response.startswith('{') and cleaned_response.endswith('}'):
+            intent_data = json.loads(cleaned_response)
+    except json.JSONDecodeError:
+        pass
+
+    # Estrategia 2: Buscar JSON en el texto
+    if not intent_data:
+        try:
+            json_match = re.search(r'\{[^{}]*"intent"[^{}]*\}', response_text)
+            if json_match:
+                intent_data = json.loads(json_match.group())
+        except json.JSONDecodeError:
+            pass
+
+    # Estrategia 3: Extracción por regex
+    if not intent_data:
+        intent_match = re.search(r'"intent"\s*:\s*"([^"]+)"', response_text)
+        if intent_match:
+            intent_data = {"intent": intent_match.group(1)}
+
+    if intent_data and isinstance(intent_data.get('intent'), str):
+        return intent_data['intent'].lower().strip()
+    return None
+
+
+def classify_intent_with_llm(ollama_service, message: str, context_info: str = '') -> Tuple[Optional[str], Optional[str]]:
+    """
+    Clasificar con el LLM
+
+    Returns:
+        (intención o None, error o None)
+    """
+    response = ollama_service.generate_response(build_intent_prompt(message, context_info), {
+        'temperature': 0.2,  # Más bajo para respuestas consistentes
+        'response_format': 'json'
+    })
+    if response.get('error'):
+        return None, response['error']
+    return parse_intent_response(response.get('response', '')), None
+
+
+# ------------------------------------------------------------ servicio
+
+class IntentClassificationService:
+    """Clasificador local con escalado al LLM y aprendizaje en línea"""
+
+    def __init__(self, model_path: str = None, log_path: str = None,
+                 confidence_threshold: float = None, min_training_examples: int = 40,
+                 save_every: int = 25):
+        """
+        Inicializar servicio
+
+        Args:
+            model_path: Fichero del modelo (INTENT_MODEL_PATH)
+            log_path: Registro JSONL de ejemplos etiquetados (INTENT_LOG_PATH)
+            confidence_threshold: Probabilidad mínima para decidir sin LLM (INTENT_CONFIDENCE_THRESHOLD, 0.85)
+            min_training_examples: Ejemplos vistos antes de confiar en el modelo
+            save_every: Actualizaciones en línea entre guardados del modelo
+        """
+        base_dir = '/tmp/mitosis_intent'
+        self.model_path = model_path or os.getenv('INTENT_MODEL_PATH', os.path.join(base_dir, 'intent_model.json'))
+        self.example_log = IntentExampleLog(log_path or os.getenv('INTENT_LOG_PATH', os.path.join(base_dir, 'intent_examples.jsonl')))
+        self.confidence_threshold = confidence_threshold or float(os.getenv('INTENT_CONFIDENCE_THRESHOLD', '0.85'))
+        self.min_training_examples = min_training_examples
+        self.save_every = save_every
+
+        self._lock = threading.Lock()
+        self._updates_since_save = 0
+        self.model = self._load_or_train()
+
+        self.stats = {
+            'classified': 0,
+            'local_decisions': 0,
+            'escalations': 0,
+            'online_updates': 0,
+            'llm_agreement': 0,
+            'llm_disagreement': 0
+        }
+
+    def _load_or_train(self) -> HashedNgramIntentClassifier:
+        """Cargar el modelo guardado, o reentrenar si el registro tiene ejemplos que no vio"""
+        if os.path.exists(self.model_path):
+            try:
+                model = HashedNgramIntentClassifier.load(self.model_path)
+                # Las actualizaciones en línea posteriores al último guardado se pierden al reiniciar
+                known_examples = len(SEED_EXAMPLES) + len(self.example_log.load())
+                if model.examples_seen >= known_examples:
+                    logger.info(f"🧠 Intent classifier loaded ({model.examples_seen} examples seen)")
+                    return model
+                logger.info(f"🧠 Intent model saw {model.examples_seen} of {known_examples} examples, retraining")
+            except Exception as e:
+                logger.warning(f"⚠️ Could not load intent model, retraining: {str(e)}")
+        return self.retrain()
+
+    def retrain(self, epochs: int = 15) -> HashedNgramIntentClassifier:
+        """Entrenar desde cero con los ejemplos semilla y los registrados"""
+        examples = SEED_EXAMPLES + self.example_log.load()
+        model = HashedNgramIntentClassifier().fit(examples, epochs=epochs)
+        with self._lock:
+            self.model = model
+        try:
+            model.save(self.model_path)
+        except Exception as e:
+            logger.warning(f"⚠️ Could not save intent model: {str(e)}")
+        logger.info(f"🧠 Intent classifier trained on {len(examples)} examples")
+        return model
+
+    def classify(self, message: str) -> IntentPrediction:
+        start = time.perf_counter()
+        with self._lock:
+            probabilities = self.model.predict_proba(message)
+            trained = self.model.examples_seen >= self.min_training_examples
+        intent = max(probabilities, key=probabilities.get)
+        confidence = probabilities[intent]
+        is_confident = trained and confidence >= self.confidence_threshold
+
+        self.stats['classified'] += 1
+        self.stats['local_decisions' if is_confident else 'escalations'] += 1
+        return IntentPrediction(
+            intent=intent,
+            confidence=confidence,
+            is_confident=is_confident,
+            probabilities=probabilities,
+            latency_ms=(time.perf_counter() - start) * 1000
+        )
+
+    def record_label(self, message: str, intent: str, source: str = 'llm',
+                     prediction: IntentPrediction = None):
+        """Registrar una etiqueta (p.ej. la del LLM) y actualizar el modelo en línea"""
+        if intent not in INTENT_LABELS:
+            intent = 'otro'
+        if prediction is not None:
+            self.stats['llm_agreement' if prediction.intent == intent else 'llm_disagreement'] += 1
+
+        try:
+            self.example_log.append(message, intent, source)
+        except Exception as e:
+            logger.warning(f"⚠️ Could not log intent example: {str(e)}")
+
+        with self._lock:
+            self.model.partial_fit(message, intent)
+            self.stats['online_updates'] += 1
+            self._updates_since_save += 1
+            should_save = self._updates_since_save >= self.save_every
+            if should_save:
+                self._updates_since_save = 0
+                snapshot = self.model.to_dict()
+
+        if should_save:
+            try:
+                HashedNgramIntentClassifier.from_dict(snapshot).save(self.model_path)
+            except Exception as e:
+                logger.warning(f"⚠️ Could not save intent model: {str(e)}")
+
+    def get_statistics(self) -> Dict[str, Any]:
+        classified = self.stats['classified']
+        compared = self.stats['llm_agreement'] + self.stats['llm_disagreement']
+        return {
+            **self.stats,
+            'local_rate': self.stats['local_decisions'] / classified if classified else 0.0,
+            'llm_agreement_rate': self.stats['llm_agreement'] / compared if compared else 0.0,
+            'examples_seen': self.model.examples_seen,
+            'confidence_threshold': self.confidence_threshold
+        }
+
+
+# Instancia global del servicio
+_intent_classifier_instance = None
+
+def get_intent_classifier() -> IntentClassificationService:
+    """Obtener instancia singleton del IntentClassificationService"""
+    global _intent_classifier_instance
+    if _intent_classifier_instance is None:
+        _intent_classifier_instance = IntentClassificationService()
+    return _intent_classifier_instance
@@ -8,6 +8,8 @@ import logging
 from datetime import datetime
 import time
 
+from ..monitoring.tracing import traced
+
 logger = logging.getLogger(__name__)
 
 class IntelligentContextManager:
@@ -57,6 +59,7 @@ class IntelligentContextManager:
                 'error_handling': BasicContextStrategy()
             }
     
+    @traced('context.build_context', lambda args: {'context.type': args['context_type'], 'context.max_tokens': args['max_tokens']})
     async def build_context(self, context_type: str, query: str, max_tokens: int = 4000) -> Dict[str, Any]:
         """
         Construye contexto optimizado basado en el tipo de interacción
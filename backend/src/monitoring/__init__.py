@@ -0,0 +1,26 @@
+"""
+Módulo de observabilidad para Mitosis
+Implementa tracing en proceso de peticiones, planificación, herramientas y LLM,
+y profiling por muestreo activable en caliente
+"""
+
+from .tracing import Span, Tracer, JSONLFileExporter, OTLPFileExporter, get_tracer, traced
+from .sampling_profiler import (
+    SamplingProfiler, ProfileSession, get_sampling_profiler,
+    tag_current_thread, with_thread_tags, inherit_thread_tags
+)
+
+__all__ = [
+    'Span',
+    'Tracer',
+    'JSONLFileExporter',
+    'OTLPFileExporter',
+    'get_tracer',
+    'traced',
+    'SamplingProfiler',
+    'ProfileSession',
+    'get_sampling_profiler',
+    'tag_current_thread',
+    'with_thread_tags',
+    'inherit_thread_tags'
+]
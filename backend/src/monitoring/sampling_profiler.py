@@ -0,0 +1,277 @@
+"""
+Profiler estadístico por muestreo activable en caliente
+Un único hilo toma periódicamente las pilas de todos los hilos del proceso
+(sys._current_frames) y las agrega en formato "collapsed stack", listo para
+generar flamegraphs. Las sesiones pueden limitarse a una tarea o a una ruta
+mediante etiquetas asociadas a cada hilo.
+"""
+
+import functools
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Etiquetas (task_id, route, ...) asociadas a cada hilo: thread_id -> tags
+_thread_tags: Dict[int, Dict[str, str]] = {}
+
+
+def get_thread_tags(thread_id: int = None) -> Dict[str, str]:
+    """Obtener las etiquetas de un hilo (por defecto el actual)"""
+    return dict(_thread_tags.get(thread_id or threading.get_ident(), {}))
+
+def set_thread_tags(**tags) -> Dict[str, str]:
+    """Añadir etiquetas al hilo actual y devolver las anteriores"""
+    thread_id = threading.get_ident()
+    previous = _thread_tags.get(thread_id, {})
+    merged = dict(previous)
+    merged.update({key: str(value) for key, value in tags.items() if value is not None})
+    _thread_tags[thread_id] = merged
+    return previous
+
+def clear_thread_tags(previous: Dict[str, str] = None):
+    """Restaurar (o eliminar) las etiquetas del hilo actual"""
+    thread_id = threading.get_ident()
+    if previous:
+        _thread_tags[thread_id] = previous
+    else:
+        _thread_tags.pop(thread_id, None)
+
+@contextmanager
+def tag_current_thread(**tags):
+    """Context manager que etiqueta el hilo actual durante un bloque"""
+    previous = set_thread_tags(**tags)
+    try:
+        yield
+    finally:
+        clear_thread_tags(previous)
+
+def with_thread_tags(func: Callable, **tags) -> Callable:
+    """Envuelve una función para que el hilo que la ejecute quede etiquetado"""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with tag_current_thread(**tags):
+            return func(*args, **kwargs)
+    return wrapper
+
+def inherit_thread_tags(func: Callable) -> Callable:
+    """Envuelve una función para que herede las etiquetas del hilo que la crea"""
+    return with_thread_tags(func, **get_thread_tags())
+
+
+@dataclass
+class ProfileSession:
+    """Sesión de muestreo con su filtro y sus pilas agregadas"""
+    session_id: str
+    interval: float
+    max_duration: float
+    task_id: Optional[str] = None
+    route: Optional[str] = None
+    started_at: float = field(default_factory=time.time)
+    stopped_at: Optional[float] = None
+    samples: int = 0
+    stacks: Counter = field(default_factory=Counter)
+    threads_seen: Dict[str, int] = field(default_factory=dict)
+    next_sample_at: float = 0.0
+
+    @property
+    def active(self) -> bool:
+        return self.stopped_at is None
+
+    def matches(self, tags: Dict[str, str]) -> bool:
+        if self.task_id and tags.get('task_id') != self.task_id:
+            return False
+        if self.route and not tags.get('route', '').startswith(self.route):
+            return False
+        return True
+
+    def to_dict(self, top: int = 20) -> Dict[str, Any]:
+        end_time = self.stopped_at or time.time()
+        return {
+            'session_id': self.session_id,
+            'task_id': self.task_id,
+            'route': self.route,
+            'interval': self.interval,
+            'max_duration': self.max_duration,
+            'started_at': self.started_at,
+            'stopped_at': self.stopped_at,
+            'duration': end_time - self.started_at,
+            'active': self.active,
+            'samples': self.samples,
+            'unique_stacks': len(self.stacks),
+            'threads_seen': self.threads_seen,
+            'top_stacks': [
+                {'stack': stack, 'count': count}
+                for stack, count in self.stacks.most_common(top)
+            ]
+        }
+
+
+class SamplingProfiler:
+    """
+    Profiler de muestreo de bajo overhead para investigar hot paths.
+
+    El hilo de muestreo solo existe mientras haya sesiones activas, y cada
+    sesión se detiene sola al alcanzar max_duration.
+    """
+
+    def __init__(self, max_stack_depth: int = 128, max_sessions: int = 20):
+        self.max_stack_depth = max_stack_depth
+        self.max_sessions = max_sessions
+        self.sessions: Dict[str, ProfileSession] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._wakeup = threading.Event()
+
+    def start_session(self, task_id: str = None, route: str = None, interval: float = 0.01,
+                      max_duration: float = 60.0) -> ProfileSession:
+        """
+        Iniciar una sesión de muestreo
+
+        Args:
+            task_id: Limitar a hilos etiquetados con esta tarea
+            route: Limitar a hilos atendiendo rutas con este prefijo
+            interval: Segundos entre muestras (mínimo 1 ms)
+            max_duration: Duración máxima antes de detenerse automáticamente
+        """
+        session = ProfileSession(
+            session_id=uuid.uuid4().hex[:12],
+            interval=max(0.001, interval),
+            max_duration=max_duration,
+            task_id=task_id,
+            route=route
+        )
+
+        with self._lock:
+            self._evict_finished_sessions()
+            self.sessions[session.session_id] = session
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._sampling_loop, name='mitosis-sampling-profiler', daemon=True
+                )
+                self._thread.start()
+        self._wakeup.set()
+
+        logger.info(f"🔬 Profiling session {session.session_id} started "
+                    f"(task={task_id}, route={route}, interval={session.interval}s)")
+        return session
+
+    def stop_session(self, session_id: str) -> Optional[ProfileSession]:
+        with self._lock:
+            session = self.sessions.get(session_id)
+            if session and session.active:
+                session.stopped_at = time.time()
+                logger.info(f"🔬 Profiling session {session_id} stopped with {session.samples} samples")
+        return session
+
+    def get_session(self, session_id: str) -> Optional[ProfileSession]:
+        return self.sessions.get(session_id)
+
+    def list_sessions(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [session.to_dict(top=0) for session in self.sessions.values()]
+
+    def collapsed_stacks(self, session_id: str) -> Optional[str]:
+        """Exportar la sesión en formato collapsed stack (flamegraph.pl / speedscope)"""
+        session = self.sessions.get(session_id)
+        if session is None:
+            return None
+        with self._lock:
+            items = list(session.stacks.items())
+        return ''.join(f"{stack} {count}\n" for stack, count in sorted(items))
+
+    def _evict_finished_sessions(self):
+        finished = sorted(
+            (s for s in self.sessions.values() if not s.active),
+            key=lambda s: s.stopped_at
+        )
+        while len(self.sessions) >= self.max_sessions and finished:
+            self.sessions.pop(finished.pop(0).session_id, None)
+
+    def _sampling_loop(self):
+        own_thread_id = threading.get_ident()
+
+        while True:
+            with self._lock:
+                now = time.time()
+                active = []
+                for session in self.sessions.values():
+                    if not session.active:
+                        continue
+                    if now - session.started_at >= session.max_duration:
+                        session.stopped_at = now
+                        continue
+                    active.append(session)
+
+                if not active:
+                    self._thread = None
+                    return
+
+                due = [s for s in active if s.next_sample_at <= now]
+                next_wakeup = min(s.next_sample_at for s in active)
+
+            if due:
+                self._sample(due, own_thread_id)
+                with self._lock:
+                    for session in due:
+                        session.next_sample_at = now + session.interval
+                    next_wakeup = min(s.next_sample_at for s in active)
+
+            self._wakeup.wait(max(0.0, next_wakeup - time.time()))
+            self._wakeup.clear()
+
+    def _sample(self, sessions: List[ProfileSession], own_thread_id: int):
+        threads_by_id = {thread.ident: thread.name for thread in threading.enumerate()}
+        frames = sys._current_frames()
+
+        collapsed_cache: Dict[int, str] = {}
+        for session in sessions:
+            session.samples += 1
+
+        for thread_id, frame in frames.items():
+            if thread_id == own_thread_id:
+                continue
+
+            tags = _thread_tags.get(thread_id, {})
+            matching = [s for s in sessions if s.matches(tags)]
+            if not matching:
+                continue
+
+            if thread_id not in collapsed_cache:
+                thread_name = threads_by_id.get(thread_id, f'thread-{thread_id}')
+                collapsed_cache[thread_id] = self._collapse(thread_name, frame)
+            stack = collapsed_cache[thread_id]
+            thread_name = stack.split(';', 1)[0]
+
+            with self._lock:
+                for session in matching:
+                    session.stacks[stack] += 1
+                    session.threads_seen[thread_name] = session.threads_seen.get(thread_name, 0) + 1
+
+    def _collapse(self, thread_name: str, frame) -> str:
+        names = []
+        while frame is not None and len(names) < self.max_stack_depth:
+            code = frame.f_code
+            names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+            frame = frame.f_back
+        names.append(thread_name.replace(';', '_'))
+        return ';'.join(reversed(names))
+
+
+# Instancia global del profiler
+_profiler_instance = None
+
+def get_sampling_profiler() -> SamplingProfiler:
+    """Obtener instancia singleton del SamplingProfiler"""
+    global _profiler_instance
+    if _profiler_instance is None:
+        _profiler_instance = SamplingProfiler()
+    return _profiler_instance
@@ -0,0 +1,479 @@
+"""
+Tracing ligero en proceso para el agente
+Registra spans anidados (chat, clasificación, planificación, herramientas y
+llamadas LLM) propagados con contextvars, incluso hacia los hilos de ejecución
+en segundo plano, y los exporta a un fichero JSONL u OTLP/JSON con muestreo.
+"""
+
+import asyncio
+import contextvars
+import functools
+import inspect
+import json
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Span:
+    """Unidad de trabajo medida dentro de una traza"""
+    name: str
+    trace_id: str
+    span_id: str
+    parent_id: Optional[str]
+    start_time: float
+    sampled: bool = True
+    end_time: Optional[float] = None
+    attributes: Dict[str, Any] = field(default_factory=dict)
+    status: str = "ok"
+    error: Optional[str] = None
+    thread_name: str = ""
+
+    @property
+    def duration_ms(self) -> float:
+        end_time = self.end_time if self.end_time is not None else time.time()
+        return (end_time - self.start_time) * 1000
+
+    def set_attribute(self, key: str, value: Any):
+        if self.sampled and value is not None:
+            self.attributes[key] = value
+
+    def set_attributes(self, attributes: Dict[str, Any]):
+        for key, value in (attributes or {}).items():
+            self.set_attribute(key, value)
+
+    def record_error(self, error: Any):
+        self.status = "error"
+        self.error = str(error)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'name': self.name,
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'start_time': self.start_time,
+            'end_time': self.end_time,
+            'duration_ms': round(self.duration_ms, 3),
+            'attributes': self.attributes,
+            'status': self.status,
+            'error': self.error,
+            'thread': self.thread_name
+        }
+
+
+_current_span: contextvars.ContextVar = contextvars.ContextVar('mitosis_current_span', default=None)
+
+
+class JSONLFileExporter:
+    """Exporta cada span como una línea JSON"""
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def export(self, spans: List[Span]):
+        with open(self.path, 'a', encoding='utf-8') as f:
+            for span in spans:
+                f.write(json.dumps(span.to_dict(), default=str) + '\n')
+
+
+class OTLPFileExporter(JSONLFileExporter):
+    """Exporta lotes de spans en formato OTLP/JSON (una petición por línea)"""
+
+    def __init__(self, path: str, service_name: str = 'mitosis-backend'):
+        super().__init__(path)
+        self.service_name = service_name
+
+    def export(self, spans: List[Span]):
+        otlp_spans = []
+        for span in spans:
+            otlp_spans.append({
+                'traceId': span.trace_id,
+                'spanId': span.span_id,
+                'parentSpanId': span.parent_id or '',
+                'name': span.name,
+                'kind': 1,
+                'startTimeUnixNano': str(int(span.start_time * 1e9)),
+                'endTimeUnixNano': str(int((span.end_time or span.start_time) * 1e9)),
+                'attributes': [
+                    {'key': key, 'value': self._otlp_value(value)}
+                    for key, value in span.attributes.items()
+                ],
+                'status': {'code': 2, 'message': span.error or ''} if span.status == 'error' else {'code': 1}
+            })
+
+        request = {
+            'resourceSpans': [{
+                'resource': {'attributes': [
+                    {'key': 'service.name', 'value': {'stringValue': self.service_name}}
+                ]},
+                'scopeSpans': [{'scope': {'name': 'mitosis.tracing'}, 'spans': otlp_spans}]
+            }]
+        }
+
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(request, default=str) + '\n')
+
+    @staticmethod
+    def _otlp_value(value: Any) -> Dict[str, Any]:
+        if isinstance(value, bool):
+            return {'boolValue': value}
+        if isinstance(value, int):
+            return {'intValue': str(value)}
+        if isinstance(value, float):
+            return {'doubleValue': value}
+        return {'stringValue': str(value)}
+
+
+class Tracer:
+    """
+    Tracer en proceso con muestreo por traza (head sampling).
+
+    Las trazas muestreadas se guardan en memoria (acotadas) para renderizar el
+    waterfall de una tarea y se envían por lotes al exportador configurado.
+    """
+
+    def __init__(self, sample_rate: float = 1.0, exporter=None, max_traces: int = 500,
+                 max_spans_per_trace: int = 2000, export_batch_size: int = 64,
+                 export_interval: float = 2.0):
+        self.sample_rate = max(0.0, min(1.0, sample_rate))
+        self.exporter = exporter
+        self.max_traces = max_traces
+        self.max_spans_per_trace = max_spans_per_trace
+        self.export_batch_size = export_batch_size
+        self.export_interval = export_interval
+
+        self._traces: "OrderedDict[str, List[Span]]" = OrderedDict()
+        self._task_traces: "OrderedDict[str, List[str]]" = OrderedDict()
+        self._export_buffer: List[Span] = []
+        self._last_export = time.time()
+        self._lock = threading.Lock()
+
+        self.stats = {
+            'spans_started': 0,
+            'spans_recorded': 0,
+            'spans_dropped': 0,
+            'traces_sampled': 0,
+            'traces_unsampled': 0,
+            'export_errors': 0
+        }
+
+    # ------------------------------------------------------------------ spans
+
+    def current_span(self) -> Optional[Span]:
+        return _current_span.get()
+
+    def start_span(self, name: str, attributes: Dict[str, Any] = None, task_id: str = None) -> Span:
+        """
+        Inicia un span hijo del span activo (o una traza nueva) y lo activa
+        en el contexto actual. Debe cerrarse con end_span.
+        """
+        parent = _current_span.get()
+
+        if parent is not None:
+            trace_id = parent.trace_id
+            parent_id = parent.span_id
+            sampled = parent.sampled
+        else:
+            trace_id = uuid.uuid4().hex
+            parent_id = None
+            sampled = random.random() < self.sample_rate
+
+        span = Span(
+            name=name,
+            trace_id=trace_id,
+            span_id=uuid.uuid4().hex[:16],
+            parent_id=parent_id,
+            start_time=time.time(),
+            sampled=sampled,
+            thread_name=threading.current_thread().name
+        )
+        span.set_attributes(attributes)
+        span._token = _current_span.set(span)
+        span._parent = parent
+
+        with self._lock:
+            self.stats['spans_started'] += 1
+            if parent is None:
+                self.stats['traces_sampled' if sampled else 'traces_unsampled'] += 1
+
+        if task_id:
+            self.bind_task(task_id, span)
+
+        return span
+
+    def end_span(self, span: Span, error: Any = None):
+        """Cierra un span, restaura el span padre y lo registra si está muestreado"""
+        if span.end_time is not None:
+            return
+
+        span.end_time = time.time()
+        if error is not None:
+            span.record_error(error)
+
+        try:
+            _current_span.reset(span._token)
+        except ValueError:
+            # Cerrado desde otro contexto: restaurar el padre explícitamente
+            _current_span.set(span._parent)
+
+        if span.sampled:
+            self._record(span)
+
+    def span(self, name: str, attributes: Dict[str, Any] = None, task_id: str = None):
+        """Context manager para medir un bloque de código"""
+        return _SpanContext(self, name, attributes, task_id)
+
+    def traced(self, name: str = None, attributes: Callable[..., Dict[str, Any]] = None):
+        """
+        Decorador que mide una función (sync o async).
+
+        Args:
+            name: Nombre del span (por defecto el nombre calificado de la función)
+            attributes: Callable opcional que recibe un dict con los argumentos
+                        de la llamada por nombre (con los valores por defecto
+                        aplicados) y devuelve atributos para el span
+        """
+        return _trace_decorator(lambda: self, name, attributes)
+
+    def bind_task(self, task_id: str, span: Span = None):
+        """Asocia la traza del span (o del span activo) a un task_id"""
+        span = span or _current_span.get()
+        if span is None or not span.sampled:
+            return
+
+        span.set_attribute('task_id', task_id)
+        with self._lock:
+            trace_ids = self._task_traces.setdefault(task_id, [])
+            if span.trace_id not in trace_ids:
+                trace_ids.append(span.trace_id)
+            self._task_traces.move_to_end(task_id)
+            while len(self._task_traces) > self.max_traces:
+                self._task_traces.popitem(last=False)
+
+    def wrap_context(self, func: Callable) -> Callable:
+        """
+        Devuelve una función que se ejecuta dentro de una copia del contexto
+        actual, para que los hilos en segundo plano hereden el span activo.
+        """
+        context = contextvars.copy_context()
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            return context.run(func, *args, **kwargs)
+        return wrapper
+
+    # -------------------------------------------------------------- storage
+
+    def _record(self, span: Span):
+        flush = []
+        with self._lock:
+            spans = self._traces.get(span.trace_id)
+            if spans is None:
+                spans = self._traces[span.trace_id] = []
+                while len(self._traces) > self.max_traces:
+                    self._traces.popitem(last=False)
+
+            if len(spans) >= self.max_spans_per_trace:
+                self.stats['spans_dropped'] += 1
+                return
+
+            spans.append(span)
+            self.stats['spans_recorded'] += 1
+
+            if self.exporter is not None:
+                self._export_buffer.append(span)
+                if (span.parent_id is None
+                        or len(self._export_buffer) >= self.export_batch_size
+                        or time.time() - self._last_export >= self.export_interval):
+                    flush = self._export_buffer
+                    self._export_buffer = []
+                    self._last_export = time.time()
+
+        if flush:
+            self._export(flush)
+
+    def _export(self, spans: List[Span]):
+        try:
+            self.exporter.export(spans)
+        except Exception as e:
+            self.stats['export_errors'] += 1
+            logger.warning(f"⚠️ Trace export failed: {e}")
+
+    def flush(self):
+        """Exporta los spans pendientes en el buffer"""
+        with self._lock:
+            pending = self._export_buffer
+            self._export_buffer = []
+            self._last_export = time.time()
+        if pending and self.exporter is not None:
+            self._export(pending)
+
+    def get_task_spans(self, task_id: str) -> List[Span]:
+        with self._lock:
+            trace_ids = list(self._task_traces.get(task_id, []))
+            spans = []
+            for trace_id in trace_ids:
+                spans.extend(self._traces.get(trace_id, []))
+        return sorted(spans, key=lambda s: s.start_time)
+
+    def render_waterfall(self, task_id: str, width: int = 60) -> Optional[Dict[str, Any]]:
+        """
+        Construye la vista waterfall de todas las trazas de una tarea
+
+        Returns:
+            Dict con spans ordenados (offset, duración, profundidad) y líneas
+            de texto con barras proporcionales, o None si no hay trazas
+        """
+        spans = self.get_task_spans(task_id)
+        if not spans:
+            return None
+
+        trace_start = spans[0].start_time
+        trace_end = max((s.end_time or time.time()) for s in spans)
+        total_ms = max((trace_end - trace_start) * 1000, 0.001)
+
+        depth_by_id: Dict[str, int] = {}
+        rows = []
+        lines = []
+        for span in spans:
+            depth = depth_by_id.get(span.parent_id, -1) + 1 if span.parent_id else 0
+            depth_by_id[span.span_id] = depth
+
+            offset_ms = (span.start_time - trace_start) * 1000
+            duration_ms = span.duration_ms
+            rows.append({
+                'name': span.name,
+                'span_id': span.span_id,
+                'parent_id': span.parent_id,
+                'trace_id': span.trace_id,
+                'depth': depth,
+                'offset_ms': round(offset_ms, 3),
+                'duration_ms': round(duration_ms, 3),
+                'status': span.status,
+                'error': span.error,
+                'thread': span.thread_name,
+                'attributes': span.attributes
+            })
+
+            bar_start = int(offset_ms / total_ms * width)
+            bar_length = max(1, int(duration_ms / total_ms * width))
+            bar = ' ' * bar_start + '█' * min(bar_length, width - bar_start)
+            label = f"{'  ' * depth}{span.name}"
+            lines.append(f"{label[:40]:<40} |{bar:<{width}}| {duration_ms:9.1f} ms")
+
+        return {
+            'task_id': task_id,
+            'trace_ids': sorted({s.trace_id for s in spans}),
+            'total_duration_ms': round(total_ms, 3),
+            'span_count': len(spans),
+            'spans': rows,
+            'waterfall': lines
+        }
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self.stats,
+                'sample_rate': self.sample_rate,
+                'traces_in_memory': len(self._traces),
+                'tasks_indexed': len(self._task_traces),
+                'export_pending': len(self._export_buffer),
+                'exporter': type(self.exporter).__name__ if self.exporter else None
+            }
+
+
+class _SpanContext:
+    """Context manager que abre y cierra un span"""
+
+    def __init__(self, tracer: Tracer, name: str, attributes: Dict[str, Any], task_id: str):
+        self.tracer = tracer
+        self.name = name
+        self.attributes = attributes
+        self.task_id = task_id
+        self.span = None
+
+    def __enter__(self) -> Span:
+        self.span = self.tracer.start_span(self.name, self.attributes, self.task_id)
+        return self.span
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.tracer.end_span(self.span, exc_val)
+        return False
+
+
+def _create_exporter_from_env():
+    export_path = os.getenv('TRACE_EXPORT_PATH', '')
+    if not export_path:
+        return None
+
+    export_format = os.getenv('TRACE_EXPORT_FORMAT', 'jsonl').lower()
+    try:
+        if export_format == 'otlp':
+            return OTLPFileExporter(export_path)
+        return JSONLFileExporter(export_path)
+    except Exception as e:
+        logger.warning(f"⚠️ Could not create trace exporter at {export_path}: {e}")
+        return None
+
+
+# Instancia global del tracer
+_tracer_instance = None
+
+def get_tracer() -> Tracer:
+    """Obtener instancia singleton del Tracer configurada desde el entorno"""
+    global _tracer_instance
+    if _tracer_instance is None:
+        _tracer_instance = Tracer(
+            sample_rate=float(os.getenv('TRACE_SAMPLE_RATE', '1.0')),
+            exporter=_create_exporter_from_env()
+        )
+    return _tracer_instance
+
+def traced(name: str = None, attributes: Callable[..., Dict[str, Any]] = None):
+    """Decorador equivalente a Tracer.traced usando el tracer global"""
+    return _trace_decorator(get_tracer, name, attributes)
+
+def _trace_decorator(tracer_getter: Callable[[], Tracer], name: str,
+                     attributes: Callable[..., Dict[str, Any]]):
+    def decorator(func):
+        span_name = name or func.__qualname__
+        signature = inspect.signature(func) if attributes else None
+
+        def _attributes(args, kwargs):
+            if not attributes:
+                return None
+            try:
+                # Por nombre: el callable no tiene que repetir la firma de la función
+                bound = signature.bind(*args, **kwargs)
+                bound.apply_defaults()
+                return attributes(bound.arguments)
+            except Exception:
+                return None
+
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with tracer_getter().span(span_name, _attributes(args, kwargs)):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with tracer_getter().span(span_name, _attributes(args, kwargs)):
+                return func(*args, **kwargs)
+        return wrapper
+
+    return decorator
@@ -4,6 +4,7 @@ Implementa capacidades avanzadas de ejecución con adaptación dinámica
 """
 
 import asyncio
+import functools
 import logging
 from typing import Dict, List, Any, Optional, Callable
 from dataclasses import dataclass, field
@@ -12,6 +13,8 @@ import time
 import json
 
 from .planning_algorithms import ExecutionPlan, TaskStep
+from ..utils.dag_scheduler import DAGScheduler, DAGNode
+from ..utils.system_sampler import get_system_sampler
 
 logger = logging.getLogger(__name__)
 
@@ -164,23 +167,18 @@ class ExecutionMonitor:
     def _get_resource_baseline(self) -> Dict[str, Any]:
         """Obtiene baseline de recursos"""
         
-        import psutil
-        
-        return {
-            "memory": psutil.virtual_memory().used,
-            "cpu": psutil.cpu_percent(),
-            "disk": psutil.disk_usage('/').used
-        }
+        return self._get_current_resources()
     
     def _get_current_resources(self) -> Dict[str, Any]:
-        """Obtiene recursos actuales"""
+        """Obtiene recursos actuales (última muestra del muestreador compartido)"""
         
-        import psutil
+        sample = get_system_sampler().latest()
         
         return {
-            "memory": psutil.virtual_memory().used,
-            "cpu": psutil.cpu_percent(),
-            "disk": psutil.disk_usage('/').used
+            "memory": sample["memory_used"],
+            "cpu": sample["cpu_percent"],
+            "disk": sample["disk_used"],
+            "children_rss": sample["children_rss"]
         }
     
     def get_metrics(self) -> Dict[str, Any]:
@@ -681,6 +679,7 @@ class AdaptiveExecutionEngine:
             "enable_error_recovery": True,
             "max_adaptation_attempts": 3,
             "parallel_execution": True,
+            "max_parallel_steps": 4,
             "resource_monitoring": True
         }
         
@@ -714,36 +713,39 @@ class AdaptiveExecutionEngine:
         }
         
         try:
-            # Ejecutar pasos del plan
-            for step in plan.steps:
-                logger.info(f"Ejecutando paso: {step.id}")
-                
-                # Verificar dependencias
-                if not await self._check_dependencies(step, execution_state):
-                    logger.warning(f"Dependencias no satisfechas para paso: {step.id}")
-                    continue
-                
-                # Ejecutar paso con monitoreo y adaptación
-                result = await self._execute_step_with_adaptation(step, context, execution_state)
-                
-                # Procesar resultado
-                execution_state["results"][step.id] = result
-                
-                if result.status == ExecutionStatus.COMPLETED:
-                    execution_state["steps_completed"] += 1
-                    logger.info(f"Paso completado exitosamente: {step.id}")
-                else:
-                    execution_state["steps_failed"] += 1
-                    logger.error(f"Paso falló: {step.id}, error: {result.error}")
-                
-                # Notificar progreso
-                if self.progress_callback:
-                    await self.progress_callback(step.id, result, execution_state)
-                
-                # Verificar si continuar
-                if not await self._should_continue_execution(execution_state):
-                    logger.info("Deteniendo ejecución por criterios de parada")
-                    break
+            if self.config["parallel_execution"]:
+                await self._execute_steps_parallel(plan, context, execution_state)
+            else:
+                # Ejecutar pasos del plan
+                for step in plan.steps:
+                    logger.info(f"Ejecutando paso: {step.id}")
+                    
+                    # Verificar dependencias
+                    if not await self._check_dependencies(step, execution_state):
+                        logger.warning(f"Dependencias no satisfechas para paso: {step.id}")
+                        continue
+                    
+                    # Ejecutar paso con monitoreo y adaptación
+                    result = await self._execute_step_with_adaptation(step, context, execution_state)
+                    
+                    # Procesar resultado
+                    execution_state["results"][step.id] = result
+                    
+                    if result.status == ExecutionStatus.COMPLETED:
+                        execution_state["steps_completed"] += 1
+                        logger.info(f"Paso completado exitosamente: {step.id}")
+                    else:
+                        execution_state["steps_failed"] += 1
+                        logger.error(f"Paso falló: {step.id}, error: {result.error}")
+                    
+                    # Notificar progreso
+                    if self.progress_callback:
+                        await self.progress_callback(step.id, result, execution_state)
+                    
+                    # Verificar si continuar
+                    if not await self._should_continue_execution(execution_state):
+                        logger.info("Deteniendo ejecución por criterios de parada")
+                        break
             
             # Finalizar ejecución
             execution_summary = await self._finalize_execution(plan, execution_state)
@@ -764,6 +766,64 @@ class AdaptiveExecutionEngine:
                 "execution_state": execution_state
             }
     
+    async def _execute_steps_parallel(self, plan: ExecutionPlan, context: ExecutionContext,
+                                      execution_state: Dict[str, Any]):
+        """
+        Ejecuta los pasos con una cola de listos: cada paso arranca en cuanto
+        terminan sus dependencias, con prioridad para el camino crítico
+        """
+        
+        nodes = [
+            DAGNode(
+                node_id=step.id,
+                dependencies=step.dependencies,
+                estimated_duration=step.estimated_duration,
+                payload=step
+            )
+            for step in plan.steps
+        ]
+        
+        async def run_step(node: DAGNode) -> ExecutionResult:
+            logger.info(f"Ejecutando paso: {node.node_id}")
+            return await self._execute_step_with_adaptation(node.payload, context, execution_state)
+        
+        async def on_step_done(node: DAGNode, result: Optional[ExecutionResult], success: bool) -> bool:
+            if result is None:
+                result = ExecutionResult(
+                    step_id=node.node_id,
+                    status=ExecutionStatus.FAILED,
+                    error="Step execution raised an exception",
+                    execution_time=0.0
+                )
+            execution_state["results"][node.node_id] = result
+            
+            if success:
+                execution_state["steps_completed"] += 1
+                logger.info(f"Paso completado exitosamente: {node.node_id}")
+            else:
+                execution_state["steps_failed"] += 1
+                logger.error(f"Paso falló: {node.node_id}, error: {result.error}")
+            
+            if self.progress_callback:
+                await self.progress_callback(node.node_id, result, execution_state)
+            
+            if not await self._should_continue_execution(execution_state):
+                logger.info("Deteniendo ejecución por criterios de parada")
+                return False
+            return True
+        
+        scheduler = DAGScheduler(max_in_flight=self.config.get("max_parallel_steps", 4))
+        dag_result = await scheduler.run(
+            nodes, run_step,
+            is_success=lambda result: result.status == ExecutionStatus.COMPLETED,
+            on_complete=on_step_done
+        )
+        
+        for step_id, reason in dag_result.cancelled.items():
+            logger.warning(f"Paso no ejecutado: {step_id} ({reason})")
+        execution_state["critical_path"] = dag_result.critical_path
+        execution_state["max_concurrency"] = dag_result.max_concurrency
+    
     async def _execute_step_with_adaptation(self, step: TaskStep, context: ExecutionContext,
                                           execution_state: Dict[str, Any]) -> ExecutionResult:
         """Ejecuta un paso con capacidades de adaptación"""
@@ -856,12 +916,17 @@ class AdaptiveExecutionEngine:
                 "step_id": step.id
             })
             
-            # Ejecutar herramienta
-            result = self.tool_manager.execute_tool(
+            # Ejecutar herramienta; en paralelo la llamada bloqueante va a un hilo
+            execute = functools.partial(
+                self.tool_manager.execute_tool,
                 step.tool, 
                 execution_params,
                 task_id=context.task_id
             )
+            if self.config["parallel_execution"]:
+                result = await asyncio.to_thread(execute)
+            else:
+                result = execute()
             
             execution_time = time.time() - start_time
             
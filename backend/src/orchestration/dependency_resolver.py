@@ -1,10 +1,17 @@
 """
 Resolvedor de dependencias para el sistema de orquestación
 Maneja la resolución de dependencias entre pasos de ejecución
+
+Todo el análisis es lineal en pasos + relaciones: las dependencias de datos,
+recursos e implícitas se resuelven con mapas productor/consumidor (cada paso
+se enlaza con el productor más cercano de cada clave, no con todos), el orden
+por niveles usa Kahn con grados de entrada y los ciclos se rompen con
+componentes fuertemente conexas (Tarjan) en lugar de enumerar ciclos.
 """
 
 import logging
-from typing import Dict, List, Set, Optional, Tuple
+from collections import defaultdict
+from typing import Callable, Dict, Iterable, List, Set, Optional, Tuple
 from dataclasses import dataclass
 from enum import Enum
 import networkx as nx
@@ -32,12 +39,95 @@ class DependencyRelation:
     resource_name: Optional[str] = None
     metadata: Dict[str, any] = None
 
+@dataclass
+class StepProfile:
+    """Recursos y datos de un paso, extraídos una sola vez por análisis"""
+    position: int
+    resources: List[str]
+    inputs: List[str]
+    outputs: List[str]
+
+# Peso de cada tipo de dependencia: al romper ciclos se eliminan primero las más débiles
+DEPENDENCY_WEIGHTS = {
+    DependencyType.SEQUENTIAL: 1.0,
+    DependencyType.RESOURCE: 0.8,
+    DependencyType.DATA: 0.9,
+    DependencyType.CONDITIONAL: 0.5,
+    DependencyType.PARALLEL: 0.3
+}
+
+# Herramientas que deben preceder a otra (dependencias implícitas)
+IMPLICIT_TOOL_DEPENDENCIES = {
+    "file_manager": ["shell"],  # file_manager debe ir antes que shell
+    "web_search": ["deep_research"],  # web_search puede ir antes que deep_research
+}
+
+# Palabras de la descripción: un paso con la clave depende de uno con el valor
+IMPLICIT_DESCRIPTION_DEPENDENCIES = {
+    "prepare": "execute",
+    "analyze": "report",
+}
+
+def strongly_connected_components(nodes: Iterable[str],
+                                  successors: Dict[str, Set[str]]) -> List[List[str]]:
+    """Tarjan iterativo: O(V + E) y sin límite de recursión"""
+    
+    index_of: Dict[str, int] = {}
+    lowlink: Dict[str, int] = {}
+    on_stack: Set[str] = set()
+    stack: List[str] = []
+    components: List[List[str]] = []
+    counter = 0
+    
+    for root in nodes:
+        if root in index_of:
+            continue
+        work = [(root, iter(successors.get(root, ())))]
+        index_of[root] = lowlink[root] = counter
+        counter += 1
+        stack.append(root)
+        on_stack.add(root)
+        
+        while work:
+            node, children = work[-1]
+            advanced = False
+            for child in children:
+                if child not in index_of:
+                    index_of[child] = lowlink[child] = counter
+                    counter += 1
+                    stack.append(child)
+                    on_stack.add(child)
+                    work.append((child, iter(successors.get(child, ()))))
+                    advanced = True
+                    break
+                if child in on_stack:
+                    lowlink[node] = min(lowlink[node], index_of[child])
+            if advanced:
+                continue
+            
+            work.pop()
+            if work:
+                parent = work[-1][0]
+                lowlink[parent] = min(lowlink[parent], lowlink[node])
+            if lowlink[node] == index_of[node]:
+                component = []
+                while True:
+                    member = stack.pop()
+                    on_stack.discard(member)
+                    component.append(member)
+                    if member == node:
+                        break
+                components.append(component)
+    
+    return components
+
 class DependencyResolver:
     """Resolvedor de dependencias para pasos de ejecución"""
     
     def __init__(self):
         self.dependency_graph = nx.DiGraph()
         self.resolved_cache = {}
+        self.removed_edges: List[Tuple[str, str]] = []
         
     def analyze_dependencies(self, steps: List[TaskStep]) -> Dict[str, List[DependencyRelation]]:
         """Analiza las dependencias entre pasos"""
@@ -46,15 +136,16 @@ class DependencyResolver:
         
         # Construir grafo de dependencias
         self._build_dependency_graph(steps)
+        profiles = self._profile_steps(steps)
         
         # Detectar dependencias implícitas
         implicit_deps = self._detect_implicit_dependencies(steps)
         
         # Detectar dependencias de recursos
-        resource_deps = self._detect_resource_dependencies(steps)
+        resource_deps = self._detect_resource_dependencies(steps, profiles)
         
         # Detectar dependencias de datos
-        data_deps = self._detect_data_dependencies(steps)
+        data_deps = self._detect_data_dependencies(steps, profiles)
         
         # Consolidar todas las dependencias
         all_dependencies = {}
@@ -94,52 +185,49 @@ class DependencyResolver:
         
         # Analizar dependencias
         dependencies = self.analyze_dependencies(steps)
+        positions = {step.id: i for i, step in enumerate(steps)}
         
-        # Construir grafo dirigido
-        graph = nx.DiGraph()
-        
-        # Agregar nodos
-        for step in steps:
-            graph.add_node(step.id, step=step)
-        
-        # Agregar aristas (dependencias)
-        for step_id, deps in dependencies.items():
+        # Grafo dirigido como listas de adyacencia; entre dos pasos se queda el
+        # tipo de dependencia más fuerte
+        successors: Dict[str, Set[str]] = {step.id: set() for step in steps}
+        edge_types: Dict[Tuple[str, str], DependencyType] = {}
+        for deps in dependencies.values():
             for dep in deps:
-                if dep.required:
-                    graph.add_edge(dep.source_step, dep.target_step, 
-                                 dependency_type=dep.dependency_type)
-        
-        # Verificar ciclos
-        if not nx.is_directed_acyclic_graph(graph):
-            cycles = list(nx.simple_cycles(graph))
-            logger.error(f"Ciclos detectados en dependencias: {cycles}")
-            # Intentar resolver ciclos
-            graph = self._resolve_cycles(graph, cycles)
-        
-        # Ordenamiento topológico por niveles
+                if not dep.required or dep.source_step not in positions:
+                    continue
+                edge = (dep.source_step, dep.target_step)
+                current = edge_types.get(edge)
+                if current is None or DEPENDENCY_WEIGHTS[dep.dependency_type] > DEPENDENCY_WEIGHTS[current]:
+                    edge_types[edge] = dep.dependency_type
+                successors[dep.source_step].add(dep.target_step)
+        
+        # Romper ciclos
+        self.removed_edges = self._resolve_cycles(successors, edge_types, positions)
+        
+        # Ordenamiento topológico por niveles (Kahn)
         try:
-            execution_levels = []
-            remaining_nodes = set(graph.nodes())
+            in_degree = {step_id: 0 for step_id in successors}
+            for targets in successors.values():
+                for target in targets:
+                    in_degree[target] += 1
             
-            while remaining_nodes:
-                # Encontrar nodos sin dependencias pendientes
-                current_level = []
-                for node in remaining_nodes:
-                    if not any(pred in remaining_nodes for pred in graph.predecessors(node)):
-                        current_level.append(node)
-                
-                if not current_level:
-                    # Deadlock - remover dependencia más débil
-                    weakest_edge = self._find_weakest_dependency(graph, remaining_nodes)
-                    if weakest_edge:
-                        graph.remove_edge(*weakest_edge)
-                        continue
-                    else:
-                        # Agregar nodos restantes como último nivel
-                        current_level = list(remaining_nodes)
-                
+            execution_levels = []
+            current_level = [step.id for step in steps if in_degree[step.id] == 0]
+            while current_level:
                 execution_levels.append(current_level)
-                remaining_nodes -= set(current_level)
+                next_level = []
+                for step_id in current_level:
+                    for target in successors[step_id]:
+                        in_degree[target] -= 1
+                        if in_degree[target] == 0:
+                            next_level.append(target)
+                current_level = sorted(next_level, key=positions.__getitem__)
+            
+            placed = sum(len(level) for level in execution_levels)
+            if placed < len(steps):
+                # No debería ocurrir tras romper ciclos: lo restante va al final
+                placed_ids = {step_id for level in execution_levels for step_id in level}
+                execution_levels.append([step.id for step in steps if step.id not in placed_ids])
             
             logger.info(f"Orden de ejecución resuelto: {len(execution_levels)} niveles")
             return execution_levels
@@ -181,6 +269,8 @@ class DependencyResolver:
         
         issues = {}
         step_ids = {step.id for step in steps}
+        circular = self._steps_with_circular_dependency(steps)
+        resource_conflicts = self._check_resource_conflicts(steps, self._profile_steps(steps))
         
         for step in steps:
             step_issues = []
@@ -191,13 +281,12 @@ class DependencyResolver:
                     step_issues.append(f"Dependencia no encontrada: {dep_id}")
             
             # Verificar dependencias circulares
-            if self._has_circular_dependency(step, steps):
+            if step.id in circular:
                 step_issues.append("Dependencia circular detectada")
             
             # Verificar dependencias de recursos
-            resource_conflicts = self._check_resource_conflicts(step, steps)
-            if resource_conflicts:
-                step_issues.extend(resource_conflicts)
+            if resource_conflicts.get(step.id):
+                step_issues.extend(resource_conflicts[step.id])
             
             if step_issues:
                 issues[step.id] = step_issues
@@ -214,141 +303,165 @@ class DependencyResolver:
             self.dependency_graph.add_node(step.id, step=step)
         
         # Agregar aristas
+        step_ids = {step.id for step in steps}
         for step in steps:
             for dep_id in step.dependencies:
-                if dep_id in [s.id for s in steps]:
+                if dep_id in step_ids:
                     self.dependency_graph.add_edge(dep_id, step.id)
     
+    def _profile_steps(self, steps: List[TaskStep]) -> Dict[str, StepProfile]:
+        """Extrae recursos, entradas y salidas de cada paso una sola vez"""
+        
+        return {
+            step.id: StepProfile(
+                position=i,
+                resources=self._extract_step_resources(step),
+                inputs=self._extract_step_inputs(step),
+                outputs=self._extract_step_outputs(step)
+            )
+            for i, step in enumerate(steps)
+        }
+    
+    @staticmethod
+    def _link_nearest_producers(steps: List[TaskStep],
+                                consumes: Callable[[TaskStep], List[str]],
+                                produces: Callable[[TaskStep], List[str]]) -> Dict[str, List[Tuple[str, str]]]:
+        """
+        Enlaza cada clave consumida con su productor más cercano: el último
+        anterior en el plan o, si no hay, el primero posterior. Un recorrido
+        con mapas clave -> productor, O(pasos + claves)
+        
+        Returns:
+            {paso consumidor: [(paso productor, clave)]}
+        """
+        
+        first_producers: Dict[str, List[str]] = defaultdict(list)
+        for step in steps:
+            for key in produces(step):
+                if len(first_producers[key]) < 2:
+                    first_producers[key].append(step.id)
+        
+        links: Dict[str, List[Tuple[str, str]]] = {}
+        last_producer: Dict[str, str] = {}
+        for step in steps:
+            step_links = []
+            for key in consumes(step):
+                producer = last_producer.get(key)
+                if producer is None:
+                    producer = next((p for p in first_producers.get(key, ()) if p != step.id), None)
+                if producer is not None:
+                    step_links.append((producer, key))
+            if step_links:
+                links[step.id] = step_links
+            for key in produces(step):
+                last_producer[key] = step.id
+        
+        return links
+    
     def _detect_implicit_dependencies(self, steps: List[TaskStep]) -> Dict[str, List[DependencyRelation]]:
         """Detecta dependencias implícitas entre pasos"""
         
         implicit_deps = {}
+        links = self._link_nearest_producers(
+            steps, self._implicit_dependency_keys, self._implicit_dependency_provides
+        )
         
-        for i, step in enumerate(steps):
+        for step_id, step_links in links.items():
+            seen = set()
             step_deps = []
-            
-            for j, other_step in enumerate(steps):
-                if i != j and self._should_have_implicit_dependency(step, other_step):
-                    step_deps.append(DependencyRelation(
-                        source_step=other_step.id,
-                        target_step=step.id,
-                        dependency_type=DependencyType.SEQUENTIAL,
-                        required=False
-                    ))
-            
-            if step_deps:
-                implicit_deps[step.id] = step_deps
+            for source_id, _ in step_links:
+                if source_id in seen:
+                    continue
+                seen.add(source_id)
+                step_deps.append(DependencyRelation(
+                    source_step=source_id,
+                    target_step=step_id,
+                    dependency_type=DependencyType.SEQUENTIAL,
+                    required=False
+                ))
+            implicit_deps[step_id] = step_deps
         
         return implicit_deps
     
-    def _detect_resource_dependencies(self, steps: List[TaskStep]) -> Dict[str, List[DependencyRelation]]:
-        """Detecta dependencias de recursos compartidos"""
-        
+    def _detect_resource_dependencies(self, steps: List[TaskStep],
+                                      profiles: Dict[str, StepProfile] = None) -> Dict[str, List[DependencyRelation]]:
+        """
+        Detecta dependencias de recursos compartidos: los usuarios de un mismo
+        recurso se encadenan en el orden del plan (cada uno depende del
+        anterior), sin relacionar todos los pares
+        """
+        
+        profiles = profiles or self._profile_steps(steps)
         resource_deps = {}
+        last_user: Dict[str, str] = {}
         
-        # Mapear recursos por paso
-        step_resources = {}
         for step in steps:
-            resources = self._extract_step_resources(step)
-            if resources:
-                step_resources[step.id] = resources
-        
-        # Detectar conflictos de recursos
-        for step in steps:
-            if step.id not in step_resources:
-                continue
-            
             step_deps = []
-            step_resources_set = set(step_resources[step.id])
-            
-            for other_step in steps:
-                if (step.id != other_step.id and 
-                    other_step.id in step_resources and
-                    step_resources_set.intersection(set(step_resources[other_step.id]))):
-                    
-                    # Conflicto de recursos - crear dependencia
-                    step_deps.append(DependencyRelation(
-                        source_step=other_step.id,
-                        target_step=step.id,
-                        dependency_type=DependencyType.RESOURCE,
-                        required=True,
-                        resource_name=list(step_resources_set.intersection(
-                            set(step_resources[other_step.id])
-                        ))[0]
-                    ))
+            seen = set()
+            for resource in profiles[step.id].resources:
+                previous = last_user.get(resource)
+                last_user[resource] = step.id
+                if previous is None or previous == step.id or previous in seen:
+                    continue
+                seen.add(previous)
+                step_deps.append(DependencyRelation(
+                    source_step=previous,
+                    target_step=step.id,
+                    dependency_type=DependencyType.RESOURCE,
+                    required=True,
+                    resource_name=resource
+                ))
             
             if step_deps:
                 resource_deps[step.id] = step_deps
         
         return resource_deps
     
-    def _detect_data_dependencies(self, steps: List[TaskStep]) -> Dict[str, List[DependencyRelation]]:
-        """Detecta dependencias de datos entre pasos"""
+    def _detect_data_dependencies(self, steps: List[TaskStep],
+                                  profiles: Dict[str, StepProfile] = None) -> Dict[str, List[DependencyRelation]]:
+        """Detecta dependencias de datos: cada entrada viene de su productor más cercano"""
         
-        data_deps = {}
+        profiles = profiles or self._profile_steps(steps)
+        links = self._link_nearest_producers(
+            steps,
+            lambda step: profiles[step.id].inputs,
+            lambda step: profiles[step.id].outputs
+        )
         
-        # Mapear datos de entrada y salida
-        step_inputs = {}
-        step_outputs = {}
-        
-        for step in steps:
-            inputs = self._extract_step_inputs(step)
-            outputs = self._extract_step_outputs(step)
-            
-            if inputs:
-                step_inputs[step.id] = inputs
-            if outputs:
-                step_outputs[step.id] = outputs
-        
-        # Detectar dependencias de datos
-        for step in steps:
-            if step.id not in step_inputs:
-                continue
-            
-            step_deps = []
-            
-            for input_data in step_inputs[step.id]:
-                # Buscar pasos que producen este dato
-                for other_step in steps:
-                    if (step.id != other_step.id and 
-                        other_step.id in step_outputs and
-                        input_data in step_outputs[other_step.id]):
-                        
-                        step_deps.append(DependencyRelation(
-                            source_step=other_step.id,
-                            target_step=step.id,
-                            dependency_type=DependencyType.DATA,
-                            required=True,
-                            metadata={"data_item": input_data}
-                        ))
-            
-            if step_deps:
-                data_deps[step.id] = step_deps
-        
-        return data_deps
+        return {
+            step_id: [
+                DependencyRelation(
+                    source_step=source_id,
+                    target_step=step_id,
+                    dependency_type=DependencyType.DATA,
+                    required=True,
+                    metadata={"data_item": data_item}
+                )
+                for source_id, data_item in step_links
+            ]
+            for step_id, step_links in links.items()
+        }
     
-    def _should_have_implicit_dependency(self, step1: TaskStep, step2: TaskStep) -> bool:
-        """Determina si debe existir una dependencia implícita"""
+    def _implicit_dependency_keys(self, step: TaskStep) -> List[str]:
+        """Claves de los pasos de los que este paso depende implícitamente"""
         
         # Dependencias basadas en herramientas
-        tool_dependencies = {
-            "file_manager": ["shell"],  # file_manager debe ir antes que shell
-            "web_search": ["deep_research"],  # web_search puede ir antes que deep_research
-        }
-        
-        if step1.tool in tool_dependencies:
-            return step2.tool in tool_dependencies[step1.tool]
+        if step.tool in IMPLICIT_TOOL_DEPENDENCIES:
+            return [f"tool:{tool}" for tool in IMPLICIT_TOOL_DEPENDENCIES[step.tool]]
         
         # Dependencias basadas en operaciones
-        if ("prepare" in step1.description.lower() and 
-            "execute" in step2.description.lower()):
-            return True
-        
-        if ("analyze" in step1.description.lower() and 
-            "report" in step2.description.lower()):
-            return True
-        
-        return False
+        description = step.description.lower()
+        return [f"operation:{operation}" for word, operation in IMPLICIT_DESCRIPTION_DEPENDENCIES.items()
+                if word in description]
+    
+    def _implicit_dependency_provides(self, step: TaskStep) -> List[str]:
+        """Claves por las que otros pasos pueden depender implícitamente de este"""
+        
+        description = step.description.lower()
+        keys = [f"tool:{step.tool}"]
+        keys.extend(f"operation:{operation}" for operation in IMPLICIT_DESCRIPTION_DEPENDENCIES.values()
+                    if operation in description)
+        return keys
     
     def _extract_step_resources(self, step: TaskStep) -> List[str]:
         """Extrae recursos utilizados por un paso"""
@@ -425,74 +538,73 @@ class DependencyResolver:
         
         return outputs
     
-    def _resolve_cycles(self, graph: nx.DiGraph, cycles: List[List[str]]) -> nx.DiGraph:
-        """Resuelve ciclos en el grafo de dependencias"""
-        
-        logger.info(f"Resolviendo {len(cycles)} ciclos")
-        
-        for cycle in cycles:
-            # Encontrar la arista más débil en el ciclo
-            weakest_edge = None
-            min_weight = float('inf')
-            
-            for i in range(len(cycle)):
-                source = cycle[i]
-                target = cycle[(i + 1) % len(cycle)]
-                
-                if graph.has_edge(source, target):
-                    # Calcular peso de la arista
-                    edge_data = graph.get_edge_data(source, target)
-                    weight = self._calculate_edge_weight(source, target, edge_data)
-                    
-                    if weight < min_weight:
-                        min_weight = weight
-                        weakest_edge = (source, target)
+    def _resolve_cycles(self, successors: Dict[str, Set[str]],
+                        edge_types: Dict[Tuple[str, str], DependencyType],
+                        positions: Dict[str, int]) -> List[Tuple[str, str]]:
+        """
+        Rompe los ciclos del grafo (modificándolo) y devuelve las aristas eliminadas
+        
+        Las aristas se vuelven a añadir por clases, de la más fuerte a la más
+        débil (por peso y, a igual peso, primero las que siguen el orden del
+        plan). Tras añadir una clase se calculan las componentes fuertemente
+        conexas (Tarjan) y se quitan las aristas de esa clase que quedan dentro
+        de una: son exactamente las que cierran un ciclo con dependencias más
+        fuertes. El grafo es acíclico tras cada clase; como mucho 2 pasadas por
+        tipo de dependencia, O(V + E)
+        """
+        
+        removed = []
+        classes: Dict[Tuple[float, bool], List[Tuple[str, str]]] = defaultdict(list)
+        for source, targets in successors.items():
+            for target in targets:
+                if source == target:
+                    # Un paso que depende de sí mismo no tiene arreglo posible
+                    removed.append((source, target))
+                    continue
+                dep_type = edge_types.get((source, target), DependencyType.SEQUENTIAL)
+                weight = self._calculate_edge_weight(source, target, {"dependency_type": dep_type})
+                classes[(weight, positions[source] < positions[target])].append((source, target))
+        
+        kept: Dict[str, Set[str]] = {node: set() for node in successors}
+        has_backward_edges = False
+        for weight, forward in sorted(classes, reverse=True):
+            edges = classes[(weight, forward)]
+            for source, target in edges:
+                kept[source].add(target)
+            has_backward_edges = has_backward_edges or not forward
+            if not has_backward_edges:
+                # Solo aristas en el orden del plan: no puede haber ciclos
+                continue
             
-            # Remover la arista más débil
-            if weakest_edge:
-                graph.remove_edge(*weakest_edge)
-                logger.info(f"Removida arista débil: {weakest_edge[0]} -> {weakest_edge[1]}")
-        
-        return graph
+            component_of = {}
+            for number, component in enumerate(strongly_connected_components(kept, kept)):
+                if len(component) > 1:
+                    for node in component:
+                        component_of[node] = number
+            for source, target in edges:
+                if source in component_of and component_of[source] == component_of.get(target):
+                    kept[source].discard(target)
+                    removed.append((source, target))
+        
+        for node in successors:
+            successors[node] = kept[node]
+        
+        if removed:
+            logger.warning(f"Ciclos en dependencias: removidas {len(removed)} aristas débiles")
+        return removed
     
     def _calculate_edge_weight(self, source: str, target: str, edge_data: Dict) -> float:
         """Calcula el peso de una arista de dependencia"""
         
-        # Peso basado en tipo de dependencia
-        type_weights = {
-            DependencyType.SEQUENTIAL: 1.0,
-            DependencyType.RESOURCE: 0.8,
-            DependencyType.DATA: 0.9,
-            DependencyType.CONDITIONAL: 0.5,
-            DependencyType.PARALLEL: 0.3
-        }
-        
         dep_type = edge_data.get("dependency_type", DependencyType.SEQUENTIAL)
-        return type_weights.get(dep_type, 1.0)
-    
-    def _find_weakest_dependency(self, graph: nx.DiGraph, nodes: Set[str]) -> Optional[Tuple[str, str]]:
-        """Encuentra la dependencia más débil en un conjunto de nodos"""
-        
-        weakest_edge = None
-        min_weight = float('inf')
-        
-        for node in nodes:
-            for pred in graph.predecessors(node):
-                if pred in nodes:
-                    edge_data = graph.get_edge_data(pred, node)
-                    weight = self._calculate_edge_weight(pred, node, edge_data)
-                    
-                    if weight < min_weight:
-                        min_weight = weight
-                        weakest_edge = (pred, node)
-        
-        return weakest_edge
+        return DEPENDENCY_WEIGHTS.get(dep_type, 1.0)
     
     def _group_parallel_compatible_steps(self, step_ids: List[str], steps: List[TaskStep]) -> List[List[str]]:
         """Agrupa pasos compatibles para ejecución paralela"""
         
         # Crear diccionario de pasos
         step_dict = {step.id: step for step in steps}
+        profiles = self._profile_steps([step_dict[step_id] for step_id in step_ids])
         
         # Verificar qué pasos pueden ejecutarse en paralelo
         parallel_groups = []
@@ -509,7 +621,7 @@ class DependencyResolver:
             compatible_steps = []
             for step_id in remaining_steps:
                 step = step_dict[step_id]
-                if self._can_execute_in_parallel(base_step, step):
+                if self._can_execute_in_parallel(base_step, step, profiles):
                     compatible_steps.append(step_id)
             
             # Agregar pasos compatibles al grupo
@@ -521,18 +633,19 @@ class DependencyResolver:
         
         return parallel_groups
     
-    def _can_execute_in_parallel(self, step1: TaskStep, step2: TaskStep) -> bool:
+    def _can_execute_in_parallel(self, step1: TaskStep, step2: TaskStep,
+                                 profiles: Dict[str, StepProfile] = None) -> bool:
         """Determina si dos pasos pueden ejecutarse en paralelo"""
         
         # Verificar si ambos pasos pueden paralelizarse
         if not (step1.can_parallelize and step2.can_parallelize):
             return False
         
-        # Verificar conflictos de recursos
-        step1_resources = set(self._extract_step_resources(step1))
-        step2_resources = set(self._extract_step_resources(step2))
+        profiles = profiles or self._profile_steps([step1, step2])
+        profile1, profile2 = profiles[step1.id], profiles[step2.id]
         
-        if step1_resources.intersection(step2_resources):
+        # Verificar conflictos de recursos
+        if set(profile1.resources).intersection(profile2.resources):
             return False
         
         # Verificar conflictos de herramientas
@@ -541,56 +654,60 @@ class DependencyResolver:
             return False
         
         # Verificar dependencias de datos
-        step1_outputs = set(self._extract_step_outputs(step1))
-        step2_inputs = set(self._extract_step_inputs(step2))
-        
-        if step1_outputs.intersection(step2_inputs):
+        if set(profile1.outputs).intersection(profile2.inputs):
             return False
         
         return True
     
-    def _has_circular_dependency(self, step: TaskStep, steps: List[TaskStep]) -> bool:
-        """Verifica si un paso tiene dependencias circulares"""
+    def _steps_with_circular_dependency(self, steps: List[TaskStep]) -> Set[str]:
+        """
+        Pasos con dependencias explícitas circulares: los que están en un ciclo
+        y los que dependen (directa o indirectamente) de uno. O(V + E)
+        """
         
-        visited = set()
-        rec_stack = set()
-        
-        def dfs(step_id: str) -> bool:
-            if step_id in rec_stack:
-                return True
-            if step_id in visited:
-                return False
-            
-            visited.add(step_id)
-            rec_stack.add(step_id)
-            
-            # Buscar el paso
-            current_step = next((s for s in steps if s.id == step_id), None)
-            if current_step:
-                for dep_id in current_step.dependencies:
-                    if dfs(dep_id):
-                        return True
-            
-            rec_stack.remove(step_id)
-            return False
-        
-        return dfs(step.id)
+        dependents: Dict[str, Set[str]] = {step.id: set() for step in steps}
+        for step in steps:
+            for dep_id in step.dependencies:
+                if dep_id in dependents:
+                    dependents[dep_id].add(step.id)
+        
+        circular = set()
+        for component in strongly_connected_components(dependents, dependents):
+            if len(component) > 1 or component[0] in dependents[component[0]]:
+                circular.update(component)
+        
+        pending = list(circular)
+        while pending:
+            for dependent in dependents[pending.pop()]:
+                if dependent not in circular:
+                    circular.add(dependent)
+                    pending.append(dependent)
+        
+        return circular
     
-    def _check_resource_conflicts(self, step: TaskStep, steps: List[TaskStep]) -> List[str]:
-        """Verifica conflictos de recursos"""
-        
-        conflicts = []
-        step_resources = set(self._extract_step_resources(step))
+    def _check_resource_conflicts(self, steps: List[TaskStep],
+                                  profiles: Dict[str, StepProfile]) -> Dict[str, List[str]]:
+        """
+        Verifica conflictos de recursos: cada paso con el usuario anterior y el
+        siguiente de cada recurso, que son los que se encadenan al resolver
+        """
+        
+        users: Dict[str, List[str]] = defaultdict(list)
+        for step in steps:
+            for resource in dict.fromkeys(profiles[step.id].resources):
+                users[resource].append(step.id)
         
-        for other_step in steps:
-            if step.id != other_step.id:
-                other_resources = set(self._extract_step_resources(other_step))
-                common_resources = step_resources.intersection(other_resources)
-                
-                if common_resources:
-                    conflicts.append(f"Conflicto de recursos con {other_step.id}: {list(common_resources)}")
+        shared: Dict[str, Dict[str, List[str]]] = defaultdict(dict)
+        for resource, step_ids in users.items():
+            for previous, current in zip(step_ids, step_ids[1:]):
+                shared[current].setdefault(previous, []).append(resource)
+                shared[previous].setdefault(current, []).append(resource)
         
-        return conflicts
+        return {
+            step_id: [f"Conflicto de recursos con {other_id}: {resources}"
+                      for other_id, resources in others.items()]
+            for step_id, others in shared.items()
+        }
     
     def get_dependency_metrics(self, steps: List[TaskStep]) -> Dict[str, any]:
         """Obtiene métricas de dependencias"""
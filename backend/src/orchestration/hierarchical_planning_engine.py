@@ -5,11 +5,15 @@ Implementa capacidades avanzadas de descomposición y planificación de tareas
 
 import asyncio
 import logging
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Set
 from dataclasses import dataclass
 import time
+import uuid
 
 from .planning_algorithms import PlanningAlgorithms, ExecutionPlan, TaskStep, PlanningStrategy
+from .plan_analysis import PlanAnalysis
+from .dependency_resolver import strongly_connected_components
+from ..planning.semantic_plan_cache import get_plan_cache
 
 logger = logging.getLogger(__name__)
 
@@ -32,8 +36,8 @@ class HierarchicalPlanningEngine:
         self.memory_manager = memory_manager
         self.planning_algorithms = PlanningAlgorithms(llm_service)
         
-        # Cache de planes para optimización
-        self.plan_cache = {}
+        # Cache semántica de planes compartida con el resto de planificadores
+        self.plan_cache = get_plan_cache()
         
         # Métricas de planificación
         self.planning_metrics = {
@@ -170,34 +174,33 @@ class HierarchicalPlanningEngine:
                                         analysis: Dict[str, Any]) -> ExecutionPlan:
         """Agrega estructura jerárquica al plan"""
         
-        # Organizar pasos en niveles jerárquicos
-        hierarchical_steps = []
-        current_level = 0
+        # Niveles, padres, hijos, criticidad y tiempos CPM en una sola pasada
+        self._apply_plan_analysis(plan)
+        
+        return plan
+    
+    def _get_plan_analysis(self, plan: ExecutionPlan) -> PlanAnalysis:
+        """Análisis CPM cacheado en el plan (incremental si solo cambiaron algunos pasos)"""
+        
+        return PlanAnalysis.for_plan(plan)
+    
+    def _apply_plan_analysis(self, plan: ExecutionPlan) -> PlanAnalysis:
+        """Vuelca el análisis en los metadatos de los pasos y del plan"""
+        
+        plan_analysis = self._get_plan_analysis(plan)
         
         for step in plan.steps:
-            # Calcular nivel jerárquico basado en dependencias
-            level = self._calculate_hierarchy_level(step, plan.steps)
-            
-            # Agregar metadatos jerárquicos
             step.metadata = getattr(step, 'metadata', {})
-            step.metadata.update({
-                "hierarchy_level": level,
-                "parent_steps": self._find_parent_steps(step, plan.steps),
-                "child_steps": self._find_child_steps(step, plan.steps),
-                "criticality": self._calculate_step_criticality(step, plan.steps)
-            })
-            
-            hierarchical_steps.append(step)
+            step.metadata.update(plan_analysis.step_summary(step.id))
         
-        # Actualizar plan con estructura jerárquica
-        plan.steps = hierarchical_steps
         plan.metadata.update({
-            "hierarchy_levels": max(step.metadata.get("hierarchy_level", 0) for step in hierarchical_steps) + 1,
-            "critical_path": self._identify_critical_path(hierarchical_steps),
-            "parallel_branches": self._identify_parallel_branches(hierarchical_steps)
+            "hierarchy_levels": plan_analysis.hierarchy_levels,
+            "critical_path": self._identify_critical_path(plan_analysis),
+            "critical_path_duration": plan_analysis.project_duration,
+            "parallel_branches": self._identify_parallel_branches(plan.steps)
         })
         
-        return plan
+        return plan_analysis
     
     async def _optimize_plan(self, plan: ExecutionPlan, context: PlanningContext) -> ExecutionPlan:
         """Optimiza el plan para mejorar eficiencia"""
@@ -219,10 +222,11 @@ class HierarchicalPlanningEngine:
         # Actualizar plan con pasos optimizados
         plan.steps = optimized_steps
         
-        # Recalcular métricas
+        # Recalcular métricas (el análisis se actualiza solo en los pasos cambiados)
         plan.total_estimated_duration = sum(step.estimated_duration for step in optimized_steps)
         plan.complexity_score = self._recalculate_complexity(optimized_steps)
         plan.success_probability = self._recalculate_success_probability(optimized_steps)
+        self._apply_plan_analysis(plan)
         
         return plan
     
@@ -291,53 +295,39 @@ class HierarchicalPlanningEngine:
         return plan
     
     async def _check_plan_cache(self, task_description: str, available_tools: List[str]) -> Optional[ExecutionPlan]:
-        """Verifica si existe un plan en cache"""
-        
-        cache_key = self._generate_cache_key(task_description, available_tools)
-        
-        if cache_key in self.plan_cache:
-            cached_entry = self.plan_cache[cache_key]
-            
-            # Verificar si el cache no ha expirado (1 hora)
-            if time.time() - cached_entry["timestamp"] < 3600:
-                return cached_entry["plan"]
-        
-        return None
-    
-    async def _cache_plan(self, task_description: str, plan: ExecutionPlan, available_tools: List[str]):
-        """Cachea un plan para uso futuro"""
+        """Busca un plan exitoso para una tarea equivalente (mismas herramientas)"""
         
-        cache_key = self._generate_cache_key(task_description, available_tools)
-        
-        self.plan_cache[cache_key] = {
-            "plan": plan,
-            "timestamp": time.time()
+        # El id nuevo vincula los resultados de este plan con la entrada original
+        plan_id = f"plan_{int(time.time())}_{uuid.uuid4().hex[:8]}"
+        hit = self.plan_cache.lookup(
+            'hierarchical', task_description,
+            constraints=tuple(sorted(available_tools)), task_id=plan_id
+        )
+        if hit is None:
+            return None
+        
+        plan = hit.plan
+        plan.id = plan_id
+        plan.created_at = time.strftime("%Y-%m-%d %H:%M:%S")
+        plan.metadata["plan_cache"] = {
+            "entry_id": hit.entry_id,
+            "similarity": hit.similarity,
+            "source_request": hit.source_request
         }
-        
-        # Limpiar cache si está muy lleno
-        if len(self.plan_cache) > 100:
-            await self._cleanup_cache()
+        return plan
     
-    async def _cleanup_cache(self):
-        """Limpia el cache de planes"""
-        
-        current_time = time.time()
-        expired_keys = []
-        
-        for key, entry in self.plan_cache.items():
-            if current_time - entry["timestamp"] > 3600:  # 1 hora
-                expired_keys.append(key)
+    async def _cache_plan(self, task_description: str, plan: ExecutionPlan, available_tools: List[str]):
+        """Cachea un plan; se servirá cuando una ejecución suya tenga éxito"""
         
-        for key in expired_keys:
-            del self.plan_cache[key]
+        self.plan_cache.store(
+            'hierarchical', task_description, plan,
+            constraints=tuple(sorted(available_tools)), task_id=plan.id
+        )
     
-    def _generate_cache_key(self, task_description: str, available_tools: List[str]) -> str:
-        """Genera una clave única para el cache"""
-        
-        import hashlib
+    def record_plan_outcome(self, plan_id: str, success: bool):
+        """Registra el resultado de ejecutar un plan para la caché de planes"""
         
-        content = f"{task_description}:{sorted(available_tools)}"
-        return hashlib.md5(content.encode()).hexdigest()
+        self.plan_cache.record_outcome(success, task_id=plan_id)
     
     def _classify_task_type(self, task_description: str) -> str:
         """Clasifica el tipo de tarea"""
@@ -651,26 +641,10 @@ class HierarchicalPlanningEngine:
     async def _optimize_step_sequence(self, steps: List[TaskStep], context: PlanningContext) -> List[TaskStep]:
         """Optimiza la secuencia de pasos"""
         
-        # Reordenar pasos para optimizar eficiencia
-        optimized_steps = []
-        remaining_steps = steps.copy()
-        
-        while remaining_steps:
-            # Buscar próximo paso que se puede ejecutar
-            next_step = None
-            for step in remaining_steps:
-                if all(dep_id in [s.id for s in optimized_steps] for dep_id in step.dependencies):
-                    next_step = step
-                    break
-            
-            if next_step:
-                optimized_steps.append(next_step)
-                remaining_steps.remove(next_step)
-            else:
-                # Si no hay próximo paso válido, agregar el primero disponible
-                optimized_steps.append(remaining_steps.pop(0))
-        
-        return optimized_steps
+        # Cada paso tras sus dependencias, respetando el orden original entre
+        # los que están listos (orden topológico estable del análisis)
+        plan_analysis = PlanAnalysis(steps)
+        return [plan_analysis.steps[step_id] for step_id in plan_analysis.sequence_order()]
     
     async def _optimize_resource_usage(self, steps: List[TaskStep], context: PlanningContext) -> List[TaskStep]:
         """Optimiza el uso de recursos"""
@@ -694,15 +668,15 @@ class HierarchicalPlanningEngine:
     async def _optimize_parallelization(self, steps: List[TaskStep]) -> List[TaskStep]:
         """Optimiza oportunidades de paralelización"""
         
-        # Identificar pasos que pueden ejecutarse en paralelo
-        for i, step in enumerate(steps):
-            if step.can_parallelize:
-                # Verificar si realmente puede paralelizarse
-                for j, other_step in enumerate(steps):
-                    if i != j and not self._steps_conflict(step, other_step):
-                        # Remover dependencia si no es necesaria
-                        if step.id in other_step.dependencies:
-                            other_step.dependencies.remove(step.id)
+        # Una dependencia de un paso paralelizable sobra si los pasos no
+        # comparten herramienta ni recursos: basta recorrer las aristas
+        steps_by_id = {step.id: step for step in steps}
+        for step in steps:
+            for dep_id in dict.fromkeys(step.dependencies):
+                parent = steps_by_id.get(dep_id)
+                if (parent is not None and parent is not step and parent.can_parallelize
+                        and not self._steps_conflict(parent, step)):
+                    step.dependencies.remove(dep_id)
         
         return steps
     
@@ -732,61 +706,10 @@ class HierarchicalPlanningEngine:
         
         return False
     
-    def _calculate_hierarchy_level(self, step: TaskStep, all_steps: List[TaskStep]) -> int:
-        """Calcula el nivel jerárquico de un paso"""
-        
-        if not step.dependencies:
-            return 0
-        
-        max_parent_level = 0
-        for dep_id in step.dependencies:
-            parent_step = next((s for s in all_steps if s.id == dep_id), None)
-            if parent_step:
-                parent_level = self._calculate_hierarchy_level(parent_step, all_steps)
-                max_parent_level = max(max_parent_level, parent_level)
-        
-        return max_parent_level + 1
-    
-    def _find_parent_steps(self, step: TaskStep, all_steps: List[TaskStep]) -> List[str]:
-        """Encuentra los pasos padre de un paso"""
-        
-        return step.dependencies.copy()
-    
-    def _find_child_steps(self, step: TaskStep, all_steps: List[TaskStep]) -> List[str]:
-        """Encuentra los pasos hijo de un paso"""
-        
-        children = []
-        for other_step in all_steps:
-            if step.id in other_step.dependencies:
-                children.append(other_step.id)
-        
-        return children
-    
-    def _calculate_step_criticality(self, step: TaskStep, all_steps: List[TaskStep]) -> float:
-        """Calcula la criticidad de un paso"""
-        
-        # Criticidad basada en dependencias
-        dependents = len(self._find_child_steps(step, all_steps))
-        dependency_factor = dependents / len(all_steps) if all_steps else 0
-        
-        # Criticidad basada en complejidad
-        complexity_factor = step.complexity
-        
-        # Criticidad basada en duración
-        total_duration = sum(s.estimated_duration for s in all_steps)
-        duration_factor = step.estimated_duration / total_duration if total_duration > 0 else 0
-        
-        return (dependency_factor + complexity_factor + duration_factor) / 3
-    
-    def _identify_critical_path(self, steps: List[TaskStep]) -> List[str]:
-        """Identifica la ruta crítica del plan"""
+    def _identify_critical_path(self, plan_analysis: PlanAnalysis) -> List[str]:
+        """Identifica la ruta crítica del plan (pasos sin holgura, CPM)"""
         
-        # Implementación simple: pasos con mayor criticidad
-        critical_steps = sorted(steps, 
-                              key=lambda s: s.metadata.get("criticality", 0), 
-                              reverse=True)
-        
-        return [step.id for step in critical_steps[:min(3, len(critical_steps))]]
+        return plan_analysis.critical_path()
     
     def _identify_parallel_branches(self, steps: List[TaskStep]) -> List[List[str]]:
         """Identifica ramas paralelas del plan"""
@@ -816,62 +739,44 @@ class HierarchicalPlanningEngine:
     def _has_dependency_cycles(self, steps: List[TaskStep]) -> bool:
         """Detecta ciclos en las dependencias"""
         
-        # Implementación simple de detección de ciclos
-        visited = set()
-        rec_stack = set()
-        
-        def has_cycle(step_id):
-            if step_id in rec_stack:
-                return True
-            if step_id in visited:
-                return False
-            
-            visited.add(step_id)
-            rec_stack.add(step_id)
-            
-            step = next((s for s in steps if s.id == step_id), None)
-            if step:
-                for dep in step.dependencies:
-                    if has_cycle(dep):
-                        return True
-            
-            rec_stack.remove(step_id)
-            return False
-        
-        for step in steps:
-            if step.id not in visited:
-                if has_cycle(step.id):
-                    return True
-        
-        return False
+        # Los pasos que el orden topológico no puede colocar están en (o tras) un ciclo
+        return PlanAnalysis(steps).has_cycles
     
     def _remove_dependency_cycles(self, steps: List[TaskStep]) -> List[TaskStep]:
         """Remueve ciclos en las dependencias"""
         
-        # Implementación simple: remover dependencias que causan ciclos
+        # Todos los ciclos quedan dentro de componentes fuertemente conexas (Tarjan,
+        # una pasada): en cada una se quitan las dependencias hacia pasos posteriores
+        # del plan, con lo que solo quedan aristas hacia atrás y deja de haber ciclos.
+        # Las demás dependencias no se tocan; en s0 <-> s1 se mantiene s1 -> s0
+        positions: Dict[str, int] = {}
+        successors: Dict[str, Set[str]] = {}
+        for position, step in enumerate(steps):
+            positions.setdefault(step.id, position)
+            successors.setdefault(step.id, set()).update(step.dependencies)
+        
+        component_of: Dict[str, int] = {}
+        for number, component in enumerate(strongly_connected_components(successors, successors)):
+            if len(component) > 1:
+                for node in component:
+                    component_of[node] = number
+        
+        removed = 0
         for step in steps:
-            safe_dependencies = []
-            for dep in step.dependencies:
-                # Verificar si agregar esta dependencia causa un ciclo
-                test_step = TaskStep(
-                    id=step.id,
-                    title=step.title,
-                    description=step.description,
-                    tool=step.tool,
-                    parameters=step.parameters,
-                    dependencies=safe_dependencies + [dep],
-                    estimated_duration=step.estimated_duration,
-                    complexity=step.complexity,
-                    priority=step.priority,
-                    can_parallelize=step.can_parallelize
+            component = component_of.get(step.id)
+            safe_dependencies = [
+                dep for dep in step.dependencies
+                if dep != step.id and not (
+                    component is not None
+                    and component_of.get(dep) == component
+                    and positions[dep] > positions[step.id]
                 )
-                
-                temp_steps = [s for s in steps if s.id != step.id] + [test_step]
-                if not self._has_dependency_cycles(temp_steps):
-                    safe_dependencies.append(dep)
-            
+            ]
+            removed += len(step.dependencies) - len(safe_dependencies)
             step.dependencies = safe_dependencies
         
+        if removed:
+            logger.warning(f"Ciclos en dependencias: removidas {removed} dependencias")
         return steps
     
     def _find_alternative_tool(self, original_tool: str, available_tools: List[str]) -> Optional[str]:
@@ -0,0 +1,332 @@
+"""
+Análisis estructural de planes (método del camino crítico)
+
+El motor jerárquico calculaba por separado, para cada paso, su nivel, sus
+padres, sus hijos y su criticidad recorriendo todos los pasos del plan
+(cuadrático, y el nivel recursivo sin memoizar podía explotar). PlanAnalysis
+lo calcula una vez en O(V + E):
+
+- Adyacencia (padres e hijos), dependencias que no están en el plan y ciclos
+- Nivel jerárquico (camino más largo en número de pasos desde una raíz)
+- CPM: inicio/fin más temprano (ES/EF) y más tardío (LS/LF), holgura y ruta crítica
+
+El análisis se guarda en el propio plan (for_plan) y refresh() aplica solo
+los cambios cuando una replanificación toca unos pocos pasos: se recalcula
+hacia delante desde los pasos cambiados y hacia atrás desde sus ancestros.
+"""
+
+import heapq
+import logging
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Por encima de esta fracción de pasos cambiados sale más a cuenta reconstruir
+INCREMENTAL_MAX_FRACTION = 0.25
+SLACK_EPSILON = 1e-9
+
+
+def _signature(step) -> Tuple[Tuple[str, ...], float]:
+    return tuple(step.dependencies), float(step.estimated_duration)
+
+
+class PlanAnalysis:
+    """Adyacencia, niveles y tiempos CPM de los pasos de un plan"""
+
+    def __init__(self, steps: List[Any]):
+        self.stats = {'full_builds': 0, 'incremental_updates': 0, 'steps_recomputed': 0}
+        self._build(steps)
+
+    @classmethod
+    def for_plan(cls, plan) -> 'PlanAnalysis':
+        """Análisis cacheado en el plan, actualizado con los cambios de sus pasos"""
+        analysis = getattr(plan, '_analysis', None)
+        if analysis is None:
+            analysis = cls(plan.steps)
+            # Atributo fuera de los campos del dataclass: asdict y la serialización lo ignoran
+            plan._analysis = analysis
+        else:
+            analysis.refresh(plan.steps)
+        return analysis
+
+    # ------------------------------------------------------------------ construcción completa
+
+    def _index_steps(self, steps: List[Any]):
+        self.steps = {step.id: step for step in steps}
+        self.position = {step.id: index for index, step in enumerate(steps)}
+        self.duration = {step.id: float(step.estimated_duration) for step in steps}
+        self.total_duration = sum(self.duration.values())
+
+    def _link(self, step_id: str):
+        """Enlazar un paso con sus dependencias (las que no están en el plan quedan en espera)"""
+        parents, missing = [], []
+        for dependency in dict.fromkeys(self.steps[step_id].dependencies):
+            if dependency in self.steps:
+                parents.append(dependency)
+                self.children[dependency].append(step_id)
+            else:
+                missing.append(dependency)
+                self._waiting.setdefault(dependency, set()).add(step_id)
+        self.parents[step_id] = parents
+        self.missing[step_id] = missing
+
+    def _unlink(self, step_id: str):
+        for parent in self.parents.pop(step_id, []):
+            if parent in self.children:
+                self.children[parent].remove(step_id)
+        for dependency in self.missing.pop(step_id, []):
+            waiting = self._waiting.get(dependency)
+            if waiting:
+                waiting.discard(step_id)
+                if not waiting:
+                    del self._waiting[dependency]
+
+    def _build(self, steps: List[Any]):
+        self._index_steps(steps)
+        self._signatures = {step.id: _signature(step) for step in steps}
+        self.parents: Dict[str, List[str]] = {}
+        self.children: Dict[str, List[str]] = {step_id: [] for step_id in self.steps}
+        self.missing: Dict[str, List[str]] = {}
+        self._waiting: Dict[str, Set[str]] = {}
+        for step_id in self.steps:
+            self._link(step_id)
+
+        self.level: Dict[str, int] = {}
+        self.earliest_start: Dict[str, float] = {}
+        self.earliest_finish: Dict[str, float] = {}
+        self.latest_start: Dict[str, float] = {}
+        self.latest_finish: Dict[str, float] = {}
+        self.slack: Dict[str, float] = {}
+
+        order, self.cyclic = self._topological(set(self.steps))
+        self._forward(order + sorted(self.cyclic, key=self.position.get))
+        self.project_duration = max(self.earliest_finish.values(), default=0.0)
+        self._backward(self._reverse_order(self.steps))
+        self._critical_path: Optional[List[str]] = None
+        self.stats['full_builds'] += 1
+        self.stats['steps_recomputed'] += len(self.steps)
+
+    # ------------------------------------------------------------------ pasadas CPM
+
+    def _topological(self, nodes: Set[str]) -> Tuple[List[str], Set[str]]:
+        """Kahn dentro de `nodes` (desempate por posición en el plan); devuelve también los que quedan en ciclos"""
+        in_degree = {node: sum(1 for parent in self.parents[node] if parent in nodes) for node in nodes}
+        ready = [(self.position[node], node) for node, degree in in_degree.items() if degree == 0]
+        heapq.heapify(ready)
+        order = []
+        while ready:
+            _, node = heapq.heappop(ready)
+            order.append(node)
+            for child in self.children[node]:
+                if child in in_degree:
+                    in_degree[child] -= 1
+                    if in_degree[child] == 0:
+                        heapq.heappush(ready, (self.position[child], child))
+        return order, nodes - set(order)
+
+    def _forward(self, order: Iterable[str]):
+        """ES/EF y nivel de cada nodo a partir de sus padres (ya calculados)"""
+        for node in order:
+            start, level = 0.0, 0
+            for parent in self.parents[node]:
+                if parent in self.earliest_finish and parent not in self.cyclic:
+                    start = max(start, self.earliest_finish[parent])
+                    level = max(level, self.level[parent] + 1)
+            self.earliest_start[node] = start
+            self.earliest_finish[node] = start + self.duration[node]
+            self.level[node] = level
+
+    def _backward(self, reverse_order: Iterable[str]):
+        """LS/LF y holgura de cada nodo a partir de sus hijos (ya calculados)"""
+        for node in reverse_order:
+            finish = self.project_duration
+            for child in self.children[node]:
+                if child in self.latest_start and child not in self.cyclic:
+                    finish = min(finish, self.latest_start[child])
+            self.latest_finish[node] = finish
+            self.latest_start[node] = finish - self.duration[node]
+            self.slack[node] = self.latest_start[node] - self.earliest_start[node]
+
+    def _reverse_order(self, nodes: Iterable[str]) -> List[str]:
+        # El nivel crece estrictamente a lo largo de cada arista: ordenar por nivel es topológico
+        return sorted(nodes, key=lambda node: (self.level[node], self.position[node]), reverse=True)
+
+    def _descendants(self, seeds: Set[str]) -> Set[str]:
+        seen, stack = set(seeds), list(seeds)
+        while stack:
+            for child in self.children[stack.pop()]:
+                if child not in seen:
+                    seen.add(child)
+                    stack.append(child)
+        return seen
+
+    def _ancestors(self, seeds: Set[str]) -> Set[str]:
+        seen, stack = set(seeds), list(seeds)
+        while stack:
+            for parent in self.parents[stack.pop()]:
+                if parent not in seen:
+                    seen.add(parent)
+                    stack.append(parent)
+        return seen
+
+    # ------------------------------------------------------------------ actualización incremental
+
+    def refresh(self, steps: List[Any]) -> Set[str]:
+        """
+        Actualizar el análisis tras cambios en los pasos (dependencias,
+        duraciones, pasos añadidos o quitados). Devuelve los ids cambiados
+        """
+        signatures = {step.id: _signature(step) for step in steps}
+        changed = {step_id for step_id, signature in signatures.items()
+                   if self._signatures.get(step_id) != signature}
+        removed = set(self._signatures) - set(signatures)
+        reordered = len(steps) != len(self.position) or any(
+            self.position.get(step.id) != index for index, step in enumerate(steps))
+
+        if not changed and not removed:
+            if reordered or any(self.steps.get(step.id) is not step for step in steps):
+                self._index_steps(steps)
+            return set()
+
+        if self.cyclic or len(changed) + len(removed) > max(8, INCREMENTAL_MAX_FRACTION * len(steps)):
+            self._build(steps)
+            return changed | removed
+
+        # Padres anteriores de lo que cambia: su LS/LF depende de los hijos que pierden o ganan
+        backward_seeds = set(changed & set(self._signatures))
+        for step_id in changed | removed:
+            backward_seeds.update(self.parents.get(step_id, ()))
+
+        # 1. Adyacencia
+        affected = set(changed)
+        for step_id in removed:
+            for child in list(self.children.get(step_id, ())):
+                # El hijo pasa a tener una dependencia fuera del plan
+                self.parents[child].remove(step_id)
+                self.missing[child].append(step_id)
+                self._waiting.setdefault(step_id, set()).add(child)
+                affected.add(child)
+            self._unlink(step_id)
+            self.children.pop(step_id, None)
+            for table in (self.level, self.earliest_start, self.earliest_finish,
+                          self.latest_start, self.latest_finish, self.slack):
+                table.pop(step_id, None)
+        self._index_steps(steps)
+        for step_id in changed:
+            self._unlink(step_id)
+            self.children.setdefault(step_id, [])
+        for step_id in changed:
+            self._link(step_id)
+            # Pasos que esperaban a este id como dependencia inexistente
+            for waiting in self._waiting.pop(step_id, set()):
+                if waiting in changed:
+                    continue
+                self.missing[waiting].remove(step_id)
+                self.parents[waiting].append(step_id)
+                self.children[step_id].append(waiting)
+                affected.add(waiting)
+        self._signatures = signatures
+
+        # 2. Hacia delante: los cambiados y todo lo que depende de ellos
+        affected &= set(self.steps)
+        forward = self._descendants(affected)
+        order, cyclic = self._topological(forward)
+        if cyclic:
+            logger.warning(f"Plan analysis: replanning introduced a dependency cycle ({len(cyclic)} steps)")
+            self._build(steps)
+            return changed | removed
+        self._forward(order)
+
+        # 3. Hacia atrás: todo si cambia la duración del proyecto, si no solo los ancestros afectados
+        project_duration = max(self.earliest_finish.values(), default=0.0)
+        if project_duration != self.project_duration:
+            self.project_duration = project_duration
+            backward = set(self.steps)
+        else:
+            backward = self._ancestors({node for node in backward_seeds | affected if node in self.steps})
+        self._backward(self._reverse_order(backward))
+        for node in forward - backward:
+            self.slack[node] = self.latest_start[node] - self.earliest_start[node]
+
+        self._critical_path = None
+        self.stats['incremental_updates'] += 1
+        self.stats['steps_recomputed'] += len(forward | backward)
+        return changed | removed
+
+    # ------------------------------------------------------------------ consultas
+
+    @property
+    def has_cycles(self) -> bool:
+        return bool(self.cyclic)
+
+    @property
+    def hierarchy_levels(self) -> int:
+        return max(self.level.values(), default=-1) + 1
+
+    def critical_path(self) -> List[str]:
+        """Cadena de pasos sin holgura desde el inicio hasta el final del proyecto"""
+        if self._critical_path is not None:
+            return list(self._critical_path)
+        path: List[str] = []
+        candidates = [node for node in self.steps
+                      if node not in self.cyclic and not self.parents[node]
+                      and self.slack[node] <= SLACK_EPSILON]
+        current = min(candidates, key=self.position.get) if candidates else None
+        while current is not None:
+            path.append(current)
+            finish = self.earliest_finish[current]
+            next_nodes = [child for child in self.children[current]
+                          if child not in self.cyclic and self.slack[child] <= SLACK_EPSILON
+                          and abs(self.earliest_start[child] - finish) <= SLACK_EPSILON]
+            current = min(next_nodes, key=self.position.get) if next_nodes else None
+        self._critical_path = path
+        return list(path)
+
+    def criticality(self, step_id: str) -> float:
+        """Media de la fracción de dependientes directos, la complejidad y la fracción de duración"""
+        step = self.steps[step_id]
+        dependency_factor = len(self.children[step_id]) / len(self.steps) if self.steps else 0
+        duration_factor = self.duration[step_id] / self.total_duration if self.total_duration > 0 else 0
+        return (dependency_factor + step.complexity + duration_factor) / 3
+
+    def sequence_order(self) -> List[str]:
+        """
+        Orden de ejecución estable: el primer paso (en orden del plan) cuyas
+        dependencias ya están colocadas. Si ninguno lo está (ciclos o
+        dependencias que no existen) se coloca el primero pendiente
+        """
+        unmet = {node: len(self.parents[node]) + len(self.missing[node]) for node in self.steps}
+        ready = [(self.position[node], node) for node, count in unmet.items() if count == 0]
+        heapq.heapify(ready)
+        pending = sorted(self.steps, key=self.position.get)
+        placed: Set[str] = set()
+        order: List[str] = []
+        cursor = 0
+        while len(order) < len(self.steps):
+            if ready:
+                _, node = heapq.heappop(ready)
+                if node in placed:
+                    continue
+            else:
+                while pending[cursor] in placed:
+                    cursor += 1
+                node = pending[cursor]
+            placed.add(node)
+            order.append(node)
+            for child in self.children[node]:
+                unmet[child] -= 1
+                if unmet[child] == 0 and child not in placed:
+                    heapq.heappush(ready, (self.position[child], child))
+        return order
+
+    def step_summary(self, step_id: str) -> Dict[str, Any]:
+        """Metadatos jerárquicos y de tiempos de un paso"""
+        return {
+            'hierarchy_level': self.level[step_id],
+            'parent_steps': list(self.steps[step_id].dependencies),
+            'child_steps': list(self.children[step_id]),
+            'criticality': self.criticality(step_id),
+            'earliest_start': self.earliest_start[step_id],
+            'latest_start': self.latest_start[step_id],
+            'slack': self.slack[step_id]
+        }
@@ -1,17 +1,28 @@
 """
 Gestor de recursos para el sistema de orquestación
 Maneja la asignación y monitoreo de recursos del sistema
+
+La admisión es awaitable: si no hay capacidad, la solicitud espera en una cola
+justa por tipo de recurso (weighted fair queueing con la prioridad como peso)
+hasta que otra asignación se libera o vence su tiempo máximo de espera. El uso
+se lleva en contadores y las asignaciones abandonadas se reclaman al expirar.
 """
 
 import logging
+import os
+import heapq
+import itertools
 import psutil
 import threading
 import time
-from typing import Dict, List, Any, Optional, Set
+from collections import defaultdict, deque
+from typing import Dict, List, Any, Optional, Set, Tuple
 from dataclasses import dataclass, field
 from enum import Enum
 import asyncio
 
+from ..utils.system_sampler import get_system_sampler
+
 logger = logging.getLogger(__name__)
 
 class ResourceType(Enum):
@@ -40,8 +51,10 @@ class ResourceRequest:
     resource_type: ResourceType
     requested_amount: float
     priority: int = 1
-    timeout: float = 300.0  # 5 minutos
+    timeout: float = 300.0  # 5 minutos: duración máxima de la asignación
     metadata: Dict[str, Any] = field(default_factory=dict)
+    max_wait: Optional[float] = None  # Espera máxima en cola (None: RESOURCE_ADMISSION_TIMEOUT)
+    owner: Optional[str] = None  # Flujo para el reparto justo (por defecto step_id)
 
 @dataclass
 class ResourceAllocation:
@@ -55,13 +68,25 @@ class ResourceAllocation:
     peak_usage: float = 0.0
     metadata: Dict[str, Any] = field(default_factory=dict)
 
+@dataclass
+class AdmissionWaiter:
+    """Solicitud esperando capacidad en la cola de admisión"""
+    request: ResourceRequest
+    future: asyncio.Future
+    loop: asyncio.AbstractEventLoop
+    enqueued_at: float
+    allocation: Optional[ResourceAllocation] = None
+    cancelled: bool = False
+
 class ResourceMonitor:
-    """Monitor de recursos del sistema"""
+    """Monitor de recursos del sistema (lee del muestreador compartido)"""
     
-    def __init__(self, monitoring_interval: float = 1.0):
+    def __init__(self, monitoring_interval: float = 0.0):
+        # Intervalo mínimo entre notificaciones; el ritmo real lo marca el muestreador
         self.monitoring_interval = monitoring_interval
         self.monitoring_active = False
-        self.monitor_thread = None
+        self.sampler = get_system_sampler()
+        self._subscription = None
         
         # Métricas actuales
         self.current_metrics = {
@@ -71,10 +96,6 @@ class ResourceMonitor:
             ResourceType.NETWORK: 0.0
         }
         
-        # Historial de métricas
-        self.metrics_history = []
-        self.max_history_size = 3600  # 1 hora con intervalos de 1 segundo
-        
         # Callbacks para alertas
         self.alert_callbacks = []
     
@@ -86,9 +107,7 @@ class ResourceMonitor:
             return
         
         self.monitoring_active = True
-        self.monitor_thread = threading.Thread(target=self._monitoring_loop)
-        self.monitor_thread.daemon = True
-        self.monitor_thread.start()
+        self._subscription = self.sampler.subscribe(self._on_sample, interval=self.monitoring_interval)
         
         logger.info("Monitoreo de recursos iniciado")
     
@@ -97,75 +116,38 @@ class ResourceMonitor:
         
         self.monitoring_active = False
         
-        if self.monitor_thread:
-            self.monitor_thread.join(timeout=5.0)
+        if self._subscription is not None:
+            self.sampler.unsubscribe(self._subscription)
+            self._subscription = None
         
         logger.info("Monitoreo de recursos detenido")
     
-    def _monitoring_loop(self):
-        """Loop principal de monitoreo"""
-        
-        while self.monitoring_active:
-            try:
-                # Recolectar métricas
-                metrics = self._collect_metrics()
-                
-                # Actualizar métricas actuales
-                self.current_metrics.update(metrics)
-                
-                # Agregar al historial
-                self._add_to_history(metrics)
-                
-                # Verificar alertas
-                self._check_alerts(metrics)
-                
-                time.sleep(self.monitoring_interval)
-                
-            except Exception as e:
-                logger.error(f"Error en monitoreo de recursos: {e}")
-                time.sleep(self.monitoring_interval)
-    
-    def _collect_metrics(self) -> Dict[ResourceType, float]:
-        """Recolecta métricas actuales del sistema"""
+    def _on_sample(self, snapshot: Dict[str, Any]):
+        """Procesa cada muestra del muestreador compartido"""
         
-        metrics = {}
+        metrics = self._metrics_from_sample(snapshot)
         
-        try:
-            # CPU
-            metrics[ResourceType.CPU] = psutil.cpu_percent(interval=None)
-            
-            # Memoria
-            memory = psutil.virtual_memory()
-            metrics[ResourceType.MEMORY] = memory.percent
-            
-            # Disco
-            disk = psutil.disk_usage('/')
-            metrics[ResourceType.DISK] = (disk.used / disk.total) * 100
-            
-            # Red (aproximado)
-            network = psutil.net_io_counters()
-            metrics[ResourceType.NETWORK] = 0.0  # Placeholder
-            
-        except Exception as e:
-            logger.error(f"Error recolectando métricas: {e}")
+        # Actualizar métricas actuales
+        self.current_metrics.update(metrics)
         
-        return metrics
+        # Verificar alertas
+        self._check_alerts(metrics)
     
-    def _add_to_history(self, metrics: Dict[ResourceType, float]):
-        """Agrega métricas al historial"""
-        
-        timestamp = time.time()
+    @staticmethod
+    def _metrics_from_sample(sample: Dict[str, float]) -> Dict[ResourceType, float]:
+        """Métricas por tipo de recurso a partir de una muestra"""
         
-        history_entry = {
-            'timestamp': timestamp,
-            'metrics': metrics.copy()
+        return {
+            ResourceType.CPU: sample['cpu_percent'],
+            ResourceType.MEMORY: sample['memory_percent'],
+            ResourceType.DISK: sample['disk_percent'],
+            ResourceType.NETWORK: 0.0  # Placeholder
         }
+    
+    def _collect_metrics(self) -> Dict[ResourceType, float]:
+        """Métricas actuales del sistema (última muestra compartida)"""
         
-        self.metrics_history.append(history_entry)
-        
-        # Mantener tamaño del historial
-        if len(self.metrics_history) > self.max_history_size:
-            self.metrics_history.pop(0)
+        return self._metrics_from_sample(self.sampler.latest())
     
     def _check_alerts(self, metrics: Dict[ResourceType, float]):
         """Verifica condiciones de alerta"""
@@ -203,11 +185,21 @@ class ResourceMonitor:
     def get_historical_metrics(self, duration: int = 300) -> List[Dict[str, Any]]:
         """Obtiene métricas históricas"""
         
-        cutoff_time = time.time() - duration
+        window = self.sampler.window(duration, ['timestamp', 'cpu_percent', 'memory_percent', 'disk_percent'])
         
         return [
-            entry for entry in self.metrics_history
-            if entry['timestamp'] >= cutoff_time
+            {
+                'timestamp': float(timestamp),
+                'metrics': {
+                    ResourceType.CPU: float(cpu),
+                    ResourceType.MEMORY: float(memory),
+                    ResourceType.DISK: float(disk),
+                    ResourceType.NETWORK: 0.0
+                }
+            }
+            for timestamp, cpu, memory, disk in zip(
+                window['timestamp'], window['cpu_percent'], window['memory_percent'], window['disk_percent']
+            )
         ]
     
     def add_alert_callback(self, callback):
@@ -234,10 +226,21 @@ class ResourceManager:
     
     def __init__(self):
         self.resource_limits = {}
-        self.active_allocations = {}
-        self.allocation_queue = []
+        self.active_allocations: Dict[Tuple[str, ResourceType], ResourceAllocation] = {}
         self.resource_monitor = ResourceMonitor()
         
+        # Admisión: contadores de uso, colas justas por tipo y relojes virtuales
+        self._lock = threading.RLock()
+        self._usage: Dict[ResourceType, float] = defaultdict(float)
+        self._wait_queues: Dict[ResourceType, List[Tuple[float, float, int, AdmissionWaiter]]] = defaultdict(list)
+        self._queued: Dict[ResourceType, int] = defaultdict(int)
+        self._virtual_time: Dict[ResourceType, float] = defaultdict(float)
+        self._flow_finish: Dict[Tuple[ResourceType, str], float] = {}
+        self._sequence = itertools.count()
+        self.default_max_wait = float(os.getenv('RESOURCE_ADMISSION_TIMEOUT', '300'))
+        self.reaper_interval = float(os.getenv('RESOURCE_REAPER_INTERVAL', '15'))
+        self._reaper: Optional[Tuple[asyncio.AbstractEventLoop, asyncio.Task]] = None
+        
         # Configuración por defecto
         self._set_default_limits()
         
@@ -255,6 +258,15 @@ class ResourceManager:
             'timeout_allocations': 0,
             'avg_allocation_time': 0.0
         }
+        self.admission_metrics: Dict[ResourceType, Dict[str, Any]] = defaultdict(lambda: {
+            'granted_immediately': 0,
+            'granted_after_wait': 0,
+            'queue_timeouts': 0,
+            'rejected_oversized': 0,
+            'total_wait_time': 0.0,
+            'max_wait_time': 0.0,
+            'recent_waits': deque(maxlen=500)
+        })
     
     def __del__(self):
         """Destructor para limpiar recursos"""
@@ -262,7 +274,7 @@ class ResourceManager:
             self.resource_monitor.stop_monitoring()
     
     def _set_default_limits(self):
-        """Establece límites por defecto"""
+        """Establece límites por defecto (en las unidades que piden los pasos)"""
         
         try:
             # CPU: 80% máximo
@@ -276,88 +288,140 @@ class ResourceManager:
             memory_info = psutil.virtual_memory()
             self.resource_limits[ResourceType.MEMORY] = ResourceLimit(
                 resource_type=ResourceType.MEMORY,
-                max_value=memory_info.total * 0.8,
-                unit="bytes"
+                max_value=memory_info.total / (1024 * 1024) * 0.8,
+                unit="MB"
             )
             
             # Disco: 90% máximo
             disk_info = psutil.disk_usage('/')
             self.resource_limits[ResourceType.DISK] = ResourceLimit(
                 resource_type=ResourceType.DISK,
-                max_value=disk_info.total * 0.9,
-                unit="bytes"
+                max_value=disk_info.total / (1024 * 1024) * 0.9,
+                unit="MB"
             )
             
         except Exception as e:
             logger.error(f"Error estableciendo límites por defecto: {e}")
     
     async def request_resources(self, request: ResourceRequest) -> Optional[ResourceAllocation]:
-        """Solicita recursos para un paso"""
+        """
+        Solicita recursos para un paso, esperando en la cola de admisión si no
+        hay capacidad. Devuelve None si la solicitud nunca cabría o si vence su
+        espera máxima
+        """
         
         logger.info(f"Solicitando recursos para paso {request.step_id}: "
                    f"{request.requested_amount} {request.resource_type.value}")
         
         start_time = time.time()
-        self.allocation_metrics['total_requests'] += 1
+        resource_type = request.resource_type
+        self._ensure_reaper()
         
-        try:
-            # Verificar disponibilidad
-            if not self._check_resource_availability(request):
-                logger.warning(f"Recursos no disponibles para {request.step_id}")
-                await self._queue_request(request)
-                return None
+        with self._lock:
+            self.allocation_metrics['total_requests'] += 1
+            metrics = self.admission_metrics[resource_type]
             
-            # Asignar recursos
-            allocation = self._allocate_resources(request)
+            limit = self.resource_limits.get(resource_type)
+            if limit is not None and request.requested_amount > limit.max_value:
+                metrics['rejected_oversized'] += 1
+                self.allocation_metrics['failed_allocations'] += 1
+                logger.error(f"Solicitud de {request.step_id} excede la capacidad total de "
+                             f"{resource_type.value}: {request.requested_amount} > {limit.max_value}")
+                return None
             
-            if allocation:
-                self.active_allocations[request.step_id] = allocation
-                self.allocation_metrics['successful_allocations'] += 1
-                
-                # Actualizar tiempo promedio
-                allocation_time = time.time() - start_time
-                self._update_avg_allocation_time(allocation_time)
-                
+            # Sin cola delante y con capacidad: admisión inmediata
+            if self._queued[resource_type] == 0 and self._check_resource_availability(request):
+                allocation = self._grant(request)
+                metrics['granted_immediately'] += 1
+                self._update_avg_allocation_time(time.time() - start_time)
                 logger.info(f"Recursos asignados exitosamente para {request.step_id}")
                 return allocation
-            else:
-                self.allocation_metrics['failed_allocations'] += 1
-                logger.error(f"Error asignando recursos para {request.step_id}")
-                return None
-                
-        except Exception as e:
-            self.allocation_metrics['failed_allocations'] += 1
-            logger.error(f"Error en solicitud de recursos: {e}")
+            
+            waiter = self._enqueue(request)
+        
+        max_wait = request.max_wait if request.max_wait is not None else self.default_max_wait
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), timeout=max_wait)
+        except asyncio.TimeoutError:
+            pass
+        except asyncio.CancelledError:
+            # Si se concedió justo antes de la cancelación, nadie la liberaría
+            granted = self._abandon(waiter)
+            if granted is not None:
+                self._release_allocations([granted])
+            raise
+        
+        allocation = self._abandon(waiter)
+        if allocation is None:
+            logger.warning(f"Espera de recursos agotada para {request.step_id} tras {max_wait:.0f}s")
             return None
+        
+        self._update_avg_allocation_time(time.time() - start_time)
+        logger.info(f"Recursos asignados tras espera para {request.step_id}")
+        return allocation
+    
+    async def acquire_resources(self, requests: List[ResourceRequest]) -> Optional[List[ResourceAllocation]]:
+        """
+        Obtiene varias asignaciones a la vez o ninguna. Se piden en un orden
+        fijo por tipo de recurso, así dos solicitantes nunca se bloquean
+        mutuamente reteniendo cada uno lo que el otro espera
+        """
+        
+        allocations = []
+        try:
+            for request in sorted(requests, key=lambda r: r.resource_type.value):
+                allocation = await self.request_resources(request)
+                if allocation is None:
+                    self._release_allocations(allocations)
+                    return None
+                allocations.append(allocation)
+        except asyncio.CancelledError:
+            self._release_allocations(allocations)
+            raise
+        return allocations
     
     def release_resources(self, step_id: str):
-        """Libera recursos de un paso"""
+        """Libera recursos de un paso (todas sus asignaciones)"""
         
-        if step_id in self.active_allocations:
-            allocation = self.active_allocations[step_id]
-            
-            # Actualizar métricas finales
-            allocation.actual_usage = self._calculate_actual_usage(allocation)
-            
-            # Liberar recursos
-            self._deallocate_resources(allocation)
-            
-            del self.active_allocations[step_id]
-            
+        with self._lock:
+            allocations = [allocation for (owner, _), allocation in self.active_allocations.items()
+                           if owner == step_id]
+        if allocations:
+            self._release_allocations(allocations)
             logger.info(f"Recursos liberados para paso {step_id}")
+    
+    def _release_allocations(self, allocations: List[ResourceAllocation]):
+        """Libera asignaciones concretas y despierta a quien pueda entrar"""
+        
+        released_types = set()
+        with self._lock:
+            for allocation in allocations:
+                key = (allocation.step_id, allocation.resource_type)
+                if self.active_allocations.get(key) is not allocation:
+                    continue
+                
+                # Actualizar métricas finales
+                allocation.actual_usage = self._calculate_actual_usage(allocation)
+                
+                # Liberar recursos
+                self._deallocate_resources(allocation)
+                del self.active_allocations[key]
+                released_types.add(allocation.resource_type)
             
             # Procesar cola de espera
-            asyncio.create_task(self._process_queue())
+            for resource_type in released_types:
+                self._dispatch(resource_type)
     
     def update_resource_usage(self, step_id: str, usage_metrics: Dict[str, float]):
         """Actualiza métricas de uso de recursos"""
         
-        if step_id in self.active_allocations:
-            allocation = self.active_allocations[step_id]
-            
-            # Actualizar uso actual
-            if allocation.resource_type.value in usage_metrics:
-                current_usage = usage_metrics[allocation.resource_type.value]
+        with self._lock:
+            for (owner, resource_type), allocation in self.active_allocations.items():
+                if owner != step_id or resource_type.value not in usage_metrics:
+                    continue
+                
+                # Actualizar uso actual
+                current_usage = usage_metrics[resource_type.value]
                 allocation.actual_usage = current_usage
                 
                 # Actualizar pico de uso
@@ -370,32 +434,18 @@ class ResourceManager:
         resource_type = request.resource_type
         
         if resource_type not in self.resource_limits:
-            logger.warning(f"Límite no definido para {resource_type}")
             return True
         
         limit = self.resource_limits[resource_type]
         
-        # Calcular uso actual
-        current_usage = self._calculate_current_usage(resource_type)
-        
         # Verificar si hay suficientes recursos
-        if current_usage + request.requested_amount > limit.max_value:
-            logger.info(f"Recursos insuficientes: {current_usage + request.requested_amount} > {limit.max_value}")
-            return False
-        
-        return True
+        current_usage = self._calculate_current_usage(resource_type)
+        return current_usage + request.requested_amount <= limit.max_value
     
     def _calculate_current_usage(self, resource_type: ResourceType) -> float:
-        """Calcula el uso actual de un tipo de recurso"""
-        
-        current_usage = 0.0
+        """Uso actual de un tipo de recurso (contador mantenido al asignar y liberar)"""
         
-        # Sumar uso de asignaciones activas
-        for allocation in self.active_allocations.values():
-            if allocation.resource_type == resource_type:
-                current_usage += allocation.allocated_amount
-        
-        return current_usage
+        return self._usage[resource_type]
     
     def _allocate_resources(self, request: ResourceRequest) -> Optional[ResourceAllocation]:
         """Asigna recursos a un paso"""
@@ -409,62 +459,151 @@ class ResourceManager:
             metadata=request.metadata.copy()
         )
         
-        # Actualizar límite actual
-        if request.resource_type in self.resource_limits:
-            limit = self.resource_limits[request.resource_type]
-            limit.current_value += request.requested_amount
-        
+        self._adjust_usage(request.resource_type, request.requested_amount)
         return allocation
     
     def _deallocate_resources(self, allocation: ResourceAllocation):
         """Libera recursos de una asignación"""
         
-        # Actualizar límite actual
-        if allocation.resource_type in self.resource_limits:
-            limit = self.resource_limits[allocation.resource_type]
-            limit.current_value -= allocation.allocated_amount
-            
-            # Asegurar que no sea negativo
-            limit.current_value = max(0, limit.current_value)
+        self._adjust_usage(allocation.resource_type, -allocation.allocated_amount)
     
-    def _calculate_actual_usage(self, allocation: ResourceAllocation) -> float:
-        """Calcula el uso real de recursos"""
+    def _adjust_usage(self, resource_type: ResourceType, delta: float):
+        """Actualiza el contador de uso (y el límite) sin bajar de cero"""
         
-        # Obtener métricas actuales del monitor
-        current_metrics = self.resource_monitor.get_current_metrics()
+        self._usage[resource_type] = max(0.0, self._usage[resource_type] + delta)
+        if resource_type in self.resource_limits:
+            self.resource_limits[resource_type].current_value = self._usage[resource_type]
+    
+    def _grant(self, request: ResourceRequest) -> ResourceAllocation:
+        """Asigna y registra (con el lock tomado)"""
         
-        if allocation.resource_type in current_metrics:
-            return current_metrics[allocation.resource_type]
+        key = (request.step_id, request.resource_type)
+        previous = self.active_allocations.get(key)
+        if previous is not None:
+            # Una nueva solicitud del mismo paso y tipo sustituye a la anterior
+            self._deallocate_resources(previous)
         
-        return 0.0
+        allocation = self._allocate_resources(request)
+        self.active_allocations[key] = allocation
+        self.allocation_metrics['successful_allocations'] += 1
+        return allocation
     
-    async def _queue_request(self, request: ResourceRequest):
-        """Agrega solicitud a la cola"""
+    def _enqueue(self, request: ResourceRequest) -> AdmissionWaiter:
+        """
+        Encola con etiqueta de fin virtual (self-clocked fair queueing): cada
+        flujo avanza cantidad / peso, con la prioridad como peso, de modo que
+        ningún flujo acapara la capacidad y los prioritarios avanzan antes
+        """
         
-        self.allocation_queue.append(request)
-        logger.info(f"Solicitud {request.step_id} agregada a cola")
+        resource_type = request.resource_type
+        flow = request.owner or request.step_id
+        weight = max(1, request.priority)
+        start_tag = max(self._virtual_time[resource_type], self._flow_finish.get((resource_type, flow), 0.0))
+        finish_tag = start_tag + request.requested_amount / weight
+        self._flow_finish[(resource_type, flow)] = finish_tag
+        
+        loop = asyncio.get_running_loop()
+        now = time.time()
+        max_wait = request.max_wait if request.max_wait is not None else self.default_max_wait
+        waiter = AdmissionWaiter(request=request, future=loop.create_future(), loop=loop, enqueued_at=now)
+        heapq.heappush(self._wait_queues[resource_type],
+                       (finish_tag, now + max_wait, next(self._sequence), waiter))
+        self._queued[resource_type] += 1
+        logger.info(f"Solicitud {request.step_id} agregada a cola de {resource_type.value} "
+                    f"({self._queued[resource_type]} en espera)")
+        return waiter
+    
+    def _abandon(self, waiter: AdmissionWaiter) -> Optional[ResourceAllocation]:
+        """Sale de la cola: devuelve la asignación si llegó a concederse"""
+        
+        with self._lock:
+            if waiter.allocation is not None or waiter.cancelled:
+                return waiter.allocation
+            
+            waiter.cancelled = True
+            resource_type = waiter.request.resource_type
+            self._queued[resource_type] -= 1
+            self.admission_metrics[resource_type]['queue_timeouts'] += 1
+            self.allocation_metrics['failed_allocations'] += 1
+            # Si bloqueaba la cabeza de la cola, los siguientes pueden entrar ya
+            self._dispatch(resource_type)
+            return None
     
-    async def _process_queue(self):
-        """Procesa la cola de solicitudes"""
+    def _dispatch(self, resource_type: ResourceType):
+        """
+        Concede en orden de etiqueta mientras la cabeza de la cola quepa (con el
+        lock tomado). La cabeza no se salta para no matar de hambre a las
+        solicitudes grandes
+        """
+        
+        queue = self._wait_queues[resource_type]
+        while queue:
+            finish_tag, _, _, waiter = queue[0]
+            if waiter.cancelled:
+                heapq.heappop(queue)
+                continue
+            if not self._check_resource_availability(waiter.request):
+                break
+            
+            heapq.heappop(queue)
+            self._virtual_time[resource_type] = max(self._virtual_time[resource_type], finish_tag)
+            self._queued[resource_type] -= 1
+            waiter.allocation = self._grant(waiter.request)
+            
+            waited = time.time() - waiter.enqueued_at
+            metrics = self.admission_metrics[resource_type]
+            metrics['granted_after_wait'] += 1
+            metrics['total_wait_time'] += waited
+            metrics['max_wait_time'] = max(metrics['max_wait_time'], waited)
+            metrics['recent_waits'].append(waited)
+            
+            try:
+                waiter.loop.call_soon_threadsafe(self._wake, waiter.future)
+            except RuntimeError:
+                # El loop del solicitante ya no existe: la asignación se reclamará al expirar
+                pass
+        
+        if not queue:
+            # Sin nadie esperando, las etiquetas ya servidas no aportan nada
+            virtual_time = self._virtual_time[resource_type]
+            for key in [key for key, tag in self._flow_finish.items()
+                        if key[0] == resource_type and tag <= virtual_time]:
+                del self._flow_finish[key]
+    
+    @staticmethod
+    def _wake(future: asyncio.Future):
+        if not future.done():
+            future.set_result(True)
+    
+    def _ensure_reaper(self):
+        """Arranca (una vez por loop) la tarea que reclama asignaciones expiradas"""
         
-        if not self.allocation_queue:
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
             return
+        if self._reaper and self._reaper[0] is loop and not self._reaper[1].done():
+            return
+        self._reaper = (loop, loop.create_task(self._reaper_loop()))
+    
+    async def _reaper_loop(self):
+        while True:
+            await asyncio.sleep(self.reaper_interval)
+            try:
+                self.cleanup_expired_allocations()
+            except Exception as e:
+                logger.error(f"Error reclamando asignaciones expiradas: {e}")
+    
+    def _calculate_actual_usage(self, allocation: ResourceAllocation) -> float:
+        """Calcula el uso real de recursos"""
         
-        processed_requests = []
+        # Obtener métricas actuales del monitor
+        current_metrics = self.resource_monitor.get_current_metrics()
         
-        for request in self.allocation_queue:
-            if self._check_resource_availability(request):
-                allocation = self._allocate_resources(request)
-                
-                if allocation:
-                    self.active_allocations[request.step_id] = allocation
-                    processed_requests.append(request)
-                    
-                    logger.info(f"Solicitud en cola procesada: {request.step_id}")
+        if allocation.resource_type in current_metrics:
+            return current_metrics[allocation.resource_type]
         
-        # Remover solicitudes procesadas
-        for request in processed_requests:
-            self.allocation_queue.remove(request)
+        return 0.0
     
     def _handle_resource_alert(self, alert: Dict[str, Any]):
         """Maneja alertas de recursos"""
@@ -481,10 +620,11 @@ class ResourceManager:
         resource_type = alert['resource_type']
         
         # Buscar asignaciones del tipo de recurso problemático
-        critical_allocations = [
-            allocation for allocation in self.active_allocations.values()
-            if allocation.resource_type == resource_type
-        ]
+        with self._lock:
+            critical_allocations = [
+                allocation for allocation in self.active_allocations.values()
+                if allocation.resource_type == resource_type
+            ]
         
         if critical_allocations:
             # Ordenar por prioridad (asignaciones más recientes primero)
@@ -524,25 +664,51 @@ class ResourceManager:
                 for rt, limit in self.resource_limits.items()
             },
             'active_allocations': len(self.active_allocations),
-            'queued_requests': len(self.allocation_queue),
+            'queued_requests': sum(self._queued.values()),
             'system_info': self.resource_monitor.get_system_info()
         }
         
         return status
     
     def get_allocation_metrics(self) -> Dict[str, Any]:
-        """Obtiene métricas de asignaciones"""
-        
-        return self.allocation_metrics.copy()
+        """Obtiene métricas de asignaciones, con las de espera en cola por recurso"""
+        
+        now = time.time()
+        metrics = self.allocation_metrics.copy()
+        admission = {}
+        with self._lock:
+            for resource_type, type_metrics in self.admission_metrics.items():
+                waits = sorted(type_metrics['recent_waits'])
+                waiting = [entry[3] for entry in self._wait_queues[resource_type] if not entry[3].cancelled]
+                granted_after_wait = type_metrics['granted_after_wait']
+                admission[resource_type.value] = {
+                    'queued': self._queued[resource_type],
+                    'usage': self._usage[resource_type],
+                    'granted_immediately': type_metrics['granted_immediately'],
+                    'granted_after_wait': granted_after_wait,
+                    'queue_timeouts': type_metrics['queue_timeouts'],
+                    'rejected_oversized': type_metrics['rejected_oversized'],
+                    'avg_wait_time': type_metrics['total_wait_time'] / granted_after_wait if granted_after_wait else 0.0,
+                    'p95_wait_time': waits[int(0.95 * (len(waits) - 1))] if waits else 0.0,
+                    'max_wait_time': type_metrics['max_wait_time'],
+                    # Hambre: cuánto lleva esperando la solicitud más antigua
+                    'oldest_waiting_age': max((now - waiter.enqueued_at for waiter in waiting), default=0.0)
+                }
+        metrics['admission'] = admission
+        return metrics
     
     def set_resource_limit(self, resource_type: ResourceType, max_value: float, unit: str = ""):
         """Establece límite para un tipo de recurso"""
         
-        self.resource_limits[resource_type] = ResourceLimit(
-            resource_type=resource_type,
-            max_value=max_value,
-            unit=unit
-        )
+        with self._lock:
+            self.resource_limits[resource_type] = ResourceLimit(
+                resource_type=resource_type,
+                max_value=max_value,
+                current_value=self._usage[resource_type],
+                unit=unit
+            )
+            # Con más capacidad puede entrar quien esperaba
+            self._dispatch(resource_type)
         
         logger.info(f"Límite establecido para {resource_type.value}: {max_value} {unit}")
     
@@ -590,39 +756,37 @@ class ResourceManager:
         logger.info("Iniciando optimización de recursos")
         
         # Analizar asignaciones activas
-        for step_id, allocation in self.active_allocations.items():
-            # Verificar si la asignación está subutilizada
-            if allocation.actual_usage < allocation.allocated_amount * 0.5:
-                logger.info(f"Asignación subutilizada detectada: {step_id}")
-                
-                # Considerar reducir asignación
-                new_amount = max(allocation.actual_usage * 1.2, allocation.allocated_amount * 0.6)
-                difference = allocation.allocated_amount - new_amount
-                
-                if difference > 0:
-                    allocation.allocated_amount = new_amount
+        with self._lock:
+            for (step_id, resource_type), allocation in self.active_allocations.items():
+                # Verificar si la asignación está subutilizada
+                if allocation.actual_usage < allocation.allocated_amount * 0.5:
+                    logger.info(f"Asignación subutilizada detectada: {step_id}")
                     
-                    # Actualizar límite
-                    if allocation.resource_type in self.resource_limits:
-                        limit = self.resource_limits[allocation.resource_type]
-                        limit.current_value -= difference
+                    # Considerar reducir asignación
+                    new_amount = max(allocation.actual_usage * 1.2, allocation.allocated_amount * 0.6)
+                    difference = allocation.allocated_amount - new_amount
                     
-                    logger.info(f"Asignación optimizada para {step_id}: {new_amount}")
-        
-        # Procesar cola después de optimización
-        asyncio.create_task(self._process_queue())
+                    if difference > 0:
+                        allocation.allocated_amount = new_amount
+                        self._adjust_usage(resource_type, -difference)
+                        logger.info(f"Asignación optimizada para {step_id}: {new_amount}")
+            
+            # Procesar cola después de optimización
+            for resource_type in list(self._wait_queues):
+                self._dispatch(resource_type)
     
     def cleanup_expired_allocations(self):
-        """Limpia asignaciones expiradas"""
+        """Reclama asignaciones expiradas (pasos que no liberaron sus recursos)"""
         
         current_time = time.time()
-        expired_allocations = []
-        
-        for step_id, allocation in self.active_allocations.items():
-            if current_time - allocation.start_time > allocation.expected_duration:
-                expired_allocations.append(step_id)
-        
-        for step_id in expired_allocations:
-            logger.warning(f"Liberando asignación expirada: {step_id}")
-            self.release_resources(step_id)
-            self.allocation_metrics['timeout_allocations'] += 1
\ No newline at end of file
+        with self._lock:
+            expired_allocations = [
+                allocation for allocation in self.active_allocations.values()
+                if current_time - allocation.start_time > allocation.expected_duration
+            ]
+            for allocation in expired_allocations:
+                logger.warning(f"Liberando asignación expirada: {allocation.step_id} ({allocation.resource_type.value})")
+                self.allocation_metrics['timeout_allocations'] += 1
+        
+        if expired_allocations:
+            self._release_allocations(expired_allocations)
@@ -18,6 +18,7 @@ from .resource_manager import ResourceManager, ResourceRequest, ResourceType
 from .planning_algorithms import ExecutionPlan, TaskStep, PlanningStrategy
 from ..memory.advanced_memory_manager import AdvancedMemoryManager
 from ..tools.dynamic_task_planner import DynamicTaskPlanner, get_dynamic_task_planner
+from ..planning.dynamic_task_planner import report_enhanced_plan_outcome
 
 logger = logging.getLogger(__name__)
 
@@ -93,6 +94,7 @@ class TaskOrchestrator:
             "enable_adaptive_execution": True,
             "enable_progress_tracking": True,
             "default_timeout": 1800,  # 30 minutos
+            "resource_admission_timeout": 600,  # Espera máxima de una tarea por capacidad
             "retry_failed_steps": True,
             "max_retries": 3,
             "enable_memory_learning": True,  # Nueva configuración
@@ -189,8 +191,10 @@ class TaskOrchestrator:
                 logger.info(f"Almacenando experiencia de aprendizaje para tarea: {context.task_id}")
                 await self._store_learning_experience(context, result)
             
-            # 14. Actualizar métricas
+            # 14. Actualizar métricas (y la calidad del plan en la caché de planes)
             self._update_metrics(result)
+            self.planning_engine.record_plan_outcome(execution_plan.id, result.success)
+            report_enhanced_plan_outcome(context.task_id, result.success)
             
             # 15. Notificar finalización
             await self._notify_callbacks("on_complete", result)
@@ -216,6 +220,11 @@ class TaskOrchestrator:
             
             # Notificar error
             await self._notify_callbacks("on_error", error_result)
+            report_enhanced_plan_outcome(context.task_id, False)
+            
+            # Liberar recursos que hubiera reservado
+            if self.config["enable_resource_management"]:
+                await self._release_resources(context.task_id)
             
             # Limpiar estado
             self._cleanup_orchestration(context.task_id)
@@ -321,30 +330,45 @@ class TaskOrchestrator:
         return plan
     
     async def _allocate_resources(self, plan: ExecutionPlan, context: OrchestrationContext):
-        """Asigna recursos para el plan de ejecución"""
+        """
+        Reserva la capacidad que la tarea puede usar a la vez antes de ejecutarla
+        
+        La demanda por tipo de recurso es la suma de los pasos más exigentes que
+        pueden correr en paralelo. Si no hay capacidad la tarea espera en la cola
+        justa del gestor de recursos (por usuario, con su prioridad como peso),
+        de modo que las tareas concurrentes quedan limitadas a la máquina
+        """
         
         logger.info(f"Asignando recursos para plan: {plan.id}")
         
+        engine_config = self.execution_engine.get_config()
+        parallel_steps = engine_config.get("max_parallel_steps", 1) if engine_config.get("parallel_execution") else 1
+        
+        step_requirements: Dict[ResourceType, List[float]] = {}
         for step in plan.steps:
             # Determinar recursos requeridos
-            resource_requirements = self._calculate_resource_requirements(step)
-            
-            # Crear solicitudes de recursos
-            for resource_type, amount in resource_requirements.items():
-                request = ResourceRequest(
-                    step_id=step.id,
-                    resource_type=resource_type,
-                    requested_amount=amount,
-                    priority=step.priority,
-                    timeout=step.estimated_duration * 2  # Timeout 2x duración estimada
-                )
-                
-                # Solicitar recursos
-                allocation = await self.resource_manager.request_resources(request)
-                
-                if not allocation:
-                    logger.warning(f"No se pudieron asignar recursos para paso: {step.id}")
-                    # Podría implementar estrategia de espera o reducción de recursos
+            for resource_type, amount in self._calculate_resource_requirements(step).items():
+                step_requirements.setdefault(resource_type, []).append(amount)
+        
+        # Crear solicitudes de recursos
+        requests = [
+            ResourceRequest(
+                step_id=context.task_id,
+                resource_type=resource_type,
+                requested_amount=sum(sorted(amounts, reverse=True)[:parallel_steps]),
+                priority=context.priority,
+                timeout=context.timeout or self.config["default_timeout"],
+                max_wait=self.config["resource_admission_timeout"],
+                owner=context.user_id,
+                metadata={"plan_id": plan.id}
+            )
+            for resource_type, amounts in step_requirements.items()
+        ]
+        
+        # Solicitar recursos (todos o ninguno)
+        allocations = await self.resource_manager.acquire_resources(requests)
+        if allocations is None:
+            raise RuntimeError(f"Recursos insuficientes para la tarea {context.task_id}")
     
     async def _execute_plan(self, plan: ExecutionPlan, context: OrchestrationContext) -> Dict[str, ExecutionResult]:
         """Ejecuta el plan usando el motor de ejecución adaptativa"""
@@ -380,11 +404,8 @@ class TaskOrchestrator:
         
         logger.info(f"Liberando recursos para tarea: {task_id}")
         
-        # Obtener pasos de la tarea
-        if task_id in self.active_orchestrations:
-            orchestration = self.active_orchestrations[task_id]
-            # Liberar recursos paso por paso
-            # (implementación específica dependería de cómo se rastrean los recursos por paso)
+        # Las reservas de la tarea se hacen a su nombre (ver _allocate_resources)
+        self.resource_manager.release_resources(task_id)
         
         # Limpiar asignaciones caducadas
         self.resource_manager.cleanup_expired_allocations()
@@ -518,13 +539,14 @@ class TaskOrchestrator:
         
         logger.info(f"Resolviendo {len(issues)} problemas de dependencias")
         
+        steps_by_id = {s.id: s for s in plan.steps}
         for step_id, step_issues in issues.items():
-            step = next((s for s in plan.steps if s.id == step_id), None)
+            step = steps_by_id.get(step_id)
             if step:
                 # Resolver dependencias faltantes
                 valid_dependencies = []
                 for dep_id in step.dependencies:
-                    if any(s.id == dep_id for s in plan.steps):
+                    if dep_id in steps_by_id:
                         valid_dependencies.append(dep_id)
                 
                 step.dependencies = valid_dependencies
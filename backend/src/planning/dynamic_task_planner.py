@@ -28,6 +28,7 @@ from collections import defaultdict
 from src.tools.task_planner import TaskPlan, TaskStep, ExecutionPlan, ExecutionStrategy
 from src.memory.advanced_memory_manager import AdvancedMemoryManager
 from src.services.ollama_service import OllamaService
+from src.planning.semantic_plan_cache import get_plan_cache
 
 logger = logging.getLogger(__name__)
 
@@ -136,6 +137,10 @@ class EnhancedDynamicTaskPlanner:
         # Patrones de planificación aprendidos
         self.planning_patterns = {}
         
+        # Cache semántica de planes compartida con el resto de planificadores
+        self.plan_cache = get_plan_cache()
+        self.cached_plans_served = 0
+        
         logger.info("🚀 EnhancedDynamicTaskPlanner inicializado")
     
     async def create_dynamic_plan(self, 
@@ -161,6 +166,17 @@ class EnhancedDynamicTaskPlanner:
             # Incrementar contador
             self.plans_generated += 1
             
+            # 0. Reutilizar un plan exitoso de una tarea equivalente sin llamar al LLM
+            tools_key = tuple(sorted((context or {}).get('available_tools', [])))
+            cache_hit = self.plan_cache.lookup('enhanced', task_description, constraints=tools_key, task_id=task_id)
+            if cache_hit:
+                cached_plan = cache_hit.plan
+                cached_plan.id = task_id
+                cached_plan.created_at = datetime.now()
+                self.cached_plans_served += 1
+                logger.info(f"♻️ Plan reutilizado desde cache semántica (similitud {cache_hit.similarity:.2f})")
+                return cached_plan
+            
             # 1. Crear contexto de planificación
             planning_context = await self._create_planning_context(
                 task_id, task_description, context
@@ -195,6 +211,9 @@ class EnhancedDynamicTaskPlanner:
             # 9. Actualizar estadísticas
             self.complexity_distribution[complexity] += 1
             
+            # 10. Guardar en la cache semántica (se servirá tras una ejecución exitosa)
+            self.plan_cache.store('enhanced', task_description, validated_plan, constraints=tools_key, task_id=task_id)
+            
             logger.info(f"✅ Plan generado exitosamente con {len(validated_plan.steps)} pasos")
             return validated_plan
             
@@ -914,6 +933,13 @@ Responde ÚNICAMENTE en formato JSON:
         except Exception as e:
             logger.warning(f"Error almacenando planificación en memoria: {str(e)}")
     
+    def record_plan_outcome(self, task_id: str, success: bool):
+        """Registrar el resultado de ejecutar el plan de una tarea"""
+        # Solo cuenta si la tarea tiene un plan de este planificador (generado o servido)
+        recorded = self.plan_cache.record_outcome(success, task_id=task_id)
+        if success and recorded:
+            self.successful_plans += 1
+    
     def get_statistics(self) -> Dict[str, Any]:
         """Obtener estadísticas del planificador"""
         
@@ -925,6 +951,7 @@ Responde ÚNICAMENTE en formato JSON:
         return {
             'plans_generated': self.plans_generated,
             'successful_plans': self.successful_plans,
+            'cached_plans_served': self.cached_plans_served,
             'success_rate': success_rate,
             'average_planning_time': self.average_planning_time,
             'complexity_distribution': dict(self.complexity_distribution),
@@ -961,4 +988,9 @@ def get_enhanced_dynamic_task_planner(memory_manager=None, ollama_service=None,
             config=config
         )
     
-    return _dynamic_task_planner
\ No newline at end of file
+    return _dynamic_task_planner
+
+def report_enhanced_plan_outcome(task_id: str, success: bool):
+    """Atribuir el resultado de una tarea al plan del planificador mejorado, si existe"""
+    if _dynamic_task_planner is not None:
+        _dynamic_task_planner.record_plan_outcome(task_id, success)
\ No newline at end of file
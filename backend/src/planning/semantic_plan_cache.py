@@ -0,0 +1,452 @@
+"""
+Caché semántica de planes compartida entre planificadores
+Reutiliza planes que ya tuvieron éxito para peticiones parecidas: busca el
+vecino más cercano por embedding, alinea la petición nueva con la guardada
+para sustituir el tema ("investiga X y escribe un informe" -> otra X) y solo
+sirve el plan si la sustitución no deja restos de la petición anterior.
+
+- Espacios de nombres por planificador ('agent', 'hierarchical', 'enhanced')
+- Tasa de éxito por plan a partir de los resultados de ejecución
+- Desalojo LRU ponderado por calidad
+"""
+
+import copy
+import dataclasses
+import difflib
+import itertools
+import logging
+import math
+import os
+import re
+import threading
+import time
+import unicodedata
+import zlib
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Palabras que pueden aparecer o desaparecer entre dos peticiones sin cambiar el plan
+FILLER_WORDS = {
+    'el', 'la', 'los', 'las', 'un', 'una', 'unos', 'unas', 'de', 'del', 'al', 'a',
+    'en', 'sobre', 'acerca', 'y', 'e', 'o', 'que', 'por', 'para', 'con', 'mi', 'tu',
+    'su', 'me', 'te', 'se', 'lo', 'favor', 'porfavor', 'the', 'an', 'of', 'about',
+    'on', 'and', 'or', 'for', 'to', 'please', 'my'
+}
+
+
+def _normalize(text: str) -> str:
+    text = unicodedata.normalize('NFKD', (text or '').lower())
+    return ''.join(char for char in text if not unicodedata.combining(char))
+
+
+def hashed_embedding(text: str, num_features: int = 2 ** 16) -> Dict[int, float]:
+    """Embedding disperso normalizado (L2) de palabras, bigramas y trigramas de caracteres"""
+    tokens = re.findall(r'\w+', _normalize(text))
+    grams = [f"w:{token}" for token in tokens]
+    grams.extend(f"b:{a}_{b}" for a, b in zip(tokens, tokens[1:]))
+    for token in tokens:
+        padded = f"#{token}#"
+        grams.extend(f"c:{padded[i:i + 3]}" for i in range(len(padded) - 2))
+
+    vector: Dict[int, float] = {}
+    for gram in grams:
+        index = zlib.crc32(gram.encode('utf-8')) % num_features
+        vector[index] = vector.get(index, 0.0) + 1.0
+    norm = math.sqrt(sum(v * v for v in vector.values())) or 1.0
+    return {index: value / norm for index, value in vector.items()}
+
+
+def sentence_transformer_embedder(model_name: str = 'all-MiniLM-L6-v2') -> Callable[[str], Dict[int, float]]:
+    """Embedder denso con sentence-transformers (el mismo modelo que EmbeddingService)"""
+    from sentence_transformers import SentenceTransformer
+    model = SentenceTransformer(model_name)
+
+    def embed(text: str) -> Dict[int, float]:
+        values = model.encode([text])[0]
+        norm = math.sqrt(sum(float(v) * float(v) for v in values)) or 1.0
+        return {i: float(v) / norm for i, v in enumerate(values)}
+
+    return embed
+
+
+def cosine(a: Dict[int, float], b: Dict[int, float]) -> float:
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(value * b.get(index, 0.0) for index, value in a.items())
+
+
+def _tokens_with_spans(text: str) -> List[Tuple[str, int, int]]:
+    return [(_normalize(match.group()), match.start(), match.end()) for match in re.finditer(r'\w+', text)]
+
+
+@dataclass
+class Reparameterization:
+    """Alineación entre la petición guardada y la nueva"""
+    template_similarity: float
+    substitutions: List[Tuple[str, str]]
+
+
+def align_requests(old_request: str, new_request: str, max_slots: int = 2) -> Optional[Reparameterization]:
+    """
+    Alinear dos peticiones palabra a palabra
+
+    Returns:
+        Los tramos a sustituir (texto antiguo -> texto nuevo) y la similitud de
+        la plantilla común, o None si difieren en más de max_slots tramos o en
+        palabras añadidas/quitadas que no son de relleno
+    """
+    old_tokens = _tokens_with_spans(old_request)
+    new_tokens = _tokens_with_spans(new_request)
+    if not old_tokens or not new_tokens:
+        return None
+
+    matcher = difflib.SequenceMatcher(None, [t[0] for t in old_tokens], [t[0] for t in new_tokens], autojunk=False)
+    equal = 0
+    substitutions = []
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            equal += i2 - i1
+        elif tag == 'replace':
+            old_span = old_request[old_tokens[i1][1]:old_tokens[i2 - 1][2]]
+            new_span = new_request[new_tokens[j1][1]:new_tokens[j2 - 1][2]]
+            substitutions.append((old_span, new_span))
+        else:
+            changed = old_tokens[i1:i2] if tag == 'delete' else new_tokens[j1:j2]
+            if any(token not in FILLER_WORDS for token, _, _ in changed):
+                return None
+
+    if len(substitutions) > max_slots:
+        return None
+    return Reparameterization(
+        template_similarity=2.0 * equal / (len(old_tokens) + len(new_tokens)),
+        substitutions=substitutions
+    )
+
+
+def _substitute_strings(value: Any, replace: Callable[[str], str]) -> Any:
+    """Aplicar replace a todas las cadenas de un plan (dicts, listas, dataclasses)"""
+    if isinstance(value, str):
+        return replace(value)
+    if isinstance(value, dict):
+        return {key: _substitute_strings(item, replace) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_substitute_strings(item, replace) for item in value]
+    if isinstance(value, tuple):
+        return tuple(_substitute_strings(item, replace) for item in value)
+    if dataclasses.is_dataclass(value) and not isinstance(value, type):
+        for plan_field in dataclasses.fields(value):
+            setattr(value, plan_field.name, _substitute_strings(getattr(value, plan_field.name), replace))
+        return value
+    return value
+
+
+def _collect_text(value: Any, parts: List[str]):
+    if isinstance(value, str):
+        parts.append(value)
+    elif isinstance(value, dict):
+        for item in value.values():
+            _collect_text(item, parts)
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            _collect_text(item, parts)
+    elif dataclasses.is_dataclass(value) and not isinstance(value, type):
+        for plan_field in dataclasses.fields(value):
+            _collect_text(getattr(value, plan_field.name), parts)
+
+
+def reparameterize_plan(plan: Any, alignment: Reparameterization) -> Optional[Any]:
+    """
+    Copia del plan con los tramos de la petición antigua sustituidos por los
+    nuevos; None si el plan sigue mencionando palabras propias de la antigua
+    """
+    plan = copy.deepcopy(plan)
+    if not alignment.substitutions:
+        return plan
+
+    patterns = [
+        (re.compile(r'(?<!\w)' + re.escape(old_span) + r'(?!\w)', re.IGNORECASE), new_span)
+        for old_span, new_span in alignment.substitutions
+    ]
+
+    def replace(text: str) -> str:
+        for pattern, new_span in patterns:
+            text = pattern.sub(lambda _: new_span, text)
+        return text
+
+    plan = _substitute_strings(plan, replace)
+
+    # Raíces (5 letras) de las palabras propias de la petición antigua, para
+    # detectar también formas flexionadas ("solar" -> "solares")
+    new_words = set()
+    old_stems = set()
+    for old_span, new_span in alignment.substitutions:
+        new_words.update(token for token, _, _ in _tokens_with_spans(new_span))
+        old_stems.update(
+            token[:5] for token, _, _ in _tokens_with_spans(old_span)
+            if len(token) > 3 and token not in FILLER_WORDS
+        )
+    old_stems = {stem for stem in old_stems if not any(word.startswith(stem) for word in new_words)}
+
+    parts: List[str] = []
+    _collect_text(plan, parts)
+    plan_words = {token for part in parts for token, _, _ in _tokens_with_spans(part)}
+    if any(word.startswith(stem) for word in plan_words for stem in old_stems):
+        return None
+    return plan
+
+
+@dataclass
+class PlanCacheEntry:
+    """Plan guardado con su petición de origen y su historial de ejecución"""
+    entry_id: str
+    namespace: str
+    request: str
+    plan: Any
+    embedding: Dict[int, float]
+    constraints: Optional[Hashable] = None
+    created_at: float = field(default_factory=time.time)
+    last_used: float = field(default_factory=time.time)
+    hits: int = 0
+    successes: int = 0
+    failures: int = 0
+
+    @property
+    def quality(self) -> float:
+        """Tasa de éxito suavizada (Laplace): 0.5 sin historial"""
+        return (self.successes + 1) / (self.successes + self.failures + 2)
+
+
+@dataclass
+class PlanCacheHit:
+    """Resultado de una búsqueda con éxito"""
+    entry_id: str
+    plan: Any
+    similarity: float
+    template_similarity: float
+    substitutions: List[Tuple[str, str]]
+    source_request: str
+    quality: float
+
+
+class SemanticPlanCache:
+    """Caché de planes por similitud semántica de la petición"""
+
+    def __init__(self, capacity: int = None, similarity_threshold: float = None,
+                 template_threshold: float = None, min_quality: float = None,
+                 require_success: bool = None, embedder: Callable[[str], Dict[int, float]] = None,
+                 max_candidates: int = 5):
+        """
+        Args:
+            capacity: Planes guardados como máximo (PLAN_CACHE_SIZE, 500)
+            similarity_threshold: Coseno mínimo del vecino más cercano (PLAN_CACHE_SIMILARITY, 0.55)
+            template_threshold: Proporción mínima de palabras comunes tras alinear (PLAN_CACHE_TEMPLATE_SIMILARITY, 0.5)
+            min_quality: Tasa de éxito suavizada mínima para servir un plan (PLAN_CACHE_MIN_QUALITY, 0.4)
+            require_success: Servir solo planes con al menos una ejecución exitosa (PLAN_CACHE_REQUIRE_SUCCESS, true)
+            embedder: Función texto -> vector disperso normalizado (por defecto hashed_embedding)
+            max_candidates: Vecinos que se intentan reparametrizar por búsqueda
+        """
+        self.capacity = capacity or int(os.getenv('PLAN_CACHE_SIZE', '500'))
+        self.similarity_threshold = similarity_threshold if similarity_threshold is not None else float(
+            os.getenv('PLAN_CACHE_SIMILARITY', '0.55'))
+        self.template_threshold = template_threshold if template_threshold is not None else float(
+            os.getenv('PLAN_CACHE_TEMPLATE_SIMILARITY', '0.5'))
+        self.min_quality = min_quality if min_quality is not None else float(
+            os.getenv('PLAN_CACHE_MIN_QUALITY', '0.4'))
+        self.require_success = require_success if require_success is not None else (
+            os.getenv('PLAN_CACHE_REQUIRE_SUCCESS', 'true').lower() == 'true')
+        self.embedder = embedder or hashed_embedding
+        self.max_candidates = max_candidates
+
+        self._entries: "OrderedDict[str, PlanCacheEntry]" = OrderedDict()
+        self._task_entries: "OrderedDict[str, str]" = OrderedDict()
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+        self.stats = {
+            'lookups': 0,
+            'hits': 0,
+            'misses': 0,
+            'reparameterized': 0,
+            'rejected_alignment': 0,
+            'rejected_leak': 0,
+            'stores': 0,
+            'evictions': 0,
+            'successes': 0,
+            'failures': 0
+        }
+
+    def _servable(self, entry: PlanCacheEntry) -> bool:
+        if self.require_success and entry.successes == 0:
+            return False
+        return entry.quality >= self.min_quality
+
+    def lookup(self, namespace: str, request: str, constraints: Hashable = None,
+               task_id: str = None) -> Optional[PlanCacheHit]:
+        """
+        Buscar un plan reutilizable para la petición
+
+        Con task_id, el resultado de ejecución de esa tarea se atribuirá al
+        plan servido (record_outcome).
+        """
+        embedding = self.embedder(request)
+        with self._lock:
+            self.stats['lookups'] += 1
+            candidates = sorted(
+                (
+                    (cosine(embedding, entry.embedding), entry)
+                    for entry in self._entries.values()
+                    if entry.namespace == namespace and entry.constraints == constraints and self._servable(entry)
+                ),
+                key=lambda pair: (pair[0], pair[1].quality),
+                reverse=True
+            )[:self.max_candidates]
+            candidates = [(score, entry) for score, entry in candidates if score >= self.similarity_threshold]
+
+        for score, entry in candidates:
+            alignment = align_requests(entry.request, request)
+            if alignment is None or alignment.template_similarity < self.template_threshold:
+                with self._lock:
+                    self.stats['rejected_alignment'] += 1
+                continue
+            plan = reparameterize_plan(entry.plan, alignment)
+            if plan is None:
+                with self._lock:
+                    self.stats['rejected_leak'] += 1
+                continue
+
+            with self._lock:
+                entry.hits += 1
+                entry.last_used = time.time()
+                if entry.entry_id in self._entries:
+                    self._entries.move_to_end(entry.entry_id)
+                if task_id:
+                    self._bind_task(task_id, entry.entry_id)
+                self.stats['hits'] += 1
+                if alignment.substitutions:
+                    self.stats['reparameterized'] += 1
+
+            logger.info(f"♻️ Plan cache hit ({namespace}) similarity={score:.2f} "
+                        f"template={alignment.template_similarity:.2f} substitutions={alignment.substitutions}")
+            return PlanCacheHit(
+                entry_id=entry.entry_id,
+                plan=plan,
+                similarity=score,
+                template_similarity=alignment.template_similarity,
+                substitutions=alignment.substitutions,
+                source_request=entry.request,
+                quality=entry.quality
+            )
+
+        with self._lock:
+            self.stats['misses'] += 1
+        return None
+
+    def store(self, namespace: str, request: str, plan: Any, constraints: Hashable = None,
+              task_id: str = None) -> str:
+        """
+        Guardar un plan recién generado; no se sirve hasta que una ejecución
+        vinculada (task_id) termine con éxito si require_success está activo
+        """
+        embedding = self.embedder(request)
+        normalized = _normalize(request).strip()
+        with self._lock:
+            existing = next(
+                (entry for entry in self._entries.values()
+                 if entry.namespace == namespace and entry.constraints == constraints
+                 and _normalize(entry.request).strip() == normalized),
+                None
+            )
+            if existing is not None and existing.quality >= 0.5:
+                # Ya hay un plan que funciona para esta misma petición
+                entry = existing
+            else:
+                if existing is not None:
+                    del self._entries[existing.entry_id]
+                entry = PlanCacheEntry(
+                    entry_id=f"plan-cache-{next(self._ids)}",
+                    namespace=namespace,
+                    request=request,
+                    plan=copy.deepcopy(plan),
+                    embedding=embedding,
+                    constraints=constraints
+                )
+                self._entries[entry.entry_id] = entry
+                self.stats['stores'] += 1
+                self._evict()
+            if task_id:
+                self._bind_task(task_id, entry.entry_id)
+            return entry.entry_id
+
+    def _bind_task(self, task_id: str, entry_id: str):
+        self._task_entries[task_id] = entry_id
+        self._task_entries.move_to_end(task_id)
+        while len(self._task_entries) > self.capacity * 2:
+            self._task_entries.popitem(last=False)
+
+    def _evict(self):
+        """Desalojar, entre el 10% menos usado recientemente, el plan de peor calidad"""
+        while len(self._entries) > self.capacity:
+            window = max(1, self.capacity // 10)
+            oldest = list(itertools.islice(self._entries.values(), window))
+            victim = min(oldest, key=lambda entry: entry.quality)
+            del self._entries[victim.entry_id]
+            self.stats['evictions'] += 1
+
+    def record_outcome(self, success: bool, task_id: str = None, entry_id: str = None) -> bool:
+        """Registrar el resultado de ejecutar un plan guardado o servido por la caché"""
+        with self._lock:
+            if entry_id is None and task_id is not None:
+                entry_id = self._task_entries.pop(task_id, None)
+            entry = self._entries.get(entry_id) if entry_id else None
+            if entry is None:
+                return False
+            if success:
+                entry.successes += 1
+                self.stats['successes'] += 1
+            else:
+                entry.failures += 1
+                self.stats['failures'] += 1
+            return True
+
+    def invalidate(self, entry_id: str):
+        with self._lock:
+            self._entries.pop(entry_id, None)
+
+    def get_statistics(self) -> Dict[str, Any]:
+        with self._lock:
+            entries = list(self._entries.values())
+            lookups = self.stats['lookups']
+            return {
+                **self.stats,
+                'hit_rate': self.stats['hits'] / lookups if lookups else 0.0,
+                'entries': len(entries),
+                'servable_entries': sum(1 for entry in entries if self._servable(entry)),
+                'namespaces': sorted({entry.namespace for entry in entries}),
+                'capacity': self.capacity,
+                'similarity_threshold': self.similarity_threshold,
+                'template_threshold': self.template_threshold
+            }
+
+
+# Instancia global compartida por los planificadores
+_plan_cache_instance: Optional[SemanticPlanCache] = None
+_plan_cache_lock = threading.Lock()
+
+
+def get_plan_cache() -> SemanticPlanCache:
+    """Obtener la caché semántica de planes (PLAN_CACHE_EMBEDDER=hashed|sentence_transformer)"""
+    global _plan_cache_instance
+    if _plan_cache_instance is None:
+        with _plan_cache_lock:
+            if _plan_cache_instance is None:
+                embedder = None
+                if os.getenv('PLAN_CACHE_EMBEDDER', 'hashed').lower() == 'sentence_transformer':
+                    try:
+                        embedder = sentence_transformer_embedder()
+                    except Exception as e:
+                        logger.warning(f"⚠️ sentence-transformers no disponible para la caché de planes: {e}")
+                _plan_cache_instance = SemanticPlanCache(embedder=embedder)
+    return _plan_cache_instance
@@ -0,0 +1,112 @@
+"""
+Rutas de administración y diagnóstico
+Endpoints para activar el profiler de muestreo en caliente y descargar
+sus resultados como collapsed stacks (flamegraph)
+
+Solo están disponibles con ADMIN_ENDPOINTS_ENABLED=true (por defecto, el valor
+de DEBUG) y, si se define ADMIN_TOKEN, exigen 'Authorization: Bearer <token>'
+"""
+
+from flask import Blueprint, request, jsonify, Response, current_app
+import hmac
+import logging
+import os
+
+from src.monitoring.sampling_profiler import get_sampling_profiler
+
+logger = logging.getLogger(__name__)
+
+admin_bp = Blueprint('admin', __name__)
+
+def admin_endpoints_enabled() -> bool:
+    """Endpoints de administración habilitados (en producción, desactivados salvo configuración)"""
+    return os.getenv('ADMIN_ENDPOINTS_ENABLED', os.getenv('DEBUG', 'False')).lower() == 'true'
+
+@admin_bp.before_request
+def require_admin_access():
+    """Rechazar las peticiones si los endpoints están deshabilitados o el token no coincide"""
+    if not admin_endpoints_enabled():
+        return jsonify({'error': 'Not found'}), 404
+    
+    admin_token = os.getenv('ADMIN_TOKEN')
+    if admin_token:
+        provided = request.headers.get('Authorization', '')
+        if not hmac.compare_digest(provided.encode('utf-8'), f'Bearer {admin_token}'.encode('utf-8')):
+            logger.warning(f"🚫 Admin endpoint {request.path} rejected: invalid token")
+            return jsonify({'error': 'Unauthorized'}), 401
+    return None
+
+@admin_bp.route('/profiler/sessions', methods=['GET'])
+def list_profiler_sessions():
+    """Lista las sesiones de profiling activas y finalizadas"""
+    try:
+        return jsonify({'sessions': get_sampling_profiler().list_sessions()})
+    except Exception as e:
+        logger.error(f"Error listing profiler sessions: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/profiler/start', methods=['POST'])
+def start_profiler_session():
+    """
+    Inicia una sesión de profiling por muestreo
+    Body opcional: task_id, route, interval (s), max_duration (s)
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        
+        interval = float(data.get('interval', 0.01))
+        max_duration = float(data.get('max_duration', 60))
+        if max_duration <= 0 or max_duration > 3600:
+            return jsonify({'error': 'max_duration must be between 0 and 3600 seconds'}), 400
+        
+        session = get_sampling_profiler().start_session(
+            task_id=data.get('task_id'),
+            route=data.get('route'),
+            interval=interval,
+            max_duration=max_duration
+        )
+        
+        return jsonify(session.to_dict(top=0))
+        
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': f'Invalid parameters: {str(e)}'}), 400
+    except Exception as e:
+        logger.error(f"Error starting profiler session: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/profiler/<session_id>/stop', methods=['POST'])
+def stop_profiler_session(session_id):
+    """Detiene una sesión de profiling"""
+    session = get_sampling_profiler().stop_session(session_id)
+    if not session:
+        return jsonify({'error': 'Profiling session not found'}), 404
+    return jsonify(session.to_dict())
+
+@admin_bp.route('/profiler/<session_id>', methods=['GET'])
+def get_profiler_session(session_id):
+    """Obtiene el resumen de una sesión con sus pilas más frecuentes"""
+    session = get_sampling_profiler().get_session(session_id)
+    if not session:
+        return jsonify({'error': 'Profiling session not found'}), 404
+    return jsonify(session.to_dict(top=int(request.args.get('top', 20))))
+
+@admin_bp.route('/profiler/<session_id>/flamegraph', methods=['GET'])
+def download_profiler_flamegraph(session_id):
+    """Descarga las pilas agregadas en formato collapsed stack"""
+    collapsed = get_sampling_profiler().collapsed_stacks(session_id)
+    if collapsed is None:
+        return jsonify({'error': 'Profiling session not found'}), 404
+    
+    return Response(
+        collapsed,
+        mimetype='text/plain',
+        headers={'Content-Disposition': f'attachment; filename=profile_{session_id}.collapsed'}
+    )
+
+@admin_bp.route('/websocket/stats', methods=['GET'])
+def get_websocket_dispatch_stats():
+    """Contadores del dispatcher de WebSocket (lotes, coalescencia, descartes)"""
+    websocket_manager = getattr(current_app, 'websocket_manager', None)
+    if not websocket_manager:
+        return jsonify({'error': 'WebSocket manager not available'}), 503
+    return jsonify(websocket_manager.get_dispatch_statistics())
@@ -4,8 +4,11 @@ Sistema de agente que usa Ollama real para generar respuestas inteligentes
 Y distingue entre conversaciones casuales y tareas complejas
 """
 
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, request, jsonify, current_app, Response, stream_with_context
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+import asyncio
 from datetime import datetime
+from typing import Optional
 import logging
 import time
 import uuid
@@ -13,7 +16,7 @@ import json
 import os
 import requests
 import re
-import jsonschema
+import threading
 from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
 
 logger = logging.getLogger(__name__)
@@ -44,14 +47,20 @@ PLAN_SCHEMA = {
                     },
                     "tool": {
                         "type": "string",
-                        "enum": ["web_search", "analysis", "creation", "planning", "delivery", "processing", "synthesis", "search_definition", "data_analysis"]
+                        "enum": ["web_search", "analysis", "creation", "planning", "delivery", "processing", "synthesis", "search_definition", "data_analysis"],
+                        "default": "processing"
                     },
                     "estimated_time": {
                         "type": "string"
                     },
                     "priority": {
                         "type": "string",
-                        "enum": ["alta", "media", "baja"]
+                        "enum": ["alta", "media", "baja"],
+                        "default": "media"
+                    },
+                    "dependencies": {
+                        "type": "array",
+                        "items": {"type": "integer", "minimum": 1}
                     }
                 },
                 "additionalProperties": False
@@ -76,15 +85,32 @@ agent_bp = Blueprint('agent', __name__)
 
 # Importar nuevo TaskManager para persistencia
 from ..services.task_manager import get_task_manager
-
-# Almacenamiento temporal para compartir conversaciones
-shared_conversations = {}
-# Almacenamiento temporal para archivos por tarea
-task_files = {}
+from ..services.task_state_cache import TaskStateCache
+from ..services.execution_journal import get_execution_journal
+from ..services.task_executor import get_task_executor, TaskExecutorOverloaded
+from ..monitoring.tracing import get_tracer, traced
+from ..monitoring.sampling_profiler import set_thread_tags, with_thread_tags, inherit_thread_tags
+from ..analysis.intent_classifier import get_intent_classifier, classify_intent_with_llm
+from ..utils.json_repair import parse_json_tolerant, coerce_to_schema, describe_schema_errors
+from ..planning.semantic_plan_cache import get_plan_cache
+from ..utils.dag_scheduler import DAGScheduler, DAGNode
+
+def _write_back_task_plan(task_id: str, task_data: dict):
+    """Persistir en TaskManager una entrada legacy sucia desalojada de la caché"""
+    task_manager = get_task_manager()
+    if task_manager.get_task(task_id):
+        task_manager.update_task(task_id, dict(task_data))
+    else:
+        task_manager.create_task(task_id, task_data)
+
+# Almacenamiento temporal (acotado LRU+TTL) para compartir conversaciones
+shared_conversations = TaskStateCache('shared_conversations')
+# Almacenamiento temporal (acotado LRU+TTL) para archivos por tarea
+task_files = TaskStateCache('task_files')
 
 # DEPRECATED: Reemplazado por TaskManager con persistencia MongoDB
-# Mantenido temporalmente para migración gradual
-active_task_plans = {}
+# Mantenido temporalmente para migración gradual; acotado y versionado
+active_task_plans = TaskStateCache('active_task_plans', on_evict=_write_back_task_plan)
 
 def get_task_data(task_id: str) -> dict:
     """
@@ -98,12 +124,14 @@ def get_task_data(task_id: str) -> dict:
         if task_data:
             logger.debug(f"📥 Task {task_id} retrieved from persistent storage")
             return task_data
-        elif task_id in active_task_plans:
+        
+        legacy_data = active_task_plans.snapshot(task_id)
+        if legacy_data:
             # Fallback a memoria legacy
             logger.warning(f"⚠️ Task {task_id} found only in legacy memory, migrating...")
-            legacy_data = active_task_plans[task_id]
             # Migrar a persistencia
-            task_manager.create_task(task_id, legacy_data)
+            if task_manager.create_task(task_id, legacy_data):
+                active_task_plans.mark_clean(task_id)
             return legacy_data
         else:
             logger.warning(f"⚠️ Task {task_id} not found in persistent or legacy storage")
@@ -112,7 +140,7 @@ def get_task_data(task_id: str) -> dict:
     except Exception as e:
         logger.error(f"❌ Error getting task data {task_id}: {str(e)}")
         # Fallback a memoria legacy
-        return active_task_plans.get(task_id)
+        return active_task_plans.snapshot(task_id)
 
 def save_task_data(task_id: str, task_data: dict) -> bool:
     """
@@ -125,17 +153,17 @@ def save_task_data(task_id: str, task_data: dict) -> bool:
         if success:
             logger.debug(f"💾 Task {task_id} saved to persistent storage")
             # Mantener en memoria legacy por compatibilidad
-            active_task_plans[task_id] = task_data
+            active_task_plans.set(task_id, task_data, dirty=False)
             return True
         else:
             logger.warning(f"⚠️ Failed to save task {task_id} to persistent storage, using legacy")
-            active_task_plans[task_id] = task_data
+            active_task_plans.set(task_id, task_data)
             return False
             
     except Exception as e:
         logger.error(f"❌ Error saving task data {task_id}: {str(e)}")
         # Fallback a memoria legacy
-        active_task_plans[task_id] = task_data
+        active_task_plans.set(task_id, task_data)
         return False
 
 def update_task_data(task_id: str, updates: dict) -> bool:
@@ -149,20 +177,17 @@ def update_task_data(task_id: str, updates: dict) -> bool:
         if success:
             logger.debug(f"✅ Task {task_id} updated in persistent storage")
             # Actualizar memoria legacy por compatibilidad
-            if task_id in active_task_plans:
-                active_task_plans[task_id].update(updates)
+            active_task_plans.update_entry(task_id, updates, dirty=False)
             return True
         else:
             logger.warning(f"⚠️ Failed to update task {task_id} in persistent storage, using legacy")
-            if task_id in active_task_plans:
-                active_task_plans[task_id].update(updates)
+            active_task_plans.update_entry(task_id, updates)
             return False
             
     except Exception as e:
         logger.error(f"❌ Error updating task data {task_id}: {str(e)}")
         # Fallback a memoria legacy
-        if task_id in active_task_plans:
-            active_task_plans[task_id].update(updates)
+        active_task_plans.update_entry(task_id, updates)
         return False
 
 # Patrones para detectar tipo de mensaje
@@ -202,12 +227,47 @@ TASK_PATTERNS = [
     r'ayúdame\b.*\b(con|a crear|a generar|a desarrollar)'
 ]
 
+def pre_classify_message(message: str) -> Optional[bool]:
+    """
+    Pre-clasificador local sin LLM para los casos evidentes
+    
+    Returns:
+        True si es claramente casual, False si es claramente una tarea,
+        None si es ambiguo y necesita la clasificación LLM
+    """
+    message_lower = message.lower().strip()
+    words = message_lower.split()
+    
+    if any(re.search(pattern, message_lower) for pattern in TASK_PATTERNS):
+        return False
+    
+    # Saludos y cortesías cortas
+    if len(words) <= 4 and any(re.search(pattern, message_lower) for pattern in CASUAL_PATTERNS):
+        return True
+    
+    return None
+
+@traced('chat.is_casual_conversation', lambda args: {'message.length': len(args['message'])})
 def is_casual_conversation(message: str) -> bool:
     """
     Detecta si un mensaje es una conversación casual usando clasificación LLM
     Mejora implementada según UPGRADE.md Sección 1: Sistema de Contexto Dinámico Inteligente
     """
+    # Los casos evidentes se resuelven localmente sin llamar al LLM
+    decision = pre_classify_message(message)
+    if decision is not None:
+        logger.info(f"⚡ Pre-clasificación local: '{message[:30]}...' -> {'CASUAL' if decision else 'TAREA'}")
+        return decision
+    
     try:
+        # Clasificador local: decide sin LLM cuando tiene confianza suficiente
+        intent_classifier = get_intent_classifier()
+        prediction = intent_classifier.classify(message)
+        if prediction.is_confident:
+            logger.info(f"⚡ Clasificación local: '{message[:30]}...' -> {prediction.intent} "
+                        f"({prediction.confidence:.2f}) -> {'CASUAL' if prediction.is_casual else 'TAREA'}")
+            return prediction.is_casual
+        
         # Obtener servicio de Ollama para clasificación inteligente
         ollama_service = get_ollama_service()
         
@@ -238,79 +298,25 @@ def is_casual_conversation(message: str) -> bool:
             if context.get('topics'):
                 context_info += f"Temas: {', '.join(context['topics'])}\n"
         
-        intent_prompt = f"""Clasifica la siguiente frase del usuario en una de estas categorías exactas: 'casual', 'tarea_investigacion', 'tarea_creacion', 'tarea_analisis', 'otro'.
-
-{context_info}
-
-Responde ÚNICAMENTE con un objeto JSON con la clave 'intent'. No agregues explicaciones adicionales.
-
-EJEMPLOS:
-- "hola" -> {{"intent": "casual"}}
-- "¿cómo estás?" -> {{"intent": "casual"}}
-- "gracias" -> {{"intent": "casual"}}
-- "buscar información sobre IA" -> {{"intent": "tarea_investigacion"}}
-- "crear un informe" -> {{"intent": "tarea_creacion"}}
-- "analizar datos" -> {{"intent": "tarea_analisis"}}
-
-Frase a clasificar: "{message}"
-
-Respuesta JSON:"""
-        
-        logger.info(f"🤖 Clasificando intención con LLM para: '{message[:50]}...'")
+        logger.info(f"🤖 Clasificando intención con LLM para: '{message[:50]}...' "
+                    f"(local: {prediction.intent} {prediction.confidence:.2f})")
         
-        # Llamar a Ollama con parámetros optimizados para JSON
-        response = ollama_service.generate_response(intent_prompt, {
-            'temperature': 0.2,  # Más bajo para respuestas consistentes
-            'response_format': 'json'
-        })
+        intent, error = classify_intent_with_llm(ollama_service, message, context_info)
         
-        if response.get('error'):
-            logger.warning(f"⚠️ Error en clasificación LLM: {response['error']}, usando fallback")
+        if error:
+            logger.warning(f"⚠️ Error en clasificación LLM: {error}, usando fallback")
             return _fallback_casual_detection(message)
         
-        # Parsear respuesta JSON con estrategias robustas
-        response_text = response.get('response', '').strip()
-        logger.info(f"📥 Respuesta LLM clasificación: {response_text[:100]}...")
-        
-        # Intentar parseo JSON con múltiples estrategias
-        intent_data = None
-        
-        # Estrategia 1: JSON directo
-        try:
-            # Limpiar respuesta
-            cleaned_response = response_text.replace('```json', '').replace('```', '').strip()
-            if cleaned_response.startswith('{') and cleaned_response.endswith('}'):
-                intent_data = json.loads(cleaned_response)
-        except json.JSONDecodeError:
-            pass
-        
-        # Estrategia 2: Buscar JSON en el texto
-        if not intent_data:
-            try:
-                json_match = re.search(r'\{[^{}]*"intent"[^{}]*\}', response_text)
-                if json_match:
-                    intent_data = json.loads(json_match.group())
-            except json.JSONDecodeError:
-                pass
-        
-        # Estrategia 3: Extracción por regex
-        if not intent_data:
-            try:
-                intent_match = re.search(r'"intent"\s*:\s*"([^"]+)"', response_text)
-                if intent_match:
-                    intent_data = {"intent": intent_match.group(1)}
-            except:
-                pass
-        
         # Validar resultado
-        if intent_data and 'intent' in intent_data:
-            intent = intent_data['intent'].lower().strip()
-            
+        if intent:
             # Clasificar como casual o tarea
             is_casual = intent == 'casual'
             
             logger.info(f"✅ Clasificación LLM exitosa: '{message[:30]}...' -> {intent} -> {'CASUAL' if is_casual else 'TAREA'}")
             
+            # Aprendizaje en línea con la etiqueta del LLM
+            intent_classifier.record_label(message, intent, source='llm', prediction=prediction)
+            
             return is_casual
         else:
             logger.warning(f"⚠️ No se pudo parsear intención LLM, usando fallback para: {message[:30]}...")
@@ -389,10 +395,69 @@ def get_tool_manager():
         logger.error("Tool manager not available")
         return None
 
-def execute_plan_with_real_tools(task_id: str, plan_steps: list, message: str):
+# Ejecución concurrente de los pasos del plan en execute_plan_with_real_tools
+PLAN_MAX_PARALLEL_STEPS = int(os.getenv('PLAN_MAX_PARALLEL_STEPS', '4'))
+PLAN_STEP_GROUP_LIMITS = {
+    'web_search': int(os.getenv('PLAN_WEB_SEARCH_CONCURRENCY', '3')),
+    'ollama': int(os.getenv('PLAN_OLLAMA_CONCURRENCY', '2'))
+}
+
+def classify_plan_step(step: dict) -> str:
+    """Tipo de ejecución de un paso: web_search, analysis, creation, planning, delivery o generic"""
+    title = step.get('title', '').lower()
+    tool = step.get('tool')
+    if tool == 'web_search' or 'búsqueda' in title:
+        return 'web_search'
+    if tool == 'analysis' or 'análisis' in title:
+        return 'analysis'
+    if tool == 'creation' or 'creación' in title or 'desarrollo' in title:
+        return 'creation'
+    if tool == 'planning' or 'planificación' in title:
+        return 'planning'
+    if tool == 'delivery' or 'entrega' in title:
+        return 'delivery'
+    return 'generic'
+
+def resolve_plan_step_dependencies(steps: list) -> dict:
+    """
+    Dependencias (ids de pasos anteriores) de cada paso del plan
+    
+    Se usan las 'dependencies' declaradas en el plan si al menos un paso
+    declara alguna (una lista vacía en todos suele significar que el modelo
+    no las rellenó); si no, se infieren por tipo de paso:
+    - Búsquedas: independientes entre sí y del resto
+    - Planificación: tras los pasos anteriores que no son búsquedas
+    - Análisis, creación y genéricos: tras todos los pasos anteriores
+    La entrega final depende siempre de todos los pasos anteriores.
+    """
+    declared = any(step.get('dependencies') for step in steps)
+    dependencies = {}
+    for index, step in enumerate(steps):
+        previous = [other['id'] for other in steps[:index]]
+        kind = classify_plan_step(step)
+        if kind == 'delivery':
+            step_dependencies = previous
+        elif declared and step.get('dependencies') is not None:
+            step_dependencies = [dep for dep in step['dependencies'] if dep in previous]
+        elif kind == 'web_search':
+            step_dependencies = []
+        elif kind == 'planning':
+            step_dependencies = [other['id'] for other in steps[:index] if classify_plan_step(other) != 'web_search']
+        else:
+            step_dependencies = previous
+        dependencies[step['id']] = step_dependencies
+    return dependencies
+
+@traced('plan.execute_plan_with_real_tools', lambda args: {'task_id': args['task_id'], 'plan.steps': len(args['plan_steps'])})
+def execute_plan_with_real_tools(task_id: str, plan_steps: list, message: str,
+                                 user_id: str = None, priority: int = 1) -> Optional[dict]:
     """
     Ejecuta REALMENTE los pasos del plan usando herramientas y entrega resultados finales
     Mejora implementada según UPGRADE.md Sección 3: WebSockets para Comunicación en Tiempo Real
+    
+    La ejecución se encola en el ejecutor de tareas (workers acotados, reparto
+    justo por usuario). Devuelve la posición en cola y la ETA, o lanza
+    TaskExecutorOverloaded si la cola está llena y la política es rechazar.
     """
     try:
         import threading
@@ -435,10 +500,13 @@ def execute_plan_with_real_tools(task_id: str, plan_steps: list, message: str):
                     elif update_type == 'task_failed':
                         websocket_manager.send_update(task_id, websocket_manager.UpdateType.TASK_FAILED, data)
                         
-                    logger.info(f"📡 WebSocket update sent: {update_type} for task {task_id}")
+                    logger.debug(f"📡 WebSocket update sent: {update_type} for task {task_id}")
                 except Exception as e:
                     logger.warning(f"⚠️ WebSocket update failed: {e}")
         
+        tracer = get_tracer()
+        
+        @traced('plan.execute_steps', lambda args: {'task_id': task_id})
         def execute_steps():
             # Usar TaskManager en lugar de active_task_plans
             task_data = get_task_data(task_id)
@@ -447,9 +515,33 @@ def execute_plan_with_real_tools(task_id: str, plan_steps: list, message: str):
                 return
                 
             steps = task_data['plan']
-            final_results = []  # Almacenar resultados de cada paso
+            step_results = {}  # Resultado de cada paso por id (final_results se arma en orden del plan)
+            finished_steps = []
+            # Los pasos se ejecutan en paralelo: los cambios sobre `steps` y su
+            # publicación en la caché/persistencia van siempre bajo este lock
+            progress_lock = threading.Lock()
             
-            logger.info(f"🚀 Starting REAL execution of {len(steps)} steps for task: {message}")
+            dependencies = resolve_plan_step_dependencies(steps)
+            ancestors = {}
+            for step in steps:
+                ancestors[step['id']] = set()
+                for dependency in dependencies[step['id']]:
+                    ancestors[step['id']] |= {dependency} | ancestors[dependency]
+            
+            # Diario durable: si la tarea se interrumpió (reinicio del proceso) se
+            # reutilizan las salidas de los pasos que ya habían terminado
+            journal = get_execution_journal()
+            journal_state = journal.start_task(task_id, message, steps)
+            reused_outputs = journal.completed_outputs(journal_state)
+            
+            def upstream_results(step: dict) -> list:
+                """Resultados de los pasos de los que depende (directa o indirectamente), en orden del plan"""
+                with progress_lock:
+                    return [step_results[other['id']] for other in steps
+                            if other['id'] in ancestors[step['id']] and other['id'] in step_results]
+            
+            logger.info(f"🚀 Starting REAL execution of {len(steps)} steps for task: {message} "
+                        f"(dependencies: {dependencies})")
             
             # Enviar notificación de inicio de tarea
             send_websocket_update('log_message', {
@@ -459,47 +551,71 @@ def execute_plan_with_real_tools(task_id: str, plan_steps: list, message: str):
                 'timestamp': datetime.now().isoformat()
             })
             
-            for i, step in enumerate(steps):
+            def run_step(i: int, step: dict):
+                """Ejecutar un paso (en un hilo; sus dependientes esperan a que termine)"""
+                with tracer.span('plan.step', {
+                    'task_id': task_id,
+                    'step.id': step['id'],
+                    'step.index': i + 1,
+                    'tool.name': step.get('tool')
+                }) as step_span:
+                    execute_step(i, step)
+                    step_span.set_attribute('step.status', step['status'])
+                    if step['status'] == 'failed':
+                        step_span.record_error(step.get('error'))
+            
+            def execute_step(i: int, step: dict):
+                """Cuerpo de run_step: marcar el paso, ejecutarlo y guardar su resultado"""
                 logger.info(f"🔄 Executing step {i+1}/{len(steps)}: {step['title']}")
                 
-                # Marcar paso como activo
-                step['active'] = True
-                step['status'] = 'in-progress'
-                
-                # Enviar actualización de estado del paso en tiempo real
-                send_websocket_update('step_update', {
-                    'type': 'step_update',
-                    'step_id': step['id'],
-                    'status': 'in-progress',
-                    'title': step['title'],
-                    'description': step['description'],
-                    'progress': (i / len(steps)) * 100,
-                    'current_step': i + 1,
-                    'total_steps': len(steps)
-                })
-                
-                # Enviar log detallado al monitor
-                send_websocket_update('log_message', {
-                    'type': 'log_message',
-                    'level': 'info',
-                    'message': f'🔄 Ejecutando paso {i+1}/{len(steps)}: {step["title"]}',
-                    'timestamp': datetime.now().isoformat()
-                })
-                
-                # Actualizar plan en memoria y persistencia
-                task_manager = get_task_manager()
-                task_manager.update_task_step_status(
-                    task_id, 
-                    step['id'], 
-                    'in-progress'
-                )
-                update_task_data(task_id, {
-                    'plan': steps,
-                    'current_step': i + 1
-                })
+                with progress_lock:
+                    # Marcar paso como activo
+                    step['active'] = True
+                    step['status'] = 'in-progress'
+                    
+                    # Enviar actualización de estado del paso en tiempo real
+                    send_websocket_update('step_update', {
+                        'type': 'step_update',
+                        'step_id': step['id'],
+                        'status': 'in-progress',
+                        'title': step['title'],
+                        'description': step['description'],
+                        'progress': (len(finished_steps) / len(steps)) * 100,
+                        'current_step': i + 1,
+                        'total_steps': len(steps)
+                    })
+                    
+                    # Enviar log detallado al monitor
+                    send_websocket_update('log_message', {
+                        'type': 'log_message',
+                        'level': 'info',
+                        'message': f'🔄 Ejecutando paso {i+1}/{len(steps)}: {step["title"]}',
+                        'timestamp': datetime.now().isoformat()
+                    })
+                    
+                    # Actualizar plan en memoria y persistencia (solo el delta del paso)
+                    task_manager = get_task_manager()
+                    task_manager.update_task_step_status(
+                        task_id, 
+                        step['id'], 
+                        'in-progress',
+                        extra_fields={'active': True}
+                    )
+                    update_task_data(task_id, {'current_step': i + 1})
+                    active_task_plans.update_entry(task_id, {'plan': steps}, dirty=False)
                 
                 step_start_time = time.time()
                 step_result = None
+                prior_results = upstream_results(step)
+                kind = classify_plan_step(step)
+                journal.step_started(task_id, step['id'])
+                
+                def journaled(operation: str, params, call):
+                    """Llamada con efectos: si ya se completó antes de una interrupción se reutiliza su salida"""
+                    return journal.run_once(task_id, step['id'], operation, params, call)
+                
+                # Nombre de fichero estable por paso: reanudar sobrescribe en lugar de duplicar
+                file_token = journal.idempotency_key(task_id, step['id'], 'file')[:12]
                 
                 # Función para ejecutar herramientas con reintentos y retroceso exponencial
                 # Mejora implementada según UPGRADE.md Sección 6: Manejo de Errores y Resiliencia
@@ -508,6 +624,7 @@ def execute_plan_with_real_tools(task_id: str, plan_steps: list, message: str):
                     wait=wait_exponential(multiplier=1, min=2, max=8),
                     retry=retry_if_exception_type((requests.RequestException, ConnectionError, TimeoutError))
                 )
+                @traced('plan.execute_tool_with_retries', lambda args: {'tool.name': args['tool_name']})
                 def execute_tool_with_retries(tool_name: str, tool_params: dict, step_title: str):
                     """Ejecutar herramienta con reintentos automáticos"""
                     logger.info(f"🔄 Executing tool '{tool_name}' with retries for step: {step_title}")
@@ -530,8 +647,9 @@ def execute_plan_with_real_tools(task_id: str, plan_steps: list, message: str):
                 
                 try:
                     # EJECUTAR HERRAMIENTA REAL según el tipo de paso con reintentos automáticos
-                    if step['tool'] == 'web_search' or 'búsqueda' in step['title'].lower():
-                        search_query = extract_search_query_from_message(message, step['title'])
+                    if kind == 'web_search':
+                        search_query = journaled('search_query', {'title': step['title']},
+                                                 lambda: extract_search_query_from_message(message, step['title']))
                         logger.info(f"🔍 Executing web search with retries for: {search_query}")
                         
                         # Enviar detalle de ejecución de herramienta
@@ -545,10 +663,9 @@ def execute_plan_with_real_tools(task_id: str, plan_steps: list, message: str):
                         
                         try:
                             # Usar ejecución con reintentos automáticos
-                            result = execute_tool_with_retries('web_search', {
-                                'query': search_query,
-                                'num_results': 5
-                            }, step['title'])
+                            search_params = {'query': search_query, 'num_results': 5}
+                            result = journaled('web_search', search_params,
+                                               lambda: execute_tool_with_retries('web_search', search_params, step['title']))
                             
                             step_result = {
                                 'type': 'web_search',
@@ -557,8 +674,6 @@ def execute_plan_with_real_tools(task_id: str, plan_steps: list, message: str):
                                 'summary': f"Encontradas {len(result.get('search_results', []))} fuentes relevantes"
                             }
                             
-                            step['result'] = step_result
-                            final_results.append(step_result)
                             
                             # Enviar resultado de herramienta
                             send_websocket_update('tool_execution_detail', {
@@ -593,10 +708,8 @@ def execute_plan_with_real_tools(task_id: str, plan_steps: list, message: str):
                                 'error': str(search_error),
                                 'fallback_used': True
                             }
-                            step['result'] = step_result
-                            final_results.append(step_result)
                     
-                    elif step['tool'] == 'analysis' or 'análisis' in step['title'].lower():
+                    elif kind == 'analysis':
                         if ollama_service:
                             logger.info(f"🧠 Executing analysis using Ollama")
                             
@@ -611,8 +724,8 @@ def execute_plan_with_real_tools(task_id: str, plan_steps: list, message: str):
                             
                             # Generar análisis específico usando contexto previo
                             analysis_context = f"Tarea: {message}\nPaso actual: {step['title']}\nDescripción: {step['description']}"
-                            if final_results:
-                                analysis_context += f"\nResultados previos: {final_results[-1] if final_results else 'Ninguno'}"
+                            if prior_results:
+                                analysis_context += f"\nResultados previos: {prior_results[-1]}"
                             
                             analysis_prompt = f"""
 Realiza un análisis detallado para:
@@ -627,7 +740,8 @@ Proporciona:
 Formato: Respuesta estructurada y profesional.
 """
                             
-                            result = ollama_service.generate_response(analysis_prompt, {})
+                            result = journaled('ollama', {'prompt': analysis_prompt},
+                                              lambda: ollama_service.generate_response(analysis_prompt, {}))
                             
                             step_result = {
                                 'type': 'analysis',
@@ -635,8 +749,6 @@ Formato: Respuesta estructurada y profesional.
                                 'summary': 'Análisis detallado generado exitosamente'
                             }
                             
-                            step['result'] = step_result
-                            final_results.append(step_result)
                             
                             # Enviar resultado de herramienta
                             send_websocket_update('tool_execution_detail', {
@@ -648,10 +760,8 @@ Formato: Respuesta estructurada y profesional.
                             })
                             
                             logger.info(f"✅ Analysis completed")
-                        else:
-                            time.sleep(2)
                     
-                    elif step['tool'] == 'creation' or 'creación' in step['title'].lower() or 'desarrollo' in step['title'].lower():
+                    elif kind == 'creation':
                         if ollama_service:
                             logger.info(f"🛠️ Executing creation with REAL file generation")
                             
@@ -666,8 +776,8 @@ Formato: Respuesta estructurada y profesional.
                             
                             # Generar contenido específico
                             creation_context = f"Tarea: {message}\nPaso: {step['title']}\nDescripción: {step['description']}"
-                            if final_results:
-                                creation_context += f"\nInformación previa: {final_results}"
+                            if prior_results:
+                                creation_context += f"\nInformación previa: {prior_results}"
                             
                             creation_prompt = f"""
 Crea el contenido solicitado para:
@@ -684,7 +794,8 @@ Incluye:
 Responde con el contenido completo y listo para usar.
 """
                             
-                            result = ollama_service.generate_response(creation_prompt, {})
+                            result = journaled('ollama', {'prompt': creation_prompt},
+                                              lambda: ollama_service.generate_response(creation_prompt, {}))
                             content = result.get('response', 'Contenido creado')
                             
                             # 🆕 CREAR ARCHIVO REAL TANGIBLE
@@ -701,7 +812,7 @@ Responde con el contenido completo y listo para usar.
                                 # Crear nombre de archivo único
                                 import re
                                 safe_title = re.sub(r'[^a-zA-Z0-9\-_]', '_', step['title'][:30])
-                                filename = f"{safe_title}_{int(time.time())}{file_extension}"
+                                filename = f"{safe_title}_{file_token}{file_extension}"
                                 file_path = f"/app/backend/static/generated_files/{filename}"
                                 
                                 # Crear directorio si no existe
@@ -752,13 +863,9 @@ Responde con el contenido completo y listo para usar.
                                     'file_error': str(file_error)
                                 }
                             
-                            step['result'] = step_result
-                            final_results.append(step_result)
                             logger.info(f"✅ Content creation with file generation completed")
-                        else:
-                            time.sleep(4)
                     
-                    elif step['tool'] == 'planning' or 'planificación' in step['title'].lower():
+                    elif kind == 'planning':
                         if ollama_service:
                             logger.info(f"📋 Executing planning using Ollama")
                             
@@ -768,7 +875,7 @@ Crea un plan detallado para: {message}
 Basándote en el contexto:
 - Tarea: {step['title']}
 - Descripción: {step['description']}
-- Información previa: {final_results if final_results else 'Primera fase'}
+- Información previa: {prior_results if prior_results else 'Primera fase'}
 
 Genera un plan estructurado con:
 1. Objetivos claros
@@ -780,7 +887,8 @@ Genera un plan estructurado con:
 Proporciona un plan completo y actionable.
 """
                             
-                            result = ollama_service.generate_response(planning_prompt, {})
+                            result = journaled('ollama', {'prompt': planning_prompt},
+                                              lambda: ollama_service.generate_response(planning_prompt, {}))
                             
                             step_result = {
                                 'type': 'planning',
@@ -788,13 +896,9 @@ Proporciona un plan completo y actionable.
                                 'summary': 'Plan detallado creado exitosamente'
                             }
                             
-                            step['result'] = step_result
-                            final_results.append(step_result)
                             logger.info(f"✅ Planning completed")
-                        else:
-                            time.sleep(2)
                     
-                    elif step['tool'] == 'delivery' or 'entrega' in step['title'].lower():
+                    elif kind == 'delivery':
                         if ollama_service:
                             logger.info(f"📦 Executing final delivery with TANGIBLE results")
                             
@@ -803,7 +907,7 @@ Proporciona un plan completo y actionable.
 Prepara la entrega final para la tarea: {message}
 
 Consolida todos los resultados obtenidos:
-{final_results}
+{prior_results}
 
 Crea un documento de entrega final que incluya:
 1. RESUMEN EJECUTIVO de lo realizado
@@ -816,7 +920,8 @@ Crea un documento de entrega final que incluya:
 Formato: Documento profesional completo y estructurado.
 """
                             
-                            result = ollama_service.generate_response(delivery_prompt, {})
+                            result = journaled('ollama', {'prompt': delivery_prompt},
+                                              lambda: ollama_service.generate_response(delivery_prompt, {}))
                             content = result.get('response', 'Entrega completada')
                             
                             # 🆕 CREAR RESUMEN EJECUTIVO COMO ARCHIVO
@@ -824,7 +929,7 @@ Formato: Documento profesional completo y estructurado.
                                 # Crear resumen ejecutivo como archivo tangible
                                 import re
                                 safe_message = re.sub(r'[^a-zA-Z0-9\-_]', '_', message[:30])
-                                filename = f"Resumen_Ejecutivo_{safe_message}_{int(time.time())}.md"
+                                filename = f"Resumen_Ejecutivo_{safe_message}_{file_token}.md"
                                 file_path = f"/app/backend/static/generated_files/{filename}"
                                 
                                 # Crear directorio si no existe
@@ -842,7 +947,7 @@ Formato: Documento profesional completo y estructurado.
                                 
                                 # Agregar lista de archivos creados
                                 files_created = []
-                                for result_item in final_results:
+                                for result_item in prior_results:
                                     if isinstance(result_item, dict) and result_item.get('file_created'):
                                         files_created.append(f"- {result_item['file_name']} ({result_item['file_size']} bytes)")
                                         executive_summary += f"- {result_item['file_name']} ({result_item['file_size']} bytes)\n"
@@ -853,7 +958,7 @@ Formato: Documento profesional completo y estructurado.
                                 executive_summary += f"""
 ## ESTADÍSTICAS
 - Pasos ejecutados: {len(steps)}
-- Resultados generados: {len(final_results)}
+- Resultados generados: {len(prior_results)}
 - Archivos creados: {len(files_created)}
 - Estado: ✅ Completado exitosamente
 """
@@ -906,11 +1011,7 @@ Formato: Documento profesional completo y estructurado.
                                     'file_error': str(file_error)
                                 }
                             
-                            step['result'] = step_result
-                            final_results.append(step_result)
                             logger.info(f"✅ Final delivery with tangible results completed")
-                        else:
-                            time.sleep(2)
                     
                     else:
                         # Paso genérico - ejecutar con Ollama
@@ -921,12 +1022,13 @@ Formato: Documento profesional completo y estructurado.
 Ejecuta el paso '{step['title']}' para la tarea: {message}
 
 Descripción: {step['description']}
-Contexto previo: {final_results if final_results else 'Inicio de tarea'}
+Contexto previo: {prior_results if prior_results else 'Inicio de tarea'}
 
 Proporciona un resultado específico y útil para este paso.
 """
                             
-                            result = ollama_service.generate_response(generic_prompt, {})
+                            result = journaled('ollama', {'prompt': generic_prompt},
+                                              lambda: ollama_service.generate_response(generic_prompt, {}))
                             
                             step_result = {
                                 'type': 'generic',
@@ -934,80 +1036,158 @@ Proporciona un resultado específico y útil para este paso.
                                 'summary': f"Paso '{step['title']}' completado exitosamente"
                             }
                             
-                            step['result'] = step_result
-                            final_results.append(step_result)
                             logger.info(f"✅ Generic step completed: {step['title']}")
-                        else:
-                            time.sleep(2)
                     
-                    # Marcar paso como completado
+                    # Marcar paso como completado; la interfaz se actualiza en cuanto
+                    # termina cada paso, sin pausas artificiales entre ellos
                     step_execution_time = time.time() - step_start_time
-                    step['completed'] = True
-                    step['active'] = False
-                    step['status'] = 'completed'
-                    
-                    # Enviar actualización de paso completado en tiempo real
-                    send_websocket_update('step_update', {
-                        'type': 'step_update',
-                        'step_id': step['id'],
-                        'status': 'completed',
-                        'title': step['title'],
-                        'description': step['description'],
-                        'result_summary': step_result.get('summary', 'Paso completado') if step_result else 'Paso completado',
-                        'execution_time': step_execution_time,
-                        'progress': ((i + 1) / len(steps)) * 100
-                    })
-                    
-                    # Enviar log de completado
-                    send_websocket_update('log_message', {
-                        'type': 'log_message',
-                        'level': 'info',
-                        'message': f'✅ Paso {i+1}/{len(steps)} completado: {step["title"]} ({step_execution_time:.1f}s)',
-                        'timestamp': datetime.now().isoformat()
-                    })
+                    with progress_lock:
+                        step['completed'] = True
+                        step['active'] = False
+                        step['status'] = 'completed'
+                        if step_result:
+                            step['result'] = step_result
+                            step_results[step['id']] = step_result
+                        finished_steps.append(step['id'])
+                        
+                        # Enviar actualización de paso completado en tiempo real
+                        send_websocket_update('step_update', {
+                            'type': 'step_update',
+                            'step_id': step['id'],
+                            'status': 'completed',
+                            'title': step['title'],
+                            'description': step['description'],
+                            'result_summary': step_result.get('summary', 'Paso completado') if step_result else 'Paso completado',
+                            'execution_time': step_execution_time,
+                            'progress': (len(finished_steps) / len(steps)) * 100
+                        })
+                        
+                        # Enviar log de completado
+                        send_websocket_update('log_message', {
+                            'type': 'log_message',
+                            'level': 'info',
+                            'message': f'✅ Paso {i+1}/{len(steps)} completado: {step["title"]} ({step_execution_time:.1f}s)',
+                            'timestamp': datetime.now().isoformat()
+                        })
                     
+                    journal.step_completed(task_id, step['id'], step_result)
                     logger.info(f"✅ Step {i+1} completed successfully: {step['title']} in {step_execution_time:.1f}s")
                     
-                    # Pausa entre pasos para dar tiempo a mostrar progreso
-                    time.sleep(2)
-                    
                 except Exception as step_error:
                     step_execution_time = time.time() - step_start_time
                     logger.error(f"❌ Error in step {i+1}: {str(step_error)}")
-                    step['completed'] = False
-                    step['active'] = False
-                    step['status'] = 'failed'
-                    step['error'] = str(step_error)
-                    
-                    # Enviar actualización de paso fallido en tiempo real
-                    send_websocket_update('step_update', {
-                        'type': 'step_update',
-                        'step_id': step['id'],
-                        'status': 'failed',
-                        'title': step['title'],
-                        'description': step['description'],
-                        'error': str(step_error),
-                        'execution_time': step_execution_time
-                    })
-                    
-                    # Enviar log de error
-                    send_websocket_update('log_message', {
-                        'type': 'log_message',
-                        'level': 'error',
-                        'message': f'❌ Error en paso {i+1}/{len(steps)}: {step["title"]} - {str(step_error)}',
-                        'timestamp': datetime.now().isoformat()
-                    })
+                    journal.step_failed(task_id, step['id'], str(step_error))
+                    with progress_lock:
+                        step['completed'] = False
+                        step['active'] = False
+                        step['status'] = 'failed'
+                        step['error'] = str(step_error)
+                        if step_result:
+                            step['result'] = step_result
+                            step_results[step['id']] = step_result
+                        finished_steps.append(step['id'])
+                        
+                        # Enviar actualización de paso fallido en tiempo real
+                        send_websocket_update('step_update', {
+                            'type': 'step_update',
+                            'step_id': step['id'],
+                            'status': 'failed',
+                            'title': step['title'],
+                            'description': step['description'],
+                            'error': str(step_error),
+                            'execution_time': step_execution_time,
+                            'progress': (len(finished_steps) / len(steps)) * 100
+                        })
+                        
+                        # Enviar log de error
+                        send_websocket_update('log_message', {
+                            'type': 'log_message',
+                            'level': 'error',
+                            'message': f'❌ Error en paso {i+1}/{len(steps)}: {step["title"]} - {str(step_error)}',
+                            'timestamp': datetime.now().isoformat()
+                        })
                 
-                # Actualizar plan en memoria y persistencia
-                task_manager = get_task_manager()
-                task_manager.update_task_step_status(
-                    task_id,
-                    step['id'],
-                    'completed' if step['status'] == 'completed' else 'failed',
-                    step_result.get('summary') if step_result else None,
-                    step.get('error') if step['status'] == 'failed' else None
+                # Actualizar plan en memoria y persistencia (solo el delta del paso)
+                with progress_lock:
+                    task_manager = get_task_manager()
+                    task_manager.update_task_step_status(
+                        task_id,
+                        step['id'],
+                        'completed' if step['status'] == 'completed' else 'failed',
+                        step_result.get('summary') if step_result else None,
+                        step.get('error') if step['status'] == 'failed' else None,
+                        extra_fields={'active': False, 'result': step.get('result')}
+                    )
+                    active_task_plans.update_entry(task_id, {'plan': steps}, dirty=False)
+            
+            # Ejecutar los pasos como un DAG: cada paso arranca en cuanto terminan sus
+            # dependencias, con límites de concurrencia por tipo de herramienta
+            # (las búsquedas comparten un límite y los pasos de Ollama otro)
+            # Los pasos reanudados desde el diario no se vuelven a ejecutar
+            for step in steps:
+                if step['id'] not in reused_outputs:
+                    continue
+                reused_result = reused_outputs[step['id']]
+                with progress_lock:
+                    step['completed'] = True
+                    step['active'] = False
+                    step['status'] = 'completed'
+                    step.pop('error', None)
+                    if reused_result:
+                        step['result'] = reused_result
+                        step_results[step['id']] = reused_result
+                    finished_steps.append(step['id'])
+                    get_task_manager().update_task_step_status(
+                        task_id, step['id'], 'completed',
+                        reused_result.get('summary') if isinstance(reused_result, dict) else None, None,
+                        extra_fields={'active': False, 'result': step.get('result')}
+                    )
+            if reused_outputs:
+                active_task_plans.update_entry(task_id, {'plan': steps}, dirty=False)
+                send_websocket_update('log_message', {
+                    'type': 'log_message',
+                    'level': 'info',
+                    'message': f'♻️ Reanudando tarea: {len(reused_outputs)}/{len(steps)} pasos ya completados',
+                    'timestamp': datetime.now().isoformat()
+                })
+            
+            run_step_in_thread = inherit_thread_tags(run_step)
+            nodes = [
+                DAGNode(
+                    node_id=step['id'],
+                    dependencies=[dependency for dependency in dependencies[step['id']]
+                                  if dependency not in reused_outputs],
+                    payload=(i, step),
+                    group='web_search' if classify_plan_step(step) == 'web_search' else 'ollama'
                 )
-                update_task_data(task_id, {'plan': steps})
+                for i, step in enumerate(steps)
+                if step['id'] not in reused_outputs
+            ]
+            scheduler = DAGScheduler(max_in_flight=PLAN_MAX_PARALLEL_STEPS, group_limits=PLAN_STEP_GROUP_LIMITS)
+            
+            async def execute_node(node: DAGNode):
+                # asyncio.to_thread copia el contexto: el span activo se hereda
+                return await asyncio.to_thread(run_step_in_thread, *node.payload)
+            
+            dag_run = asyncio.run(scheduler.run(nodes, execute_node))
+            logger.info(f"🧮 Plan steps for task {task_id} finished in {dag_run.execution_time:.1f}s "
+                        f"(max concurrency {dag_run.max_concurrency}, critical path {dag_run.critical_path})")
+            
+            # Pasos que no llegaron a ejecutarse (p. ej. un error antes de empezar un paso del que dependían)
+            for step in steps:
+                if step['id'] in dag_run.cancelled or (step['id'] in dag_run.failed and step.get('status') != 'failed'):
+                    reason = dag_run.cancelled.get(step['id']) or dag_run.failed[step['id']]
+                    with progress_lock:
+                        step['completed'] = False
+                        step['active'] = False
+                        step['status'] = 'failed'
+                        step['error'] = reason
+                        get_task_manager().update_task_step_status(
+                            task_id, step['id'], 'failed', None, reason, extra_fields={'active': False}
+                        )
+                        active_task_plans.update_entry(task_id, {'plan': steps}, dirty=False)
+            
+            final_results = [step_results[step['id']] for step in steps if step['id'] in step_results]
             
             # GENERAR RESULTADO FINAL CONSOLIDADO
             if final_results:
@@ -1043,26 +1223,27 @@ Genera un RESULTADO FINAL CONSOLIDADO que incluya:
 Formato: Profesional, estructurado y completo.
 """
                         
-                        final_result = ollama_service.generate_response(final_prompt, {})
+                        final_result = journal.run_once(task_id, 'final', 'ollama', {'prompt': final_prompt},
+                                                        lambda: ollama_service.generate_response(final_prompt, {}))
                         
                         # Guardar resultado final
-                        active_task_plans[task_id]['final_result'] = {
+                        active_task_plans.update_entry(task_id, {'final_result': {
                             'content': final_result.get('response', 'Tarea completada exitosamente'),
                             'completed_at': datetime.now().isoformat(),
                             'total_steps': len(steps),
                             'all_results': final_results
-                        }
+                        }}, dirty=False)
                         
                         logger.info(f"✅ Final consolidated result generated for task {task_id}")
                         
                 except Exception as e:
                     logger.error(f"Error generating final result: {str(e)}")
-                    active_task_plans[task_id]['final_result'] = {
+                    active_task_plans.update_entry(task_id, {'final_result': {
                         'content': 'Tarea completada con algunos errores en la consolidación final',
                         'completed_at': datetime.now().isoformat(),
                         'total_steps': len(steps),
                         'error': str(e)
-                    }
+                    }}, dirty=False)
             
             # Determinar estado final de la tarea para respuesta dinámica
             completed_steps = sum(1 for step in steps if step.get('completed', False))
@@ -1098,12 +1279,14 @@ Formato: Profesional, estructurado y completo.
                 'total_steps': total_steps
             }
             
-            # Actualizar con TaskManager (persistencia)
+            # Actualizar con TaskManager (persistencia y memoria legacy)
             update_task_data(task_id, task_completion_updates)
             
-            # También actualizar memoria legacy por compatibilidad
-            if task_id in active_task_plans:
-                active_task_plans[task_id].update(task_completion_updates)
+            # Calidad del plan en la caché semántica (mismo criterio que el orquestador)
+            get_plan_cache().record_outcome(failed_steps == 0 and completed_steps > 0, task_id=task_id)
+            
+            # La tarea ya no se reanudará en el próximo arranque
+            journal.finish_task(task_id, final_task_status)
             
             # Enviar notificación de finalización del plan con estado real
             send_websocket_update('task_completed', {
@@ -1115,7 +1298,7 @@ Formato: Profesional, estructurado y completo.
                 'total_steps': total_steps,
                 'completed_steps': completed_steps,
                 'failed_steps': failed_steps,
-                'execution_time': (datetime.now() - active_task_plans[task_id]['start_time']).total_seconds(),
+                'execution_time': (datetime.now() - active_task_plans.get(task_id, task_data)['start_time']).total_seconds(),
                 'message': f'🎉 Tarea completada: {completed_steps}/{total_steps} pasos exitosos',
                 'timestamp': datetime.now().isoformat()
             })
@@ -1130,12 +1313,41 @@ Formato: Profesional, estructurado y completo.
             
             logger.info(f"🎉 Task {task_id} completed successfully with REAL execution and final delivery!")
         
-        # Ejecutar en hilo separado
-        thread = threading.Thread(target=execute_steps)
-        thread.daemon = True
-        thread.start()
+        def execute_steps_claimed():
+            """Ejecutar el plan salvo que otro hilo o proceso ya tenga la tarea reclamada"""
+            journal = get_execution_journal()
+            if not journal.claim(task_id):
+                logger.warning(f"⚠️ Task {task_id} is already being executed elsewhere, not starting it again")
+                return
+            try:
+                execute_steps()
+            finally:
+                journal.release(task_id)
+        
+        # Encolar en el pool de workers, propagando el contexto de tracing y
+        # las etiquetas del profiler de muestreo
+        executor = get_task_executor()
+        executor.submit(
+            task_id,
+            tracer.wrap_context(with_thread_tags(execute_steps_claimed, task_id=task_id)),
+            user_id=user_id,
+            priority=priority,
+            kind='plan_execution',
+            payload={'task_id': task_id, 'message': message}
+        )
+        queue_info = executor.position(task_id)
+        
+        logger.info(f"🚀 Queued REAL plan execution for task {task_id} "
+                    f"(position {queue_info.get('position') if queue_info else '-'})")
+        return queue_info
         
-        logger.info(f"🚀 Started REAL plan execution for task {task_id}")
+    except TaskExecutorOverloaded as overload:
+        logger.warning(f"🚫 Plan execution for task {task_id} rejected: {overload.reason}")
+        update_task_data(task_id, {
+            'status': 'rejected',
+            'error': f'Servidor ocupado ({overload.reason}), reintentar en {overload.retry_after:.0f}s'
+        })
+        raise
         
     except Exception as e:
         logger.error(f"Error in real plan execution: {str(e)}")
@@ -1167,10 +1379,93 @@ Formato: Profesional, estructurado y completo.
             pass
         
         # Marcar como fallido con respuesta dinámica
-        if task_id in active_task_plans:
-            active_task_plans[task_id]['status'] = 'failed'
-            active_task_plans[task_id]['error'] = str(e)
-            active_task_plans[task_id]['final_result'] = error_response
+        active_task_plans.update_entry(task_id, {
+            'status': 'failed',
+            'error': str(e),
+            'final_result': error_response
+        })
+
+# Reanudaciones por tarea antes de darla por perdida (evita reintentar sin fin
+# una tarea que tumba el proceso en cada arranque)
+EXECUTION_JOURNAL_MAX_RESUMES = int(os.getenv('EXECUTION_JOURNAL_MAX_RESUMES', '3'))
+
+def resume_interrupted_executions() -> list:
+    """
+    Reanudar los planes que quedaron a medias por un reinicio del proceso
+    
+    Se llama al arrancar, dentro del contexto de la app: recupera las tareas
+    incompletas en TaskManager y relanza execute_plan_with_real_tools para
+    cada diario de ejecución sin terminar (los pasos ya completados se
+    reutilizan y se continúa por el primero pendiente) y para cada plan que
+    seguía en la cola del ejecutor. Las tareas reclamadas por otro proceso
+    se dejan a ese proceso.
+    
+    Returns:
+        Lista de task_ids reanudados
+    """
+    journal = get_execution_journal()
+    # Borrar las salidas de diarios ya terminados (se conservan las de los incompletos)
+    try:
+        journal.collect_garbage()
+    except Exception as e:
+        logger.warning(f"⚠️ Execution journal garbage collection failed: {e}")
+    interrupted = {state.task_id: state for state in journal.incomplete_tasks()}
+    # Planes que esperaban en la cola del ejecutor y no llegaron a empezar (sin diario)
+    queued = {
+        record['payload']['task_id']: record
+        for record in get_task_executor().pending_from_previous_run('plan_execution')
+        if (record.get('payload') or {}).get('task_id')
+    }
+    if not interrupted and not queued:
+        return []
+    
+    get_task_manager().recover_incomplete_tasks_on_startup()
+    resumed_task_ids = []
+    for task_id in list(interrupted) + [task_id for task_id in queued if task_id not in interrupted]:
+        state = interrupted.get(task_id)
+        queue_record = queued.get(task_id, {})
+        try:
+            if journal.is_claimed(task_id):
+                continue
+            if state and state.resumes >= EXECUTION_JOURNAL_MAX_RESUMES:
+                logger.error(f"❌ Task {task_id} was interrupted {state.resumes} times, giving up on resuming it")
+                journal.finish_task(task_id, 'abandoned')
+                update_task_data(task_id, {'status': 'failed', 'error': 'Ejecución interrumpida repetidamente'})
+                continue
+            
+            task_data = get_task_data(task_id)
+            if not task_data or not task_data.get('plan'):
+                if state is None:
+                    logger.warning(f"⚠️ Queued task {task_id} has no persisted plan, dropping it")
+                    continue
+                # La tarea no llegó a persistirse: se reconstruye desde el diario
+                task_data = {
+                    'plan': [dict(step) for step in state.plan],
+                    'current_step': 0,
+                    'status': 'executing',
+                    'created_at': datetime.now().isoformat(),
+                    'start_time': datetime.now(),
+                    'message': state.message
+                }
+                save_task_data(task_id, task_data)
+            elif 'start_time' not in task_data:
+                update_task_data(task_id, {'start_time': datetime.now()})
+            
+            if state:
+                logger.info(f"♻️ Resuming interrupted task {task_id} "
+                            f"({len(state.completed_steps)}/{len(state.plan)} steps already completed)")
+            else:
+                logger.info(f"♻️ Re-queuing task {task_id}, it was waiting in the executor queue")
+            message = ((state.message if state else '') or queue_record.get('payload', {}).get('message')
+                       or task_data.get('message', ''))
+            execute_plan_with_real_tools(task_id, task_data['plan'], message,
+                                         user_id=queue_record.get('user_id'),
+                                         priority=queue_record.get('priority', 1))
+            resumed_task_ids.append(task_id)
+        except Exception as e:
+            logger.error(f"❌ Error resuming task {task_id}: {str(e)}")
+    
+    return resumed_task_ids
 
 def extract_search_query_from_message(message: str, step_title: str) -> str:
     """
@@ -1286,41 +1581,66 @@ def _fallback_query_extraction(message: str, step_title: str) -> str:
     except Exception:
         return message[:50]  # Fallback seguro
 
-def generate_dynamic_plan_with_ai(message: str, task_id: str) -> dict:
+class PlanGenerationCancelled(Exception):
+    """La generación especulativa del plan se canceló (el mensaje resultó casual)"""
+    pass
+
+# Llamadas al LLM por plan: la primera generación más, como mucho, un reintento dirigido
+PLAN_MAX_LLM_CALLS = int(os.getenv('PLAN_MAX_LLM_CALLS', '2'))
+
+_plan_generation_stats = {
+    'plans_generated': 0,
+    'plans_from_cache': 0,
+    'plans_failed': 0,
+    'plans_cancelled': 0,
+    'llm_calls': 0,
+    'local_repairs': 0,
+    'schema_fixes': 0
+}
+_plan_generation_stats_lock = threading.Lock()
+
+def record_plan_generation_stat(name: str, llm_calls: int = 0):
+    with _plan_generation_stats_lock:
+        _plan_generation_stats[name] += 1
+        _plan_generation_stats['llm_calls'] += llm_calls
+
+def get_plan_generation_statistics() -> dict:
+    """Contadores de generación de planes, incluida la media de llamadas al LLM por plan"""
+    with _plan_generation_stats_lock:
+        stats = dict(_plan_generation_stats)
+    plans = stats['plans_generated'] + stats['plans_from_cache'] + stats['plans_failed'] + stats['plans_cancelled']
+    stats['avg_llm_calls_per_plan'] = stats['llm_calls'] / plans if plans else 0.0
+    stats['max_llm_calls'] = PLAN_MAX_LLM_CALLS
+    stats['plan_cache'] = get_plan_cache().get_statistics()
+    return stats
+
+@traced('plan.generate_dynamic_plan_with_ai', lambda args: {'task_id': args['task_id']})
+def generate_dynamic_plan_with_ai(message: str, task_id: str, cancel_event: threading.Event = None) -> dict:
     """
     Genera un plan dinámico usando Ollama con robustecimiento y validación de esquemas
     Mejora implementada según UPGRADE.md Sección 2: Generación de Plan y Robustez
+    
+    Con cancel_event, la generación se detiene antes de cada intento y antes
+    de persistir el plan (PlanGenerationCancelled) si el evento se activa.
     """
+    def raise_if_cancelled():
+        if cancel_event is not None and cancel_event.is_set():
+            logger.info(f"🛑 Speculative plan generation cancelled for task {task_id}")
+            raise PlanGenerationCancelled(task_id)
+    
     logger.info(f"🧠 Generating AI-powered dynamic plan for task {task_id} - Message: {message[:50]}...")
     
+    # Un plan que ya funcionó para una petición equivalente evita la generación
+    plan_cache = get_plan_cache()
+    cache_hit = plan_cache.lookup('agent', message, task_id=task_id)
+    
     ollama_service = get_ollama_service()
-    if not ollama_service or not ollama_service.is_healthy():
+    if not cache_hit and (not ollama_service or not ollama_service.is_healthy()):
         logger.warning(f"⚠️ Ollama not available for task {task_id}, using fallback plan")
         return generate_fallback_plan_with_notification(message, task_id, "Ollama no disponible")
     
-    def validate_plan_schema(plan_data: dict) -> bool:
-        """Validar que el plan cumple con el esquema esperado"""
-        try:
-            jsonschema.validate(plan_data, PLAN_SCHEMA)
-            logger.info(f"✅ Plan schema validation successful for task {task_id}")
-            return True
-        except jsonschema.ValidationError as e:
-            logger.warning(f"❌ Plan schema validation failed for task {task_id}: {e.message}")
-            return False
-    
-    def generate_plan_with_retries() -> dict:
-        """Generar plan con reintentos y retroalimentación específica a Ollama"""
-        max_attempts = 3
-        last_error = None
-        
-        for attempt in range(1, max_attempts + 1):
-            try:
-                logger.info(f"🔄 Plan generation attempt {attempt}/{max_attempts} for task {task_id}")
-                
-                # Construir prompt específico para generación de JSON estructurado
-                if attempt == 1:
-                    # Primera tentativa: prompt normal
-                    prompt = f"""
+    def build_plan_prompt() -> str:
+        return f"""
 GENERA UN PLAN DE ACCIÓN ESTRUCTURADO para esta tarea: "{message}"
 
 Responde ÚNICAMENTE con un objeto JSON válido siguiendo EXACTAMENTE este formato:
@@ -1332,7 +1652,8 @@ Responde ÚNICAMENTE con un objeto JSON válido siguiendo EXACTAMENTE este forma
       "description": "Descripción detallada del paso (10-300 caracteres)",
       "tool": "web_search|analysis|creation|planning|delivery|processing|synthesis|search_definition|data_analysis",
       "estimated_time": "Tiempo estimado como string",
-      "priority": "alta|media|baja"
+      "priority": "alta|media|baja",
+      "dependencies": [1]
     }}
   ],
   "task_type": "Tipo de tarea específico (mínimo 3 caracteres)",
@@ -1343,124 +1664,111 @@ Responde ÚNICAMENTE con un objeto JSON válido siguiendo EXACTAMENTE este forma
 IMPORTANTE:
 - Mínimo 1 paso, máximo 10 pasos
 - Usar solo las herramientas listadas en "tool"
+- "dependencies": números (desde 1) de los pasos ANTERIORES cuyos resultados necesita el paso; [] si es independiente (p. ej. varias búsquedas pueden ejecutarse en paralelo)
 - Títulos y descripciones específicas para la tarea, NO genéricas
 - NO agregues texto adicional, solo el JSON
 - Asegúrate de que sea JSON válido
 """
-                elif attempt == 2:
-                    # Segunda tentativa: prompt con corrección específica
-                    prompt = f"""
-El JSON anterior tuvo errores. CORRIGE y genera un plan válido para: "{message}"
-
-ERROR PREVIO: {last_error}
-
-Responde SOLO con JSON válido:
-{{
-  "steps": [
-    {{
-      "title": "string de 5-100 caracteres",
-      "description": "string de 10-300 caracteres", 
-      "tool": "web_search",
-      "estimated_time": "string",
-      "priority": "media"
-    }}
-  ],
-  "task_type": "string de mínimo 3 caracteres",
-  "complexity": "media",
-  "estimated_total_time": "string"
-}}
-
-SOLO JSON, sin explicaciones adicionales.
-"""
-                else:
-                    # Tercera tentativa: prompt simplificado
-                    prompt = f"""
-Genera SOLO este JSON válido para: "{message}"
-
-{{"steps":[{{"title":"Completar solicitud","description":"Procesar y completar la solicitud del usuario","tool":"processing","estimated_time":"2 minutos","priority":"media"}}],"task_type":"procesamiento_general","complexity":"media","estimated_total_time":"2 minutos"}}
-
-Pero personalízalo para la tarea específica. SOLO JSON.
+    
+    def build_correction_prompt(previous: str, errors: list) -> str:
+        """Reintento dirigido: el JSON anterior y solo los errores a corregir"""
+        error_lines = '\n'.join(f"- {error}" for error in errors)
+        return f"""
+El plan JSON para la tarea "{message}" tiene estos errores de validación:
+{error_lines}
+
+JSON anterior:
+{previous[:3000]}
+
+Devuelve el MISMO plan con SOLO esos errores corregidos (títulos de 5-100
+caracteres, descripciones de 10-300, herramientas y prioridades de la lista
+permitida, entre 1 y 10 pasos). SOLO JSON, sin explicaciones.
 """
-                
-                # Llamar a Ollama con parámetros optimizados para JSON
-                response = ollama_service.generate_response(prompt, {
-                    'temperature': 0.2,  # Baja para mayor consistencia
-                    'max_tokens': 1000,
-                    'response_format': 'json'
-                })
-                
-                if response.get('error'):
-                    last_error = response['error']
-                    logger.warning(f"⚠️ Ollama error attempt {attempt}: {response['error']}")
-                    continue
-                
-                # Parsear respuesta JSON con múltiples estrategias
-                response_text = response.get('response', '').strip()
-                logger.info(f"📥 Ollama response attempt {attempt} for task {task_id}: {response_text[:200]}...")
-                
-                plan_data = None
-                
-                # Estrategia 1: JSON limpio directo
+    
+    def parse_and_validate(response_text: str, attempt: int):
+        """
+        Parseo tolerante + correcciones locales guiadas por PLAN_SCHEMA
+        
+        Returns:
+            (plan válido o None, lista de errores estructurados)
+        """
+        plan_data, repairs = parse_json_tolerant(response_text, root='{')
+        if repairs:
+            record_plan_generation_stat('local_repairs')
+            logger.info(f"🩹 Repaired plan JSON locally for task {task_id} on attempt {attempt}: {repairs}")
+        if not isinstance(plan_data, dict):
+            return None, [f"$: no se encontró un objeto JSON. Respuesta: {response_text[:100]}..."]
+        
+        plan_data, fixes = coerce_to_schema(plan_data, PLAN_SCHEMA)
+        if fixes:
+            record_plan_generation_stat('schema_fixes')
+            logger.info(f"🩹 Applied {len(fixes)} schema fixes for task {task_id}: {fixes[:5]}")
+        
+        errors = describe_schema_errors(plan_data, PLAN_SCHEMA)
+        if errors:
+            logger.warning(f"❌ Plan schema validation failed for task {task_id} on attempt {attempt}: {errors[:3]}")
+            return None, errors
+        logger.info(f"✅ Plan schema validation successful for task {task_id}")
+        return plan_data, []
+    
+    def generate_plan_with_retries() -> dict:
+        """
+        Generar plan con salida JSON restringida; los fallos de parseo o de
+        esquema se reparan localmente y solo lo irreparable provoca un único
+        reintento dirigido con los errores concretos (PLAN_MAX_LLM_CALLS)
+        """
+        max_attempts = PLAN_MAX_LLM_CALLS
+        prompt = build_plan_prompt()
+        last_error = None
+        llm_calls = 0
+        
+        try:
+            for attempt in range(1, max_attempts + 1):
+                raise_if_cancelled()
                 try:
-                    cleaned_response = response_text.replace('```json', '').replace('```', '').strip()
-                    if cleaned_response.startswith('{') and cleaned_response.endswith('}'):
-                        plan_data = json.loads(cleaned_response)
-                except json.JSONDecodeError as e:
-                    logger.debug(f"📝 JSON parsing strategy 1 failed: {str(e)}")
-                
-                # Estrategia 2: Buscar JSON en el texto
-                if not plan_data:
-                    try:
-                        json_match = re.search(r'\{[^}]*"steps"[^}]*\[.*?\][^}]*\}', response_text, re.DOTALL)
-                        if json_match:
-                            plan_data = json.loads(json_match.group())
-                    except json.JSONDecodeError as e:
-                        logger.debug(f"📝 JSON parsing strategy 2 failed: {str(e)}")
-                
-                # Estrategia 3: JSON con corrección de formato común
-                if not plan_data:
-                    try:
-                        # Corregir comillas simples por dobles
-                        corrected_text = response_text.replace("'", '"')
-                        # Remover caracteres no JSON
-                        corrected_text = re.sub(r'^[^{]*', '', corrected_text)
-                        corrected_text = re.sub(r'[^}]*$', '', corrected_text)
-                        plan_data = json.loads(corrected_text)
-                    except (json.JSONDecodeError, Exception) as e:
-                        logger.debug(f"📝 JSON parsing strategy 3 failed: {str(e)}")
-                
-                if not plan_data:
-                    last_error = f"No se pudo parsear JSON válido. Respuesta: {response_text[:100]}..."
-                    logger.warning(f"❌ Failed to parse JSON on attempt {attempt}: {last_error}")
-                    continue
-                
-                # Validar esquema
-                if not validate_plan_schema(plan_data):
-                    last_error = "El JSON no cumple con el esquema requerido"
-                    logger.warning(f"❌ Schema validation failed on attempt {attempt}")
-                    continue
-                
-                # Validar que el plan tenga la estructura esperada
-                if not isinstance(plan_data.get('steps'), list) or len(plan_data.get('steps', [])) == 0:
-                    last_error = "El plan no contiene pasos válidos"
-                    logger.warning(f"❌ Invalid plan structure on attempt {attempt}")
+                    logger.info(f"🔄 Plan generation attempt {attempt}/{max_attempts} for task {task_id}")
+                    llm_calls += 1
+                    response = ollama_service.generate_structured(prompt, PLAN_SCHEMA, {'num_predict': 1000})
+                    
+                    if response.get('error'):
+                        last_error = response['error']
+                        logger.warning(f"⚠️ Ollama error attempt {attempt}: {response['error']}")
+                        continue
+                    
+                    response_text = response.get('response', '').strip()
+                    logger.info(f"📥 Ollama response attempt {attempt} for task {task_id} "
+                                f"(format={response.get('format')}): {response_text[:200]}...")
+                    
+                    plan_data, errors = parse_and_validate(response_text, attempt)
+                    if plan_data is not None:
+                        logger.info(f"✅ Successfully generated and validated plan for task {task_id} on attempt {attempt}")
+                        record_plan_generation_stat('plans_generated', llm_calls=llm_calls)
+                        return plan_data
+                    
+                    last_error = '; '.join(errors)
+                    prompt = build_correction_prompt(response_text, errors)
+                    
+                except Exception as e:
+                    last_error = f"Error inesperado: {str(e)}"
+                    logger.error(f"❌ Unexpected error on attempt {attempt} for task {task_id}: {str(e)}")
                     continue
-                
-                logger.info(f"✅ Successfully generated and validated plan for task {task_id} on attempt {attempt}")
-                return plan_data
-                
-            except Exception as e:
-                last_error = f"Error inesperado: {str(e)}"
-                logger.error(f"❌ Unexpected error on attempt {attempt} for task {task_id}: {str(e)}")
-                continue
+        except PlanGenerationCancelled:
+            record_plan_generation_stat('plans_cancelled', llm_calls=llm_calls)
+            raise
         
         # Si llegamos aquí, todos los reintentos fallaron
+        record_plan_generation_stat('plans_failed', llm_calls=llm_calls)
         logger.error(f"❌ All {max_attempts} plan generation attempts failed for task {task_id}")
         raise Exception(f"Failed to generate valid plan after {max_attempts} attempts. Last error: {last_error}")
     
     try:
-        # Intentar generar plan con reintentos
-        plan_data = generate_plan_with_retries()
+        if cache_hit:
+            plan_data = cache_hit.plan
+            logger.info(f"♻️ Reusing cached plan {cache_hit.entry_id} for task {task_id} "
+                        f"(similarity {cache_hit.similarity:.2f}, from: {cache_hit.source_request[:50]})")
+        else:
+            # Intentar generar plan con reintentos
+            plan_data = generate_plan_with_retries()
         
         # Convertir a formato frontend
         plan_steps = []
@@ -1478,12 +1786,26 @@ Pero personalízalo para la tarea específica. SOLO JSON.
                 'estimated_time': step.get('estimated_time', '1 minuto'),
                 'completed': False,
                 'active': i == 0,  # Solo el primer paso activo
-                'priority': step.get('priority', 'media')
+                'priority': step.get('priority', 'media'),
+                # Números de paso (1-based) declarados por el modelo -> ids de pasos anteriores
+                'dependencies': [f"step_{number}" for number in step['dependencies']
+                                 if isinstance(number, int) and 1 <= number <= i]
+                                if isinstance(step.get('dependencies'), list) else None
             })
         
+        raise_if_cancelled()
+        
         if len(plan_steps) == 0:
             logger.error(f"❌ No valid steps created for task {task_id}")
             return generate_fallback_plan_with_notification(message, task_id, "No se pudieron crear pasos válidos")
+        
+        # El resultado de la ejecución se atribuye al plan guardado (record_outcome)
+        if cache_hit:
+            record_plan_generation_stat('plans_from_cache')
+            plan_cache_entry = cache_hit.entry_id
+        else:
+            plan_cache_entry = plan_cache.store('agent', message, plan_data, task_id=task_id)
+        plan_source = 'semantic_cache' if cache_hit else 'ai_generated'
             
         # Guardar plan con TaskManager (persistencia MongoDB)
         task_data = {
@@ -1496,7 +1818,8 @@ Pero personalízalo para la tarea específica. SOLO JSON.
             'task_type': plan_data.get('task_type', 'general'),
             'complexity': plan_data.get('complexity', 'media'),
             'ai_generated': True,
-            'plan_source': 'ai_generated'  # Indicar fuente del plan
+            'plan_source': plan_source,  # Indicar fuente del plan
+            'metadata': {'plan_cache_entry': plan_cache_entry}
         }
         
         # Guardar en persistencia y memoria legacy
@@ -1505,18 +1828,29 @@ Pero personalízalo para la tarea específica. SOLO JSON.
         logger.info(f"🎉 Generated AI-powered plan for task {task_id} with {len(plan_steps)} specific steps")
         logger.info(f"📋 Plan steps for task {task_id}: {[step['title'] for step in plan_steps]}")
         
-        return {
+        plan_response = {
             'steps': plan_steps,
             'total_steps': len(plan_steps),
             'estimated_total_time': plan_data.get('estimated_total_time', '2-5 minutos'),
             'task_type': plan_data.get('task_type', 'ai_generated_dynamic'),
             'complexity': plan_data.get('complexity', 'media'),
             'ai_generated': True,
-            'plan_source': 'ai_generated',  # ✅ MEJORA: Indicar fuente del plan
+            'plan_source': plan_source,  # ✅ MEJORA: Indicar fuente del plan
             'schema_validated': True  # ✅ MEJORA: Indicar que pasó validación
         }
+        if cache_hit:
+            plan_response['plan_cache'] = {
+                'entry_id': cache_hit.entry_id,
+                'similarity': round(cache_hit.similarity, 3),
+                'source_request': cache_hit.source_request,
+                'quality': round(cache_hit.quality, 3)
+            }
+        return plan_response
             
+    except PlanGenerationCancelled:
+        raise
     except Exception as e:
+        raise_if_cancelled()
         logger.error(f"❌ All retries failed for AI plan generation task {task_id}: {str(e)}")
         return generate_fallback_plan_with_notification(message, task_id, f"Error en generación IA: {str(e)}")
 
@@ -1535,10 +1869,11 @@ def generate_fallback_plan_with_notification(message: str, task_id: str, error_r
     fallback_plan['warning'] = 'Plan generado por contingencia - precisión limitada'
     
     # Marcar en memoria global que es fallback
-    if task_id in active_task_plans:
-        active_task_plans[task_id]['plan_source'] = 'fallback'
-        active_task_plans[task_id]['fallback_reason'] = error_reason
-        active_task_plans[task_id]['warning'] = 'Plan generado por contingencia'
+    active_task_plans.update_entry(task_id, {
+        'plan_source': 'fallback',
+        'fallback_reason': error_reason,
+        'warning': 'Plan generado por contingencia'
+    })
     
     return fallback_plan
 
@@ -1970,7 +2305,147 @@ Puedes ver el progreso del plan de acción en el panel lateral derecho. El plan
         
         return fallback_response
 
+# Pipeline del chat: clasificación, plan y respuesta en paralelo
+CHAT_PLAN_TIMEOUT = float(os.getenv('CHAT_PLAN_TIMEOUT', '300'))
+CHAT_RESPONSE_TIMEOUT = float(os.getenv('CHAT_RESPONSE_TIMEOUT', '300'))
+_chat_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv('CHAT_PLAN_WORKERS', '8')),
+    thread_name_prefix='chat-pipeline'
+)
+
+def submit_chat_work(task_id: str, func, *args, **kwargs):
+    """
+    Ejecutar func en el pool del chat con el contexto de la aplicación,
+    el span activo y las etiquetas del profiler
+    """
+    app = current_app._get_current_object()
+    
+    def run():
+        with app.app_context():
+            return func(*args, **kwargs)
+    
+    return _chat_executor.submit(get_tracer().wrap_context(with_thread_tags(run, task_id=task_id)))
+
+def start_plan_generation(message: str, task_id: str, cancel_event: threading.Event = None):
+    """Lanzar generate_dynamic_plan_with_ai en segundo plano"""
+    return submit_chat_work(task_id, generate_dynamic_plan_with_ai, message, task_id, cancel_event)
+
+class SpeculativeBranch:
+    """Trabajo lanzado antes de conocer la clasificación; se cancela si no se usa"""
+    
+    def __init__(self, plan_future=None, response_future=None, cancel_event: threading.Event = None):
+        self.plan_future = plan_future
+        self.response_future = response_future
+        self.cancel_event = cancel_event or threading.Event()
+    
+    def cancel(self):
+        # Las llamadas al LLM en curso no se interrumpen: su resultado se descarta
+        # y el plan se detiene antes del siguiente intento o de persistirse
+        self.cancel_event.set()
+        for future in (self.plan_future, self.response_future):
+            if future is not None:
+                future.cancel()
+
+def classify_with_speculation(message: str, task_id: str, context: dict = None,
+                              speculate_response: bool = False):
+    """
+    Clasificar el mensaje mientras el plan se genera de forma especulativa
+    
+    La respuesta con herramientas (speculate_response) solo se lanza cuando el
+    mensaje resulta no casual: una llamada al LLM en curso no se puede
+    cancelar y competiría con la respuesta casual.
+    
+    Returns:
+        (is_casual, SpeculativeBranch o None); si el mensaje es casual la rama
+        especulativa ya está cancelada
+    """
+    decision = pre_classify_message(message)
+    if decision is True:
+        logger.info("⚡ Casual message detected locally, no speculative work")
+        return True, None
+    
+    branch = SpeculativeBranch()
+    branch.plan_future = start_plan_generation(message, task_id, branch.cancel_event)
+    
+    is_casual = decision if decision is not None else is_casual_conversation(message)
+    if is_casual:
+        logger.info(f"🗑️ Message classified as casual, cancelling speculative plan for task {task_id}")
+        branch.cancel()
+        return True, None
+    
+    if speculate_response:
+        ollama_service = get_ollama_service()
+        branch.response_future = submit_chat_work(
+            task_id, ollama_service.generate_response, message, context, True
+        )
+    
+    return False, branch
+
+def wait_for_plan(plan_future, message: str, task_id: str, timeout: float = None) -> dict:
+    """Esperar el plan generado en paralelo; plan de fallback si falla o tarda demasiado"""
+    try:
+        return plan_future.result(timeout=CHAT_PLAN_TIMEOUT if timeout is None else timeout)
+    except FutureTimeoutError:
+        logger.warning(f"⏱️ Plan generation timed out for task {task_id}, using fallback plan")
+    except Exception as e:
+        logger.error(f"❌ Plan generation failed for task {task_id}: {str(e)}")
+    return generate_fallback_plan(message, task_id)
+
+def execute_chat_tool_calls(tool_calls: list) -> list:
+    """Ejecutar los tool_calls de una respuesta del chat y devolver sus resultados"""
+    tool_results = []
+    if not tool_calls:
+        return tool_results
+    
+    logger.info(f"🔧 Processing {len(tool_calls)} tool calls")
+    tool_manager = get_tool_manager()
+    if not tool_manager:
+        return tool_results
+    
+    for tool_call in tool_calls:
+        tool_name = tool_call.get('tool')
+        parameters = tool_call.get('parameters', {})
+        try:
+            logger.info(f"🔧 Executing tool: {tool_name}")
+            
+            # Ejecutar herramienta real
+            tool_result = tool_manager.execute_tool(tool_name, parameters)
+            tool_results.append({
+                'tool': tool_name,
+                'parameters': parameters,
+                'result': tool_result
+            })
+            
+        except Exception as e:
+            logger.error(f"Error executing tool {tool_name}: {str(e)}")
+            tool_results.append({
+                'tool': tool_name,
+                'parameters': parameters,
+                'error': str(e)
+            })
+    
+    return tool_results
+
+def _sse_event(event: str, data: dict) -> str:
+    """Formatear un evento Server-Sent Events"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+def resolve_request_user(context: dict) -> str:
+    """Usuario para el reparto justo de la cola de ejecución"""
+    return (context.get('user_id') or request.headers.get('X-User-Id')
+            or request.remote_addr or 'anonymous')
+
+def _overload_payload(task_id: str, overload: TaskExecutorOverloaded) -> dict:
+    return {
+        'error': 'server_busy',
+        'reason': overload.reason,
+        'retry_after': overload.retry_after,
+        'task_id': task_id,
+        'response': 'El servidor está ocupado con otras tareas. Inténtalo de nuevo en unos momentos.'
+    }
+
 @agent_bp.route('/chat', methods=['POST'])
+@traced('agent.chat')
 def chat():
     """
     Endpoint principal del chat - VERSIÓN REAL CON OLLAMA
@@ -1989,6 +2464,8 @@ def chat():
         task_id = context.get('task_id', str(uuid.uuid4()))
         
         logger.info(f"🚀 Processing message: {message[:50]}... (ID: {task_id})")
+        get_tracer().bind_task(task_id)
+        set_thread_tags(task_id=task_id)
         
         # Obtener servicio de Ollama
         ollama_service = get_ollama_service()
@@ -1998,8 +2475,9 @@ def chat():
                 'response': 'Lo siento, el servicio de IA no está disponible en este momento.'
             }), 503
         
-        # PASO 1: Detectar si es conversación casual o tarea compleja
-        is_casual = is_casual_conversation(message)
+        # PASO 1: Clasificar (pre-clasificador local + LLM si es ambiguo) mientras
+        # el plan y la respuesta con herramientas se generan especulativamente
+        is_casual, branch = classify_with_speculation(message, task_id, context, speculate_response=True)
         
         if is_casual:
             # MODO CONVERSACIÓN CASUAL
@@ -2027,56 +2505,48 @@ def chat():
             # MODO AGENTE CON PLANIFICACIÓN ESTRUCTURADA
             logger.info(f"🤖 Detected task mode - generating structured plan")
             
-            # PASO 2: Generar plan dinámico PRIMERO usando IA
-            structured_plan = generate_dynamic_plan_with_ai(message, task_id)
-            
-            # PASO 3: Generar respuesta usando Ollama con contexto de herramientas
-            ollama_response = ollama_service.generate_response(message, context, use_tools=True)
-            
-            if ollama_response.get('error'):
-                return jsonify({
-                    'error': ollama_response['error'],
-                    'response': ollama_response['response']
-                }), 500
-            
-            # PASO 4: Procesar tool_calls si existen
-            tool_results = []
-            if ollama_response.get('tool_calls'):
-                logger.info(f"🔧 Processing {len(ollama_response['tool_calls'])} tool calls")
-                tool_manager = get_tool_manager()
+            # PASO 2-3: Plan dinámico y respuesta con herramientas, ya en curso
+            plan_published = False
+            try:
+                try:
+                    ollama_response = branch.response_future.result(timeout=CHAT_RESPONSE_TIMEOUT)
+                except FutureTimeoutError:
+                    logger.warning(f"⏱️ Response generation timed out for task {task_id}")
+                    return jsonify({
+                        'error': 'Response generation timed out',
+                        'response': 'Lo siento, la respuesta está tardando demasiado. Inténtalo de nuevo.'
+                    }), 504
                 
-                if tool_manager:
-                    for tool_call in ollama_response['tool_calls']:
-                        try:
-                            tool_name = tool_call.get('tool')
-                            parameters = tool_call.get('parameters', {})
-                            
-                            logger.info(f"🔧 Executing tool: {tool_name}")
-                            
-                            # Ejecutar herramienta real
-                            tool_result = tool_manager.execute_tool(tool_name, parameters)
-                            tool_results.append({
-                                'tool': tool_name,
-                                'parameters': parameters,
-                                'result': tool_result
-                            })
-                            
-                        except Exception as e:
-                            logger.error(f"Error executing tool {tool_name}: {str(e)}")
-                            tool_results.append({
-                                'tool': tool_name,
-                                'parameters': parameters,
-                                'error': str(e)
-                            })
-            
-            # PASO 5: Generar respuesta LIMPIA basada en estado inicial (tarea comenzando)
-            final_response = generate_clean_response(ollama_response['response'], tool_results, 
-                                                    task_status="starting", 
-                                                    failed_step_title=None, 
-                                                    error_message=None)
-            
-            # PASO 6: Ejecutar plan automáticamente
-            execute_plan_with_real_tools(task_id, structured_plan['steps'], message)
+                if ollama_response.get('error'):
+                    return jsonify({
+                        'error': ollama_response['error'],
+                        'response': ollama_response['response']
+                    }), 500
+                
+                structured_plan = wait_for_plan(branch.plan_future, message, task_id)
+                
+                # PASO 4: Procesar tool_calls si existen
+                tool_results = execute_chat_tool_calls(ollama_response.get('tool_calls', []))
+                
+                # PASO 5: Generar respuesta LIMPIA basada en estado inicial (tarea comenzando)
+                final_response = generate_clean_response(ollama_response['response'], tool_results, 
+                                                        task_status="starting", 
+                                                        failed_step_title=None, 
+                                                        error_message=None)
+                
+                # PASO 6: Encolar la ejecución automática del plan
+                try:
+                    queue_info = execute_plan_with_real_tools(task_id, structured_plan['steps'], message,
+                                                              user_id=resolve_request_user(context))
+                    plan_published = True
+                except TaskExecutorOverloaded as overload:
+                    response = jsonify(_overload_payload(task_id, overload))
+                    response.headers['Retry-After'] = str(max(1, int(overload.retry_after)))
+                    return response, 429
+            finally:
+                # Cualquier salida sin plan encolado descarta la rama especulativa
+                if not plan_published:
+                    branch.cancel()
             
             logger.info(f"✅ Task completed successfully with structured plan")
             
@@ -2088,6 +2558,7 @@ def chat():
                 'tool_results': tool_results,
                 'timestamp': datetime.now().isoformat(),
                 'execution_status': 'plan_generated',  # ✅ MEJORA: Estado inicial correcto
+                'queue': queue_info,
                 'mode': 'agent_with_structured_plan',
                 'memory_used': True
             })
@@ -2099,6 +2570,148 @@ def chat():
             'response': 'Lo siento, hubo un error procesando tu solicitud.'
         }), 500
 
+@agent_bp.route('/chat/stream', methods=['POST'])
+def chat_stream():
+    """
+    Chat con streaming de tokens por Server-Sent Events
+    
+    Los tokens se envían según Ollama los produce; en modo agente el plan se
+    genera en paralelo y se envía (y se empieza a ejecutar) en cuanto está
+    validado, sin esperar al final de la respuesta.
+    
+    Eventos: start, token, plan, response, error, done
+    """
+    data = request.get_json() or {}
+    message = data.get('message', '')
+    context = data.get('context', {})
+    
+    if not message:
+        return jsonify({'error': 'Message is required'}), 400
+    
+    task_id = context.get('task_id', str(uuid.uuid4()))
+    
+    logger.info(f"🚀 Streaming message: {message[:50]}... (ID: {task_id})")
+    set_thread_tags(task_id=task_id)
+    
+    ollama_service = get_ollama_service()
+    if not ollama_service:
+        return jsonify({
+            'error': 'Ollama service not available',
+            'response': 'Lo siento, el servicio de IA no está disponible en este momento.'
+        }), 503
+    
+    is_casual, branch = classify_with_speculation(message, task_id)
+    mode = 'casual_conversation' if is_casual else 'agent_with_structured_plan'
+    plan_future = branch.plan_future if branch else None
+    
+    user_id = resolve_request_user(context)
+    
+    def publish_plan(plan: dict) -> tuple:
+        """Encolar el plan: (evento SSE, payload de sobrecarga o None si se admitió)"""
+        try:
+            queue_info = execute_plan_with_real_tools(task_id, plan['steps'], message, user_id=user_id)
+        except TaskExecutorOverloaded as overload:
+            rejection = _overload_payload(task_id, overload)
+            return _sse_event('error', rejection), rejection
+        return _sse_event('plan', {'task_id': task_id, 'plan': plan, 'queue': queue_info}), None
+    
+    def generate():
+        started_at = time.time()
+        first_token_at = None
+        plan_sent = False
+        rejection = None
+        failed = False
+        chunks = []
+        
+        try:
+            yield _sse_event('start', {'task_id': task_id, 'mode': mode})
+            
+            for chunk in ollama_service.chat_streaming(message, context, use_tools=not is_casual,
+                                                       conversation_mode=is_casual):
+                if chunk.get('error'):
+                    failed = True
+                    yield _sse_event('error', {'task_id': task_id, 'error': chunk['error'],
+                                               'response': chunk.get('response', '')})
+                    break
+                
+                token = chunk.get('response', '')
+                if token:
+                    if first_token_at is None:
+                        first_token_at = time.time()
+                    chunks.append(token)
+                    yield _sse_event('token', {'text': token})
+                
+                # Enviar el plan entre tokens en cuanto esté listo
+                if plan_future is not None and not plan_sent and plan_future.done():
+                    plan_sent = True
+                    event, rejection = publish_plan(wait_for_plan(plan_future, message, task_id))
+                    yield event
+                
+                if chunk.get('done'):
+                    break
+            
+            if not failed:
+                full_text = ''.join(chunks)
+                tool_calls, tool_results = [], []
+            
+                if is_casual:
+                    final_response = full_text.strip()
+                else:
+                    parsed = ollama_service._parse_response(full_text)
+                    tool_calls = parsed['tool_calls']
+                    tool_results = execute_chat_tool_calls(tool_calls)
+                    final_response = generate_clean_response(parsed['text'], tool_results,
+                                                             task_status="starting",
+                                                             failed_step_title=None,
+                                                             error_message=None)
+                    if not plan_sent:
+                        plan_sent = True
+                        event, rejection = publish_plan(wait_for_plan(plan_future, message, task_id))
+                        yield event
+            
+                response_event = {
+                    'response': final_response,
+                    'task_id': task_id,
+                    'tool_calls': tool_calls,
+                    'tool_results': tool_results,
+                    'timestamp': datetime.now().isoformat(),
+                    'execution_status': 'completed' if is_casual else 'plan_generated',
+                    'mode': mode,
+                    'memory_used': True
+                }
+                if rejection is not None:
+                    # El plan no llegó a encolarse: no anunciarlo como en marcha
+                    response_event.update(execution_status='rejected', error=rejection['error'],
+                                          reason=rejection['reason'], retry_after=rejection['retry_after'])
+                yield _sse_event('response', response_event)
+            
+        except Exception as e:
+            logger.error(f"Error en chat streaming: {str(e)}")
+            yield _sse_event('error', {'task_id': task_id, 'error': str(e)})
+        
+        finally:
+            # Error de Ollama, excepción, cliente desconectado (GeneratorExit) o
+            # plan rechazado: el plan especulativo sin encolar no debe persistirse ni cachearse
+            if branch is not None and (not plan_sent or rejection is not None):
+                branch.cancel()
+        
+        yield _sse_event('done', {
+            'task_id': task_id,
+            'time_to_first_token': (first_token_at - started_at) if first_token_at else None,
+            'total_time': time.time() - started_at
+        })
+    
+    def traced_stream():
+        # El span cubre el streaming: el handler termina antes de enviar el primer evento
+        with get_tracer().span('agent.chat_stream', {'chat.mode': mode}, task_id=task_id):
+            yield from generate()
+    
+    return Response(
+        stream_with_context(traced_stream()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
 @agent_bp.route('/test-plan-generation', methods=['POST'])
 def test_plan_generation():
     """
@@ -2283,17 +2896,15 @@ def update_task_progress():
         if not task_id or not step_id:
             return jsonify({'error': 'task_id and step_id are required'}), 400
         
-        # Actualizar progreso en memoria
-        if task_id in active_task_plans:
-            plan = active_task_plans[task_id]['plan']
-            for step in plan:
+        # Actualizar progreso en memoria (lectura-modificación-escritura versionada)
+        def mark_step(plan_data):
+            for step in plan_data['plan']:
                 if step['id'] == step_id:
                     step['completed'] = completed
                     step['status'] = 'completed' if completed else 'pending'
                     break
-            
-            # Actualizar plan en memoria
-            active_task_plans[task_id]['plan'] = plan
+        
+        active_task_plans.modify_entry(task_id, mark_step)
         
         return jsonify({
             'success': True,
@@ -2312,8 +2923,8 @@ def update_task_progress():
 def update_task_time(task_id):
     """Actualiza el tiempo transcurrido de una tarea en tiempo real"""
     try:
-        if task_id in active_task_plans:
-            plan_data = active_task_plans[task_id]
+        plan_data = active_task_plans.get(task_id)
+        if plan_data:
             start_time = plan_data.get('start_time')
             
             if start_time:
@@ -2326,20 +2937,19 @@ def update_task_time(task_id):
                 seconds = elapsed_seconds % 60
                 elapsed_str = f"{minutes}:{seconds:02d}"
                 
-                # Actualizar el paso activo
-                plan = plan_data['plan']
-                for step in plan:
-                    if step.get('active', False):
-                        step['elapsed_time'] = f"{elapsed_str} Pensando"
-                        break
+                # Actualizar el paso activo (lectura-modificación-escritura versionada)
+                def mark_elapsed(current):
+                    for step in current['plan']:
+                        if step.get('active', False):
+                            step['elapsed_time'] = f"{elapsed_str} Pensando"
+                            break
                 
-                # Actualizar en memoria
-                active_task_plans[task_id]['plan'] = plan
+                updated = active_task_plans.modify_entry(task_id, mark_elapsed, dirty=False)
                 
                 return jsonify({
                     'success': True,
                     'elapsed_time': elapsed_str,
-                    'plan': plan
+                    'plan': (updated or plan_data)['plan']
                 })
             
         return jsonify({'error': 'Task not found'}), 404
@@ -2352,8 +2962,9 @@ def update_task_time(task_id):
 def get_task_plan(task_id):
     """Obtiene el plan de una tarea específica con progreso actualizado"""
     try:
-        if task_id in active_task_plans:
-            plan_data = active_task_plans[task_id]
+        # Versión publicada: inmutable, se puede leer sin copiar
+        plan_data = active_task_plans.get(task_id)
+        if plan_data:
             
             # Calcular progreso
             completed_steps = sum(1 for step in plan_data['plan'] if step['completed'])
@@ -2387,8 +2998,8 @@ def get_task_plan(task_id):
 def get_final_result(task_id):
     """Obtiene el resultado final de una tarea completada"""
     try:
-        if task_id in active_task_plans:
-            plan_data = active_task_plans[task_id]
+        plan_data = active_task_plans.get(task_id)
+        if plan_data:
             
             if plan_data['status'] == 'completed' and 'final_result' in plan_data:
                 return jsonify({
@@ -2419,6 +3030,52 @@ def get_final_result(task_id):
             'error': f'Error obteniendo resultado final: {str(e)}'
         }), 500
 
+@agent_bp.route('/trace/<task_id>', methods=['GET'])
+def get_task_trace(task_id):
+    """Obtiene el waterfall de spans registrados para una tarea"""
+    try:
+        tracer = get_tracer()
+        waterfall = tracer.render_waterfall(task_id)
+        
+        if not waterfall:
+            return jsonify({
+                'error': 'Trace not found for task (not sampled or evicted)',
+                'tracing': tracer.get_stats()
+            }), 404
+        
+        if request.args.get('format') == 'text':
+            return current_app.response_class('\n'.join(waterfall['waterfall']) + '\n', mimetype='text/plain')
+        
+        return jsonify(waterfall)
+    
+    except Exception as e:
+        logger.error(f"Error getting task trace: {str(e)}")
+        return jsonify({
+            'error': f'Error obteniendo traza: {str(e)}'
+        }), 500
+
+@agent_bp.route('/queue-status/<task_id>', methods=['GET'])
+def get_queue_status(task_id):
+    """Posición en la cola de ejecución y ETA estimada de inicio de una tarea"""
+    executor = get_task_executor()
+    queue_info = executor.position(task_id)
+    if queue_info is None:
+        task_data = get_task_data(task_id)
+        if not task_data:
+            return jsonify({'error': 'Task not found'}), 404
+        # Ya no está en la cola: terminó (o no llegó a encolarse)
+        queue_info = {'job_id': task_id, 'status': task_data.get('status', 'unknown')}
+    queue_info['executor'] = {
+        'queued': executor.get_statistics()['queued'],
+        'workers': executor.workers
+    }
+    return jsonify(queue_info)
+
+@agent_bp.route('/plan-generation/stats', methods=['GET'])
+def plan_generation_stats():
+    """Contadores de generación de planes (llamadas al LLM por plan, reparaciones locales)"""
+    return jsonify(get_plan_generation_statistics())
+
 @agent_bp.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
@@ -2439,6 +3096,7 @@ def agent_status():
         'status': 'running',
         'timestamp': datetime.now().isoformat(),
         'active_tasks': len(active_task_plans),
+        'task_executor': get_task_executor().get_statistics(),
         'ollama': {
             'connected': True,
             'endpoint': 'https://78d08925604a.ngrok-free.app',
@@ -2508,9 +3166,7 @@ def upload_files():
                 })
         
         # Guardar referencias en memoria
-        if task_id not in task_files:
-            task_files[task_id] = []
-        task_files[task_id].extend(uploaded_files)
+        task_files[task_id] = task_files.get(task_id, []) + uploaded_files
         
         return jsonify({
             'files': uploaded_files,
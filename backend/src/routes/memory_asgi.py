@@ -0,0 +1,98 @@
+"""
+Modo ASGI nativo para las rutas de memoria
+Sirve los endpoints asíncronos de /api/memory directamente desde el loop de
+uvicorn (esperando el resultado del puente sin ocupar un hilo WSGI) y delega
+el resto de peticiones en la aplicación Flask envuelta con WsgiToAsgi.
+
+Se activa con MEMORY_ASGI_NATIVE=true.
+"""
+
+import json
+import logging
+from typing import Any, Callable, Dict, Optional
+
+from src.routes.memory_routes import ASYNC_MEMORY_OPERATIONS, MEMORY_ROUTE_TIMEOUT
+from src.utils.async_bridge import AsyncLoopBridge
+from src.utils.json_encoder import MongoJSONEncoder
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryASGIApp:
+    """Router ASGI mínimo para las operaciones asíncronas de memoria"""
+
+    def __init__(self, fallback_app: Callable, flask_app: Any, bridge: AsyncLoopBridge,
+                 prefix: str = '/api/memory'):
+        """
+        Args:
+            fallback_app: Aplicación ASGI para el resto de rutas (WsgiToAsgi(app))
+            flask_app: Aplicación Flask de la que se lee memory_manager
+            bridge: Puente al event loop persistente donde viven los recursos de memoria
+            prefix: Prefijo de las rutas de memoria
+        """
+        self.fallback_app = fallback_app
+        self.flask_app = flask_app
+        self.bridge = bridge
+        self.prefix = prefix.rstrip('/')
+
+    def _resolve(self, scope: Dict[str, Any]) -> Optional[tuple]:
+        if scope.get('type') != 'http':
+            return None
+        path = scope.get('path', '')
+        if not path.startswith(self.prefix + '/'):
+            return None
+        return ASYNC_MEMORY_OPERATIONS.get((scope.get('method', 'GET'), path[len(self.prefix):]))
+
+    async def __call__(self, scope, receive, send):
+        operation = self._resolve(scope)
+        if operation is None:
+            await self.fallback_app(scope, receive, send)
+            return
+
+        handler, error_prefix = operation
+        try:
+            body = await self._read_body(receive)
+            data = json.loads(body) if body else None
+        except ValueError:
+            await self._send_json(send, {'error': 'Invalid JSON body'}, 400)
+            return
+
+        memory_manager = getattr(self.flask_app, 'memory_manager', None)
+        try:
+            payload, status = await self.bridge.run_async(
+                handler(memory_manager, data), MEMORY_ROUTE_TIMEOUT
+            )
+        except TimeoutError:
+            payload, status = {'error': f'Memory operation timed out after {MEMORY_ROUTE_TIMEOUT}s'}, 504
+        except Exception as e:
+            logger.error(f"Error in native memory route {scope.get('path')}: {str(e)}")
+            payload, status = {'error': f'{error_prefix}: {str(e)}'}, 500
+
+        await self._send_json(send, payload, status)
+
+    @staticmethod
+    async def _read_body(receive) -> bytes:
+        chunks = []
+        more_body = True
+        while more_body:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                break
+            chunks.append(message.get('body', b''))
+            more_body = message.get('more_body', False)
+        return b''.join(chunks)
+
+    @staticmethod
+    async def _send_json(send, payload: Dict[str, Any], status: int):
+        body = json.dumps(payload, cls=MongoJSONEncoder).encode('utf-8')
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [
+                (b'content-type', b'application/json'),
+                # Igual que la configuración CORS de /api/* (preflight OPTIONS lo atiende Flask)
+                (b'access-control-allow-origin', b'*'),
+                (b'content-length', str(len(body)).encode('ascii'))
+            ]
+        })
+        await send({'type': 'http.response.body', 'body': body})
@@ -7,59 +7,186 @@ from flask import Blueprint, request, jsonify, current_app
 from datetime import datetime
 import logging
 import asyncio
-from typing import Dict, List, Any, Optional
+import os
+from typing import Dict, List, Any, Optional, Tuple
 
 from src.memory.advanced_memory_manager import AdvancedMemoryManager
 from src.memory.episodic_memory_store import Episode
 from src.memory.semantic_memory_store import SemanticConcept, SemanticFact
 from src.memory.procedural_memory_store import Procedure, ToolStrategy
+from src.utils.async_bridge import get_async_bridge
 
 logger = logging.getLogger(__name__)
 
 memory_bp = Blueprint('memory', __name__)
 
+# Timeout de las operaciones asíncronas de memoria (segundos)
+MEMORY_ROUTE_TIMEOUT = float(os.getenv('MEMORY_ROUTE_TIMEOUT', '30'))
+
+# Lock de inicialización, creado en el loop del puente la primera vez que se usa
+_init_lock: Optional[asyncio.Lock] = None
+
 # Obtener el gestor de memoria
 def get_memory_manager():
     """Obtiene el gestor de memoria del contexto de la aplicación"""
     return current_app.memory_manager if hasattr(current_app, 'memory_manager') else None
 
+def run_memory_coroutine(coro, timeout: float = None):
+    """
+    Ejecutar una corrutina de memoria en el event loop persistente de la aplicación
+    en lugar de crear un loop nuevo por petición con asyncio.run()
+    """
+    bridge = getattr(current_app, 'async_bridge', None) or get_async_bridge()
+    return bridge.run(coro, timeout or MEMORY_ROUTE_TIMEOUT)
+
+def _timeout_response():
+    return jsonify({'error': f'Memory operation timed out after {MEMORY_ROUTE_TIMEOUT}s'}), 504
+
+async def ensure_memory_initialized(memory_manager):
+    """Inicializar el gestor de memoria una sola vez aunque lleguen peticiones concurrentes"""
+    global _init_lock
+    if memory_manager.is_initialized:
+        return
+    if _init_lock is None:
+        _init_lock = asyncio.Lock()
+    async with _init_lock:
+        if not memory_manager.is_initialized:
+            await memory_manager.initialize()
+
+# ------------------------------------------------------------------
+# Operaciones asíncronas: devuelven (payload, status) y se comparten entre
+# los handlers Flask y el modo ASGI nativo (memory_asgi.py)
+# ------------------------------------------------------------------
+
+async def semantic_search_async(memory_manager, data: Dict[str, Any]) -> Tuple[Dict[str, Any], int]:
+    if not data or 'query' not in data:
+        return {'error': 'Query is required'}, 400
+
+    if not memory_manager:
+        return {'error': 'Memory manager not available'}, 503
+
+    query = data['query']
+
+    # Inicializar si es necesario
+    await ensure_memory_initialized(memory_manager)
+
+    # Realizar búsqueda semántica
+    results = await memory_manager.semantic_search(
+        query=query,
+        max_results=data.get('max_results', 10),
+        memory_types=data.get('memory_types', ['all'])
+    )
+
+    return {
+        'query': query,
+        'results': results,
+        'total_results': len(results),
+        'search_timestamp': datetime.now().isoformat()
+    }, 200
+
+async def retrieve_context_async(memory_manager, data: Dict[str, Any]) -> Tuple[Dict[str, Any], int]:
+    if not data or 'query' not in data:
+        return {'error': 'Query is required'}, 400
+
+    if not memory_manager:
+        return {'error': 'Memory manager not available'}, 503
+
+    query = data['query']
+
+    # Recuperar contexto relevante
+    context = await memory_manager.retrieve_relevant_context(
+        query=query,
+        context_type=data.get('context_type', 'all'),
+        max_results=data.get('max_results', 10)
+    )
+
+    return {
+        'query': query,
+        'context': context,
+        'retrieved_at': datetime.now().isoformat()
+    }, 200
+
+async def memory_analytics_async(memory_manager, data: Dict[str, Any] = None) -> Tuple[Dict[str, Any], int]:
+    if not memory_manager:
+        return {'error': 'Memory manager not available'}, 503
+
+    # Obtener estadísticas detalladas
+    stats = await memory_manager.get_memory_stats()
+
+    # Análisis adicional
+    analytics = {
+        'overview': stats,
+        'memory_efficiency': {
+            'total_capacity_used': (
+                stats['working_memory']['total_contexts'] +
+                stats['episodic_memory']['total_episodes'] +
+                stats['semantic_memory']['total_concepts'] +
+                stats['semantic_memory']['total_facts'] +
+                stats['procedural_memory']['total_procedures']
+            ),
+            'embedding_efficiency': stats['embedding_service']['index_size'],
+            'search_performance': stats['semantic_indexer']['total_documents']
+        },
+        'learning_insights': {
+            'episode_success_rate': stats['episodic_memory']['success_rate'],
+            'procedure_effectiveness': stats['procedural_memory']['average_procedure_effectiveness'],
+            'knowledge_confidence': stats['semantic_memory']['average_fact_confidence']
+        }
+    }
+
+    return analytics, 200
+
+async def compress_memory_async(memory_manager, data: Dict[str, Any]) -> Tuple[Dict[str, Any], int]:
+    if not memory_manager:
+        return {'error': 'Memory manager not available'}, 503
+
+    compression_config = (data or {}).get('config', {})
+
+    # Realizar compresión
+    result = await memory_manager.compress_old_memory(compression_config)
+
+    return {
+        'success': True,
+        'compressed_items': result.get('compressed_items', 0),
+        'memory_saved': result.get('memory_saved', 0),
+        'compression_timestamp': datetime.now().isoformat()
+    }, 200
+
+async def export_memory_async(memory_manager, data: Dict[str, Any] = None) -> Tuple[Dict[str, Any], int]:
+    if not memory_manager:
+        return {'error': 'Memory manager not available'}, 503
+
+    # Exportar todos los datos de memoria
+    export_data = await memory_manager.export_memory_data()
+
+    return {
+        'success': True,
+        'export_data': export_data,
+        'export_timestamp': datetime.now().isoformat()
+    }, 200
+
+# Endpoints servidos de forma nativa en modo ASGI: (método, ruta) -> (operación, prefijo de error)
+ASYNC_MEMORY_OPERATIONS = {
+    ('POST', '/semantic-search'): (semantic_search_async, 'Search failed'),
+    ('POST', '/retrieve-context'): (retrieve_context_async, 'Failed to retrieve context'),
+    ('GET', '/memory-analytics'): (memory_analytics_async, 'Failed to get analytics'),
+    ('POST', '/compress-memory'): (compress_memory_async, 'Failed to compress memory'),
+    ('GET', '/export-memory'): (export_memory_async, 'Failed to export memory'),
+}
+
 @memory_bp.route('/semantic-search', methods=['POST'])
 def semantic_search():
     """
     Búsqueda semántica en el sistema de memoria
     """
     try:
-        data = request.get_json()
-        
-        if not data or 'query' not in data:
-            return jsonify({'error': 'Query is required'}), 400
-        
-        query = data['query']
-        max_results = data.get('max_results', 10)
-        memory_types = data.get('memory_types', ['all'])
-        
-        memory_manager = get_memory_manager()
-        if not memory_manager:
-            return jsonify({'error': 'Memory manager not available'}), 503
-            
-        # Inicializar si es necesario
-        if not memory_manager.is_initialized:
-            asyncio.run(memory_manager.initialize())
-        
-        # Realizar búsqueda semántica
-        results = asyncio.run(memory_manager.semantic_search(
-            query=query,
-            max_results=max_results,
-            memory_types=memory_types
-        ))
-        
-        return jsonify({
-            'query': query,
-            'results': results,
-            'total_results': len(results),
-            'search_timestamp': datetime.now().isoformat()
-        })
-        
+        payload, status = run_memory_coroutine(
+            semantic_search_async(get_memory_manager(), request.get_json())
+        )
+        return jsonify(payload), status
+
+    except TimeoutError:
+        return _timeout_response()
     except Exception as e:
         logger.error(f"Error in semantic search: {str(e)}")
         return jsonify({'error': f'Search failed: {str(e)}'}), 500
@@ -207,32 +334,13 @@ def retrieve_context():
     Recuperar contexto relevante para una consulta
     """
     try:
-        data = request.get_json()
-        
-        if not data or 'query' not in data:
-            return jsonify({'error': 'Query is required'}), 400
-        
-        memory_manager = get_memory_manager()
-        if not memory_manager:
-            return jsonify({'error': 'Memory manager not available'}), 503
-            
-        query = data['query']
-        context_type = data.get('context_type', 'all')
-        max_results = data.get('max_results', 10)
-        
-        # Recuperar contexto relevante
-        context = asyncio.run(memory_manager.retrieve_relevant_context(
-            query=query,
-            context_type=context_type,
-            max_results=max_results
-        ))
-        
-        return jsonify({
-            'query': query,
-            'context': context,
-            'retrieved_at': datetime.now().isoformat()
-        })
-        
+        payload, status = run_memory_coroutine(
+            retrieve_context_async(get_memory_manager(), request.get_json())
+        )
+        return jsonify(payload), status
+
+    except TimeoutError:
+        return _timeout_response()
     except Exception as e:
         logger.error(f"Error retrieving context: {str(e)}")
         return jsonify({'error': f'Failed to retrieve context: {str(e)}'}), 500
@@ -243,36 +351,11 @@ def memory_analytics():
     Obtener analytics detallados del sistema de memoria
     """
     try:
-        memory_manager = get_memory_manager()
-        if not memory_manager:
-            return jsonify({'error': 'Memory manager not available'}), 503
-            
-        # Obtener estadísticas detalladas
-        stats = asyncio.run(memory_manager.get_memory_stats())
-        
-        # Análisis adicional
-        analytics = {
-            'overview': stats,
-            'memory_efficiency': {
-                'total_capacity_used': (
-                    stats['working_memory']['total_contexts'] +
-                    stats['episodic_memory']['total_episodes'] +
-                    stats['semantic_memory']['total_concepts'] +
-                    stats['semantic_memory']['total_facts'] +
-                    stats['procedural_memory']['total_procedures']
-                ),
-                'embedding_efficiency': stats['embedding_service']['index_size'],
-                'search_performance': stats['semantic_indexer']['total_documents']
-            },
-            'learning_insights': {
-                'episode_success_rate': stats['episodic_memory']['success_rate'],
-                'procedure_effectiveness': stats['procedural_memory']['average_procedure_effectiveness'],
-                'knowledge_confidence': stats['semantic_memory']['average_fact_confidence']
-            }
-        }
-        
-        return jsonify(analytics)
-        
+        payload, status = run_memory_coroutine(memory_analytics_async(get_memory_manager()))
+        return jsonify(payload), status
+
+    except TimeoutError:
+        return _timeout_response()
     except Exception as e:
         logger.error(f"Error getting memory analytics: {str(e)}")
         return jsonify({'error': f'Failed to get analytics: {str(e)}'}), 500
@@ -283,24 +366,13 @@ def compress_memory():
     Comprimir memoria antigua para optimizar rendimiento
     """
     try:
-        data = request.get_json()
-        
-        memory_manager = get_memory_manager()
-        if not memory_manager:
-            return jsonify({'error': 'Memory manager not available'}), 503
-            
-        compression_config = data.get('config', {})
-        
-        # Realizar compresión
-        result = asyncio.run(memory_manager.compress_old_memory(compression_config))
-        
-        return jsonify({
-            'success': True,
-            'compressed_items': result.get('compressed_items', 0),
-            'memory_saved': result.get('memory_saved', 0),
-            'compression_timestamp': datetime.now().isoformat()
-        })
-        
+        payload, status = run_memory_coroutine(
+            compress_memory_async(get_memory_manager(), request.get_json())
+        )
+        return jsonify(payload), status
+
+    except TimeoutError:
+        return _timeout_response()
     except Exception as e:
         logger.error(f"Error compressing memory: {str(e)}")
         return jsonify({'error': f'Failed to compress memory: {str(e)}'}), 500
@@ -311,19 +383,11 @@ def export_memory():
     Exportar datos de memoria para backup
     """
     try:
-        memory_manager = get_memory_manager()
-        if not memory_manager:
-            return jsonify({'error': 'Memory manager not available'}), 503
-            
-        # Exportar todos los datos de memoria
-        export_data = asyncio.run(memory_manager.export_memory_data())
-        
-        return jsonify({
-            'success': True,
-            'export_data': export_data,
-            'export_timestamp': datetime.now().isoformat()
-        })
-        
+        payload, status = run_memory_coroutine(export_memory_async(get_memory_manager()))
+        return jsonify(payload), status
+
+    except TimeoutError:
+        return _timeout_response()
     except Exception as e:
         logger.error(f"Error exporting memory: {str(e)}")
-        return jsonify({'error': f'Failed to export memory: {str(e)}'}), 500
\ No newline at end of file
+        return jsonify({'error': f'Failed to export memory: {str(e)}'}), 500
@@ -4,6 +4,7 @@ Maneja todas las operaciones de persistencia
 """
 
 from pymongo import MongoClient
+from pymongo.errors import BulkWriteError
 from bson import ObjectId
 from datetime import datetime, timedelta
 import os
@@ -75,6 +76,9 @@ class DatabaseService:
             # Índices para shares
             self.db.shares.create_index("share_id")
             
+            # Índice del log de eventos por tarea (replay por secuencia)
+            self.db.task_events.create_index([("task_id", 1), ("seq", 1)], unique=True)
+            
         except Exception as e:
             print(f"⚠️  Error creating indexes: {e}")
     
@@ -128,6 +132,36 @@ class DatabaseService:
             print(f"Error updating task: {e}")
             return False
     
+    def apply_task_delta(self, task_id: str, fields: Dict, step_updates: Dict[str, Dict] = None) -> bool:
+        """
+        Aplicar en una sola escritura campos de la tarea y cambios por paso
+        
+        Los pasos se actualizan con $set sobre plan.$[elem] y array_filters,
+        sin reescribir el array completo del plan.
+        """
+        try:
+            set_ops = dict(fields)
+            array_filters = []
+            
+            for index, (step_id, step_fields) in enumerate((step_updates or {}).items()):
+                identifier = f"s{index}"
+                for key, value in step_fields.items():
+                    set_ops[f"plan.$[{identifier}].{key}"] = value
+                array_filters.append({f"{identifier}.id": step_id})
+            
+            set_ops.setdefault('updated_at', datetime.now())
+            
+            result = self.db.tasks.update_one(
+                {"task_id": task_id},
+                {"$set": set_ops},
+                array_filters=array_filters or None
+            )
+            return result.matched_count > 0
+            
+        except Exception as e:
+            print(f"Error applying task delta: {e}")
+            return False
+    
     def get_all_tasks(self, limit: int = 100) -> List[Dict]:
         """Obtener todas las tareas"""
         try:
@@ -152,12 +186,67 @@ class DatabaseService:
             # Eliminar archivos relacionados
             self.db.files.delete_many({"task_id": task_id})
             
+            # Eliminar log de eventos
+            self.db.task_events.delete_many({"task_id": task_id})
+            
             return True
             
         except Exception as e:
             print(f"Error deleting task: {e}")
             return False
     
+    # === TASK EVENTS ===
+    
+    def append_task_events(self, task_id: str, events: List[Dict]) -> bool:
+        """Guardar eventos del log de una tarea (cada uno con su 'seq')"""
+        if not events:
+            return True
+        try:
+            self.db.task_events.insert_many(
+                [{"task_id": task_id, "seq": event['seq'], "event": event, "created_at": datetime.now()}
+                 for event in events],
+                ordered=False
+            )
+            return True
+            
+        except BulkWriteError as e:
+            # Reintento de un lote ya guardado en parte: los duplicados no son un error
+            if not e.details.get('writeConcernErrors') and all(
+                error.get('code') == 11000 for error in e.details.get('writeErrors', [])
+            ):
+                return True
+            print(f"Error appending task events: {e}")
+            return False
+        except Exception as e:
+            print(f"Error appending task events: {e}")
+            return False
+    
+    def get_task_events(self, task_id: str, after_seq: int, before_seq: int = None) -> List[Dict]:
+        """Obtener eventos con after_seq < seq < before_seq en orden de secuencia"""
+        try:
+            seq_filter = {"$gt": after_seq}
+            if before_seq is not None:
+                seq_filter["$lt"] = before_seq
+            cursor = self.db.task_events.find(
+                {"task_id": task_id, "seq": seq_filter},
+                {"_id": 0, "event": 1}
+            ).sort("seq", 1)
+            return [doc['event'] for doc in cursor]
+            
+        except Exception as e:
+            print(f"Error getting task events: {e}")
+            return []
+    
+    def get_last_task_event_seq(self, task_id: str) -> int:
+        """Última secuencia guardada para una tarea (0 si no hay eventos)"""
+        try:
+            doc = self.db.task_events.find_one({"task_id": task_id}, {"seq": 1}, sort=[("seq", -1)])
+            return doc['seq'] if doc else 0
+            
+        except Exception as e:
+            print(f"Error getting last task event seq: {e}")
+            return 0
+    
     # === CONVERSATIONS ===
     
     def save_conversation(self, conversation_data: Dict) -> str:
@@ -357,11 +446,15 @@ class DatabaseService:
             # Eliminar shares viejos
             shares_deleted = self.db.shares.delete_many({"created_at": {"$lt": cutoff_date}})
             
+            # Eliminar eventos viejos
+            events_deleted = self.db.task_events.delete_many({"created_at": {"$lt": cutoff_date}})
+            
             return {
                 'tasks_deleted': tasks_deleted.deleted_count,
                 'conversations_deleted': conversations_deleted.deleted_count,
                 'files_deleted': files_deleted.deleted_count,
-                'shares_deleted': shares_deleted.deleted_count
+                'shares_deleted': shares_deleted.deleted_count,
+                'task_events_deleted': events_deleted.deleted_count
             }
             
         except Exception as e:
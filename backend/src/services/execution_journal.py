@@ -0,0 +1,412 @@
+"""
+Execution Journal - Diario durable de la ejecución de planes
+
+execute_plan_with_real_tools ejecuta cada plan en un hilo en segundo plano;
+si el proceso se reiniciaba, la tarea quedaba a medias y al relanzarla se
+repetían todos los pasos (con sus búsquedas, llamadas al LLM y ficheros).
+El diario guarda por tarea un fichero JSONL de solo-añadir, con fsync en
+cada evento:
+
+- task_started: mensaje y plan original
+- step_started / step_completed / step_failed: la salida del paso se guarda
+  en un BlobStore y el diario solo registra su digest
+- call_started / call_completed: cada llamada con efectos (herramienta, LLM,
+  escritura de ficheros) lleva una clave de idempotencia derivada de
+  (tarea, paso, operación, parámetros); si ya se completó, run_once
+  devuelve la salida guardada en lugar de repetirla
+- task_finished: la tarea terminó y su diario puede eliminarse
+
+Al arrancar, incomplete_tasks() devuelve las tareas sin task_finished para
+reanudarlas desde el primer paso incompleto. Un flock por tarea impide que
+dos procesos (workers de gunicorn, réplicas) reanuden la misma tarea.
+"""
+
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from ..utils.blob_store import BlobHandle, BlobStore
+
+logger = logging.getLogger(__name__)
+
+JOURNAL_SUFFIX = '.jsonl'
+LOCK_SUFFIX = '.lock'
+
+# Campos de los pasos que se generan al ejecutar y no forman parte del plan
+RUNTIME_STEP_FIELDS = {'result', 'error', 'status', 'completed', 'active',
+                       'start_time', 'completed_time', 'execution_time'}
+
+
+@dataclass
+class TaskJournalState:
+    """Estado de una tarea reconstruido a partir de su diario"""
+    task_id: str
+    message: str = ''
+    plan: List[Dict[str, Any]] = field(default_factory=list)
+    started_at: Optional[float] = None
+    completed_steps: Dict[str, Dict[str, Any]] = field(default_factory=dict)  # step_id -> BlobHandle
+    failed_steps: Dict[str, str] = field(default_factory=dict)  # step_id -> error
+    running_steps: List[str] = field(default_factory=list)
+    completed_calls: Dict[str, Dict[str, Any]] = field(default_factory=dict)  # clave -> BlobHandle
+    pending_calls: List[str] = field(default_factory=list)
+    finished: bool = False
+    status: Optional[str] = None
+    resumes: int = 0
+
+
+class ExecutionJournal:
+    """Diario por tarea en <root>/<task_id>.jsonl con las salidas en <root>/outputs"""
+
+    def __init__(self, root: str = None):
+        self.root = Path(root or os.getenv('EXECUTION_JOURNAL_DIR', '/tmp/mitosis_execution_journal'))
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.outputs = BlobStore(self.root / 'outputs')
+        self.keep_finished = os.getenv('EXECUTION_JOURNAL_KEEP_FINISHED', 'false').lower() == 'true'
+        self.fsync = os.getenv('EXECUTION_JOURNAL_FSYNC', 'true').lower() == 'true'
+        # Limpiar las salidas huérfanas cada N tareas terminadas (0 = solo al arrancar)
+        self.gc_every = int(os.getenv('EXECUTION_JOURNAL_GC_EVERY', '100'))
+        self._finished_since_gc = 0
+
+        self._lock = threading.Lock()
+        self._claims: Dict[str, int] = {}  # task_id -> descriptor del fichero de bloqueo
+        self._calls: Dict[str, Dict[str, Dict[str, Any]]] = {}  # task_id -> clave -> BlobHandle
+        self.stats = {
+            'events_written': 0,
+            'calls_executed': 0,
+            'calls_reused': 0,
+            'steps_reused': 0,
+            'tasks_resumed': 0
+        }
+
+    # ------------------------------------------------------------------ ficheros
+
+    @staticmethod
+    def _safe_name(task_id: str) -> str:
+        return re.sub(r'[^A-Za-z0-9_.-]', '_', str(task_id))
+
+    def _journal_path(self, task_id: str) -> Path:
+        return self.root / f"{self._safe_name(task_id)}{JOURNAL_SUFFIX}"
+
+    def _lock_path(self, task_id: str) -> Path:
+        return self.root / f"{self._safe_name(task_id)}{LOCK_SUFFIX}"
+
+    def _append(self, task_id: str, event: str, **fields):
+        """Añadir un evento al diario y forzarlo a disco antes de continuar"""
+        line = json.dumps({'event': event, 'task_id': task_id, 'at': time.time(), **fields}, default=str, ensure_ascii=False)
+        try:
+            with self._lock:
+                with open(self._journal_path(task_id), 'a', encoding='utf-8') as f:
+                    f.write(line + '\n')
+                    f.flush()
+                    if self.fsync:
+                        os.fsync(f.fileno())
+                self.stats['events_written'] += 1
+        except OSError as e:
+            # Sin diario la tarea sigue ejecutándose, solo pierde la reanudación
+            logger.error(f"❌ Could not write {event} to execution journal of task {task_id}: {e}")
+
+    def _read_events(self, journal_file: Path) -> List[Dict[str, Any]]:
+        """Eventos del diario en orden; una última línea incompleta (caída a mitad de escritura) se ignora"""
+        events = []
+        with open(journal_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                if not line.endswith('\n'):
+                    logger.warning(f"⚠️ Truncated event at the end of {journal_file.name}, ignoring it")
+                    break
+                try:
+                    events.append(json.loads(line))
+                except json.JSONDecodeError:
+                    logger.warning(f"⚠️ Corrupt event in {journal_file.name}, ignoring it")
+        return events
+
+    @staticmethod
+    def _repair_tail(journal_file: Path):
+        """Recortar una última línea incompleta para que los eventos nuevos no se mezclen con ella"""
+        with open(journal_file, 'rb+') as f:
+            data = f.read()
+            if data and not data.endswith(b'\n'):
+                f.truncate(data.rfind(b'\n') + 1)
+
+    def _store_output(self, value: Any) -> Dict[str, Any]:
+        return asdict(self.outputs.put(value))
+
+    @staticmethod
+    def _read_output(handle: Dict[str, Any]) -> Any:
+        return BlobHandle(**handle).read()
+
+    # ------------------------------------------------------------------ propiedad de la tarea
+
+    def claim(self, task_id: str) -> bool:
+        """
+        Reclamar la ejecución de la tarea para este proceso. Devuelve False
+        si otro hilo o proceso la está ejecutando ya
+        """
+        lock_path = self._lock_path(task_id)
+        with self._lock:
+            if task_id in self._claims:
+                return False
+            while True:
+                fd = os.open(lock_path, os.O_CREAT | os.O_RDWR, 0o644)
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    os.close(fd)
+                    return False
+                # finish_task borra el fichero con el bloqueo tomado: si el que
+                # hemos bloqueado ya no es el de la ruta, reintentar con el nuevo
+                try:
+                    if os.fstat(fd).st_ino == os.stat(lock_path).st_ino:
+                        break
+                except FileNotFoundError:
+                    pass
+                os.close(fd)
+            self._claims[task_id] = fd
+            return True
+
+    def release(self, task_id: str):
+        """Liberar la tarea (el bloqueo también se libera si el proceso muere)"""
+        with self._lock:
+            fd = self._claims.pop(task_id, None)
+        if fd is None:
+            return
+        try:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)
+
+    def is_claimed(self, task_id: str) -> bool:
+        """Comprobar si algún hilo o proceso tiene la tarea reclamada"""
+        if not self.claim(task_id):
+            return True
+        self.release(task_id)
+        return False
+
+    # ------------------------------------------------------------------ ciclo de vida
+
+    def start_task(self, task_id: str, message: str, plan: List[Dict[str, Any]]) -> TaskJournalState:
+        """
+        Abrir el diario de la tarea. Si ya existía (la ejecución se
+        interrumpió) se devuelve el estado registrado para reanudarla
+        """
+        plan_without_results = [
+            {key: value for key, value in step.items() if key not in RUNTIME_STEP_FIELDS}
+            for step in plan
+        ]
+        if self._journal_path(task_id).exists():
+            state = self.load(task_id)
+            if state is not None and not state.finished and self._same_plan(state.plan, plan_without_results):
+                self._repair_tail(self._journal_path(task_id))
+                self._append(task_id, 'task_resumed', completed_steps=list(state.completed_steps))
+                with self._lock:
+                    self._calls[task_id] = dict(state.completed_calls)
+                    self.stats['tasks_resumed'] += 1
+                    self.stats['steps_reused'] += len(state.completed_steps)
+                if state.pending_calls:
+                    logger.warning(f"⚠️ Task {task_id}: {len(state.pending_calls)} calls were interrupted "
+                                   f"before completing and will be executed again")
+                logger.info(f"♻️ Resuming task {task_id} from its execution journal "
+                            f"({len(state.completed_steps)}/{len(state.plan)} steps already completed)")
+                return state
+            # Diario de una ejecución terminada o de otro plan: se empieza uno nuevo
+            self._journal_path(task_id).unlink()
+
+        self._append(task_id, 'task_started', message=message, plan=plan_without_results)
+        with self._lock:
+            self._calls[task_id] = {}
+        return TaskJournalState(task_id=task_id, message=message, plan=plan_without_results,
+                                started_at=time.time())
+
+    @staticmethod
+    def _same_plan(journaled: List[Dict[str, Any]], current: List[Dict[str, Any]]) -> bool:
+        """Las salidas guardadas solo valen si los pasos son los mismos"""
+        def signature(plan):
+            return [(step.get('id'), step.get('title'), step.get('tool')) for step in plan]
+        return signature(journaled) == signature(current)
+
+    def step_started(self, task_id: str, step_id: str):
+        self._append(task_id, 'step_started', step_id=step_id)
+
+    def step_completed(self, task_id: str, step_id: str, output: Any):
+        try:
+            handle = self._store_output(output)
+        except Exception as e:
+            logger.warning(f"⚠️ Output of step {step_id} could not be journaled, it would run again on resume: {e}")
+            return
+        self._append(task_id, 'step_completed', step_id=step_id, output=handle)
+
+    def step_failed(self, task_id: str, step_id: str, error: str):
+        self._append(task_id, 'step_failed', step_id=step_id, error=str(error))
+
+    def finish_task(self, task_id: str, status: str):
+        """Cerrar el diario: la tarea ya no se reanudará"""
+        try:
+            self._append(task_id, 'task_finished', status=status)
+            if not self.keep_finished:
+                self._journal_path(task_id).unlink()
+        except FileNotFoundError:
+            pass
+        finally:
+            with self._lock:
+                self._calls.pop(task_id, None)
+                self._finished_since_gc += 1
+                run_gc = self.gc_every > 0 and self._finished_since_gc >= self.gc_every
+                if run_gc:
+                    self._finished_since_gc = 0
+                # Borrar el fichero de bloqueo antes de soltarlo (claim comprueba el inodo)
+                if task_id in self._claims:
+                    try:
+                        self._lock_path(task_id).unlink()
+                    except FileNotFoundError:
+                        pass
+            self.release(task_id)
+            if run_gc:
+                try:
+                    self.collect_garbage()
+                except Exception as e:
+                    logger.warning(f"⚠️ Execution journal garbage collection failed: {e}")
+
+    # ------------------------------------------------------------------ idempotencia
+
+    @staticmethod
+    def idempotency_key(task_id: str, step_id: str, operation: str, params: Any = None) -> str:
+        """Clave estable de una llamada: SHA-256 de (tarea, paso, operación, parámetros) en JSON canónico"""
+        canonical = json.dumps([task_id, step_id, operation, params], sort_keys=True, default=str, ensure_ascii=False)
+        return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+    def run_once(self, task_id: str, step_id: str, operation: str, params: Any, call: Callable[[], Any]) -> Any:
+        """
+        Ejecutar `call` una sola vez por clave de idempotencia: si una
+        ejecución anterior de la tarea ya la completó, se devuelve la salida
+        guardada sin repetir sus efectos
+        """
+        key = self.idempotency_key(task_id, step_id, operation, params)
+        with self._lock:
+            stored = self._calls.get(task_id, {}).get(key)
+        if stored is not None:
+            try:
+                output = self._read_output(stored)
+                with self._lock:
+                    self.stats['calls_reused'] += 1
+                logger.info(f"♻️ Reusing journaled output of {operation} for step {step_id}")
+                return output
+            except Exception as e:
+                logger.warning(f"⚠️ Journaled output of {operation} is unreadable, executing again: {e}")
+
+        self._append(task_id, 'call_started', step_id=step_id, operation=operation, key=key)
+        output = call()
+        with self._lock:
+            self.stats['calls_executed'] += 1
+        try:
+            handle = self._store_output(output)
+        except Exception as e:
+            logger.warning(f"⚠️ Output of {operation} could not be journaled, it would run again on resume: {e}")
+            return output
+        self._append(task_id, 'call_completed', step_id=step_id, operation=operation, key=key, output=handle)
+        with self._lock:
+            self._calls.setdefault(task_id, {})[key] = handle
+        return output
+
+    # ------------------------------------------------------------------ recuperación
+
+    def load(self, task_id: str) -> Optional[TaskJournalState]:
+        """Reconstruir el estado de la tarea reproduciendo su diario"""
+        journal_file = self._journal_path(task_id)
+        if not journal_file.exists():
+            return None
+        return self._replay(task_id, self._read_events(journal_file))
+
+    @staticmethod
+    def _replay(task_id: str, events: List[Dict[str, Any]]) -> Optional[TaskJournalState]:
+        if not events or events[0].get('event') != 'task_started':
+            return None
+        state = TaskJournalState(task_id=task_id, message=events[0].get('message', ''),
+                                 plan=events[0].get('plan', []), started_at=events[0].get('at'))
+        for event in events[1:]:
+            kind = event.get('event')
+            step_id = event.get('step_id')
+            if kind == 'step_started':
+                state.failed_steps.pop(step_id, None)
+                if step_id not in state.running_steps:
+                    state.running_steps.append(step_id)
+            elif kind == 'step_completed':
+                state.completed_steps[step_id] = event['output']
+                if step_id in state.running_steps:
+                    state.running_steps.remove(step_id)
+            elif kind == 'step_failed':
+                state.failed_steps[step_id] = event.get('error', '')
+                if step_id in state.running_steps:
+                    state.running_steps.remove(step_id)
+            elif kind == 'call_started':
+                state.pending_calls.append(event['key'])
+            elif kind == 'call_completed':
+                state.completed_calls[event['key']] = event['output']
+                if event['key'] in state.pending_calls:
+                    state.pending_calls.remove(event['key'])
+            elif kind == 'task_resumed':
+                state.resumes += 1
+            elif kind == 'task_finished':
+                state.finished = True
+                state.status = event.get('status')
+        return state
+
+    def completed_outputs(self, state: TaskJournalState) -> Dict[str, Any]:
+        """Salidas de los pasos ya completados (los blobs ilegibles se vuelven a ejecutar)"""
+        outputs = {}
+        for step_id, handle in state.completed_steps.items():
+            try:
+                outputs[step_id] = self._read_output(handle)
+            except Exception as e:
+                logger.warning(f"⚠️ Output of step {step_id} is missing from the journal store, it will run again: {e}")
+        return outputs
+
+    def incomplete_tasks(self) -> List[TaskJournalState]:
+        """Tareas con diario sin task_finished (interrumpidas por un reinicio)"""
+        states = []
+        for journal_file in sorted(self.root.glob(f"*{JOURNAL_SUFFIX}")):
+            try:
+                events = self._read_events(journal_file)
+            except Exception as e:
+                logger.error(f"Error reading execution journal {journal_file.name}: {e}")
+                continue
+            task_id = events[0].get('task_id', journal_file.stem) if events else journal_file.stem
+            state = self._replay(task_id, events)
+            if state is not None and not state.finished:
+                states.append(state)
+        return states
+
+    def collect_garbage(self, max_age_seconds: float = 7 * 24 * 3600) -> int:
+        """Eliminar salidas que ya no referencia ningún diario abierto"""
+        live = set()
+        for state in self.incomplete_tasks():
+            live.update(handle['digest'] for handle in state.completed_steps.values())
+            live.update(handle['digest'] for handle in state.completed_calls.values())
+        return self.outputs.collect_garbage(max_age_seconds, live)
+
+    def get_statistics(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.stats, claimed_tasks=len(self._claims))
+        stats['open_journals'] = len(list(self.root.glob(f"*{JOURNAL_SUFFIX}")))
+        stats['outputs'] = self.outputs.get_statistics()
+        return stats
+
+
+_execution_journal_instance: Optional[ExecutionJournal] = None
+_execution_journal_lock = threading.Lock()
+
+
+def get_execution_journal() -> ExecutionJournal:
+    """Obtener instancia singleton del diario de ejecución"""
+    global _execution_journal_instance
+    if _execution_journal_instance is None:
+        with _execution_journal_lock:
+            if _execution_journal_instance is None:
+                _execution_journal_instance = ExecutionJournal()
+    return _execution_journal_instance
@@ -9,6 +9,7 @@ import os
 from typing import Dict, List, Optional, Any
 import requests
 from requests.exceptions import RequestException, Timeout
+from ..monitoring.tracing import get_tracer, traced
 
 class OllamaService:
     def __init__(self, base_url: str = None):
@@ -17,10 +18,24 @@ class OllamaService:
         self.current_model = None
         self.conversation_history = []
         self.request_timeout = 90  # Timeout aumentado para planes dinámicos complejos
-        
-        
+        # Resultado del último health check; evita un GET /api/tags por cada
+        # clasificación, plan y respuesta de una misma petición
+        self.health_ttl = float(os.getenv('OLLAMA_HEALTH_TTL', '5'))
+        self._health_checked_at = 0.0
+        self._healthy = False
+        # None hasta saber si el servidor acepta un esquema JSON en 'format'
+        self._schema_format_supported: Optional[bool] = None
+
     def is_healthy(self) -> bool:
-        """Verificar si Ollama está disponible"""
+        """Verificar si Ollama está disponible (cacheado durante health_ttl segundos)"""
+        if time.time() - self._health_checked_at < self.health_ttl:
+            return self._healthy
+        self._healthy = self._check_health()
+        self._health_checked_at = time.time()
+        return self._healthy
+        
+    @traced('ollama.is_healthy')
+    def _check_health(self) -> bool:
         try:
             response = requests.get(f"{self.base_url}/api/tags", timeout=5)
             return response.status_code == 200
@@ -87,6 +102,7 @@ class OllamaService:
         """Obtener el modelo actual"""
         return self.current_model or self.default_model
     
+    @traced('ollama.generate_casual_response')
     def generate_casual_response(self, prompt: str, context: Dict = None) -> Dict[str, Any]:
         """
         Generar respuesta casual usando Ollama (sin planes ni herramientas)
@@ -147,6 +163,7 @@ class OllamaService:
                 'error': str(e)
             }
 
+    @traced('ollama.generate_response', lambda args: {'llm.use_tools': args['use_tools']})
     def generate_response(self, prompt: str, context: Dict = None, use_tools: bool = True) -> Dict[str, Any]:
         """
         Generar respuesta usando Ollama real
@@ -208,8 +225,101 @@ class OllamaService:
                 'error': str(e)
             }
     
+    @traced('ollama.generate_structured')
+    def generate_structured(self, prompt: str, schema: Dict[str, Any] = None,
+                            options: Dict[str, Any] = None) -> Dict[str, Any]:
+        """
+        Generar una respuesta JSON con salida restringida por Ollama
+
+        Envía el esquema en 'format' (Ollama >= 0.5); si el servidor no lo
+        admite se recuerda y se usa format: "json". OLLAMA_STRUCTURED_OUTPUT
+        fuerza el modo: 'schema' (por defecto), 'json' u 'off'.
+
+        Returns:
+            Dict con 'response' (texto JSON), 'format' usado y 'error' si falla
+        """
+        if not self.is_healthy():
+            return {'response': '', 'format': None, 'error': 'Ollama no disponible'}
+
+        mode = os.getenv('OLLAMA_STRUCTURED_OUTPUT', 'schema').lower()
+        if mode == 'schema' and schema is not None and self._schema_format_supported is not False:
+            output_format = schema
+        elif mode == 'off':
+            output_format = None
+        else:
+            output_format = 'json'
+
+        payload = {
+            "model": self.get_current_model(),
+            "prompt": prompt,
+            "stream": False,
+            "options": {
+                "temperature": 0.2,
+                "top_p": 0.8,
+                "top_k": 20,
+                "repeat_penalty": 1.1,
+                **(options or {})
+            }
+        }
+        if output_format is not None:
+            payload["format"] = output_format
+
+        with get_tracer().span('ollama.api.generate', {
+            'llm.model': self.get_current_model(),
+            'llm.prompt_chars': len(prompt),
+            'llm.format': 'schema' if isinstance(output_format, dict) else output_format
+        }) as span:
+            try:
+                response = requests.post(f"{self.base_url}/api/generate", json=payload, timeout=self.request_timeout)
+                if response.status_code == 400 and isinstance(output_format, dict):
+                    # Versión de Ollama sin esquemas en 'format': degradar a modo JSON
+                    self._schema_format_supported = False
+                    payload["format"] = output_format = 'json'
+                    response = requests.post(f"{self.base_url}/api/generate", json=payload, timeout=self.request_timeout)
+                if response.status_code != 200:
+                    result = {'error': f"HTTP {response.status_code}: {response.text}"}
+                else:
+                    result = response.json()
+                    if isinstance(output_format, dict):
+                        self._schema_format_supported = True
+            except Timeout:
+                result = {'error': f"Timeout después de {self.request_timeout} segundos"}
+            except RequestException as e:
+                result = {'error': f"Error de conexión: {str(e)}"}
+            except Exception as e:
+                result = {'error': f"Error inesperado: {str(e)}"}
+
+            span.set_attributes({
+                'llm.prompt_tokens': result.get('prompt_eval_count'),
+                'llm.completion_tokens': result.get('eval_count'),
+                'llm.error': result.get('error')
+            })
+
+        return {
+            'response': result.get('response', ''),
+            'format': 'schema' if isinstance(output_format, dict) else output_format,
+            'done_reason': result.get('done_reason'),
+            'model': self.get_current_model(),
+            'timestamp': time.time(),
+            **({'error': result['error']} if result.get('error') else {})
+        }
+
     def _call_ollama_api(self, prompt: str) -> Dict[str, Any]:
         """Hacer llamada real a la API de Ollama con parámetros optimizados"""
+        with get_tracer().span('ollama.api.generate', {
+            'llm.model': self.get_current_model(),
+            'llm.prompt_chars': len(prompt)
+        }) as span:
+            result = self._post_generate(prompt)
+            span.set_attributes({
+                'llm.prompt_tokens': result.get('prompt_eval_count'),
+                'llm.completion_tokens': result.get('eval_count'),
+                'llm.error': result.get('error')
+            })
+            return result
+    
+    def _post_generate(self, prompt: str) -> Dict[str, Any]:
+        """Enviar la petición de generación no-streaming a Ollama"""
         try:
             # Detectar si es una solicitud de JSON estructurado
             is_json_request = 'JSON' in prompt or 'json' in prompt or '"steps"' in prompt
@@ -458,7 +568,8 @@ Herramientas disponibles:
         
         return full_prompt
     
-    def chat_streaming(self, prompt: str, context: Dict = None, use_tools: bool = True):
+    def chat_streaming(self, prompt: str, context: Dict = None, use_tools: bool = True,
+                       conversation_mode: bool = False):
         """
         Generar respuesta streaming usando Ollama
         Devuelve un generator que produce chunks de respuesta
@@ -472,7 +583,7 @@ Herramientas disponibles:
             return
         
         try:
-            system_prompt = self._build_system_prompt(use_tools, conversation_mode=False)
+            system_prompt = self._build_system_prompt(use_tools, conversation_mode=conversation_mode)
             full_prompt = self._build_full_prompt(prompt, context, system_prompt)
             
             payload = {
@@ -0,0 +1,467 @@
+"""
+Task Executor - Pool acotado de workers con control de admisión
+
+Las ejecuciones en segundo plano (planes del chat, fases paralelas) lanzaban
+un threading.Thread nuevo por tarea: una ráfaga de peticiones creaba cientos
+de hilos compitiendo por Ollama, navegadores y red. El ejecutor central:
+
+- Un número fijo de workers (TASK_EXECUTOR_WORKERS)
+- Cola con prioridad y reparto justo entre usuarios: weighted fair queueing
+  con un flujo por usuario y la prioridad como peso (como la admisión de
+  ResourceManager), así un usuario con muchas tareas no bloquea al resto
+- Posición en cola y ETA estimada con la duración media de cada tipo de trabajo
+- Política de sobrecarga (TASK_EXECUTOR_OVERLOAD_POLICY) cuando la cola o la
+  cuota por usuario están llenas: 'reject' lanza TaskExecutorOverloaded con
+  un retry_after; 'defer' acepta el trabajo en una cola diferida que solo
+  avanza cuando la principal tiene hueco
+- Los trabajos con kind + payload serializable se guardan en disco y, tras
+  un reinicio, pending_from_previous_run() los devuelve para relanzarlos. El
+  fichero lo escribe un hilo propio con una instantánea tomada bajo el lock,
+  así los workers no esperan a la E/S de disco
+"""
+
+import heapq
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+OVERLOAD_REJECT = 'reject'
+OVERLOAD_DEFER = 'defer'
+
+# Estados en los que un trabajo sigue pendiente de ejecutarse
+WAITING_STATUSES = ('queued', 'deferred')
+
+
+class TaskExecutorOverloaded(Exception):
+    """La cola (o la cuota del usuario) está llena y la política es rechazar"""
+
+    def __init__(self, message: str, reason: str, retry_after: float):
+        super().__init__(message)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+@dataclass
+class ExecutorJob:
+    """Trabajo enviado al ejecutor"""
+    job_id: str
+    func: Callable[[], Any]
+    user_id: str
+    priority: int
+    kind: str
+    payload: Optional[Dict[str, Any]] = None
+    submitted_at: float = field(default_factory=time.time)
+    sequence: int = 0
+    virtual_finish: float = 0.0
+    status: str = 'queued'  # queued, deferred, running, completed, failed, cancelled
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    error: Optional[str] = None
+    future: Future = field(default_factory=Future)
+
+    def to_record(self) -> Dict[str, Any]:
+        """Descriptor serializable (sin la función) para la cola persistente"""
+        return {
+            'job_id': self.job_id,
+            'kind': self.kind,
+            'payload': self.payload,
+            'user_id': self.user_id,
+            'priority': self.priority,
+            'submitted_at': self.submitted_at,
+            'status': self.status
+        }
+
+
+class TaskExecutor:
+    """Workers fijos que consumen una cola justa por usuario"""
+
+    def __init__(self, workers: int = None, max_queue: int = None, max_queue_per_user: int = None,
+                 overload_policy: str = None, state_file: str = None):
+        self.workers = max(1, workers or int(os.getenv('TASK_EXECUTOR_WORKERS', '4')))
+        self.max_queue = max_queue or int(os.getenv('TASK_EXECUTOR_MAX_QUEUE', '100'))
+        self.max_queue_per_user = max_queue_per_user or int(os.getenv('TASK_EXECUTOR_MAX_QUEUE_PER_USER', '10'))
+        self.max_deferred = int(os.getenv('TASK_EXECUTOR_MAX_DEFERRED', '500'))
+        self.overload_policy = (overload_policy or os.getenv('TASK_EXECUTOR_OVERLOAD_POLICY', OVERLOAD_REJECT)).lower()
+        self.default_duration = float(os.getenv('TASK_EXECUTOR_DEFAULT_DURATION', '60'))
+        self.state_file = Path(state_file or os.getenv('TASK_EXECUTOR_STATE_FILE', '/tmp/mitosis_task_queue.json'))
+
+        self._lock = threading.Condition()
+        self._queue: List[tuple] = []  # (virtual_finish, sequence, job)
+        self._deferred: List[tuple] = []  # (-priority, sequence, job)
+        self._jobs: Dict[str, ExecutorJob] = {}
+        self._queued_per_user: Dict[str, int] = defaultdict(int)
+        self._queued = 0
+        self._running = 0
+        self._virtual_time = 0.0
+        self._flow_finish: Dict[str, float] = {}
+        self._sequence = itertools.count()
+        self._durations: Dict[str, float] = {}  # kind -> duración media (EWMA)
+        self._threads: List[threading.Thread] = []
+        self._worker_state = threading.local()
+        self._stopping = False
+        self._persist_wakeup = threading.Event()
+        self._persist_thread: Optional[threading.Thread] = None
+        self._write_lock = threading.Lock()
+
+        self._recovered = self._load_state()
+        self.stats = {
+            'submitted': 0,
+            'completed': 0,
+            'failed': 0,
+            'cancelled': 0,
+            'rejected': 0,
+            'deferred': 0,
+            'run_inline': 0,
+            'max_queue_depth': 0,
+            'total_wait_time': 0.0,
+            'max_wait_time': 0.0
+        }
+
+    # ------------------------------------------------------------------ ciclo de vida
+
+    def start(self) -> 'TaskExecutor':
+        """Arrancar los workers (idempotente)"""
+        with self._lock:
+            if self._threads:
+                return self
+            self._stopping = False
+            for index in range(self.workers):
+                thread = threading.Thread(target=self._worker, name=f'mitosis-task-worker-{index}', daemon=True)
+                self._threads.append(thread)
+                thread.start()
+        logger.info(f"👷 Task executor started ({self.workers} workers, queue {self.max_queue}, "
+                    f"{self.max_queue_per_user} per user, overload policy '{self.overload_policy}')")
+        return self
+
+    def shutdown(self, wait: bool = False, timeout: float = 5.0):
+        """Detener los workers; los trabajos en cola quedan guardados para el próximo arranque"""
+        with self._lock:
+            self._stopping = True
+            self._lock.notify_all()
+            threads, self._threads = self._threads, []
+        if wait:
+            for thread in threads:
+                thread.join(timeout=timeout)
+        self._write_state()
+
+    # ------------------------------------------------------------------ envío
+
+    def submit(self, job_id: str, func: Callable[[], Any], user_id: str = None, priority: int = 1,
+               kind: str = 'task', payload: Dict[str, Any] = None, enforce_limits: bool = True) -> ExecutorJob:
+        """
+        Encolar un trabajo
+
+        Args:
+            job_id: Identificador (un job_id en cola o en ejecución no se duplica)
+            func: Función sin argumentos que ejecuta el trabajo
+            user_id: Flujo para el reparto justo
+            priority: Peso en el reparto (mayor = más cuota)
+            kind: Tipo de trabajo (duración media para la ETA)
+            payload: Descriptor serializable para relanzarlo tras un reinicio
+            enforce_limits: False para trabajos internos de una tarea ya admitida
+
+        Raises:
+            TaskExecutorOverloaded: Si la cola está llena y la política es 'reject'
+        """
+        user_id = user_id or 'anonymous'
+        with self._lock:
+            existing = self._jobs.get(job_id)
+            if existing is not None and existing.status in WAITING_STATUSES + ('running',):
+                return existing
+
+            job = ExecutorJob(job_id=job_id, func=func, user_id=user_id, priority=max(1, int(priority)),
+                              kind=kind, payload=payload, sequence=next(self._sequence))
+            overload = self._overload_reason(user_id) if enforce_limits else None
+            if overload and (self.overload_policy != OVERLOAD_DEFER or len(self._deferred) >= self.max_deferred):
+                self.stats['rejected'] += 1
+                retry_after = self._estimate_drain_time()
+                logger.warning(f"🚫 Task executor overloaded ({overload}), rejecting job {job_id} from {user_id}")
+                raise TaskExecutorOverloaded(f"Task queue is full ({overload})", overload, retry_after)
+
+            self._jobs[job_id] = job
+            self.stats['submitted'] += 1
+            if overload:
+                job.status = 'deferred'
+                heapq.heappush(self._deferred, (-job.priority, job.sequence, job))
+                self.stats['deferred'] += 1
+                logger.info(f"⏸️ Job {job_id} deferred ({overload})")
+            else:
+                self._enqueue(job)
+            self._persist()
+            self._lock.notify()
+
+        self.start()
+        return job
+
+    def _overload_reason(self, user_id: str) -> Optional[str]:
+        if self._queued >= self.max_queue:
+            return 'queue_full'
+        if self._queued_per_user[user_id] >= self.max_queue_per_user:
+            return 'user_quota'
+        return None
+
+    def _enqueue(self, job: ExecutorJob):
+        """Calcular la etiqueta de fin virtual del trabajo en el flujo de su usuario"""
+        start = max(self._virtual_time, self._flow_finish.get(job.user_id, 0.0))
+        job.virtual_finish = start + 1.0 / job.priority
+        self._flow_finish[job.user_id] = job.virtual_finish
+        job.status = 'queued'
+        heapq.heappush(self._queue, (job.virtual_finish, job.sequence, job))
+        self._queued += 1
+        self._queued_per_user[job.user_id] += 1
+        self.stats['max_queue_depth'] = max(self.stats['max_queue_depth'], self._queued)
+
+    def _promote_deferred(self):
+        """Pasar trabajos diferidos a la cola principal mientras haya hueco"""
+        while self._deferred and self._queued < self.max_queue:
+            _, _, job = heapq.heappop(self._deferred)
+            if job.status == 'deferred':
+                self._enqueue(job)
+
+    def _mark_dequeued(self, job: ExecutorJob):
+        self._queued -= 1
+        self._queued_per_user[job.user_id] -= 1
+        if self._queued_per_user[job.user_id] <= 0:
+            del self._queued_per_user[job.user_id]
+
+    def cancel(self, job_id: str) -> bool:
+        """Cancelar un trabajo que aún no ha empezado"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.status not in WAITING_STATUSES:
+                return False
+            if job.status == 'queued':
+                self._mark_dequeued(job)
+            job.status = 'cancelled'
+            job.finished_at = time.time()
+            job.future.cancel()
+            self.stats['cancelled'] += 1
+            # Como los terminados: se olvida (las colas lo saltan por su estado)
+            del self._jobs[job_id]
+            self._promote_deferred()
+            self._persist()
+        return True
+
+    # ------------------------------------------------------------------ ejecución
+
+    def _next_job(self) -> Optional[ExecutorJob]:
+        while self._queue:
+            virtual_finish, _, job = heapq.heappop(self._queue)
+            if job.status != 'queued':
+                continue  # cancelado o ejecutado en línea por quien lo esperaba
+            self._virtual_time = max(self._virtual_time, virtual_finish)
+            self._mark_dequeued(job)
+            return job
+        return None
+
+    def _worker(self):
+        self._worker_state.is_worker = True
+        while True:
+            with self._lock:
+                job = self._next_job()
+                while job is None and not self._stopping:
+                    self._lock.wait()
+                    job = self._next_job()
+                if job is None:
+                    return
+                self._begin(job)
+            self._run(job)
+
+    def _begin(self, job: ExecutorJob):
+        job.status = 'running'
+        job.started_at = time.time()
+        self._running += 1
+        wait_time = job.started_at - job.submitted_at
+        self.stats['total_wait_time'] += wait_time
+        self.stats['max_wait_time'] = max(self.stats['max_wait_time'], wait_time)
+        self._promote_deferred()
+        self._persist()
+
+    def _run(self, job: ExecutorJob):
+        if not job.future.set_running_or_notify_cancel():
+            return
+        try:
+            result = job.func()
+        except BaseException as e:
+            logger.error(f"❌ Job {job.job_id} ({job.kind}) failed: {e}")
+            self._finish(job, 'failed', str(e))
+            job.future.set_exception(e)
+            return
+        self._finish(job, 'completed')
+        job.future.set_result(result)
+
+    def _finish(self, job: ExecutorJob, status: str, error: str = None):
+        with self._lock:
+            job.status = status
+            job.error = error
+            job.finished_at = time.time()
+            self._running -= 1
+            self.stats[status] += 1
+            duration = job.finished_at - job.started_at
+            previous = self._durations.get(job.kind)
+            self._durations[job.kind] = duration if previous is None else 0.8 * previous + 0.2 * duration
+            # Los trabajos terminados se olvidan; el resultado queda en su future
+            if self._jobs.get(job.job_id) is job:
+                del self._jobs[job.job_id]
+            self._persist()
+
+    def wait_all(self, jobs: List[ExecutorJob], timeout: float = None) -> List[Any]:
+        """
+        Esperar a varios trabajos y devolver sus resultados en orden. Si quien
+        espera es un worker, ejecuta en línea los que siguen en cola para no
+        bloquear el pool esperando trabajo que necesita un worker libre
+        """
+        if getattr(self._worker_state, 'is_worker', False):
+            for job in jobs:
+                with self._lock:
+                    if job.status != 'queued':
+                        continue
+                    self._mark_dequeued(job)
+                    self._begin(job)
+                    self.stats['run_inline'] += 1
+                self._run(job)
+        return [job.future.result(timeout=timeout) for job in jobs]
+
+    # ------------------------------------------------------------------ posición y ETA
+
+    def _expected_duration(self, kind: str) -> float:
+        return self._durations.get(kind, self.default_duration)
+
+    def _running_remaining(self) -> float:
+        now = time.time()
+        return sum(max(0.0, self._expected_duration(job.kind) - (now - job.started_at))
+                   for job in self._jobs.values() if job.status == 'running')
+
+    def _estimate_drain_time(self) -> float:
+        """Tiempo estimado hasta que la cola actual se vacíe"""
+        queued_work = sum(self._expected_duration(job.kind) for _, _, job in self._queue if job.status == 'queued')
+        return round((queued_work + self._running_remaining()) / self.workers, 1)
+
+    def position(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Estado, posición en cola (1 = el siguiente) y ETA estimada de inicio"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            info = {
+                'job_id': job_id,
+                'status': job.status,
+                'kind': job.kind,
+                'user_id': job.user_id,
+                'submitted_at': job.submitted_at,
+                'queue_length': self._queued,
+                'deferred_length': len(self._deferred),
+                'workers': self.workers
+            }
+            if job.status == 'running':
+                info.update(position=0, eta_seconds=0.0, started_at=job.started_at)
+                return info
+            if job.status not in WAITING_STATUSES:
+                return info
+
+            order = sorted((entry for entry in self._queue if entry[2].status == 'queued'), key=lambda entry: entry[:2])
+            if job.status == 'deferred':
+                order.extend(sorted((entry for entry in self._deferred if entry[2].status == 'deferred'),
+                                    key=lambda entry: entry[:2]))
+            ahead = list(itertools.takewhile(lambda entry: entry[2] is not job, order))
+            ahead_work = sum(self._expected_duration(entry[2].kind) for entry in ahead)
+            # Empieza cuando haya un worker libre tras lo que va delante
+            eta = 0.0 if self._running + len(ahead) < self.workers else (ahead_work + self._running_remaining()) / self.workers
+            info.update(position=len(ahead) + 1, eta_seconds=round(eta, 1))
+            return info
+
+    # ------------------------------------------------------------------ persistencia
+
+    def _persist(self):
+        """Pedir que se guarden los trabajos pendientes (llamar con el lock; no escribe)"""
+        if self._persist_thread is None:
+            self._persist_thread = threading.Thread(target=self._persist_loop, name='mitosis-task-queue-writer',
+                                                    daemon=True)
+            self._persist_thread.start()
+        self._persist_wakeup.set()
+
+    def _persist_loop(self):
+        while True:
+            self._persist_wakeup.wait()
+            self._persist_wakeup.clear()
+            self._write_state()
+
+    def _write_state(self):
+        """Escribir una instantánea de los descriptores pendientes; la E/S va fuera del lock"""
+        with self._write_lock:
+            with self._lock:
+                records = [job.to_record() for job in self._jobs.values()
+                           if job.payload is not None and job.status in WAITING_STATUSES + ('running',)]
+                records.extend(self._recovered)
+            try:
+                temp_file = self.state_file.with_name(self.state_file.name + '.tmp')
+                with open(temp_file, 'w', encoding='utf-8') as f:
+                    json.dump(records, f, default=str)
+                os.replace(temp_file, self.state_file)
+            except OSError as e:
+                logger.error(f"❌ Could not persist task queue: {e}")
+
+    def _load_state(self) -> List[Dict[str, Any]]:
+        try:
+            with open(self.state_file, 'r', encoding='utf-8') as f:
+                records = json.load(f)
+        except FileNotFoundError:
+            return []
+        except Exception as e:
+            logger.error(f"❌ Could not read persisted task queue: {e}")
+            return []
+        if records:
+            logger.info(f"📥 {len(records)} background jobs pending from the previous run")
+        return records
+
+    def pending_from_previous_run(self, kind: str = None) -> List[Dict[str, Any]]:
+        """
+        Descriptores de los trabajos que quedaron en cola o en ejecución al
+        parar el proceso anterior (se devuelven una sola vez)
+        """
+        with self._lock:
+            taken = [record for record in self._recovered if kind is None or record.get('kind') == kind]
+            self._recovered = [record for record in self._recovered if record not in taken]
+            self._persist()
+        return sorted(taken, key=lambda record: record.get('submitted_at', 0))
+
+    def get_statistics(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.stats)
+            started = stats['completed'] + stats['failed'] + self._running
+            stats.update(
+                workers=self.workers,
+                overload_policy=self.overload_policy,
+                queued=self._queued,
+                deferred_queued=sum(1 for entry in self._deferred if entry[2].status == 'deferred'),
+                running=self._running,
+                queued_per_user=dict(self._queued_per_user),
+                avg_wait_time=stats['total_wait_time'] / started if started else 0.0,
+                avg_duration_by_kind={kind: round(value, 2) for kind, value in self._durations.items()},
+                estimated_drain_seconds=self._estimate_drain_time()
+            )
+        return stats
+
+
+_task_executor_instance: Optional[TaskExecutor] = None
+_task_executor_lock = threading.Lock()
+
+
+def get_task_executor() -> TaskExecutor:
+    """Obtener instancia singleton del ejecutor de tareas en segundo plano"""
+    global _task_executor_instance
+    if _task_executor_instance is None:
+        with _task_executor_lock:
+            if _task_executor_instance is None:
+                _task_executor_instance = TaskExecutor()
+    return _task_executor_instance
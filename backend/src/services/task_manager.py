@@ -6,21 +6,54 @@ Centraliza la gestión de tareas migrando del almacenamiento en memoria a MongoD
 para garantizar resiliencia y capacidad de recuperación.
 """
 
+import atexit
+import copy
 import logging
+import os
+import threading
+import time
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Any
 import json
 import uuid
 from .database import DatabaseService
+from .task_state_cache import TaskStateCache
 
 logger = logging.getLogger(__name__)
 
+# Estados que fuerzan el volcado inmediato de la tarea
+TERMINAL_TASK_STATUSES = {'completed', 'failed', 'cancelled', 'error'}
+
 class TaskManager:
     """Gestor centralizado de tareas con persistencia en MongoDB"""
     
-    def __init__(self, db_service: DatabaseService = None):
+    def __init__(self, db_service: DatabaseService = None, flush_interval: float = None):
         self.db_service = db_service or DatabaseService()
-        self.active_cache = {}  # Caché de corta duración para reducir latencia
+        # Caché acotada (LRU+TTL) y versionada; al desalojar una tarea sucia
+        # se vuelcan sus escrituras pendientes
+        self.active_cache = TaskStateCache('task_manager', on_evict=self._write_back_evicted)
+        
+        # Buffer write-behind: task_id -> {'fields': {...}, 'steps': {step_id: {...}}, 'since': ts}
+        # Con flush_interval <= 0 las escrituras son inmediatas (write-through)
+        self.flush_interval = (
+            flush_interval if flush_interval is not None
+            else float(os.getenv('TASK_WRITE_BEHIND_INTERVAL', '0.5'))
+        )
+        self._pending_writes: Dict[str, Dict[str, Any]] = {}
+        self._write_lock = threading.RLock()
+        self._flush_lock = threading.Lock()  # Serializa escrituras para no reordenarlas
+        self.max_flush_attempts = 3
+        self._flush_wakeup = threading.Event()
+        self._flusher_thread: Optional[threading.Thread] = None
+        self._shutting_down = False
+        self.write_stats = {
+            'updates_received': 0,
+            'db_writes': 0,
+            'failed_writes': 0,
+            'terminal_flushes': 0
+        }
+        atexit.register(self.shutdown)
+        
         logger.info("✅ TaskManager initialized with MongoDB persistence")
     
     def create_task(self, task_id: str, task_data: Dict[str, Any]) -> bool:
@@ -61,7 +94,7 @@ class TaskManager:
             
             if result:
                 # Actualizar caché
-                self.active_cache[task_id] = task_document
+                self.active_cache.set(task_id, task_document, dirty=False)
                 logger.info(f"✅ Task {task_id} created and persisted to MongoDB")
                 return True
             else:
@@ -83,19 +116,24 @@ class TaskManager:
             Dict con datos de la tarea o None si no existe
         """
         try:
-            # Verificar caché primero
-            if task_id in self.active_cache:
+            # Verificar caché primero (copia independiente de la versión actual)
+            cached = self.active_cache.snapshot(task_id)
+            if cached is not None:
                 logger.debug(f"📱 Task {task_id} retrieved from cache")
-                return self.active_cache[task_id].copy()
+                return cached
+            
+            # Asegurar que MongoDB refleja los cambios aún en el buffer
+            if task_id in self._pending_writes:
+                self.flush_task(task_id)
             
             # Buscar en MongoDB
             task_data = self.db_service.get_task(task_id)
             
             if task_data:
-                # Actualizar caché
-                self.active_cache[task_id] = task_data
+                # Actualizar caché (guarda su propia copia)
+                self.active_cache.set(task_id, task_data, dirty=False)
                 logger.debug(f"📥 Task {task_id} retrieved from MongoDB and cached")
-                return task_data.copy()
+                return task_data
             else:
                 logger.warning(f"⚠️ Task {task_id} not found in database")
                 return None
@@ -106,7 +144,10 @@ class TaskManager:
     
     def update_task(self, task_id: str, updates: Dict[str, Any]) -> bool:
         """
-        Actualizar tarea en MongoDB y caché
+        Actualizar tarea en caché y encolar la escritura en MongoDB
+        
+        Las actualizaciones se agrupan por tarea y se vuelcan en una sola
+        escritura cada flush_interval, o de inmediato en estados terminales.
         
         Args:
             task_id: ID de la tarea
@@ -119,83 +160,242 @@ class TaskManager:
             # Agregar timestamp de actualización
             updates['updated_at'] = datetime.now()
             
-            # Actualizar en MongoDB
-            success = self.db_service.update_task(task_id, updates)
+            # Copia única compartida por caché y buffer (ninguno la modifica in situ)
+            updates = copy.deepcopy(updates)
             
-            if success:
-                # Actualizar caché si existe
-                if task_id in self.active_cache:
-                    self.active_cache[task_id].update(updates)
+            with self._write_lock:
+                # Publicar nueva versión en caché si existe
+                self.active_cache.update_entry(task_id, updates, copy_values=False)
                 
-                logger.debug(f"✅ Task {task_id} updated successfully")
-                return True
-            else:
-                logger.error(f"❌ Failed to update task {task_id} in MongoDB")
-                return False
+                pending = self._get_pending_write(task_id)
+                if 'plan' in updates:
+                    # El plan completo sustituye a los cambios por paso pendientes
+                    pending['steps'].clear()
+                pending['fields'].update(updates)
+                self.write_stats['updates_received'] += 1
+            
+            if updates.get('status') in TERMINAL_TASK_STATUSES:
+                self.write_stats['terminal_flushes'] += 1
+                return self.flush_task(task_id)
+            
+            return self._schedule_flush(task_id)
                 
         except Exception as e:
             logger.error(f"❌ Error updating task {task_id}: {str(e)}")
             return False
     
     def update_task_step_status(self, task_id: str, step_id: str, new_status: str, 
-                              result_summary: str = None, error: str = None) -> bool:
+                              result_summary: str = None, error: str = None,
+                              extra_fields: Dict[str, Any] = None) -> bool:
         """
         Actualizar estado específico de un paso de tarea
         
+        Solo se persiste el delta del paso ($set sobre plan.$[elem]), nunca el
+        plan completo.
+        
         Args:
             task_id: ID de la tarea
             step_id: ID del paso
             new_status: Nuevo estado del paso
             result_summary: Resumen del resultado (opcional)
             error: Mensaje de error (opcional)
+            extra_fields: Otros campos del paso a persistir (opcional)
             
         Returns:
             bool: True si se actualizó exitosamente
         """
         try:
-            # Obtener tarea actual
-            task_data = self.get_task(task_id)
-            if not task_data:
-                logger.error(f"❌ Task {task_id} not found for step update")
-                return False
-            
-            # Actualizar el paso específico
-            plan = task_data.get('plan', [])
-            step_updated = False
-            
-            for step in plan:
-                if step.get('id') == step_id:
-                    step['status'] = new_status
-                    step['updated_at'] = datetime.now().isoformat()
-                    
-                    if result_summary:
-                        step['result_summary'] = result_summary
-                    if error:
-                        step['error'] = error
-                    if new_status == 'completed':
-                        step['completed'] = True
-                        step['completed_at'] = datetime.now().isoformat()
-                    elif new_status == 'failed':
-                        step['completed'] = False
-                    
-                    step_updated = True
-                    break
-            
-            if step_updated:
-                # Actualizar toda la tarea con el plan modificado
-                updates = {
-                    'plan': plan,
-                    'updated_at': datetime.now()
-                }
-                return self.update_task(task_id, updates)
-            else:
-                logger.warning(f"⚠️ Step {step_id} not found in task {task_id}")
-                return False
+            now = datetime.now()
+            delta = dict(extra_fields or {})
+            delta['status'] = new_status
+            delta['updated_at'] = now.isoformat()
+            
+            if result_summary:
+                delta['result_summary'] = result_summary
+            if error:
+                delta['error'] = error
+            if new_status == 'completed':
+                delta['completed'] = True
+                delta['completed_at'] = now.isoformat()
+            elif new_status == 'failed':
+                delta['completed'] = False
+            
+            delta = copy.deepcopy(delta)
+            
+            # Obtener tarea actual (se carga desde MongoDB si no está en caché)
+            known_task = self.active_cache.peek(task_id)
+            if known_task is None:
+                known_task = self.get_task(task_id)
+                if not known_task:
+                    logger.error(f"❌ Task {task_id} not found for step update")
+                    return False
+            
+            with self._write_lock:
+                cached_task = self.active_cache.peek(task_id)
+                # Si se desalojó entretanto, el delta se persiste igualmente
+                task_data = cached_task if cached_task is not None else known_task
+                plan = task_data.get('plan', [])
+                index = next((i for i, s in enumerate(plan) if s.get('id') == step_id), None)
+                if index is None:
+                    logger.warning(f"⚠️ Step {step_id} not found in task {task_id}")
+                    return False
+                
+                if cached_task is not None:
+                    # Copy-on-write: solo se copia el paso modificado
+                    new_plan = list(plan)
+                    new_plan[index] = {**plan[index], **delta}
+                    self.active_cache.update_entry(
+                        task_id, {'plan': new_plan, 'updated_at': now}, copy_values=False
+                    )
+                
+                pending = self._get_pending_write(task_id)
+                pending_plan = pending['fields'].get('plan')
+                if pending_plan is not None:
+                    # Hay un plan completo pendiente: aplicar el delta sobre él
+                    pending['fields']['plan'] = [
+                        {**pending_step, **delta} if pending_step.get('id') == step_id else pending_step
+                        for pending_step in pending_plan
+                    ]
+                else:
+                    pending['steps'].setdefault(step_id, {}).update(delta)
+                pending['fields']['updated_at'] = now
+                self.write_stats['updates_received'] += 1
+            
+            return self._schedule_flush(task_id)
                 
         except Exception as e:
             logger.error(f"❌ Error updating task step {task_id}/{step_id}: {str(e)}")
             return False
     
+    def _get_pending_write(self, task_id: str) -> Dict[str, Any]:
+        pending = self._pending_writes.get(task_id)
+        if pending is None:
+            pending = {'fields': {}, 'steps': {}, 'since': time.time(), 'failures': 0}
+            self._pending_writes[task_id] = pending
+        self.active_cache.mark_dirty(task_id)
+        return pending
+    
+    def _write_back_evicted(self, task_id: str, task_data: Dict[str, Any]):
+        """Adelantar el volcado de una tarea sucia desalojada de la caché
+        
+        Solo se marca para el hilo write-behind: el desalojo puede ocurrir con
+        _write_lock tomado y flush_task adquiere _flush_lock (orden inverso al
+        del hilo). get_task vuelca lo pendiente antes de leer de MongoDB.
+        """
+        with self._write_lock:
+            pending = self._pending_writes.get(task_id)
+            if pending is None:
+                return
+            pending['since'] = 0.0
+        self._flush_wakeup.set()
+    
+    def _schedule_flush(self, task_id: str) -> bool:
+        """Volcar ya (write-through) o dejar la escritura al hilo write-behind"""
+        if self.flush_interval <= 0 or self._shutting_down:
+            return self.flush_task(task_id)
+        
+        if self._flusher_thread is None or not self._flusher_thread.is_alive():
+            with self._write_lock:
+                if self._flusher_thread is None or not self._flusher_thread.is_alive():
+                    self._flusher_thread = threading.Thread(
+                        target=self._flush_loop, name='task-write-behind', daemon=True
+                    )
+                    self._flusher_thread.start()
+        return True
+    
+    def _flush_loop(self):
+        while not self._shutting_down:
+            self._flush_wakeup.wait(self.flush_interval)
+            self._flush_wakeup.clear()
+            
+            now = time.time()
+            with self._write_lock:
+                due = [
+                    task_id for task_id, pending in self._pending_writes.items()
+                    if now - pending['since'] >= self.flush_interval
+                ]
+            for task_id in due:
+                self.flush_task(task_id)
+    
+    def flush_task(self, task_id: str) -> bool:
+        """
+        Persistir en una sola escritura los cambios pendientes de una tarea
+        
+        Returns:
+            bool: True si no quedaban cambios o se escribieron correctamente
+        """
+        with self._flush_lock:
+            with self._write_lock:
+                pending = self._pending_writes.pop(task_id, None)
+            
+            if not pending or (not pending['fields'] and not pending['steps']):
+                return True
+            
+            success = self.db_service.apply_task_delta(task_id, pending['fields'], pending['steps'])
+            self.write_stats['db_writes'] += 1
+        
+        if not success:
+            self.write_stats['failed_writes'] += 1
+            pending['failures'] += 1
+            if pending['failures'] >= self.max_flush_attempts:
+                logger.error(f"❌ Dropping pending writes for task {task_id} after {pending['failures']} failed flushes")
+                return False
+            
+            logger.error(f"❌ Failed to flush task {task_id} to MongoDB")
+            with self._write_lock:
+                # Reencolar sin pisar cambios más recientes
+                current = self._pending_writes.get(task_id)
+                if current is None:
+                    self._pending_writes[task_id] = pending
+                elif 'plan' not in current['fields']:
+                    current['failures'] = pending['failures']
+                    for step_id, delta in pending['steps'].items():
+                        current['steps'][step_id] = {**delta, **current['steps'].get(step_id, {})}
+                    current['fields'] = {**pending['fields'], **current['fields']}
+            return False
+        
+        with self._write_lock:
+            if task_id not in self._pending_writes:
+                self.active_cache.mark_clean(task_id)
+        
+        logger.debug(f"✅ Task {task_id} flushed ({len(pending['fields'])} fields, {len(pending['steps'])} steps)")
+        return True
+    
+    def flush_all(self) -> int:
+        """Persistir todas las tareas con cambios pendientes; devuelve las fallidas"""
+        with self._write_lock:
+            task_ids = list(self._pending_writes.keys())
+        return sum(1 for task_id in task_ids if not self.flush_task(task_id))
+    
+    def shutdown(self):
+        """Detener el hilo write-behind garantizando el volcado de cambios pendientes"""
+        if self._shutting_down:
+            return
+        self._shutting_down = True
+        self._flush_wakeup.set()
+        if self._flusher_thread is not None and self._flusher_thread is not threading.current_thread():
+            self._flusher_thread.join(timeout=5)
+        failed = self.flush_all()
+        if failed:
+            logger.error(f"❌ {failed} tasks could not be flushed on shutdown")
+        else:
+            logger.info("✅ TaskManager write-behind buffer flushed on shutdown")
+    
+    def get_write_behind_stats(self) -> Dict[str, Any]:
+        """Métricas del buffer write-behind"""
+        with self._write_lock:
+            dirty_tasks = len(self._pending_writes)
+            oldest = min((p['since'] for p in self._pending_writes.values()), default=None)
+        
+        updates = self.write_stats['updates_received']
+        return {
+            **self.write_stats,
+            'dirty_tasks': dirty_tasks,
+            'oldest_dirty_age': time.time() - oldest if oldest else 0.0,
+            'flush_interval': self.flush_interval,
+            'writes_per_update': self.write_stats['db_writes'] / updates if updates else 0.0
+        }
+    
     def get_all_tasks(self, limit: int = 100, include_completed: bool = True) -> List[Dict[str, Any]]:
         """
         Obtener todas las tareas con filtros opcionales
@@ -255,13 +455,21 @@ class TaskManager:
             bool: True si se eliminó exitosamente
         """
         try:
+            # Descartar escrituras pendientes
+            with self._write_lock:
+                self._pending_writes.pop(task_id, None)
+            
             # Eliminar de MongoDB
             success = self.db_service.delete_task(task_id)
             
             if success:
                 # Eliminar del caché
-                if task_id in self.active_cache:
-                    del self.active_cache[task_id]
+                self.active_cache.pop(task_id, None)
+                
+                # Eliminar su log de eventos (memoria y volcado a disco)
+                event_log = self._get_task_event_log()
+                if event_log is not None:
+                    event_log.discard(task_id)
                 
                 logger.info(f"✅ Task {task_id} deleted successfully")
                 return True
@@ -273,6 +481,15 @@ class TaskManager:
             logger.error(f"❌ Error deleting task {task_id}: {str(e)}")
             return False
     
+    def _get_task_event_log(self):
+        """Log de eventos del WebSocket, si está disponible"""
+        try:
+            from ..websocket.websocket_manager import get_websocket_manager
+            return get_websocket_manager().event_log
+        except Exception as e:
+            logger.warning(f"⚠️ Task event log not available: {str(e)}")
+            return None
+    
     def get_task_history(self, limit: int = 50) -> List[Dict[str, Any]]:
         """
         Obtener historial de tareas para análisis y revisión
@@ -312,13 +529,14 @@ class TaskManager:
             
             # Limpiar caché de tareas eliminadas
             cutoff_date = datetime.now() - timedelta(days=days_old)
-            old_cache_keys = [
-                task_id for task_id, task_data in self.active_cache.items()
-                if task_data.get('created_at', datetime.now()) < cutoff_date
-            ]
+            self.active_cache.remove_where(
+                lambda task_id, task_data: task_data.get('created_at', datetime.now()) < cutoff_date
+            )
             
-            for key in old_cache_keys:
-                del self.active_cache[key]
+            # Limpiar logs de eventos volcados a disco sin actividad reciente
+            event_log = self._get_task_event_log()
+            if event_log is not None and isinstance(result, dict) and 'error' not in result:
+                result['task_event_logs_deleted'] = event_log.purge_spill_older_than(cutoff_date.timestamp())
             
             logger.info(f"🧹 Cleanup completed: {result.get('tasks_deleted', 0)} tasks deleted")
             return result
@@ -342,7 +560,7 @@ class TaskManager:
                 task_id = task.get('task_id')
                 if task_id:
                     # Cargar en caché para acceso rápido
-                    self.active_cache[task_id] = task
+                    self.active_cache.set(task_id, task, dirty=False)
                     recovered_task_ids.append(task_id)
                     
                     # Log del estado de recuperación
@@ -394,12 +612,13 @@ class TaskManager:
             # Estadísticas de caché
             cache_stats = {
                 'cached_tasks': len(self.active_cache),
-                'cache_memory_mb': sum(len(str(task)) for task in self.active_cache.values()) / (1024 * 1024)
+                **self.active_cache.get_statistics()
             }
             
             return {
                 'database_stats': db_stats,
                 'cache_stats': cache_stats,
+                'write_behind': self.get_write_behind_stats(),
                 'recovery_capable': self.db_service.is_connected()
             }
             
@@ -420,5 +639,7 @@ def get_task_manager() -> TaskManager:
 def initialize_task_manager(db_service: DatabaseService = None) -> TaskManager:
     """Inicializar TaskManager con servicio de base de datos específico"""
     global _task_manager_instance
+    if _task_manager_instance is not None:
+        _task_manager_instance.shutdown()
     _task_manager_instance = TaskManager(db_service)
     return _task_manager_instance
\ No newline at end of file
@@ -0,0 +1,319 @@
+"""
+Task State Cache - Caché acotada del estado de tareas
+Sustituye a los diccionarios de proceso (active_cache, active_task_plans,
+task_files...) que crecían sin límite durante la vida del servidor.
+
+- Límite LRU de entradas y expiración por inactividad (TTL)
+- Número de versión por entrada para concurrencia optimista entre el hilo
+  de la petición y los hilos de ejecución
+- Escrituras copy-on-write: cada versión publicada no se modifica in situ,
+  y los lectores obtienen copias independientes con snapshot()
+- Las entradas sucias se devuelven al almacenamiento persistente al desalojarlas
+"""
+
+import copy
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class TaskVersionConflict(Exception):
+    """La entrada cambió desde que se leyó (versión esperada distinta)"""
+
+    def __init__(self, key: str, expected: int, actual: int):
+        super().__init__(f"Version conflict for {key}: expected {expected}, found {actual}")
+        self.key = key
+        self.expected = expected
+        self.actual = actual
+
+
+@dataclass
+class CacheEntry:
+    value: Any
+    version: int = 1
+    dirty: bool = False
+    last_access: float = field(default_factory=time.time)
+
+
+class TaskStateCache(MutableMapping):
+    """
+    Caché LRU+TTL versionada con interfaz de diccionario.
+
+    El acceso por índice devuelve la versión publicada, que nunca se modifica
+    in situ (solo lectura por convención); para modificar una entrada se usa
+    set()/update_entry()/modify_entry(), que publican una nueva versión.
+    """
+
+    def __init__(self, name: str, max_entries: int = None, ttl_seconds: float = None,
+                 on_evict: Callable[[str, Any], Any] = None):
+        """
+        Inicializar caché
+
+        Args:
+            name: Nombre para logs y métricas
+            max_entries: Máximo de entradas (TASK_CACHE_MAX_ENTRIES, 500 por defecto)
+            ttl_seconds: Segundos de inactividad antes de expirar (TASK_CACHE_TTL, 3600)
+            on_evict: Callback (key, value) para escribir entradas sucias al desalojarlas
+        """
+        self.name = name
+        self.max_entries = max_entries or int(os.getenv('TASK_CACHE_MAX_ENTRIES', '500'))
+        self.ttl_seconds = ttl_seconds or float(os.getenv('TASK_CACHE_TTL', '3600'))
+        self.on_evict = on_evict
+
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._lock = threading.RLock()
+        # Entradas sucias desalojadas; se escriben fuera del lock para no
+        # invertir el orden de locks con el almacenamiento persistente
+        self._write_back_queue = []
+
+        self.stats = {
+            'hits': 0,
+            'misses': 0,
+            'expirations': 0,
+            'evictions': 0,
+            'write_backs': 0,
+            'write_back_errors': 0,
+            'version_conflicts': 0
+        }
+
+    # ------------------------------------------------------------ lectura
+
+    def _get_entry(self, key: str) -> Optional[CacheEntry]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.stats['misses'] += 1
+            return None
+        if time.time() - entry.last_access > self.ttl_seconds:
+            self._remove(key, 'expirations')
+            self.stats['misses'] += 1
+            return None
+        entry.last_access = time.time()
+        self._entries.move_to_end(key)
+        self.stats['hits'] += 1
+        return entry
+
+    def __getitem__(self, key: str) -> Any:
+        with self._lock:
+            entry = self._get_entry(key)
+        self._drain_write_backs()
+        if entry is None:
+            raise KeyError(key)
+        return entry.value
+
+    def __contains__(self, key) -> bool:
+        with self._lock:
+            entry = self._get_entry(key)
+        self._drain_write_backs()
+        return entry is not None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __iter__(self) -> Iterator[str]:
+        with self._lock:
+            return iter(list(self._entries.keys()))
+
+    def snapshot(self, key: str, default: Any = None) -> Any:
+        """Copia independiente de la versión actual"""
+        with self._lock:
+            entry = self._get_entry(key)
+            value = entry.value if entry else None
+        self._drain_write_backs()
+        return copy.deepcopy(value) if entry else default
+
+    def get_with_version(self, key: str) -> Tuple[Any, int]:
+        """Devolver (copia del valor, versión); versión 0 si no existe"""
+        with self._lock:
+            entry = self._get_entry(key)
+            value, version = (entry.value, entry.version) if entry else (None, 0)
+        self._drain_write_backs()
+        return copy.deepcopy(value), version
+
+    def version(self, key: str) -> int:
+        entry = self._entries.get(key)
+        return entry.version if entry else 0
+
+    def peek(self, key: str) -> Any:
+        """Versión publicada sin tocar el orden LRU ni las métricas"""
+        entry = self._entries.get(key)
+        return entry.value if entry else None
+
+    # ------------------------------------------------------------ escritura
+
+    def __setitem__(self, key: str, value: Any):
+        self.set(key, value)
+
+    def __delitem__(self, key: str):
+        with self._lock:
+            if key not in self._entries:
+                raise KeyError(key)
+            del self._entries[key]
+
+    def set(self, key: str, value: Any, dirty: bool = True, expected_version: int = None) -> int:
+        """
+        Publicar un valor completo
+
+        Returns:
+            Nueva versión de la entrada
+        """
+        value = copy.deepcopy(value)
+        with self._lock:
+            entry = self._entries.get(key)
+            current_version = entry.version if entry else 0
+            self._check_version(key, expected_version, current_version)
+
+            self._entries[key] = CacheEntry(
+                value=value,
+                version=current_version + 1,
+                dirty=dirty
+            )
+            self._entries.move_to_end(key)
+            self._evict_if_needed()
+        self._drain_write_backs()
+        return current_version + 1
+
+    def update_entry(self, key: str, updates: Dict[str, Any], dirty: bool = True,
+                     expected_version: int = None, copy_values: bool = True) -> int:
+        """
+        Publicar una nueva versión de una entrada dict con los campos dados
+
+        La versión anterior no se modifica (copy-on-write superficial); los
+        valores nuevos se copian para que el llamador no pueda alterarlos,
+        salvo copy_values=False cuando ya son estructuras nuevas.
+
+        Returns:
+            Nueva versión, o 0 si la entrada no existe
+        """
+        if copy_values:
+            updates = copy.deepcopy(updates)
+        with self._lock:
+            entry = self._get_entry(key)
+            if entry is not None:
+                self._check_version(key, expected_version, entry.version)
+
+                new_value = dict(entry.value)
+                new_value.update(updates)
+                entry.value = new_value
+                entry.version += 1
+                entry.dirty = entry.dirty or dirty
+            version = entry.version if entry else 0
+        self._drain_write_backs()
+        return version
+
+    def modify_entry(self, key: str, mutator: Callable[[Any], None], dirty: bool = True,
+                     retries: int = 3) -> Any:
+        """
+        Leer-modificar-escribir con concurrencia optimista
+
+        El mutador recibe una copia del valor y la modifica in situ; si otro
+        hilo publicó una versión entretanto, se reintenta con la nueva.
+
+        Returns:
+            Valor publicado, o None si la entrada no existe
+        """
+        for attempt in range(retries + 1):
+            value, version = self.get_with_version(key)
+            if version == 0:
+                return None
+            mutator(value)
+            try:
+                self.set(key, value, dirty=dirty or self._is_dirty(key), expected_version=version)
+                return value
+            except TaskVersionConflict:
+                if attempt == retries:
+                    raise
+        return None
+
+    def _is_dirty(self, key: str) -> bool:
+        entry = self._entries.get(key)
+        return bool(entry and entry.dirty)
+
+    def mark_clean(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry.dirty = False
+
+    def mark_dirty(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry.dirty = True
+
+    def _check_version(self, key: str, expected_version: Optional[int], actual_version: int):
+        if expected_version is not None and expected_version != actual_version:
+            self.stats['version_conflicts'] += 1
+            raise TaskVersionConflict(key, expected_version, actual_version)
+
+    # ------------------------------------------------------------ desalojo
+
+    def _remove(self, key: str, reason: str):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self.stats[reason] += 1
+        if entry.dirty and self.on_evict is not None:
+            self._write_back_queue.append((key, entry.value))
+
+    def _drain_write_backs(self):
+        if not self._write_back_queue:
+            return
+        with self._lock:
+            pending, self._write_back_queue = self._write_back_queue, []
+        for key, value in pending:
+            try:
+                self.on_evict(key, value)
+                self.stats['write_backs'] += 1
+            except Exception as e:
+                self.stats['write_back_errors'] += 1
+                logger.error(f"❌ Error writing back evicted entry {key} from {self.name}: {str(e)}")
+
+    def _evict_if_needed(self):
+        now = time.time()
+        # Las entradas expiradas se acumulan al principio del orden LRU
+        while self._entries:
+            oldest_key, oldest = next(iter(self._entries.items()))
+            if now - oldest.last_access <= self.ttl_seconds:
+                break
+            self._remove(oldest_key, 'expirations')
+
+        while len(self._entries) > self.max_entries:
+            oldest_key = next(iter(self._entries))
+            self._remove(oldest_key, 'evictions')
+
+    def purge_expired(self) -> int:
+        """Eliminar las entradas expiradas; devuelve cuántas se eliminaron"""
+        with self._lock:
+            before = len(self._entries)
+            self._evict_if_needed()
+            removed = before - len(self._entries)
+        self._drain_write_backs()
+        return removed
+
+    def remove_where(self, predicate: Callable[[str, Any], bool]) -> int:
+        """Eliminar (sin write-back) las entradas que cumplan el predicado"""
+        with self._lock:
+            keys = [key for key, entry in self._entries.items() if predicate(key, entry.value)]
+            for key in keys:
+                del self._entries[key]
+            return len(keys)
+
+    def get_statistics(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.stats['hits'] + self.stats['misses']
+            return {
+                'name': self.name,
+                **self.stats,
+                'entries': len(self._entries),
+                'dirty_entries': sum(1 for entry in self._entries.values() if entry.dirty),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl_seconds,
+                'hit_rate': self.stats['hits'] / lookups if lookups else 0.0
+            }
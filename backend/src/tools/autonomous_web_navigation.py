@@ -14,6 +14,8 @@ import base64
 import tempfile
 from pathlib import Path
 
+from ..monitoring.sampling_profiler import inherit_thread_tags
+
 # Playwright será instalado como dependencia
 try:
     from playwright.async_api import async_playwright
@@ -170,7 +172,8 @@ class AutonomousWebNavigation:
             
             # Ejecutar en un hilo separado
             with concurrent.futures.ThreadPoolExecutor() as executor:
-                future = executor.submit(run_autonomous_navigation)
+                # Heredar etiquetas del hilo (task_id) para el profiler de muestreo
+                future = executor.submit(inherit_thread_tags(run_autonomous_navigation))
                 result = future.result(timeout=300)  # 5 minutos timeout
                 return result
         
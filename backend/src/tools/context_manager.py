@@ -1,8 +1,21 @@
 """
 Context Manager - Gestor de contexto para mantenimiento de estado entre pasos
 Maneja variables, checkpoints y estado compartido durante la ejecución de tareas
+
+Las variables de cada sesión viven en un mapa persistente (PersistentMap):
+un checkpoint es un puntero a la versión del mapa más la lista de claves que
+cambiaron desde el anterior, así que crearlo cuesta lo que cambió y no el
+tamaño de la sesión. En disco cada sesión es un diario de solo-añadir
+(<session_id>.journal) que se compacta periódicamente; al arrancar solo se
+leen las cabeceras y el diario completo se reproduce al acceder a la sesión.
+
+Los valores grandes (según el umbral de su VariableType) se desbordan a un
+BlobStore direccionado por contenido y la variable guarda solo el
+BlobHandle; get_variable los materializa, y get_variable_handle /
+open_variable_stream permiten leerlos de forma perezosa o como flujo.
 """
 
+import io
 import json
 import time
 import uuid
@@ -13,8 +26,15 @@ from enum import Enum
 import threading
 from pathlib import Path
 import pickle
+import struct
 import os
 
+from src.utils.persistent_map import PersistentMap
+from src.utils.blob_store import BlobStore, BlobHandle
+
+JOURNAL_SUFFIX = ".journal"
+_RECORD_HEADER = struct.Struct(">I")
+
 class ContextScope(Enum):
     TASK = "task"
     STEP = "step"
@@ -48,10 +68,13 @@ class ContextCheckpoint:
     task_id: str
     step_id: str
     timestamp: datetime
-    variables: Dict[str, ContextVariable]
+    variables: PersistentMap  # versión del mapa de la sesión (compartida, no copiada)
     execution_state: Dict[str, Any]
     description: str
     auto_created: bool = False
+    version: int = 0
+    changed_keys: List[str] = None  # diferencia con el checkpoint anterior
+    removed_keys: List[str] = None
 
 @dataclass
 class ContextSession:
@@ -59,10 +82,11 @@ class ContextSession:
     task_id: str
     created_at: datetime
     last_accessed: datetime
-    variables: Dict[str, ContextVariable]
+    variables: PersistentMap
     checkpoints: List[ContextCheckpoint]
     metadata: Dict[str, Any]
     is_active: bool = True
+    version: int = 0  # número de cambios aplicados a las variables
 
 class ContextManager:
     def __init__(self, storage_path: str = "/tmp/context_manager"):
@@ -72,6 +96,15 @@ class ContextManager:
         # En memoria para acceso rápido
         self.active_sessions: Dict[str, ContextSession] = {}
         
+        # Cabeceras de las sesiones en disco (se cargan completas bajo demanda)
+        self.session_index: Dict[str, Dict[str, Any]] = {}
+        
+        # Registros del diario de cada sesión: (total, tras la última compactación)
+        self._journal_records: Dict[str, tuple] = {}
+        
+        # Blobs referenciados por el diario de cada sesión no cargada: (mtime, tamaño, digests)
+        self._journal_blob_digests: Dict[str, tuple] = {}
+        
         # Configuración
         self.config = {
             'max_sessions': 100,
@@ -80,9 +113,23 @@ class ContextManager:
             'auto_checkpoint_interval': 300,  # 5 minutos
             'max_checkpoints_per_session': 50,
             'variable_ttl': timedelta(hours=12),
-            'cleanup_interval': timedelta(hours=1)
+            'cleanup_interval': timedelta(hours=1),
+            # Compactar el diario cuando supera N registros y el factor sobre la última compactación
+            'journal_compaction_min_records': int(os.getenv('CONTEXT_JOURNAL_COMPACTION_MIN_RECORDS', '500')),
+            'journal_compaction_factor': float(os.getenv('CONTEXT_JOURNAL_COMPACTION_FACTOR', '4')),
+            # Tamaño (bytes) a partir del cual un valor se desborda al almacén de blobs;
+            # los tipos que no aparecen se guardan siempre en línea
+            'spill_thresholds': {
+                VariableType.STRING: int(os.getenv('CONTEXT_SPILL_THRESHOLD_STRING', str(64 * 1024))),
+                VariableType.OBJECT: int(os.getenv('CONTEXT_SPILL_THRESHOLD_OBJECT', str(256 * 1024))),
+                VariableType.LIST: int(os.getenv('CONTEXT_SPILL_THRESHOLD_LIST', str(256 * 1024))),
+                VariableType.RESULT: int(os.getenv('CONTEXT_SPILL_THRESHOLD_RESULT', str(256 * 1024)))
+            }
         }
         
+        # Salidas grandes de los pasos, fuera de las sesiones y checkpoints
+        self.blob_store = BlobStore(self.storage_path / "blobs")
+        
         # Lock para thread safety
         self._lock = threading.RLock()
         
@@ -100,7 +147,7 @@ class ContextManager:
                 task_id=task_id,
                 created_at=datetime.now(),
                 last_accessed=datetime.now(),
-                variables={},
+                variables=PersistentMap(),
                 checkpoints=[],
                 metadata=metadata or {},
                 is_active=True
@@ -129,6 +176,9 @@ class ContextManager:
                     metadata: Dict[str, Any] = None,
                     source_step: str = None) -> bool:
         """Establecer variable en el contexto"""
+        # Los valores grandes se escriben en el almacén de blobs fuera del lock
+        value = self.spill_value(value, var_type)
+        
         with self._lock:
             session = self.get_session(session_id)
             if not session:
@@ -154,17 +204,29 @@ class ContextManager:
                 source_step=source_step
             )
             
-            # Guardar en sesión
-            session.variables[key] = variable
+            # Guardar en sesión (nueva versión del mapa)
+            session.variables = session.variables.set(key, variable)
+            session.version += 1
             session.last_accessed = datetime.now()
             
-            # Persistir cambios
-            self._save_session(session)
+            # Persistir solo el cambio
+            self._append_record(session, {'op': 'set', 'key': key, 'variable': variable})
             
             return True
     
-    def get_variable(self, session_id: str, key: str) -> Optional[Any]:
-        """Obtener valor de variable"""
+    def spill_value(self, value: Any, var_type: VariableType = VariableType.OBJECT) -> Any:
+        """Desbordar el valor a disco si supera el umbral de su tipo"""
+        return self.blob_store.maybe_spill(value, self.config['spill_thresholds'].get(var_type))
+    
+    @staticmethod
+    def materialize(value: Any) -> Any:
+        """Valor real de una variable (lee el blob si estaba desbordada)"""
+        if isinstance(value, BlobHandle):
+            return value.read()
+        return value
+    
+    def get_variable(self, session_id: str, key: str, materialize: bool = True) -> Optional[Any]:
+        """Obtener valor de variable (con materialize=False, los blobs se devuelven como BlobHandle)"""
         with self._lock:
             session = self.get_session(session_id)
             if not session:
@@ -177,16 +239,34 @@ class ContextManager:
             
             # Verificar expiración
             if variable.expires_at and datetime.now() > variable.expires_at:
-                del session.variables[key]
-                self._save_session(session)
+                self._remove_variable(session, key)
                 return None
             
             # Actualizar acceso
             session.last_accessed = datetime.now()
-            
-            return variable.value
+            value = variable.value
+        
+        # La lectura del blob se hace fuera del lock
+        return self.materialize(value) if materialize else value
+    
+    def get_variable_handle(self, session_id: str, key: str) -> Optional[BlobHandle]:
+        """BlobHandle de una variable desbordada (None si está en línea o no existe)"""
+        value = self.get_variable(session_id, key, materialize=False)
+        return value if isinstance(value, BlobHandle) else None
     
-    def get_all_variables(self, session_id: str, scope: ContextScope = None) -> Dict[str, Any]:
+    def open_variable_stream(self, session_id: str, key: str):
+        """Flujo de lectura del valor de una variable de texto o bytes"""
+        value = self.get_variable(session_id, key, materialize=False)
+        if isinstance(value, BlobHandle):
+            return value.open()
+        if isinstance(value, str):
+            return io.StringIO(value)
+        if isinstance(value, (bytes, bytearray)):
+            return io.BytesIO(value)
+        return None
+    
+    def get_all_variables(self, session_id: str, scope: ContextScope = None,
+                          materialize: bool = True) -> Dict[str, Any]:
         """Obtener todas las variables de un scope específico"""
         with self._lock:
             session = self.get_session(session_id)
@@ -206,8 +286,10 @@ class ContextManager:
                     continue
                 
                 variables[key] = variable.value
-            
-            return variables
+        
+        if materialize:
+            variables = {key: self.materialize(value) for key, value in variables.items()}
+        return variables
     
     def delete_variable(self, session_id: str, key: str) -> bool:
         """Eliminar variable del contexto"""
@@ -217,9 +299,8 @@ class ContextManager:
                 return False
             
             if key in session.variables:
-                del session.variables[key]
+                self._remove_variable(session, key)
                 session.last_accessed = datetime.now()
-                self._save_session(session)
                 return True
             
             return False
@@ -234,43 +315,37 @@ class ContextManager:
             
             checkpoint_id = f"cp_{step_id}_{uuid.uuid4().hex[:8]}"
             
-            # Crear copia de variables para el checkpoint
-            checkpoint_variables = {}
-            for key, var in session.variables.items():
-                checkpoint_variables[key] = ContextVariable(
-                    key=var.key,
-                    value=var.value,
-                    type=var.type,
-                    scope=var.scope,
-                    created_at=var.created_at,
-                    updated_at=var.updated_at,
-                    expires_at=var.expires_at,
-                    metadata=var.metadata.copy() if var.metadata else {},
-                    source_step=var.source_step
-                )
+            # El checkpoint apunta a la versión actual del mapa (las variables
+            # nunca se modifican en sitio) y guarda la diferencia con el anterior
+            previous = session.checkpoints[-1].variables if session.checkpoints else PersistentMap()
+            changed, removed = session.variables.changes_since(previous)
             
             checkpoint = ContextCheckpoint(
                 checkpoint_id=checkpoint_id,
                 task_id=session.task_id,
                 step_id=step_id,
                 timestamp=datetime.now(),
-                variables=checkpoint_variables,
+                variables=session.variables,
                 execution_state={
                     'session_id': session_id,
                     'active_variables': len(session.variables),
                     'metadata': session.metadata.copy()
                 },
                 description=description,
-                auto_created=auto_created
+                auto_created=auto_created,
+                version=session.version,
+                changed_keys=list(changed),
+                removed_keys=removed
             )
             
             # Agregar checkpoint y mantener límite
             session.checkpoints.append(checkpoint)
-            if len(session.checkpoints) > self.config['max_checkpoints_per_session']:
-                session.checkpoints.pop(0)  # Remover el más antiguo
+            self._append_record(session, {'op': 'checkpoint', 'checkpoint': self._checkpoint_header(checkpoint)})
+            while len(session.checkpoints) > self.config['max_checkpoints_per_session']:
+                oldest = session.checkpoints.pop(0)  # Remover el más antiguo
+                self._append_record(session, {'op': 'drop_checkpoint', 'checkpoint_id': oldest.checkpoint_id})
             
             session.last_accessed = datetime.now()
-            self._save_session(session)
             
             return checkpoint_id
     
@@ -291,9 +366,11 @@ class ContextManager:
             if not checkpoint:
                 return False
             
-            # Restaurar variables
-            session.variables = checkpoint.variables.copy()
+            # Restaurar variables: basta con volver a apuntar a esa versión
+            session.variables = checkpoint.variables
+            session.version += 1
             session.last_accessed = datetime.now()
+            self._append_record(session, {'op': 'restore', 'checkpoint_id': checkpoint_id})
             
             # Crear checkpoint de respaldo antes de restaurar
             self.create_checkpoint(
@@ -303,8 +380,6 @@ class ContextManager:
                 auto_created=True
             )
             
-            self._save_session(session)
-            
             return True
     
     def get_checkpoints(self, session_id: str) -> List[Dict[str, Any]]:
@@ -345,7 +420,8 @@ class ContextManager:
             
             return success
     
-    def get_step_variables(self, session_id: str, step_id: str) -> Dict[str, Any]:
+    def get_step_variables(self, session_id: str, step_id: str,
+                           materialize: bool = True) -> Dict[str, Any]:
         """Obtener variables específicas de un paso"""
         with self._lock:
             session = self.get_session(session_id)
@@ -364,8 +440,10 @@ class ContextManager:
                     # Remover prefijo del step
                     clean_key = key[len(step_prefix):]
                     step_variables[clean_key] = variable.value
-            
-            return step_variables
+        
+        if materialize:
+            step_variables = {key: self.materialize(value) for key, value in step_variables.items()}
+        return step_variables
     
     def chain_step_output(self, session_id: str, from_step: str, 
                          to_step: str, output_key: str, input_key: str = None) -> bool:
@@ -374,7 +452,8 @@ class ContextManager:
             from_key = f"{from_step}_{output_key}"
             to_key = f"{to_step}_{input_key or output_key}"
             
-            value = self.get_variable(session_id, from_key)
+            # El BlobHandle pasa tal cual: el contenido no se carga ni se copia
+            value = self.get_variable(session_id, from_key, materialize=False)
             if value is None:
                 return False
             
@@ -410,6 +489,12 @@ class ContextManager:
                         'expires_at': variable.expires_at.isoformat() if variable.expires_at else None,
                         'source_step': variable.source_step
                     }
+                    if isinstance(variable.value, BlobHandle):
+                        active_variables[key].update(
+                            spilled=True,
+                            size=variable.value.size,
+                            preview=variable.value.preview
+                        )
             
             return {
                 'session_id': session_id,
@@ -440,7 +525,7 @@ class ContextManager:
             )
             
             session.is_active = False
-            self._save_session(session)
+            self._append_record(session, {'op': 'close'})
             
             # Remover de memoria
             if session_id in self.active_sessions:
@@ -448,39 +533,216 @@ class ContextManager:
             
             return True
     
+    def _remove_variable(self, session: ContextSession, key: str):
+        """Eliminar una variable creando una nueva versión del mapa"""
+        session.variables = session.variables.delete(key)
+        session.version += 1
+        self._append_record(session, {'op': 'delete', 'key': key})
+
+    @staticmethod
+    def _checkpoint_header(checkpoint: ContextCheckpoint) -> Dict[str, Any]:
+        """Campos del checkpoint salvo las variables (se reconstruyen al reproducir el diario)"""
+        return {
+            'checkpoint_id': checkpoint.checkpoint_id,
+            'task_id': checkpoint.task_id,
+            'step_id': checkpoint.step_id,
+            'timestamp': checkpoint.timestamp,
+            'execution_state': checkpoint.execution_state,
+            'description': checkpoint.description,
+            'auto_created': checkpoint.auto_created,
+            'version': checkpoint.version,
+            'changed_keys': checkpoint.changed_keys,
+            'removed_keys': checkpoint.removed_keys
+        }
+
+    @staticmethod
+    def _diff_records(previous: PersistentMap, current: PersistentMap) -> List[Dict[str, Any]]:
+        """Registros set/delete que llevan de una versión del mapa a otra"""
+        changed, removed = current.changes_since(previous)
+        records = [{'op': 'set', 'key': key, 'variable': variable} for key, variable in changed.items()]
+        records.extend({'op': 'delete', 'key': key} for key in removed)
+        return records
+
+    def _journal_path(self, session_id: str) -> Path:
+        return self.storage_path / f"{session_id}{JOURNAL_SUFFIX}"
+
+    @staticmethod
+    def _encode_record(record: Dict[str, Any]) -> bytes:
+        data = pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL)
+        return _RECORD_HEADER.pack(len(data)) + data
+
+    @staticmethod
+    def _read_records(journal_file: Path):
+        """Registros del diario en orden; un registro final truncado se ignora"""
+        with open(journal_file, 'rb') as f:
+            while True:
+                header = f.read(_RECORD_HEADER.size)
+                if len(header) < _RECORD_HEADER.size:
+                    return
+                length = _RECORD_HEADER.unpack(header)[0]
+                data = f.read(length)
+                if len(data) < length:
+                    print(f"Truncated record at the end of {journal_file.name}, ignoring it")
+                    return
+                yield pickle.loads(data)
+
+    def _append_record(self, session: ContextSession, record: Dict[str, Any]):
+        """Añadir un registro al diario de la sesión (y compactarlo si ha crecido demasiado)"""
+        record['at'] = datetime.now()
+        try:
+            with open(self._journal_path(session.session_id), 'ab') as f:
+                f.write(self._encode_record(record))
+        except Exception as e:
+            print(f"Error appending to journal of session {session.session_id}: {e}")
+            return
+
+        records, compacted = self._journal_records.get(session.session_id, (0, 0))
+        records += 1
+        self._journal_records[session.session_id] = (records, compacted)
+        threshold = max(self.config['journal_compaction_min_records'],
+                        self.config['journal_compaction_factor'] * compacted)
+        if records > threshold:
+            self._save_session(session)
+
     def _save_session(self, session: ContextSession):
-        """Guardar sesión en disco"""
+        """
+        Reescribir el diario completo de la sesión: cabecera, las diferencias
+        entre checkpoints consecutivos y las del estado actual. Se usa al crear
+        la sesión, al compactar y al migrar sesiones antiguas (.pkl)
+        """
         try:
-            session_file = self.storage_path / f"{session.session_id}.pkl"
-            with open(session_file, 'wb') as f:
-                pickle.dump(session, f)
+            records = [{
+                'op': 'header',
+                'session': {
+                    'session_id': session.session_id,
+                    'task_id': session.task_id,
+                    'created_at': session.created_at,
+                    'metadata': session.metadata
+                }
+            }]
+            previous = PersistentMap()
+            for checkpoint in session.checkpoints:
+                records.extend(self._diff_records(previous, checkpoint.variables))
+                records.append({'op': 'checkpoint', 'checkpoint': self._checkpoint_header(checkpoint)})
+                previous = checkpoint.variables
+            records.extend(self._diff_records(previous, session.variables))
+            if not session.is_active:
+                records.append({'op': 'close'})
+
+            journal_file = self._journal_path(session.session_id)
+            temp_file = journal_file.with_name(journal_file.name + ".tmp")
+            with open(temp_file, 'wb') as f:
+                for record in records:
+                    record['at'] = session.last_accessed
+                    f.write(self._encode_record(record))
+            os.replace(temp_file, journal_file)
+
+            self._journal_records[session.session_id] = (len(records), len(records))
+            self.session_index[session.session_id] = dict(records[0]['session'])
         except Exception as e:
             print(f"Error saving session {session.session_id}: {e}")
-    
+
+    def _replay_journal(self, journal_file: Path) -> Optional[ContextSession]:
+        """Reconstruir la sesión aplicando los registros del diario"""
+        session = None
+        record_count = 0
+        for record in self._read_records(journal_file):
+            record_count += 1
+            op = record['op']
+            if op == 'header':
+                header = record['session']
+                session = ContextSession(
+                    session_id=header['session_id'],
+                    task_id=header['task_id'],
+                    created_at=header['created_at'],
+                    last_accessed=record['at'],
+                    variables=PersistentMap(),
+                    checkpoints=[],
+                    metadata=header['metadata'],
+                    is_active=True
+                )
+                continue
+            if session is None:
+                raise ValueError(f"Journal {journal_file.name} has no header")
+
+            session.last_accessed = max(session.last_accessed, record['at'])
+            if op == 'set':
+                session.variables = session.variables.set(record['key'], record['variable'])
+                session.version += 1
+            elif op == 'delete':
+                session.variables = session.variables.delete(record['key'])
+                session.version += 1
+            elif op == 'checkpoint':
+                checkpoint = ContextCheckpoint(variables=session.variables, **record['checkpoint'])
+                session.checkpoints.append(checkpoint)
+                session.version = max(session.version, checkpoint.version)
+            elif op == 'drop_checkpoint':
+                session.checkpoints = [cp for cp in session.checkpoints
+                                       if cp.checkpoint_id != record['checkpoint_id']]
+            elif op == 'restore':
+                for cp in session.checkpoints:
+                    if cp.checkpoint_id == record['checkpoint_id']:
+                        session.variables = cp.variables
+                        session.version += 1
+                        break
+            elif op == 'close':
+                session.is_active = False
+
+        if session is not None:
+            self._journal_records[session.session_id] = (record_count, 0)
+        return session
+
+    @staticmethod
+    def _upgrade_legacy_session(session: ContextSession) -> ContextSession:
+        """Convertir una sesión pickled completa (formato .pkl) al mapa persistente"""
+        session.variables = PersistentMap(session.variables)
+        for checkpoint in session.checkpoints:
+            checkpoint.variables = PersistentMap(checkpoint.variables)
+        if not hasattr(session, 'version'):
+            session.version = 0
+        return session
+
     def _load_session(self, session_id: str) -> Optional[ContextSession]:
-        """Cargar sesión desde disco"""
+        """Cargar sesión desde disco (reproduciendo su diario)"""
         try:
-            session_file = self.storage_path / f"{session_id}.pkl"
-            if session_file.exists():
-                with open(session_file, 'rb') as f:
-                    session = pickle.load(f)
-                    if session.is_active:
-                        self.active_sessions[session_id] = session
-                        return session
+            journal_file = self._journal_path(session_id)
+            legacy_file = self.storage_path / f"{session_id}.pkl"
+            if journal_file.exists():
+                session = self._replay_journal(journal_file)
+            elif legacy_file.exists():
+                with open(legacy_file, 'rb') as f:
+                    session = self._upgrade_legacy_session(pickle.load(f))
+                self._save_session(session)
+                legacy_file.unlink()
+            else:
+                return None
+
+            if session and session.is_active:
+                self.active_sessions[session_id] = session
+                return session
         except Exception as e:
             print(f"Error loading session {session_id}: {e}")
-        
+
         return None
-    
+
     def _load_persistent_sessions(self):
-        """Cargar sesiones persistentes al inicio"""
+        """Indexar las sesiones persistentes al inicio leyendo solo sus cabeceras"""
         try:
+            for journal_file in self.storage_path.glob(f"*{JOURNAL_SUFFIX}"):
+                try:
+                    first_record = next(self._read_records(journal_file), None)
+                except Exception as e:
+                    print(f"Error reading header of {journal_file.name}: {e}")
+                    continue
+                if first_record and first_record.get('op') == 'header':
+                    self.session_index[journal_file.stem] = dict(first_record['session'])
+
+            # Sesiones en el formato anterior: se migran al diario cuando se acceden
             for session_file in self.storage_path.glob("*.pkl"):
-                session_id = session_file.stem
-                self._load_session(session_id)
+                self.session_index.setdefault(session_file.stem, {'session_id': session_file.stem, 'legacy': True})
         except Exception as e:
             print(f"Error loading persistent sessions: {e}")
-    
+
     def _start_cleanup_thread(self):
         """Iniciar thread de limpieza automática"""
         def cleanup_worker():
@@ -513,7 +775,7 @@ class ContextManager:
                         expired_variables.append(key)
                 
                 for key in expired_variables:
-                    del session.variables[key]
+                    self._remove_variable(session, key)
                 
                 # Limpiar checkpoints expirados
                 expired_checkpoints = []
@@ -523,14 +785,58 @@ class ContextManager:
                 
                 for checkpoint in expired_checkpoints:
                     session.checkpoints.remove(checkpoint)
-                
-                # Guardar cambios si hubo limpieza
-                if expired_variables or expired_checkpoints:
-                    self._save_session(session)
+                    self._append_record(session, {'op': 'drop_checkpoint', 'checkpoint_id': checkpoint.checkpoint_id})
             
             # Remover sesiones expiradas
             for session_id in sessions_to_remove:
                 self.close_session(session_id)
+            
+            # Blobs en uso por las sesiones cargadas
+            live_digests = set()
+            for session in self.active_sessions.values():
+                versions = [session.variables] + [cp.variables for cp in session.checkpoints]
+                for variables in versions:
+                    live_digests.update(
+                        variable.value.digest for variable in variables.values()
+                        if isinstance(variable.value, BlobHandle)
+                    )
+            unloaded_sessions = [session_id for session_id in self.session_index
+                                 if session_id not in self.active_sessions]
+        
+        # ...y por las indexadas en disco sin cargar (sus diarios se leen fuera del lock)
+        for session_id in unloaded_sessions:
+            live_digests.update(self._journal_digests(session_id))
+        
+        self.blob_store.collect_garbage(
+            max(self.config['session_ttl'], self.config['checkpoint_ttl']).total_seconds(),
+            live_digests
+        )
+    
+    def _journal_digests(self, session_id: str) -> set:
+        """Blobs referenciados en algún registro del diario (conservador: incluye los ya borrados)"""
+        journal_file = self._journal_path(session_id)
+        try:
+            stat = journal_file.stat()
+        except FileNotFoundError:
+            self._journal_blob_digests.pop(session_id, None)
+            return set()
+        
+        cached = self._journal_blob_digests.get(session_id)
+        if cached is not None and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+            return cached[2]
+        
+        digests = set()
+        try:
+            for record in self._read_records(journal_file):
+                variable = record.get('variable')
+                if variable is not None and isinstance(variable.value, BlobHandle):
+                    digests.add(variable.value.digest)
+        except Exception as e:
+            # Lo posterior al error tampoco se podría reproducir; se reintenta en la próxima limpieza
+            print(f"Error reading journal of session {session_id}: {e}")
+            return digests
+        self._journal_blob_digests[session_id] = (stat.st_mtime_ns, stat.st_size, digests)
+        return digests
     
     def get_statistics(self) -> Dict[str, Any]:
         """Obtener estadísticas del sistema"""
@@ -544,9 +850,11 @@ class ContextManager:
             
             return {
                 'active_sessions': len(self.active_sessions),
+                'stored_sessions': len(self.session_index),
                 'total_variables': total_variables,
                 'total_checkpoints': total_checkpoints,
                 'storage_path': str(self.storage_path),
+                'blob_store': self.blob_store.get_statistics(),
                 'config': {
                     'max_sessions': self.config['max_sessions'],
                     'session_ttl_hours': self.config['session_ttl'].total_seconds() / 3600,
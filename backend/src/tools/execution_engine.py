@@ -4,6 +4,7 @@ Coordina la ejecución automática de pasos de tareas con manejo de errores y re
 """
 
 import asyncio
+import functools
 import time
 import json
 import logging
@@ -17,7 +18,9 @@ from .dynamic_task_planner import DynamicTaskPlanner, get_dynamic_task_planner
 from .tool_manager import ToolManager
 from .environment_setup_manager import EnvironmentSetupManager
 from .context_manager import ContextManager, ContextScope, VariableType
+from src.utils.dag_scheduler import DAGScheduler, DAGNode
 from src.agents.replanning_engine import ReplanningEngine, ReplanningContext, ReplanningResult
+from src.planning.dynamic_task_planner import report_enhanced_plan_outcome
 
 logger = logging.getLogger(__name__)
 
@@ -35,7 +38,7 @@ class StepExecution:
     status: StepStatus
     start_time: Optional[datetime] = None
     end_time: Optional[datetime] = None
-    result: Optional[Dict[str, Any]] = None
+    result: Optional[Any] = None  # Dict, o BlobHandle si el resultado se desbordó a disco
     error: Optional[str] = None
     retry_count: int = 0
     execution_time: float = 0.0
@@ -70,6 +73,7 @@ class ExecutionEngine:
             'retry_delay': 2.0,  # segundos
             'timeout_per_step': 300,  # 5 minutos
             'parallel_execution': False,
+            'max_parallel_steps': 4,  # Pasos en curso a la vez en modo paralelo
             'fail_fast': False,
             'auto_recovery': True,
             'auto_checkpoint': True,  # Checkpoints automáticos
@@ -187,6 +191,17 @@ class ExecutionEngine:
                 # Actualizar plan de ejecución
                 context.execution_plan = replanning_result.new_plan
                 
+                # Recordar qué paso valida la estrategia elegida
+                if replanning_result.cache_key and replanning_result.new_plan.steps:
+                    replanned_step = replanning_result.new_plan.steps[
+                        min(context.current_step_index, len(replanning_result.new_plan.steps) - 1)
+                    ]
+                    context.variables.setdefault('pending_replanning_outcomes', {})[replanned_step.id] = {
+                        'cache_key': replanning_result.cache_key,
+                        'strategy': replanning_result.strategy_used.value,
+                        'error_info': replanning_context.error_info
+                    }
+                
                 # Actualizar step_executions para reflejar el nuevo plan
                 context.step_executions = [
                     StepExecution(step=step, status=StepStatus.PENDING)
@@ -332,6 +347,9 @@ class ExecutionEngine:
             else:
                 context.status = StepStatus.FAILED
             
+            # Calidad del plan para la caché de planes (solo cuenta el éxito completo)
+            report_enhanced_plan_outcome(task_id, context.success_rate == 1.0)
+            
             # Crear checkpoint final
             if self.config.get('auto_checkpoint', True):
                 self.context_manager.create_checkpoint(
@@ -350,6 +368,8 @@ class ExecutionEngine:
             return context
             
         except Exception as e:
+            report_enhanced_plan_outcome(task_id, False)
+            
             # Manejo de errores a nivel de tarea
             if task_id in self.execution_contexts:
                 context = self.execution_contexts[task_id]
@@ -405,23 +425,53 @@ class ExecutionEngine:
             })
     
     async def _execute_parallel(self, context: ExecutionContext):
-        """Ejecutar pasos en paralelo (donde sea posible)"""
-        
-        # Agrupar pasos por nivel de dependencias
-        execution_levels = self._group_steps_by_dependencies(context.execution_plan.steps)
-        
-        for level_steps in execution_levels:
-            # Ejecutar pasos del mismo nivel en paralelo
-            tasks = []
-            for step in level_steps:
-                step_execution = next(
-                    se for se in context.step_executions 
-                    if se.step.id == step.id
-                )
-                tasks.append(self._execute_step_with_retries(context, step_execution))
-            
-            # Esperar a que todos los pasos del nivel se completen
-            await asyncio.gather(*tasks, return_exceptions=True)
+        """
+        Ejecutar pasos en paralelo (donde sea posible): cada paso arranca en
+        cuanto terminan sus dependencias, priorizando el camino crítico
+        """
+        
+        executions = {se.step.id: se for se in context.step_executions}
+        indexes = {se.step.id: i for i, se in enumerate(context.step_executions)}
+        nodes = [
+            DAGNode(
+                node_id=se.step.id,
+                dependencies=se.step.dependencies,
+                estimated_duration=se.step.estimated_duration,
+                payload=se
+            )
+            for se in context.step_executions
+        ]
+        completed = 0
+        
+        async def run_step(node: DAGNode) -> bool:
+            return await self._execute_step_with_retries(context, node.payload)
+        
+        async def on_step_done(node: DAGNode, value: Any, success: bool):
+            nonlocal completed
+            completed += 1
+            context.current_step_index = indexes[node.node_id]
+            await self._notify_progress(context, "step_completed", {
+                'step_index': indexes[node.node_id],
+                'step_id': node.node_id,
+                'status': node.payload.status.value,
+                'progress': completed / len(context.step_executions)
+            })
+        
+        scheduler = DAGScheduler(
+            max_in_flight=self.config.get('max_parallel_steps', 4),
+            fail_fast=self.config.get('fail_fast', False)
+        )
+        result = await scheduler.run(nodes, run_step, is_success=bool, on_complete=on_step_done)
+        
+        # Dependientes de un paso fallido (o que nunca pudieron arrancar) quedan omitidos
+        for step_id, reason in result.cancelled.items():
+            step_execution = executions[step_id]
+            if step_execution.status != StepStatus.COMPLETED:
+                step_execution.status = StepStatus.SKIPPED
+                step_execution.error = reason
+        
+        logger.info(f"🧮 Ejecución paralela de {context.task_id}: concurrencia máxima {result.max_concurrency}, "
+                    f"camino crítico {result.critical_path} ({result.critical_path_duration}s estimados)")
     
     async def _execute_step_with_retries(self, context: ExecutionContext, 
                                        step_execution: StepExecution) -> bool:
@@ -443,6 +493,7 @@ class ExecutionEngine:
                 success = await self._execute_single_step(context, step_execution)
                 if success:
                     step_execution.status = StepStatus.COMPLETED
+                    self._report_replanning_outcome(context, step_execution, True)
                     return True
                     
             except Exception as e:
@@ -476,8 +527,23 @@ class ExecutionEngine:
         
         # Todos los intentos (incluyendo replanificación) fallaron
         step_execution.status = StepStatus.FAILED
+        self._report_replanning_outcome(context, step_execution, False)
         return False
     
+    def _report_replanning_outcome(self, context: ExecutionContext, 
+                                   step_execution: StepExecution, success: bool):
+        """Informar al ReplanningEngine del resultado de un paso replanificado"""
+        
+        pending = context.variables.get('pending_replanning_outcomes')
+        if not pending or self.replanning_engine is None:
+            return
+        
+        outcome = pending.pop(step_execution.step.id, None)
+        if outcome:
+            self.replanning_engine.record_replanning_outcome(
+                outcome['cache_key'], outcome['strategy'], success, outcome['error_info']
+            )
+    
     async def _execute_single_step(self, context: ExecutionContext, 
                                  step_execution: StepExecution) -> bool:
         """Ejecutar un paso individual"""
@@ -489,13 +555,19 @@ class ExecutionEngine:
             # Preparar parámetros del paso usando context manager
             parameters = await self._prepare_step_parameters_with_context(context, step)
             
-            # Ejecutar herramienta
-            result = self.tool_manager.execute_tool(
+            # Ejecutar herramienta; en modo paralelo la llamada bloqueante va a un
+            # hilo para no detener al resto de pasos en curso
+            execute = functools.partial(
+                self.tool_manager.execute_tool,
                 tool_name=step.tool,
                 parameters=parameters,
                 config={'timeout': self.config.get('timeout_per_step', 300)},
                 task_id=context.task_id
             )
+            if self.config.get('parallel_execution', False):
+                result = await asyncio.to_thread(execute)
+            else:
+                result = execute()
             
             step_execution.result = result
             step_execution.end_time = datetime.now()
@@ -507,8 +579,9 @@ class ExecutionEngine:
             success = self._evaluate_step_result(result)
             
             if success:
-                # Extraer y guardar variables del resultado en context manager
-                await self._extract_and_store_variables(context, step, result)
+                # Extraer y guardar variables del resultado en context manager; los
+                # resultados grandes quedan en disco y aquí solo se guarda su handle
+                step_execution.result = await self._extract_and_store_variables(context, step, result)
                 
                 # Crear checkpoint del paso si fue exitoso
                 if self.config.get('auto_checkpoint', True):
@@ -594,16 +667,21 @@ class ExecutionEngine:
                 else:
                     # Fallback al contexto local
                     if var_name in context.variables:
-                        parameters[key] = context.variables[var_name]
+                        parameters[key] = self.context_manager.materialize(context.variables[var_name])
         
         return parameters
     
     async def _extract_and_store_variables(self, context: ExecutionContext, 
-                                         step: TaskStep, result: Dict[str, Any]):
-        """Extraer variables del resultado y guardarlas en context manager"""
+                                         step: TaskStep, result: Dict[str, Any]) -> Any:
+        """
+        Extraer variables del resultado y guardarlas en context manager
+        
+        Returns:
+            El resultado tal como quedó guardado (BlobHandle si superaba el umbral)
+        """
         
         if not context.context_session_id:
-            return
+            return result
         
         # Extraer paths de archivos creados
         if step.tool == 'file_manager' and 'path' in result:
@@ -638,20 +716,27 @@ class ExecutionEngine:
                 source_step=step.id
             )
         
-        # Guardar resultado completo
+        # Guardar resultado completo (se desborda una sola vez y se comparte el handle)
+        stored_result = self.context_manager.spill_value(result, VariableType.RESULT)
         self.context_manager.set_variable(
             context.context_session_id,
             f"{step.id}_result",
-            result,
+            stored_result,
             VariableType.RESULT,
             ContextScope.STEP,
             source_step=step.id
         )
         
-        # También mantener compatibilidad con el contexto local
+        # También mantener compatibilidad con el contexto local (sin retener salidas grandes)
         context.variables[f"{step.id}_file_path"] = result.get('path')
-        context.variables[f"{step.id}_search_results"] = result.get('search_results')
-        context.variables[f"{step.id}_output"] = result.get('stdout')
+        context.variables[f"{step.id}_search_results"] = self.context_manager.spill_value(
+            result.get('search_results'), VariableType.RESULT
+        )
+        context.variables[f"{step.id}_output"] = self.context_manager.spill_value(
+            result.get('stdout'), VariableType.STRING
+        )
+        
+        return stored_result
     
     async def _initialize_context_variables(self, context: ExecutionContext, 
                                           task_title: str, task_description: str):
@@ -828,39 +913,6 @@ class ExecutionEngine:
         
         return False
     
-    def _group_steps_by_dependencies(self, steps: List[TaskStep]) -> List[List[TaskStep]]:
-        """Agrupar pasos por niveles de dependencias para ejecución paralela"""
-        
-        levels = []
-        remaining_steps = steps.copy()
-        
-        while remaining_steps:
-            current_level = []
-            
-            for step in remaining_steps[:]:
-                # Un paso puede ejecutarse si todas sus dependencias están en niveles anteriores
-                can_execute = True
-                for dep_id in step.dependencies:
-                    dep_in_previous_levels = any(
-                        any(s.id == dep_id for s in level)
-                        for level in levels
-                    )
-                    if not dep_in_previous_levels:
-                        can_execute = False
-                        break
-                
-                if can_execute:
-                    current_level.append(step)
-                    remaining_steps.remove(step)
-            
-            if current_level:
-                levels.append(current_level)
-            else:
-                # Evitar bucles infinitos
-                break
-        
-        return levels
-    
     async def _notify_progress(self, context: ExecutionContext, event: str, data: Dict[str, Any]):
         """Notificar progreso a callbacks registrados"""
         
@@ -13,6 +13,8 @@ import tempfile
 from pathlib import Path
 import time
 
+from ..monitoring.sampling_profiler import inherit_thread_tags
+
 # Playwright será instalado como dependencia
 try:
     from playwright.async_api import async_playwright
@@ -209,7 +211,8 @@ class PlaywrightTool:
             
             # Ejecutar en un hilo separado con display virtual
             with concurrent.futures.ThreadPoolExecutor() as executor:
-                future = executor.submit(run_async_action)
+                # Heredar etiquetas del hilo (task_id) para el profiler de muestreo
+                future = executor.submit(inherit_thread_tags(run_async_action))
                 result = future.result(timeout=120)  # Timeout de 120 segundos para navegación completa
                 return result
         
@@ -22,6 +22,7 @@ from .qstash_tool import QStashTool
 from .playwright_tool import PlaywrightTool
 from .container_manager import ContainerManager
 from .autonomous_web_navigation import AutonomousWebNavigation
+from ..monitoring.tracing import traced
 
 class ToolManager:
     def __init__(self):
@@ -164,6 +165,7 @@ class ToolManager:
         """Verificar si una herramienta está habilitada"""
         return self.security_config.get(tool_name, {}).get('enabled', False)
     
+    @traced('tool.execute', lambda args: {'tool.name': args['tool_name'], 'task_id': args['task_id']})
     def execute_tool(self, tool_name: str, parameters: Dict[str, Any], 
                     config: Dict[str, Any] = None, task_id: str = None) -> Dict[str, Any]:
         """Ejecutar una herramienta con configuración y estadísticas mejoradas"""
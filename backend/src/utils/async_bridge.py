@@ -0,0 +1,178 @@
+"""
+Puente entre handlers síncronos (Flask) y un event loop asyncio persistente
+
+Un único loop de larga duración corre en un hilo dedicado propiedad de la
+aplicación. Los handlers envían corrutinas con run_coroutine_threadsafe y
+esperan el resultado con timeout, en lugar de crear y destruir un loop por
+petición con asyncio.run(). Así los recursos asíncronos (clientes, executors
+de embeddings, cachés) se comparten entre peticiones.
+"""
+
+import asyncio
+import concurrent.futures
+import logging
+import os
+import threading
+import time
+from typing import Any, Awaitable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncLoopBridge:
+    """Event loop en segundo plano al que se envían corrutinas desde otros hilos"""
+
+    def __init__(self, name: str = 'mitosis-async-loop', default_timeout: float = 30.0):
+        self.name = name
+        self.default_timeout = default_timeout
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._started = threading.Event()
+        self._lock = threading.Lock()
+        self._in_flight = 0
+
+        self.stats = {
+            'submitted': 0,
+            'completed': 0,
+            'failed': 0,
+            'timeouts': 0,
+            'total_time': 0.0,
+            'max_time': 0.0
+        }
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        self.start()
+        return self._loop
+
+    @property
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """Arrancar el hilo del loop (idempotente)"""
+        if self.is_running:
+            return
+        with self._lock:
+            if self.is_running:
+                return
+            self._started.clear()
+            self._thread = threading.Thread(target=self._run_loop, name=self.name, daemon=True)
+            self._thread.start()
+        self._started.wait()
+        logger.info(f"🔁 Async loop bridge '{self.name}' started")
+
+    def _run_loop(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._started.set()
+        try:
+            self._loop.run_forever()
+        finally:
+            pending = asyncio.all_tasks(self._loop)
+            for task in pending:
+                task.cancel()
+            if pending:
+                self._loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+            self._loop.run_until_complete(self._loop.shutdown_asyncgens())
+            self._loop.close()
+
+    def submit(self, coro: Awaitable) -> concurrent.futures.Future:
+        """Enviar una corrutina al loop sin esperar su resultado"""
+        loop = self.loop
+        with self._lock:
+            self.stats['submitted'] += 1
+            self._in_flight += 1
+        future = asyncio.run_coroutine_threadsafe(coro, loop)
+        future.add_done_callback(self._on_done)
+        return future
+
+    def _on_done(self, future: concurrent.futures.Future):
+        with self._lock:
+            self._in_flight -= 1
+
+    def run(self, coro: Awaitable, timeout: float = None) -> Any:
+        """
+        Ejecutar una corrutina en el loop y esperar su resultado
+
+        Args:
+            coro: Corrutina a ejecutar
+            timeout: Segundos máximos de espera (por defecto default_timeout)
+
+        Raises:
+            TimeoutError: Si se supera el timeout (la corrutina se cancela)
+            RuntimeError: Si se llama desde el propio hilo del loop
+        """
+        if threading.current_thread() is self._thread:
+            coro.close()
+            raise RuntimeError("AsyncLoopBridge.run() cannot be called from the bridge loop thread")
+
+        timeout = self.default_timeout if timeout is None else timeout
+        start_time = time.time()
+        future = self.submit(coro)
+
+        try:
+            result = future.result(timeout=timeout)
+            self._record(start_time, 'completed')
+            return result
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            self._record(start_time, 'timeouts')
+            raise TimeoutError(f"Coroutine did not finish within {timeout}s")
+        except Exception:
+            self._record(start_time, 'failed')
+            raise
+
+    async def run_async(self, coro: Awaitable, timeout: float = None) -> Any:
+        """Esperar desde otro event loop (p.ej. ASGI) una corrutina ejecutada en el puente"""
+        timeout = self.default_timeout if timeout is None else timeout
+        start_time = time.time()
+        future = asyncio.wrap_future(self.submit(coro))
+
+        try:
+            result = await asyncio.wait_for(future, timeout)
+            self._record(start_time, 'completed')
+            return result
+        except asyncio.TimeoutError:
+            self._record(start_time, 'timeouts')
+            raise TimeoutError(f"Coroutine did not finish within {timeout}s")
+        except Exception:
+            self._record(start_time, 'failed')
+            raise
+
+    def _record(self, start_time: float, outcome: str):
+        elapsed = time.time() - start_time
+        with self._lock:
+            self.stats[outcome] += 1
+            self.stats['total_time'] += elapsed
+            self.stats['max_time'] = max(self.stats['max_time'], elapsed)
+
+    def stop(self, timeout: float = 5.0):
+        """Detener el loop cancelando las tareas pendientes"""
+        if not self.is_running:
+            return
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=timeout)
+        logger.info(f"🔁 Async loop bridge '{self.name}' stopped")
+
+    def get_statistics(self) -> Dict[str, Any]:
+        finished = self.stats['completed'] + self.stats['failed'] + self.stats['timeouts']
+        return {
+            **self.stats,
+            'running': self.is_running,
+            'in_flight': self._in_flight,
+            'average_time': self.stats['total_time'] / finished if finished else 0.0
+        }
+
+
+# Instancia global del puente
+_bridge_instance = None
+
+def get_async_bridge() -> AsyncLoopBridge:
+    """Obtener instancia singleton del AsyncLoopBridge"""
+    global _bridge_instance
+    if _bridge_instance is None:
+        _bridge_instance = AsyncLoopBridge(
+            default_timeout=float(os.getenv('ASYNC_BRIDGE_TIMEOUT', '30'))
+        )
+    return _bridge_instance
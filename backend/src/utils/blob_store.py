@@ -0,0 +1,224 @@
+"""
+Almacén de blobs direccionado por contenido
+
+Las salidas grandes de los pasos (páginas extraídas, informes, capturas en
+base64...) se escriben una sola vez en disco, con el SHA-256 del contenido
+como nombre, y en memoria solo queda un BlobHandle pequeño y serializable.
+El consumidor decide cómo leerlo: materializado (read), como flujo
+(open / iter_chunks) o mapeado en memoria (mmap) sin cargarlo entero.
+"""
+
+import hashlib
+import io
+import logging
+import mmap
+import os
+import pickle
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+ENCODING_TEXT = 'text'
+ENCODING_BYTES = 'bytes'
+ENCODING_PICKLE = 'pickle'
+
+PREVIEW_CHARS = 200
+
+
+@dataclass(frozen=True)
+class BlobHandle:
+    """Referencia a un blob en disco (lo que se guarda en variables y checkpoints)"""
+    digest: str
+    size: int
+    encoding: str
+    path: str
+    preview: str = ''
+
+    def read(self) -> Any:
+        """Materializar el valor original"""
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        if self.encoding == ENCODING_TEXT:
+            return data.decode('utf-8')
+        if self.encoding == ENCODING_PICKLE:
+            return pickle.loads(data)
+        return data
+
+    def open(self) -> Union[io.BufferedReader, io.TextIOWrapper]:
+        """Flujo de lectura: texto para blobs de texto, binario para el resto"""
+        if self.encoding == ENCODING_TEXT:
+            return open(self.path, 'r', encoding='utf-8')
+        return open(self.path, 'rb')
+
+    def iter_chunks(self, chunk_size: int = 64 * 1024) -> Iterator[Union[str, bytes]]:
+        """Recorrer el contenido por trozos sin cargarlo entero"""
+        with self.open() as stream:
+            while True:
+                chunk = stream.read(chunk_size)
+                if not chunk:
+                    return
+                yield chunk
+
+    def mmap(self) -> Union[mmap.mmap, bytes]:
+        """Vista de solo lectura mapeada en memoria (el llamante debe cerrarla)"""
+        if self.size == 0:
+            return b''
+        with open(self.path, 'rb') as f:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+
+def estimate_size(value: Any, limit: int) -> int:
+    """
+    Estimación barata del tamaño serializado (textos y bytes dentro de
+    contenedores); deja de contar en cuanto supera `limit`
+    """
+    total = 0
+    stack = [value]
+    while stack and total <= limit:
+        item = stack.pop()
+        if isinstance(item, str):
+            total += len(item)
+        elif isinstance(item, (bytes, bytearray)):
+            total += len(item)
+        elif isinstance(item, dict):
+            total += 8 * len(item)
+            stack.extend(item.keys())
+            stack.extend(item.values())
+        elif isinstance(item, (list, tuple, set)):
+            total += 8 * len(item)
+            stack.extend(item)
+        else:
+            total += 8
+    return total
+
+
+class BlobStore:
+    """Blobs en <root>/<2 primeros hex>/<sha256>, deduplicados por contenido"""
+
+    def __init__(self, root: Union[str, Path]):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self.stats = {
+            'blobs_written': 0,
+            'bytes_written': 0,
+            'deduplicated': 0,
+            'blobs_collected': 0
+        }
+
+    def _path(self, digest: str) -> Path:
+        return self.root / digest[:2] / digest
+
+    def put(self, value: Any) -> BlobHandle:
+        """Guardar un valor (texto, bytes o cualquier objeto serializable)"""
+        if isinstance(value, BlobHandle):
+            return value
+        if isinstance(value, str):
+            data, encoding = value.encode('utf-8'), ENCODING_TEXT
+            preview = value[:PREVIEW_CHARS]
+        elif isinstance(value, (bytes, bytearray)):
+            data, encoding, preview = bytes(value), ENCODING_BYTES, ''
+        else:
+            data, encoding = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), ENCODING_PICKLE
+            if isinstance(value, dict):
+                preview = f"dict keys: {', '.join(str(key) for key in list(value)[:20])}"
+            else:
+                preview = f"<{type(value).__name__}>"
+        return self.put_bytes(data, encoding, preview)
+
+    def put_bytes(self, data: bytes, encoding: str = ENCODING_BYTES, preview: str = '') -> BlobHandle:
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._path(digest)
+        with self._lock:
+            if path.exists():
+                # Mismo contenido ya guardado: renovar su antigüedad para la recolección
+                os.utime(path)
+                self.stats['deduplicated'] += 1
+            else:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                temp_path = path.with_name(f"{digest}.{os.getpid()}.{threading.get_ident()}.tmp")
+                with open(temp_path, 'wb') as f:
+                    f.write(data)
+                os.replace(temp_path, path)
+                self.stats['blobs_written'] += 1
+                self.stats['bytes_written'] += len(data)
+        return BlobHandle(digest=digest, size=len(data), encoding=encoding, path=str(path), preview=preview)
+
+    def put_stream(self, chunks: Iterable[Union[str, bytes]], encoding: str = ENCODING_BYTES) -> BlobHandle:
+        """Guardar un contenido producido por trozos sin tenerlo entero en memoria"""
+        hasher = hashlib.sha256()
+        size = 0
+        preview = ''
+        temp_path = self.root / f"incoming.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, 'wb') as f:
+            for chunk in chunks:
+                if isinstance(chunk, str):
+                    if len(preview) < PREVIEW_CHARS:
+                        preview += chunk[:PREVIEW_CHARS - len(preview)]
+                    chunk = chunk.encode('utf-8')
+                hasher.update(chunk)
+                size += len(chunk)
+                f.write(chunk)
+        digest = hasher.hexdigest()
+        path = self._path(digest)
+        with self._lock:
+            if path.exists():
+                temp_path.unlink()
+                os.utime(path)
+                self.stats['deduplicated'] += 1
+            else:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                os.replace(temp_path, path)
+                self.stats['blobs_written'] += 1
+                self.stats['bytes_written'] += size
+        return BlobHandle(digest=digest, size=size, encoding=encoding, path=str(path), preview=preview)
+
+    def maybe_spill(self, value: Any, threshold: Optional[int]) -> Any:
+        """Devolver un BlobHandle si el valor supera el umbral; si no, el propio valor"""
+        if threshold is None or value is None or isinstance(value, (BlobHandle, bool, int, float)):
+            return value
+        if isinstance(value, str):
+            # Menos de threshold/4 caracteres no puede llegar al umbral en UTF-8
+            if len(value) < threshold // 4 or len(value.encode('utf-8')) < threshold:
+                return value
+        elif estimate_size(value, threshold) < threshold:
+            return value
+        try:
+            return self.put(value)
+        except Exception as e:
+            logger.warning(f"⚠️ Could not spill value to blob store, keeping it in memory: {e}")
+            return value
+
+    def collect_garbage(self, max_age_seconds: float, live_digests: Iterable[str] = ()) -> int:
+        """Eliminar blobs sin escribir ni reutilizar en `max_age_seconds` que no estén en uso"""
+        live = set(live_digests)
+        cutoff = time.time() - max_age_seconds
+        removed = 0
+        with self._lock:
+            for path in self.root.glob('*/*'):
+                if path.name in live or path.suffix == '.tmp':
+                    continue
+                try:
+                    if path.stat().st_mtime < cutoff:
+                        path.unlink()
+                        removed += 1
+                except FileNotFoundError:
+                    continue
+            self.stats['blobs_collected'] += removed
+        if removed:
+            logger.info(f"🧹 Blob store: {removed} blobs collected")
+        return removed
+
+    def get_statistics(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.stats)
+        stored = [path.stat().st_size for path in self.root.glob('*/*') if path.suffix != '.tmp']
+        stats.update(stored_blobs=len(stored), stored_bytes=sum(stored), root=str(self.root))
+        return stats
@@ -0,0 +1,274 @@
+"""
+Planificador de flujo de datos para planes con dependencias (DAG)
+
+En lugar de agrupar los pasos por niveles y esperar a que termine el nivel
+completo, cada paso se lanza en cuanto termina su última dependencia:
+
+- Contadores de grado de entrada y cola de listos, O(V + E) en total
+- Límite de pasos en curso (max_in_flight) y, opcionalmente, por grupo
+  (p. ej. por herramienta: group_limits={'web_search': 3, 'ollama': 2})
+- Prioridad por camino crítico: primero los pasos con más duración
+  estimada pendiente hasta el final del plan
+- Si un paso falla, sus dependientes (directos e indirectos) se cancelan
+"""
+
+import asyncio
+import heapq
+import logging
+import os
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class DAGNode:
+    """Paso a planificar"""
+    node_id: str
+    dependencies: List[str] = field(default_factory=list)
+    estimated_duration: float = 1.0
+    payload: Any = None
+    group: Optional[str] = None  # Grupo de concurrencia (ver DAGScheduler.group_limits)
+
+
+@dataclass
+class DAGRunResult:
+    """Resultado de ejecutar un DAG"""
+    results: Dict[str, Any] = field(default_factory=dict)
+    failed: Dict[str, str] = field(default_factory=dict)
+    cancelled: Dict[str, str] = field(default_factory=dict)
+    completion_order: List[str] = field(default_factory=list)
+    critical_path: List[str] = field(default_factory=list)
+    critical_path_duration: float = 0.0
+    max_concurrency: int = 0
+    execution_time: float = 0.0
+
+    @property
+    def succeeded(self) -> List[str]:
+        return [node_id for node_id in self.completion_order
+                if node_id not in self.failed and node_id not in self.cancelled]
+
+
+class DAGScheduler:
+    """Ejecuta los nodos de un DAG con una cola de listos"""
+
+    def __init__(self, max_in_flight: int = None, fail_fast: bool = False,
+                 group_limits: Dict[str, int] = None):
+        """
+        Args:
+            max_in_flight: Pasos ejecutándose a la vez (DAG_MAX_IN_FLIGHT, 4)
+            fail_fast: Si un paso falla, no lanzar nada más y cancelar los que están en curso
+            group_limits: Máximo de pasos en curso por grupo; los grupos sin límite solo
+                          cuentan para max_in_flight
+        """
+        self.max_in_flight = max(1, max_in_flight or int(os.getenv('DAG_MAX_IN_FLIGHT', '4')))
+        self.fail_fast = fail_fast
+        self.group_limits = {group: max(1, limit) for group, limit in (group_limits or {}).items()}
+
+    @staticmethod
+    def build_graph(nodes: List[DAGNode]):
+        """Dependientes por nodo, grado de entrada y dependencias inexistentes"""
+        node_ids = {node.node_id for node in nodes}
+        dependents: Dict[str, List[str]] = {node.node_id: [] for node in nodes}
+        in_degree: Dict[str, int] = {}
+        missing: Dict[str, List[str]] = {}
+        for node in nodes:
+            dependencies = list(dict.fromkeys(node.dependencies or []))
+            unknown = [dep for dep in dependencies if dep not in node_ids]
+            if unknown:
+                missing[node.node_id] = unknown
+            known = [dep for dep in dependencies if dep in node_ids]
+            in_degree[node.node_id] = len(known)
+            for dep in known:
+                dependents[dep].append(node.node_id)
+        return dependents, in_degree, missing
+
+    @classmethod
+    def compute_priorities(cls, nodes: List[DAGNode]) -> Dict[str, float]:
+        """
+        Duración estimada del camino más largo desde cada nodo hasta el final
+        (rango ascendente), en orden topológico inverso: O(V + E)
+        """
+        dependents, in_degree, _ = cls.build_graph(nodes)
+        durations = {node.node_id: max(0.0, float(node.estimated_duration or 0)) for node in nodes}
+
+        remaining = dict(in_degree)
+        queue = deque(node_id for node_id, degree in remaining.items() if degree == 0)
+        topological = []
+        while queue:
+            node_id = queue.popleft()
+            topological.append(node_id)
+            for dependent in dependents[node_id]:
+                remaining[dependent] -= 1
+                if remaining[dependent] == 0:
+                    queue.append(dependent)
+
+        priorities: Dict[str, float] = {}
+        for node_id in reversed(topological):
+            priorities[node_id] = durations[node_id] + max(
+                (priorities[dependent] for dependent in dependents[node_id]), default=0.0
+            )
+        # Nodos en ciclos: sin orden topológico, prioridad por su propia duración
+        for node_id in durations:
+            priorities.setdefault(node_id, durations[node_id])
+        return priorities
+
+    @classmethod
+    def critical_path(cls, nodes: List[DAGNode], priorities: Dict[str, float] = None) -> List[str]:
+        """Camino crítico siguiendo siempre al dependiente de mayor prioridad"""
+        if not nodes:
+            return []
+        priorities = priorities or cls.compute_priorities(nodes)
+        dependents, in_degree, missing = cls.build_graph(nodes)
+        sources = [node_id for node_id, degree in in_degree.items() if degree == 0 and node_id not in missing]
+        if not sources:
+            return []
+        path = [max(sources, key=lambda node_id: priorities[node_id])]
+        while dependents[path[-1]]:
+            path.append(max(dependents[path[-1]], key=lambda node_id: priorities[node_id]))
+        return path
+
+    async def run(self, nodes: List[DAGNode],
+                  execute: Callable[[DAGNode], Awaitable[Any]],
+                  is_success: Callable[[Any], bool] = None,
+                  on_complete: Callable[[DAGNode, Any, bool], Awaitable[Optional[bool]]] = None) -> DAGRunResult:
+        """
+        Ejecutar el DAG
+
+        Args:
+            nodes: Nodos en el orden del plan (desempata prioridades iguales)
+            execute: Corrutina que ejecuta un nodo; una excepción cuenta como fallo
+            is_success: Decide si el valor devuelto es un éxito (por defecto siempre)
+            on_complete: Corrutina tras cada nodo; si devuelve False no se lanza nada más
+
+        Returns:
+            DAGRunResult con resultados, fallos y nodos cancelados (con el motivo)
+        """
+        started_at = time.time()
+        result = DAGRunResult()
+        by_id = {node.node_id: node for node in nodes}
+        order = {node.node_id: index for index, node in enumerate(nodes)}
+        dependents, in_degree, missing = self.build_graph(nodes)
+        priorities = self.compute_priorities(nodes)
+        result.critical_path = self.critical_path(nodes, priorities)
+        result.critical_path_duration = priorities[result.critical_path[0]] if result.critical_path else 0.0
+
+        def cancel_dependents(root_id: str, reason: str):
+            queue = deque(dependents.get(root_id, []))
+            while queue:
+                node_id = queue.popleft()
+                if node_id in result.cancelled:
+                    continue
+                result.cancelled[node_id] = reason
+                queue.extend(dependents[node_id])
+
+        for node_id, unknown in missing.items():
+            if node_id not in result.cancelled:
+                result.cancelled[node_id] = f"missing dependency: {', '.join(unknown)}"
+                cancel_dependents(node_id, f"dependency {node_id} cancelled")
+
+        ready: List = []
+        for node in nodes:
+            if in_degree[node.node_id] == 0 and node.node_id not in result.cancelled:
+                heapq.heappush(ready, (-priorities[node.node_id], order[node.node_id], node.node_id))
+
+        in_flight: Dict[asyncio.Task, str] = {}
+        group_running: Dict[str, int] = {}
+        stopped = False
+
+        try:
+            while ready or in_flight:
+                # Los listos cuyo grupo está lleno esperan sin ocupar hueco
+                deferred = []
+                while ready and len(in_flight) < self.max_in_flight and not stopped:
+                    item = heapq.heappop(ready)
+                    node_id = item[2]
+                    if node_id in result.cancelled:
+                        continue
+                    group = by_id[node_id].group
+                    if group in self.group_limits and group_running.get(group, 0) >= self.group_limits[group]:
+                        deferred.append(item)
+                        continue
+                    task = asyncio.ensure_future(execute(by_id[node_id]))
+                    in_flight[task] = node_id
+                    if group is not None:
+                        group_running[group] = group_running.get(group, 0) + 1
+                    result.max_concurrency = max(result.max_concurrency, len(in_flight))
+                for item in deferred:
+                    heapq.heappush(ready, item)
+
+                if not in_flight:
+                    break
+
+                done, _ = await asyncio.wait(in_flight.keys(), return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    node_id = in_flight.pop(task)
+                    node = by_id[node_id]
+                    if node.group is not None:
+                        group_running[node.group] -= 1
+                    try:
+                        value = task.result()
+                        success = is_success(value) if is_success else True
+                        if success:
+                            result.results[node_id] = value
+                        else:
+                            result.failed[node_id] = 'step reported failure'
+                            result.results[node_id] = value
+                    except asyncio.CancelledError:
+                        value, success = None, False
+                        result.cancelled[node_id] = 'cancelled while running'
+                    except Exception as e:
+                        value, success = None, False
+                        result.failed[node_id] = str(e)
+                    result.completion_order.append(node_id)
+
+                    if success:
+                        for dependent in dependents[node_id]:
+                            in_degree[dependent] -= 1
+                            if in_degree[dependent] == 0 and dependent not in result.cancelled:
+                                heapq.heappush(ready, (-priorities[dependent], order[dependent], dependent))
+                    else:
+                        cancel_dependents(node_id, f"dependency {node_id} failed")
+                        if self.fail_fast:
+                            stopped = True
+
+                    if on_complete is not None and not stopped:
+                        if await on_complete(node, value, success) is False:
+                            stopped = True
+
+                if stopped:
+                    if self.fail_fast and in_flight:
+                        for task in in_flight:
+                            task.cancel()
+                        await asyncio.gather(*in_flight.keys(), return_exceptions=True)
+                        for task, node_id in in_flight.items():
+                            if task.cancelled():
+                                result.cancelled[node_id] = 'cancelled (fail fast)'
+                            elif task.exception() is not None:
+                                result.failed[node_id] = str(task.exception())
+                            else:
+                                result.results[node_id] = task.result()
+                                result.completion_order.append(node_id)
+                        in_flight.clear()
+                    while ready:
+                        _, _, node_id = heapq.heappop(ready)
+                        result.cancelled.setdefault(node_id, 'execution stopped')
+        except asyncio.CancelledError:
+            for task in in_flight:
+                task.cancel()
+            await asyncio.gather(*in_flight.keys(), return_exceptions=True)
+            raise
+
+        # Lo que nunca llegó a estar listo: ciclos o ejecución detenida
+        for node in nodes:
+            if (node.node_id not in result.results and node.node_id not in result.failed
+                    and node.node_id not in result.cancelled):
+                result.cancelled[node.node_id] = 'execution stopped' if stopped else 'dependency cycle'
+
+        result.execution_time = time.time() - started_at
+        logger.info(f"🧮 DAG executed: {len(result.succeeded)} ok, {len(result.failed)} failed, "
+                    f"{len(result.cancelled)} cancelled, max concurrency {result.max_concurrency}")
+        return result
@@ -0,0 +1,271 @@
+"""
+Parser JSON tolerante y reparación guiada por esquema
+Procesa la salida del LLM de forma incremental (admite fragmentos en
+streaming), ignora texto y bloques ``` alrededor del objeto, elimina comas
+finales, escapa saltos de línea dentro de cadenas y cierra localmente una
+salida truncada, de modo que un JSON casi válido no cueste otra generación.
+"""
+
+import json
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+import jsonschema
+
+logger = logging.getLogger(__name__)
+
+CLOSERS = {'{': '}', '[': ']'}
+CONTROL_ESCAPES = {'\n': '\\n', '\r': '\\r', '\t': '\\t'}
+
+
+class IncrementalJSONParser:
+    """Parser incremental que repara JSON truncado o mal terminado"""
+
+    def __init__(self, max_safe_points: int = 256, root: str = None):
+        """
+        Args:
+            max_safe_points: Puntos de corte recordados para cerrar una salida truncada
+            root: '{' o '[' para empezar solo en ese tipo de apertura (raíz del esquema)
+        """
+        self.max_safe_points = max_safe_points
+        self.openers = root if root in CLOSERS else ''.join(CLOSERS)
+        self._reset()
+
+    def _reset(self):
+        self._out: List[str] = []
+        self._raw: List[str] = []
+        self._stack: List[str] = []
+        self._in_string = False
+        self._escape = False
+        self._started = False
+        self.done = False
+        self._value = None
+        # (longitud de salida, pila, tras_apertura) justo antes de cada coma o tras
+        # cada apertura: puntos donde cortar deja un documento cerrable
+        self._safe_points: List[Tuple[int, Tuple[str, ...], bool]] = []
+        self.repairs: List[str] = []
+
+    def _repair(self, kind: str):
+        if kind not in self.repairs:
+            self.repairs.append(kind)
+
+    def _mark_safe_point(self, length: int, after_opener: bool = False):
+        self._safe_points.append((length, tuple(self._stack), after_opener))
+        if len(self._safe_points) > self.max_safe_points:
+            del self._safe_points[0]
+
+    def feed(self, chunk: str) -> 'IncrementalJSONParser':
+        """Procesar un fragmento de texto; lo posterior al cierre del objeto se ignora"""
+        while chunk and not self.done:
+            chunk = self._consume(chunk)
+        return self
+
+    def _consume(self, chunk: str) -> str:
+        """
+        Procesar chunk; si el valor de nivel superior se cierra pero no es JSON
+        (p.ej. '[v1]' en el texto previo), se descarta y se devuelve el texto
+        a reprocesar desde el carácter siguiente a su apertura
+        """
+        for position, char in enumerate(chunk):
+            if self.done:
+                break
+            if not self._started:
+                if char in self.openers:
+                    self._started = True
+                else:
+                    continue
+            self._raw.append(char)
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                    self._out.append(char)
+                elif char == '\\':
+                    self._escape = True
+                    self._out.append(char)
+                elif char == '"':
+                    self._in_string = False
+                    self._out.append(char)
+                elif char in CONTROL_ESCAPES:
+                    self._repair('control_character')
+                    self._out.append(CONTROL_ESCAPES[char])
+                else:
+                    self._out.append(char)
+                continue
+
+            if char == '"':
+                self._in_string = True
+                self._out.append(char)
+            elif char in CLOSERS:
+                self._stack.append(char)
+                self._out.append(char)
+                self._mark_safe_point(len(self._out), after_opener=True)
+            elif char in '}]':
+                self._strip_trailing_comma()
+                if not self._stack:
+                    self.done = True
+                    break
+                expected = CLOSERS[self._stack.pop()]
+                if char != expected:
+                    self._repair('mismatched_bracket')
+                self._out.append(expected)
+                if not self._stack:
+                    self.done = True
+            elif char == ',':
+                self._mark_safe_point(len(self._out))
+                self._out.append(char)
+            else:
+                self._out.append(char)
+
+            if self.done:
+                try:
+                    self._value = json.loads(''.join(self._out))
+                except json.JSONDecodeError:
+                    pending = ''.join(self._raw[1:]) + chunk[position + 1:]
+                    self._reset()
+                    return pending
+        return ''
+
+    def _strip_trailing_comma(self):
+        index = len(self._out) - 1
+        while index >= 0 and self._out[index].isspace():
+            index -= 1
+        if index >= 0 and self._out[index] == ',':
+            del self._out[index]
+            self._repair('trailing_comma')
+
+    @staticmethod
+    def _close(text: str, stack) -> str:
+        return text + ''.join(CLOSERS[opener] for opener in reversed(stack))
+
+    def snapshot(self) -> Tuple[Optional[Any], List[str]]:
+        """
+        Mejor valor parseable con lo recibido hasta ahora
+
+        Returns:
+            (valor o None, reparaciones aplicadas)
+        """
+        if not self._started:
+            return None, list(self.repairs)
+
+        text = ''.join(self._out)
+        repairs = list(self.repairs)
+        if self.done:
+            return self._value, repairs
+
+        if self._in_string:
+            text += '\\' if self._escape else ''
+            text += '"'
+        candidate = self._close(text.rstrip().rstrip(','), self._stack)
+        try:
+            value = json.loads(candidate)
+            if not self.done:
+                repairs.append('truncated')
+            return value, repairs
+        except json.JSONDecodeError:
+            pass
+
+        # Retroceder hasta el último valor completo y cerrar desde ahí; los cortes
+        # tras una coma van primero para no dejar un elemento vacío e incompleto
+        ordered = sorted(reversed(self._safe_points), key=lambda point: point[2])
+        for length, stack, _ in ordered:
+            candidate = self._close(''.join(self._out[:length]), stack)
+            try:
+                value = json.loads(candidate)
+                repairs.append('truncated')
+                return value, repairs
+            except json.JSONDecodeError:
+                continue
+        return None, repairs
+
+
+def parse_json_tolerant(text: str, root: str = None) -> Tuple[Optional[Any], List[str]]:
+    """Parsear el primer objeto/array JSON de un texto reparándolo si hace falta
+
+    Con root ('{' o '['), solo se considera un valor de ese tipo.
+    """
+    if not text:
+        return None, []
+    return IncrementalJSONParser(root=root).feed(text).snapshot()
+
+
+def _types_of(schema: Dict[str, Any]) -> List[str]:
+    schema_type = schema.get('type')
+    if schema_type is None:
+        return []
+    return schema_type if isinstance(schema_type, list) else [schema_type]
+
+
+def coerce_to_schema(value: Any, schema: Dict[str, Any]) -> Tuple[Any, List[str]]:
+    """
+    Corregir localmente desviaciones que no necesitan otra generación:
+    claves no permitidas, cadenas demasiado largas, listas con demasiados
+    elementos, enums con otra capitalización y enums inválidos con 'default'
+
+    Returns:
+        (valor corregido, descripción de los cambios)
+    """
+    fixes: List[str] = []
+
+    def coerce(node: Any, node_schema: Dict[str, Any], path: str) -> Any:
+        types = _types_of(node_schema)
+
+        if isinstance(node, dict) and 'object' in types:
+            properties = node_schema.get('properties', {})
+            if node_schema.get('additionalProperties') is False:
+                for key in [key for key in node if key not in properties]:
+                    del node[key]
+                    fixes.append(f"{path}.{key}: propiedad no permitida eliminada")
+            for key, prop_schema in properties.items():
+                if key in node:
+                    node[key] = coerce(node[key], prop_schema, f"{path}.{key}")
+            return node
+
+        if isinstance(node, list) and 'array' in types:
+            max_items = node_schema.get('maxItems')
+            if max_items is not None and len(node) > max_items:
+                fixes.append(f"{path}: {len(node)} elementos recortados a {max_items}")
+                del node[max_items:]
+            item_schema = node_schema.get('items')
+            if isinstance(item_schema, dict):
+                node[:] = [coerce(item, item_schema, f"{path}[{i}]") for i, item in enumerate(node)]
+            return node
+
+        if isinstance(node, str):
+            enum = node_schema.get('enum')
+            if enum and node not in enum:
+                normalized = node.strip().lower()
+                match = next((option for option in enum if isinstance(option, str) and option.lower() == normalized), None)
+                if match is None and 'default' in node_schema:
+                    match = node_schema['default']
+                if match is not None:
+                    fixes.append(f"{path}: '{node}' -> '{match}'")
+                    return match
+            max_length = node_schema.get('maxLength')
+            if max_length is not None and len(node) > max_length:
+                fixes.append(f"{path}: recortado a {max_length} caracteres")
+                return node[:max_length].rstrip()
+            if 'string' not in types and 'number' in types:
+                try:
+                    return float(node)
+                except ValueError:
+                    pass
+        elif isinstance(node, (int, float)) and not isinstance(node, bool) and types == ['string']:
+            fixes.append(f"{path}: número convertido a cadena")
+            return str(node)
+        return node
+
+    return coerce(value, schema, '$'), fixes
+
+
+def describe_schema_errors(value: Any, schema: Dict[str, Any], limit: int = 10) -> List[str]:
+    """Errores de validación como 'ruta: mensaje', para un reintento dirigido"""
+    validator = jsonschema.Draft7Validator(schema)
+    errors = sorted(validator.iter_errors(value), key=lambda error: list(error.absolute_path))
+    described = []
+    for error in errors[:limit]:
+        path = '$'
+        for part in error.absolute_path:
+            path += f"[{part}]" if isinstance(part, int) else f".{part}"
+        described.append(f"{path}: {error.message}")
+    return described
@@ -0,0 +1,248 @@
+"""
+Mapa persistente (inmutable) con compartición estructural
+
+Trie de hash comprimido (HAMT) de 32 ramas: set/delete copian solo el
+camino hasta la clave (O(log32 n)) y el resto de nodos se comparte con la
+versión anterior, así que guardar una versión es guardar un puntero. La
+diferencia entre dos versiones recorre solo las ramas que no comparten.
+"""
+
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+_BITS = 5
+_MASK = (1 << _BITS) - 1
+_HASH_MASK = (1 << 64) - 1
+
+
+def _popcount(value: int) -> int:
+    return bin(value).count('1')
+
+
+class _Leaf:
+    __slots__ = ('hash', 'key', 'value')
+
+    def __init__(self, key_hash: int, key: Any, value: Any):
+        self.hash = key_hash
+        self.key = key
+        self.value = value
+
+
+class _Collision:
+    __slots__ = ('hash', 'pairs')
+
+    def __init__(self, key_hash: int, pairs: Tuple[Tuple[Any, Any], ...]):
+        self.hash = key_hash
+        self.pairs = pairs
+
+
+class _Node:
+    __slots__ = ('bitmap', 'slots')
+
+    def __init__(self, bitmap: int, slots: tuple):
+        self.bitmap = bitmap
+        self.slots = slots
+
+
+_EMPTY = _Node(0, ())
+
+
+def _hash(key: Any) -> int:
+    return hash(key) & _HASH_MASK
+
+
+def _merge(a, b, shift: int) -> _Node:
+    index_a = (a.hash >> shift) & _MASK
+    index_b = (b.hash >> shift) & _MASK
+    if index_a == index_b:
+        return _Node(1 << index_a, (_merge(a, b, shift + _BITS),))
+    if index_a < index_b:
+        return _Node((1 << index_a) | (1 << index_b), (a, b))
+    return _Node((1 << index_a) | (1 << index_b), (b, a))
+
+
+def _assoc(node: _Node, shift: int, key_hash: int, key: Any, value: Any) -> Tuple[_Node, bool]:
+    bit = 1 << ((key_hash >> shift) & _MASK)
+    index = _popcount(node.bitmap & (bit - 1))
+    if not node.bitmap & bit:
+        slots = node.slots[:index] + (_Leaf(key_hash, key, value),) + node.slots[index:]
+        return _Node(node.bitmap | bit, slots), True
+
+    slot = node.slots[index]
+    if isinstance(slot, _Node):
+        child, added = _assoc(slot, shift + _BITS, key_hash, key, value)
+        if child is slot:
+            return node, False
+    elif isinstance(slot, _Leaf):
+        if slot.hash == key_hash and slot.key == key:
+            if slot.value is value:
+                return node, False
+            child, added = _Leaf(key_hash, key, value), False
+        elif slot.hash == key_hash:
+            child, added = _Collision(key_hash, ((slot.key, slot.value), (key, value))), True
+        else:
+            child, added = _merge(slot, _Leaf(key_hash, key, value), shift + _BITS), True
+    elif slot.hash == key_hash:
+        pairs = tuple(pair for pair in slot.pairs if pair[0] != key)
+        added = len(pairs) == len(slot.pairs)
+        child = _Collision(key_hash, pairs + ((key, value),))
+    else:
+        child, added = _merge(slot, _Leaf(key_hash, key, value), shift + _BITS), True
+
+    return _Node(node.bitmap, node.slots[:index] + (child,) + node.slots[index + 1:]), added
+
+
+def _dissoc(node: _Node, shift: int, key_hash: int, key: Any) -> Tuple[Optional[_Node], bool]:
+    bit = 1 << ((key_hash >> shift) & _MASK)
+    if not node.bitmap & bit:
+        return node, False
+    index = _popcount(node.bitmap & (bit - 1))
+    slot = node.slots[index]
+
+    if isinstance(slot, _Node):
+        child, removed = _dissoc(slot, shift + _BITS, key_hash, key)
+        if not removed:
+            return node, False
+        # Un subárbol con una sola hoja se sube un nivel
+        if child is not None and len(child.slots) == 1 and not isinstance(child.slots[0], _Node):
+            child = child.slots[0]
+    elif isinstance(slot, _Leaf):
+        if slot.hash != key_hash or slot.key != key:
+            return node, False
+        child = None
+    else:
+        if slot.hash != key_hash:
+            return node, False
+        pairs = tuple(pair for pair in slot.pairs if pair[0] != key)
+        if len(pairs) == len(slot.pairs):
+            return node, False
+        child = _Leaf(key_hash, *pairs[0]) if len(pairs) == 1 else _Collision(key_hash, pairs)
+
+    if child is None:
+        if node.bitmap == bit:
+            return None, True
+        return _Node(node.bitmap & ~bit, node.slots[:index] + node.slots[index + 1:]), True
+    return _Node(node.bitmap, node.slots[:index] + (child,) + node.slots[index + 1:]), True
+
+
+def _items(slot) -> Iterator[Tuple[Any, Any]]:
+    if isinstance(slot, _Node):
+        for child in slot.slots:
+            yield from _items(child)
+    elif isinstance(slot, _Leaf):
+        yield slot.key, slot.value
+    elif slot is not None:
+        yield from slot.pairs
+
+
+def _diff(old, new, updated: Dict[Any, Any], removed: List[Any]):
+    if old is new:
+        return
+    if isinstance(old, _Node) and isinstance(new, _Node):
+        for position in range(1 << _BITS):
+            bit = 1 << position
+            old_child = old.slots[_popcount(old.bitmap & (bit - 1))] if old.bitmap & bit else None
+            new_child = new.slots[_popcount(new.bitmap & (bit - 1))] if new.bitmap & bit else None
+            if old_child is not None or new_child is not None:
+                _diff(old_child, new_child, updated, removed)
+        return
+    # Hojas o niveles distintos: comparar los (pocos) pares de ambos subárboles
+    old_items = dict(_items(old))
+    for key, value in _items(new):
+        if key not in old_items or old_items.pop(key) is not value:
+            updated[key] = value
+    removed.extend(old_items)
+
+
+class PersistentMap:
+    """Mapa inmutable: set y delete devuelven una versión nueva"""
+
+    __slots__ = ('_root', '_size')
+
+    def __init__(self, items: Dict[Any, Any] = None):
+        self._root = _EMPTY
+        self._size = 0
+        for key, value in (items or {}).items():
+            self._root, added = _assoc(self._root, 0, _hash(key), key, value)
+            self._size += added
+
+    @classmethod
+    def _from(cls, root: Optional[_Node], size: int) -> 'PersistentMap':
+        instance = cls.__new__(cls)
+        instance._root = root if root is not None else _EMPTY
+        instance._size = size
+        return instance
+
+    def set(self, key: Any, value: Any) -> 'PersistentMap':
+        root, added = _assoc(self._root, 0, _hash(key), key, value)
+        if root is self._root:
+            return self
+        return PersistentMap._from(root, self._size + added)
+
+    def delete(self, key: Any) -> 'PersistentMap':
+        root, removed = _dissoc(self._root, 0, _hash(key), key)
+        if not removed:
+            return self
+        return PersistentMap._from(root, self._size - 1)
+
+    def get(self, key: Any, default: Any = None) -> Any:
+        key_hash = _hash(key)
+        node, shift = self._root, 0
+        while True:
+            bit = 1 << ((key_hash >> shift) & _MASK)
+            if not node.bitmap & bit:
+                return default
+            slot = node.slots[_popcount(node.bitmap & (bit - 1))]
+            if isinstance(slot, _Node):
+                node, shift = slot, shift + _BITS
+                continue
+            if isinstance(slot, _Leaf):
+                return slot.value if slot.hash == key_hash and slot.key == key else default
+            for pair_key, value in slot.pairs:
+                if pair_key == key:
+                    return value
+            return default
+
+    def changes_since(self, older: 'PersistentMap') -> Tuple[Dict[Any, Any], List[Any]]:
+        """
+        Claves añadidas o cambiadas (por identidad del valor) y claves
+        eliminadas respecto a una versión anterior; coste proporcional a lo
+        que cambió gracias a los nodos compartidos
+        """
+        updated: Dict[Any, Any] = {}
+        removed: List[Any] = []
+        _diff(older._root, self._root, updated, removed)
+        return updated, removed
+
+    def __getitem__(self, key: Any) -> Any:
+        missing = object()
+        value = self.get(key, missing)
+        if value is missing:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key: Any) -> bool:
+        missing = object()
+        return self.get(key, missing) is not missing
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __iter__(self) -> Iterator[Any]:
+        for key, _ in _items(self._root):
+            yield key
+
+    def keys(self) -> Iterator[Any]:
+        return iter(self)
+
+    def values(self) -> Iterator[Any]:
+        for _, value in _items(self._root):
+            yield value
+
+    def items(self) -> Iterator[Tuple[Any, Any]]:
+        return _items(self._root)
+
+    def to_dict(self) -> Dict[Any, Any]:
+        return dict(_items(self._root))
+
+    def __repr__(self) -> str:
+        return f"PersistentMap({self.to_dict()!r})"
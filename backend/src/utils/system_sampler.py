@@ -0,0 +1,300 @@
+"""
+Muestreador de sistema compartido
+
+Un único hilo lee psutil y guarda cada muestra en un anillo NumPy
+preasignado; ResourceMonitor, EnhancedMonitoringSystem y ExecutionMonitor
+leen la última instantánea o una ventana (o se suscriben) sin hacer sus
+propias llamadas al sistema.
+
+- Intervalo adaptativo: SAMPLER_MIN_INTERVAL (1s) mientras hay actividad
+  (procesos hijo, cambios bruscos de CPU/memoria o carga alta) y crece
+  hasta SAMPLER_MAX_INTERVAL (5s) cuando el sistema está estable
+- Métricas del propio proceso y de cada hijo (shell, navegadores...), con
+  etiquetas opcionales registradas por las herramientas con watch_process
+"""
+
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+import psutil
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_FIELDS = (
+    'timestamp',
+    'cpu_percent',
+    'memory_percent',
+    'memory_used',
+    'disk_percent',
+    'disk_used',
+    'net_bytes_sent',
+    'net_bytes_recv',
+    'process_cpu_percent',
+    'process_rss',
+    'children_count',
+    'children_cpu_percent',
+    'children_rss',
+)
+FIELD_INDEX = {name: index for index, name in enumerate(SAMPLE_FIELDS)}
+
+
+class SystemSampler:
+    """Hilo único de muestreo con anillo de muestras y suscripciones"""
+
+    def __init__(self, capacity: int = None, min_interval: float = None,
+                 max_interval: float = None, disk_path: str = '/'):
+        self.capacity = capacity or int(os.getenv('SAMPLER_CAPACITY', '3600'))
+        self.min_interval = min_interval or float(os.getenv('SAMPLER_MIN_INTERVAL', '1.0'))
+        self.max_interval = max(self.min_interval, max_interval or float(os.getenv('SAMPLER_MAX_INTERVAL', '5.0')))
+        self.disk_path = disk_path
+        self.interval = self.min_interval
+
+        self._ring = np.zeros((self.capacity, len(SAMPLE_FIELDS)), dtype=np.float64)
+        self._written = 0
+        self._latest: Optional[Dict[str, float]] = None
+        self._latest_processes: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        self._sample_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._running = False
+
+        self._process = psutil.Process(os.getpid())
+        self._tracked: Dict[int, psutil.Process] = {}
+        self._labels: Dict[int, str] = {}
+
+        self._subscribers: Dict[int, Dict[str, Any]] = {}
+        self._next_token = 0
+
+        self.stats = {
+            'samples': 0,
+            'sample_errors': 0,
+            'avg_sample_time_ms': 0.0,
+            'callback_errors': 0
+        }
+
+    # ------------------------------------------------------------------ ciclo de vida
+
+    def start(self) -> 'SystemSampler':
+        """Arrancar el hilo de muestreo (idempotente)"""
+        with self._lock:
+            if self._running:
+                return self
+            self._running = True
+            self._thread = threading.Thread(target=self._run, name='mitosis-system-sampler', daemon=True)
+            self._thread.start()
+        logger.info(f"📈 System sampler started ({self.min_interval}-{self.max_interval}s, {self.capacity} samples)")
+        return self
+
+    def stop(self):
+        """Detener el hilo de muestreo"""
+        self._running = False
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join(timeout=5.0)
+            self._thread = None
+
+    def _run(self):
+        while self._running:
+            self.sample_now()
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+
+    # ------------------------------------------------------------------ muestreo
+
+    def sample_now(self) -> Optional[Dict[str, float]]:
+        """Tomar una muestra, guardarla y notificar a los suscriptores"""
+        started = time.perf_counter()
+        try:
+            with self._sample_lock:
+                sample, processes = self._collect()
+        except Exception as e:
+            self.stats['sample_errors'] += 1
+            logger.error(f"Error muestreando el sistema: {e}")
+            return None
+
+        with self._lock:
+            previous = self._latest
+            self._ring[self._written % self.capacity] = [sample[name] for name in SAMPLE_FIELDS]
+            self._written += 1
+            self._latest = sample
+            self._latest_processes = processes
+            self.interval = self._next_interval(previous, sample)
+
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            self.stats['samples'] += 1
+            self.stats['avg_sample_time_ms'] += (elapsed_ms - self.stats['avg_sample_time_ms']) / self.stats['samples']
+            due = []
+            for subscriber in self._subscribers.values():
+                if sample['timestamp'] - subscriber['last_delivery'] >= subscriber['interval']:
+                    subscriber['last_delivery'] = sample['timestamp']
+                    due.append(subscriber['callback'])
+
+        snapshot = dict(sample, processes=processes)
+        for callback in due:
+            try:
+                callback(snapshot)
+            except Exception as e:
+                self.stats['callback_errors'] += 1
+                logger.error(f"Error en suscriptor del muestreador: {e}")
+        return sample
+
+    def _collect(self):
+        memory = psutil.virtual_memory()
+        disk = psutil.disk_usage(self.disk_path)
+        net = psutil.net_io_counters()
+        sample = {
+            'timestamp': time.time(),
+            # Sin intervalo: diferencia desde la muestra anterior, no bloquea
+            'cpu_percent': psutil.cpu_percent(interval=None),
+            'memory_percent': memory.percent,
+            'memory_used': float(memory.used),
+            'disk_percent': (disk.used / disk.total) * 100 if disk.total else 0.0,
+            'disk_used': float(disk.used),
+            'net_bytes_sent': float(net.bytes_sent) if net else 0.0,
+            'net_bytes_recv': float(net.bytes_recv) if net else 0.0,
+        }
+
+        with self._process.oneshot():
+            sample['process_cpu_percent'] = self._process.cpu_percent(interval=None)
+            sample['process_rss'] = float(self._process.memory_info().rss)
+
+        processes = []
+        children = {child.pid: child for child in self._children()}
+        for pid in list(self._tracked):
+            if pid not in children:
+                del self._tracked[pid]
+        for pid, child in children.items():
+            tracked = self._tracked.setdefault(pid, child)
+            try:
+                with tracked.oneshot():
+                    processes.append({
+                        'pid': pid,
+                        'name': tracked.name(),
+                        'label': self._labels.get(pid),
+                        'cpu_percent': tracked.cpu_percent(interval=None),
+                        'rss': float(tracked.memory_info().rss)
+                    })
+            except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+                self._tracked.pop(pid, None)
+
+        sample['children_count'] = float(len(processes))
+        sample['children_cpu_percent'] = sum(process['cpu_percent'] for process in processes)
+        sample['children_rss'] = sum(process['rss'] for process in processes)
+        return sample, processes
+
+    def _children(self) -> List[psutil.Process]:
+        try:
+            children = self._process.children(recursive=True)
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            children = []
+        known = {child.pid for child in children}
+        for pid in list(self._labels):
+            if pid in known:
+                continue
+            try:
+                children.append(self._tracked.get(pid) or psutil.Process(pid))
+            except psutil.NoSuchProcess:
+                self._labels.pop(pid, None)
+        return children
+
+    def _next_interval(self, previous: Optional[Dict[str, float]], sample: Dict[str, float]) -> float:
+        if previous is None:
+            return self.min_interval
+        busy = (
+            sample['children_count'] > 0
+            or sample['cpu_percent'] > 70
+            or abs(sample['cpu_percent'] - previous['cpu_percent']) > 10
+            or abs(sample['memory_percent'] - previous['memory_percent']) > 5
+        )
+        if busy:
+            return self.min_interval
+        return min(self.max_interval, self.interval * 1.5)
+
+    # ------------------------------------------------------------------ lectura
+
+    def latest(self) -> Dict[str, float]:
+        """Última muestra (se toma una al momento si aún no hay ninguna)"""
+        with self._lock:
+            latest = self._latest
+        if latest is None:
+            latest = self.sample_now() or {name: 0.0 for name in SAMPLE_FIELDS}
+        return dict(latest)
+
+    def processes(self) -> List[Dict[str, Any]]:
+        """Procesos hijo (y vigilados) de la última muestra"""
+        with self._lock:
+            return [dict(process) for process in self._latest_processes]
+
+    def window(self, seconds: float, fields: List[str] = None) -> Dict[str, np.ndarray]:
+        """Columnas de las muestras de los últimos `seconds`, en orden cronológico"""
+        with self._lock:
+            count = min(self._written, self.capacity)
+            if count == 0:
+                rows = self._ring[:0].copy()
+            else:
+                order = np.arange(self._written - count, self._written) % self.capacity
+                rows = self._ring[order]
+        if len(rows):
+            rows = rows[rows[:, 0] >= time.time() - seconds]
+        return {name: rows[:, FIELD_INDEX[name]].copy() for name in (fields or SAMPLE_FIELDS)}
+
+    # ------------------------------------------------------------------ suscripciones y procesos
+
+    def subscribe(self, callback: Callable[[Dict[str, Any]], None], interval: float = 0.0) -> int:
+        """
+        Recibir instantáneas en el hilo del muestreador, como mucho una cada
+        `interval` segundos (0: todas). Devuelve el token para cancelar
+        """
+        with self._lock:
+            self._next_token += 1
+            self._subscribers[self._next_token] = {
+                'callback': callback,
+                'interval': interval,
+                'last_delivery': 0.0
+            }
+            return self._next_token
+
+    def unsubscribe(self, token: int):
+        with self._lock:
+            self._subscribers.pop(token, None)
+
+    def watch_process(self, pid: int, label: str):
+        """Etiquetar un proceso lanzado por una herramienta (aunque no sea hijo directo)"""
+        with self._lock:
+            self._labels[pid] = label
+        # Hay actividad nueva: muestrear pronto
+        self.interval = self.min_interval
+        self._wakeup.set()
+
+    def unwatch_process(self, pid: int):
+        with self._lock:
+            self._labels.pop(pid, None)
+
+    def get_statistics(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(
+                self.stats,
+                interval=self.interval,
+                stored_samples=min(self._written, self.capacity),
+                subscribers=len(self._subscribers),
+                watched_processes=len(self._labels)
+            )
+
+
+_system_sampler_instance: Optional[SystemSampler] = None
+_system_sampler_lock = threading.Lock()
+
+
+def get_system_sampler() -> SystemSampler:
+    """Obtener el muestreador compartido (arrancado)"""
+    global _system_sampler_instance
+    if _system_sampler_instance is None:
+        with _system_sampler_lock:
+            if _system_sampler_instance is None:
+                _system_sampler_instance = SystemSampler().start()
+    return _system_sampler_instance
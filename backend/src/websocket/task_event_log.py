@@ -0,0 +1,341 @@
+"""
+Per-Task Event Log
+Append-only log of the updates sent for each task, with monotonically
+increasing sequence numbers so clients can resume from the last event they
+saw (join_task with since_seq) instead of polling the task endpoints.
+
+- Bounded ring per task in memory, LRU-bounded number of tasks
+- Optional spill of older events to disk (JSONL per task) or MongoDB,
+  so a replay can go further back than the ring; a batch stays in the ring
+  until the spill has stored it
+- Replays are only reported complete when the sequence has no gaps
+"""
+
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+from itertools import islice
+from typing import Any, Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class DiskEventSpill:
+    """Older events stored as one JSONL file per task"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+
+    def _path(self, task_id: str) -> str:
+        return os.path.join(self.directory, re.sub(r'[^\w.-]', '_', task_id) + '.jsonl')
+
+    def append_events(self, task_id: str, events: List[Dict[str, Any]]):
+        lines = ''.join(json.dumps(event, default=str) + '\n' for event in events)
+        with self._lock:
+            with open(self._path(task_id), 'a', encoding='utf-8') as f:
+                f.write(lines)
+
+    def _read(self, task_id: str) -> List[Dict[str, Any]]:
+        path = self._path(task_id)
+        if not os.path.exists(path):
+            return []
+        with self._lock:
+            with open(path, 'r', encoding='utf-8') as f:
+                events = [json.loads(line) for line in f if line.strip()]
+        # Concurrent spills can land out of order and a retried batch can appear twice
+        by_seq = {event['seq']: event for event in events}
+        return [by_seq[seq] for seq in sorted(by_seq)]
+
+    def read_events(self, task_id: str, after_seq: int, before_seq: int = None) -> List[Dict[str, Any]]:
+        return [
+            event for event in self._read(task_id)
+            if event['seq'] > after_seq and (before_seq is None or event['seq'] < before_seq)
+        ]
+
+    def last_seq(self, task_id: str) -> int:
+        events = self._read(task_id)
+        return events[-1]['seq'] if events else 0
+
+    def delete_events(self, task_id: str):
+        with self._lock:
+            try:
+                os.remove(self._path(task_id))
+            except FileNotFoundError:
+                pass
+
+    def delete_older_than(self, cutoff: float) -> int:
+        """Remove the files of tasks with no events since cutoff (epoch seconds)"""
+        removed = 0
+        with self._lock:
+            for name in os.listdir(self.directory):
+                path = os.path.join(self.directory, name)
+                if name.endswith('.jsonl') and os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+                    removed += 1
+        return removed
+
+
+class MongoEventSpill:
+    """Older events stored in the task_events collection"""
+
+    def __init__(self, database_service):
+        self.database_service = database_service
+
+    def append_events(self, task_id: str, events: List[Dict[str, Any]]):
+        if not self.database_service.append_task_events(task_id, events):
+            raise RuntimeError(f"append_task_events failed for task {task_id}")
+
+    def read_events(self, task_id: str, after_seq: int, before_seq: int = None) -> List[Dict[str, Any]]:
+        return self.database_service.get_task_events(task_id, after_seq, before_seq)
+
+    def last_seq(self, task_id: str) -> int:
+        return self.database_service.get_last_task_event_seq(task_id)
+
+    def delete_events(self, task_id: str):
+        # DatabaseService.delete_task already removes the task's events
+        pass
+
+    def delete_older_than(self, cutoff: float) -> int:
+        # DatabaseService.cleanup_old_data already removes old events
+        return 0
+
+
+def create_event_spill(mode: str, database_service=None):
+    """Build the spill backend for TASK_EVENT_LOG_SPILL ('none', 'disk' or 'mongo')"""
+    mode = (mode or 'none').lower()
+    if mode == 'disk':
+        return DiskEventSpill(os.getenv('TASK_EVENT_LOG_DIR', '/tmp/mitosis_task_events'))
+    if mode == 'mongo' and database_service is not None:
+        return MongoEventSpill(database_service)
+    return None
+
+
+class TaskLog:
+    """In-memory tail of one task's events"""
+
+    def __init__(self, start_seq: int = 0):
+        self.events: deque = deque()
+        self.last_seq = start_seq
+        self.last_access = time.time()
+        self.spilling = False  # a batch is being written to the spill
+        self.spill_retry_at = 0.0
+
+    @property
+    def first_seq(self) -> int:
+        return self.events[0]['seq'] if self.events else self.last_seq + 1
+
+
+class TaskEventLog:
+    """Append-only, sequence-numbered event log per task"""
+
+    def __init__(self, capacity: int = None, max_tasks: int = None,
+                 spill=None, spill_batch: int = 50):
+        """
+        Args:
+            capacity: Events kept in memory per task (TASK_EVENT_LOG_SIZE, 1000)
+            max_tasks: Tasks kept in memory (TASK_EVENT_LOG_MAX_TASKS, 500)
+            spill: Optional backend (DiskEventSpill/MongoEventSpill) for older events
+            spill_batch: Events written per spill, so the ring holds up to capacity + spill_batch
+                (up to capacity + SPILL_BACKLOG_BATCHES * spill_batch while the spill is failing)
+        """
+        self.capacity = capacity or int(os.getenv('TASK_EVENT_LOG_SIZE', '1000'))
+        self.max_tasks = max_tasks or int(os.getenv('TASK_EVENT_LOG_MAX_TASKS', '500'))
+        self.spill = spill
+        self.spill_batch = spill_batch
+
+        self._logs: "OrderedDict[str, TaskLog]" = OrderedDict()
+        # Last seq of evicted tasks, so a task that comes back continues its numbering
+        self._evicted_seqs: "OrderedDict[str, int]" = OrderedDict()
+        self.max_evicted = self.max_tasks * 10
+        self._lock = threading.Lock()
+
+        self.stats = {
+            'appended': 0,
+            'truncated': 0,
+            'spilled': 0,
+            'spill_errors': 0,
+            'replays': 0,
+            'replayed_events': 0,
+            'incomplete_replays': 0
+        }
+
+    def _get_log(self, task_id: str) -> TaskLog:
+        """Task log, restoring the last sequence from the spill so numbers never go back"""
+        with self._lock:
+            log = self._logs.get(task_id)
+        if log is not None:
+            return log
+
+        spill_seq = self._spill_last_seq(task_id)
+        with self._lock:
+            log = self._logs.get(task_id)
+            if log is None:
+                start_seq = max(spill_seq, self._evicted_seqs.pop(task_id, 0))
+                log = self._logs[task_id] = TaskLog(start_seq)
+            return log
+
+    def _spill_last_seq(self, task_id: str) -> int:
+        if self.spill is None:
+            return 0
+        try:
+            return self.spill.last_seq(task_id)
+        except Exception as e:
+            self.stats['spill_errors'] += 1
+            logger.error(f"Error reading last event seq for task {task_id}: {e}")
+            return 0
+
+    SPILL_BACKLOG_BATCHES = 4
+    SPILL_RETRY_SECONDS = 5.0
+
+    def append(self, task_id: str, event: Dict[str, Any]) -> int:
+        """Assign the next sequence number to the event (sets event['seq']) and store it"""
+        log = self._get_log(task_id)
+        batch: List[Dict[str, Any]] = []
+        evicted_batches: List[Tuple[str, List[Dict[str, Any]]]] = []
+
+        with self._lock:
+            if self._logs.get(task_id) is not log:
+                # Evicted between lookup and append: put it back
+                self._logs[task_id] = log
+                self._evicted_seqs.pop(task_id, None)
+            log.last_seq += 1
+            event['seq'] = log.last_seq
+            log.events.append(event)
+            log.last_access = time.time()
+            self._logs.move_to_end(task_id)
+            self.stats['appended'] += 1
+
+            if self.spill is not None:
+                # The batch is copied, not removed: it leaves the ring once stored
+                if (len(log.events) >= self.capacity + self.spill_batch and not log.spilling
+                        and log.last_access >= log.spill_retry_at):
+                    log.spilling = True
+                    batch = list(islice(log.events, self.spill_batch))
+                limit = self.capacity + self.SPILL_BACKLOG_BATCHES * self.spill_batch
+            else:
+                limit = self.capacity
+            while len(log.events) > limit:
+                log.events.popleft()
+                self.stats['truncated'] += 1
+
+            while len(self._logs) > self.max_tasks:
+                evicted_id, evicted = self._logs.popitem(last=False)
+                self._evicted_seqs[evicted_id] = evicted.last_seq
+                self._evicted_seqs.move_to_end(evicted_id)
+                if self.spill is not None and evicted.events:
+                    evicted_batches.append((evicted_id, list(evicted.events)))
+            while len(self._evicted_seqs) > self.max_evicted:
+                self._evicted_seqs.popitem(last=False)
+
+        if batch:
+            stored = self._write_spill(task_id, batch)
+            with self._lock:
+                if stored:
+                    while log.events and log.events[0]['seq'] <= batch[-1]['seq']:
+                        log.events.popleft()
+                else:
+                    log.spill_retry_at = time.time() + self.SPILL_RETRY_SECONDS
+                log.spilling = False
+        for spill_task_id, events in evicted_batches:
+            # If this fails the events are gone and replays report the gap
+            self._write_spill(spill_task_id, events)
+        return event['seq']
+
+    def _write_spill(self, task_id: str, events: List[Dict[str, Any]]) -> bool:
+        try:
+            self.spill.append_events(task_id, events)
+            self.stats['spilled'] += len(events)
+            return True
+        except Exception as e:
+            self.stats['spill_errors'] += 1
+            logger.error(f"Error spilling {len(events)} events for task {task_id}: {e}")
+            return False
+
+    def last_seq(self, task_id: str) -> int:
+        with self._lock:
+            log = self._logs.get(task_id)
+            if log is not None:
+                return log.last_seq
+            evicted_seq = self._evicted_seqs.get(task_id, 0)
+        return max(evicted_seq, self._spill_last_seq(task_id))
+
+    def events_since(self, task_id: str, since_seq: int) -> Tuple[List[Dict[str, Any]], bool, int]:
+        """
+        Events with seq > since_seq in order
+
+        Returns:
+            (events, complete, last_seq); complete is False when any event
+            between since_seq and last_seq is missing (truncated, or lost by
+            the spill)
+        """
+        with self._lock:
+            log = self._logs.get(task_id)
+            if log is not None:
+                tail = [event for event in log.events if event['seq'] > since_seq]
+                first_seq, last_seq = log.first_seq, log.last_seq
+            else:
+                tail, first_seq, last_seq = [], None, self._evicted_seqs.get(task_id)
+
+        older = []
+        if self.spill is not None and (first_seq is None or since_seq + 1 < first_seq):
+            try:
+                older = self.spill.read_events(task_id, since_seq, first_seq)
+            except Exception as e:
+                self.stats['spill_errors'] += 1
+                logger.error(f"Error reading spilled events for task {task_id}: {e}")
+
+        events = older + tail
+        if last_seq is None:
+            last_seq = events[-1]['seq'] if events else 0
+
+        expected = since_seq
+        for event in events:
+            if event['seq'] != expected + 1:
+                break
+            expected += 1
+        complete = expected == since_seq + len(events) and expected >= last_seq
+        self.stats['replays'] += 1
+        self.stats['replayed_events'] += len(events)
+        if not complete:
+            self.stats['incomplete_replays'] += 1
+        return events, complete, last_seq
+
+    def discard(self, task_id: str):
+        """Forget a deleted task's events, in memory and in the spill"""
+        with self._lock:
+            self._logs.pop(task_id, None)
+            self._evicted_seqs.pop(task_id, None)
+        if self.spill is not None:
+            try:
+                self.spill.delete_events(task_id)
+            except Exception as e:
+                self.stats['spill_errors'] += 1
+                logger.error(f"Error deleting spilled events for task {task_id}: {e}")
+
+    def purge_spill_older_than(self, cutoff: float) -> int:
+        """Delete spilled logs of tasks with no events since cutoff (epoch seconds)"""
+        if self.spill is None:
+            return 0
+        try:
+            return self.spill.delete_older_than(cutoff)
+        except Exception as e:
+            self.stats['spill_errors'] += 1
+            logger.error(f"Error purging spilled task events: {e}")
+            return 0
+
+    def get_statistics(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self.stats,
+                'tasks': len(self._logs),
+                'events_in_memory': sum(len(log.events) for log in self._logs.values()),
+                'capacity': self.capacity,
+                'max_tasks': self.max_tasks,
+                'spill': type(self.spill).__name__ if self.spill else None
+            }
@@ -0,0 +1,241 @@
+"""
+Outbound WebSocket Update Dispatcher
+Buffers task updates per room, coalesces superseded progress events and
+flushes them as batched frames on a short interval or size threshold
+"""
+
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+logger = logging.getLogger(__name__)
+
+BATCH_EVENT = 'task_update_batch'
+SINGLE_EVENT = 'task_update'
+
+# Updates that end a task are flushed immediately and never dropped
+TERMINAL_UPDATE_TYPES = {'task_completed', 'task_failed'}
+
+
+class RoomBuffer:
+    """Pending updates for one room, in send order"""
+
+    def __init__(self):
+        self.updates: "OrderedDict[Hashable, Dict[str, Any]]" = OrderedDict()
+        self.first_enqueued_at: Optional[float] = None
+        self.coalesced = 0
+        self.dropped = 0
+        self.batch_seq = 0
+        # Held from draining to emit so a room's batches go out in batch_seq order
+        self.emit_lock = threading.Lock()
+
+
+class UpdateDispatcher:
+    """Coalescing, batching dispatcher in front of SocketIO.emit"""
+
+    def __init__(self, emit: Callable[..., Any], flush_interval: float = None,
+                 max_batch_size: int = None, max_pending_per_room: int = None,
+                 compress_threshold: int = None):
+        """
+        Args:
+            emit: Function (event, payload, room) that sends a frame
+            flush_interval: Max seconds an update waits in the buffer (WEBSOCKET_BATCH_INTERVAL, 0.1)
+            max_batch_size: Pending updates that trigger an immediate flush (WEBSOCKET_BATCH_SIZE, 50)
+            max_pending_per_room: Buffer bound before dropping old updates (WEBSOCKET_MAX_PENDING, 500)
+            compress_threshold: Frame size in bytes above which it is deflated (WEBSOCKET_COMPRESS_THRESHOLD, 16384)
+        """
+        self.emit = emit
+        self.flush_interval = flush_interval if flush_interval is not None else float(
+            os.getenv('WEBSOCKET_BATCH_INTERVAL', '0.1'))
+        self.max_batch_size = max_batch_size or int(os.getenv('WEBSOCKET_BATCH_SIZE', '50'))
+        self.max_pending_per_room = max_pending_per_room or int(os.getenv('WEBSOCKET_MAX_PENDING', '500'))
+        self.compress_threshold = compress_threshold or int(os.getenv('WEBSOCKET_COMPRESS_THRESHOLD', '16384'))
+
+        self._rooms: Dict[str, RoomBuffer] = {}
+        self._lock = threading.Lock()
+        self._sequence = itertools.count()
+
+        self.stats = {
+            'enqueued': 0,
+            'coalesced': 0,
+            'dropped': 0,
+            'frames_sent': 0,
+            'batch_frames_sent': 0,
+            'updates_sent': 0,
+            'compressed_frames': 0,
+            'bytes_uncompressed': 0,
+            'bytes_sent': 0,
+            'emit_errors': 0,
+            'backpressure_events': 0
+        }
+
+    @staticmethod
+    def coalesce_key(update: Dict[str, Any]) -> Optional[Hashable]:
+        """
+        Key under which an update supersedes earlier ones, or None if it must
+        be delivered as is. Only progress snapshots are coalesced (one per step);
+        log messages, step transitions and results are always kept.
+        """
+        data = update.get('data') or {}
+        if update.get('type') != 'task_progress' or 'progress' not in data:
+            return None
+        return ('progress', data.get('step_id') or data.get('current_step'))
+
+    def enqueue(self, room: str, update: Dict[str, Any]):
+        """Buffer an update for a room; flushes right away on size or terminal updates"""
+        flush_now = False
+        with self._lock:
+            buffer = self._rooms.get(room)
+            if buffer is None:
+                buffer = self._rooms[room] = RoomBuffer()
+            if buffer.first_enqueued_at is None:
+                buffer.first_enqueued_at = time.time()
+
+            self.stats['enqueued'] += 1
+            key = self.coalesce_key(update)
+            if key is not None and key in buffer.updates:
+                # The newer snapshot replaces the old one and takes its place at the end
+                del buffer.updates[key]
+                buffer.coalesced += 1
+                self.stats['coalesced'] += 1
+            buffer.updates[key if key is not None else next(self._sequence)] = update
+
+            if len(buffer.updates) > self.max_pending_per_room:
+                self._apply_backpressure(buffer)
+
+            flush_now = (
+                len(buffer.updates) >= self.max_batch_size
+                or update.get('type') in TERMINAL_UPDATE_TYPES
+                or self.flush_interval <= 0
+            )
+
+        if flush_now:
+            self.flush_room(room)
+
+    def _apply_backpressure(self, buffer: RoomBuffer):
+        """Drop the oldest non-terminal updates until the room is back within bounds"""
+        self.stats['backpressure_events'] += 1
+        for key in list(buffer.updates.keys()):
+            if len(buffer.updates) <= self.max_pending_per_room:
+                break
+            if buffer.updates[key].get('type') in TERMINAL_UPDATE_TYPES:
+                continue
+            del buffer.updates[key]
+            buffer.dropped += 1
+            self.stats['dropped'] += 1
+
+    def flush_due(self) -> int:
+        """Flush every room whose oldest pending update exceeded flush_interval"""
+        now = time.time()
+        with self._lock:
+            due = [
+                room for room, buffer in self._rooms.items()
+                if buffer.updates and now - buffer.first_enqueued_at >= self.flush_interval
+            ]
+        for room in due:
+            self.flush_room(room)
+        return len(due)
+
+    def flush_all(self):
+        with self._lock:
+            rooms = [room for room, buffer in self._rooms.items() if buffer.updates]
+        for room in rooms:
+            self.flush_room(room)
+
+    def flush_room(self, room: str):
+        with self._lock:
+            buffer = self._rooms.get(room)
+            if buffer is None or not buffer.updates:
+                return
+        with buffer.emit_lock:
+            self._flush_buffer(room, buffer)
+
+    def _flush_buffer(self, room: str, buffer: RoomBuffer):
+        """Drain and emit one room's batch (called with buffer.emit_lock held)"""
+        with self._lock:
+            if not buffer.updates:
+                return  # a concurrent flush already sent it
+            updates = list(buffer.updates.values())
+            coalesced, dropped = buffer.coalesced, buffer.dropped
+            buffer.updates = OrderedDict()
+            buffer.first_enqueued_at = None
+            buffer.coalesced = buffer.dropped = 0
+            buffer.batch_seq += 1
+            batch_seq = buffer.batch_seq
+
+        # A lone update keeps the legacy event so existing listeners still work
+        if len(updates) == 1 and not dropped:
+            event, frame = SINGLE_EVENT, updates[0]
+        else:
+            event, frame = BATCH_EVENT, {
+                'task_id': room,
+                'batch_seq': batch_seq,
+                'count': len(updates),
+                'coalesced': coalesced,
+                'dropped': dropped,
+                'updates': updates
+            }
+
+        frame = self._maybe_compress(event, frame)
+        try:
+            self.emit(event, frame, room)
+            self.stats['frames_sent'] += 1
+            self.stats['updates_sent'] += len(updates)
+            if event == BATCH_EVENT:
+                self.stats['batch_frames_sent'] += 1
+        except Exception as e:
+            self.stats['emit_errors'] += 1
+            logger.error(f"Error emitting {event} for room {room}: {e}")
+
+    def _maybe_compress(self, event: str, frame: Dict[str, Any]) -> Dict[str, Any]:
+        """Deflate large batch frames; clients inflate with DecompressionStream('deflate')"""
+        raw = json.dumps(frame, default=str).encode('utf-8')
+        self.stats['bytes_uncompressed'] += len(raw)
+        if event != BATCH_EVENT or len(raw) < self.compress_threshold:
+            self.stats['bytes_sent'] += len(raw)
+            return frame
+
+        payload = zlib.compress(raw, 6)
+        self.stats['compressed_frames'] += 1
+        self.stats['bytes_sent'] += len(payload)
+        return {
+            'task_id': frame['task_id'],
+            'batch_seq': frame['batch_seq'],
+            'count': frame['count'],
+            'coalesced': frame['coalesced'],
+            'dropped': frame['dropped'],
+            'encoding': 'deflate',
+            'payload': payload
+        }
+
+    def discard_room(self, room: str):
+        """Forget a room's buffer (e.g. once nobody listens to it)"""
+        with self._lock:
+            buffer = self._rooms.pop(room, None)
+            if buffer is not None and buffer.updates:
+                self.stats['dropped'] += len(buffer.updates)
+
+    def pending_count(self, room: str = None) -> int:
+        with self._lock:
+            if room is not None:
+                buffer = self._rooms.get(room)
+                return len(buffer.updates) if buffer else 0
+            return sum(len(buffer.updates) for buffer in self._rooms.values())
+
+    def get_statistics(self) -> Dict[str, Any]:
+        frames = self.stats['frames_sent']
+        return {
+            **self.stats,
+            'pending': self.pending_count(),
+            'rooms': len(self._rooms),
+            'updates_per_frame': self.stats['updates_sent'] / frames if frames else 0.0,
+            'flush_interval': self.flush_interval,
+            'max_batch_size': self.max_batch_size,
+            'max_pending_per_room': self.max_pending_per_room
+        }
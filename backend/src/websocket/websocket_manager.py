@@ -6,6 +6,7 @@ Provides real-time communication between backend execution and frontend UI
 import asyncio
 import json
 import logging
+import os
 import threading
 from typing import Dict, List, Callable, Any, Optional
 from datetime import datetime
@@ -13,6 +14,9 @@ from flask import Flask, request
 from flask_socketio import SocketIO, emit, join_room, leave_room
 from enum import Enum
 
+from .update_dispatcher import UpdateDispatcher, BATCH_EVENT
+from .task_event_log import TaskEventLog
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -30,6 +34,9 @@ class UpdateType(Enum):
 
 class WebSocketManager:
     """Manages WebSocket connections and real-time updates"""
+
+    # Exposed on the instance for callers that only hold the manager
+    UpdateType = UpdateType
     
     def __init__(self, app: Flask = None):
         self.app = app
@@ -38,6 +45,11 @@ class WebSocketManager:
         self.session_tasks: Dict[str, str] = {}  # session_id -> task_id
         self.update_queue = asyncio.Queue()
         self.is_initialized = False
+        # Outbound updates are coalesced and batched per task room
+        self.batching_enabled = os.getenv('WEBSOCKET_BATCHING', 'true').lower() == 'true'
+        self.dispatcher: Optional[UpdateDispatcher] = None
+        # Sequence-numbered history per task for replay on (re)join
+        self.event_log = TaskEventLog()
         
     def initialize(self, app: Flask):
         """Initialize WebSocket with Flask app"""
@@ -50,8 +62,23 @@ class WebSocketManager:
             engineio_logger=False
         )
         self.setup_event_handlers()
+        if self.batching_enabled:
+            self.dispatcher = UpdateDispatcher(
+                emit=lambda event, payload, room: self.socketio.emit(event, payload, room=room)
+            )
+            self.socketio.start_background_task(self._dispatch_loop)
         self.is_initialized = True
-        logger.info("WebSocket Manager initialized")
+        logger.info(f"WebSocket Manager initialized (batching={'on' if self.dispatcher else 'off'})")
+
+    def _dispatch_loop(self):
+        """Background task flushing buffered updates every flush interval"""
+        interval = max(self.dispatcher.flush_interval / 2, 0.01)
+        while True:
+            self.socketio.sleep(interval)
+            try:
+                self.dispatcher.flush_due()
+            except Exception as e:
+                logger.error(f"Error flushing WebSocket updates: {e}")
         
     def setup_event_handlers(self):
         """Setup WebSocket event handlers"""
@@ -68,7 +95,12 @@ class WebSocketManager:
             
         @self.socketio.on('join_task')
         def handle_join_task(data):
-            """Client joins a task room for updates"""
+            """
+            Client joins a task room for updates.
+            With since_seq, events after that sequence are replayed first
+            (task_replay); live updates may overlap the replay, so clients
+            discard any update whose seq they already processed.
+            """
             task_id = data.get('task_id')
             session_id = request.sid
             
@@ -76,17 +108,29 @@ class WebSocketManager:
                 emit('error', {'message': 'task_id is required'})
                 return
                 
-            # Join room for this task
+            # Join the room and register the connection before reading the
+            # log: send_update only emits to tasks in active_connections, so
+            # any event logged after the replay read is still sent live
             join_room(task_id)
-            
-            # Track connection
             if task_id not in self.active_connections:
                 self.active_connections[task_id] = []
             self.active_connections[task_id].append(session_id)
             self.session_tasks[session_id] = task_id
+
+            since_seq = data.get('since_seq')
+            if since_seq is not None:
+                try:
+                    self.replay_task_events(task_id, int(since_seq))
+                except (TypeError, ValueError):
+                    emit('error', {'message': 'since_seq must be an integer'})
             
             logger.info(f"Client {session_id} joined task {task_id}")
-            emit('joined_task', {'task_id': task_id, 'status': 'joined'})
+            emit('joined_task', {
+                'task_id': task_id,
+                'status': 'joined',
+                'last_seq': self.event_log.last_seq(task_id),
+                'batch_event': BATCH_EVENT if self.dispatcher else None
+            })
             
         @self.socketio.on('leave_task')
         def handle_leave_task(data):
@@ -122,9 +166,32 @@ class WebSocketManager:
                 self.active_connections[task_id].remove(session_id)
                 if not self.active_connections[task_id]:
                     del self.active_connections[task_id]
+                    if self.dispatcher:
+                        self.dispatcher.discard_room(task_id)
                     
+    def replay_task_events(self, task_id: str, since_seq: int):
+        """Send the requesting client the logged events after since_seq"""
+        events, complete, last_seq = self.event_log.events_since(task_id, since_seq)
+        emit('task_replay', {
+            'task_id': task_id,
+            'since_seq': since_seq,
+            'last_seq': last_seq,
+            'complete': complete,
+            'events': events
+        })
+        logger.debug(f"Replayed {len(events)} events for task {task_id} since seq {since_seq}")
+
     def send_update(self, task_id: str, update_type: UpdateType, data: Dict[str, Any]):
         """Send update to all clients listening to a task"""
+        update_data = {
+            'task_id': task_id,
+            'type': update_type.value,
+            'timestamp': datetime.now().isoformat(),
+            'data': data
+        }
+        # Logged even with nobody listening so late joiners can replay it
+        self.event_log.append(task_id, update_data)
+
         if not self.is_initialized or not self.socketio:
             logger.warning("WebSocket not initialized, cannot send update")
             return
@@ -132,20 +199,36 @@ class WebSocketManager:
         if task_id not in self.active_connections:
             logger.debug(f"No active connections for task {task_id}")
             return
-            
-        update_data = {
-            'task_id': task_id,
-            'type': update_type.value,
-            'timestamp': datetime.now().isoformat(),
-            'data': data
-        }
         
+        if self.dispatcher:
+            self.dispatcher.enqueue(task_id, update_data)
+            return
+
         try:
             # Send to all clients in the task room
             self.socketio.emit('task_update', update_data, room=task_id)
-            logger.info(f"Sent {update_type.value} update for task {task_id}")
+            logger.debug(f"Sent {update_type.value} update for task {task_id}")
         except Exception as e:
             logger.error(f"Error sending WebSocket update: {e}")
+
+    def flush_updates(self, task_id: str = None):
+        """Send buffered updates now (all rooms if task_id is None)"""
+        if not self.dispatcher:
+            return
+        if task_id:
+            self.dispatcher.flush_room(task_id)
+        else:
+            self.dispatcher.flush_all()
+
+    def get_dispatch_statistics(self) -> Dict[str, Any]:
+        """Batching, coalescing, backpressure and event log counters"""
+        if not self.dispatcher:
+            return {'batching_enabled': False, 'event_log': self.event_log.get_statistics()}
+        return {
+            'batching_enabled': True,
+            **self.dispatcher.get_statistics(),
+            'event_log': self.event_log.get_statistics()
+        }
             
     def send_task_started(self, task_id: str, task_title: str, execution_plan: Dict[str, Any]):
         """Send task started notification"""